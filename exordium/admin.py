@@ -79,7 +79,7 @@ class SongAdmin(admin.ModelAdmin):
         ('Technical Information', {'fields':
             ['filename', 'filetype', 'bitrate', 'mode', 'size', 'length',
             'sha256sum']}),
-        ('Date Information', {'fields': ['time_added', 'time_updated']}),
+        ('Date Information', {'fields': ['time_added', 'time_updated', 'mtime_ns']}),
     ]
     list_display = ('artist', 'album', 'title', 'year')
     search_fields = ['title']
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # vim: set expandtab tabstop=4 shiftwidth=4:
 
-from dynamic_preferences.types import StringPreference, BooleanPreference, Section
+from dynamic_preferences.types import StringPreference, BooleanPreference, IntegerPreference, ChoicePreference, Section
 from dynamic_preferences.registries import global_preferences_registry
 from dynamic_preferences.users.registries import user_preferences_registry
 
@@ -23,6 +23,14 @@ class LibraryUrl(StringPreference):
     verbose_name = 'Exordium Media URL'
     help_text = 'What is a direct URL to the media directory?'
 
+@global_preferences_registry.register
+class StreamTracks(BooleanPreference):
+    section = exordium
+    name = 'stream_tracks'
+    default = False
+    verbose_name = 'Exordium Stream Tracks'
+    help_text = 'Serve tracks through Exordium itself, rather than linking to the Exordium Media URL?'
+
 @global_preferences_registry.register
 class ZipfileCreationPath(StringPreference):
     section = exordium
@@ -39,6 +47,111 @@ class ZipfileUrl(StringPreference):
     verbose_name = 'Exordium Zip File Retrieval URL'
     help_text = 'What is a direct URL to where zipfiles can be found?'
 
+@global_preferences_registry.register
+class ZipfileBuildJobs(IntegerPreference):
+    section = exordium
+    name = 'zipfile_build_jobs'
+    default = 1
+    verbose_name = 'Exordium Zip File Build Jobs'
+    help_text = 'How many zipfiles can be built at once?'
+
+@global_preferences_registry.register
+class ZipfileQuota(IntegerPreference):
+    section = exordium
+    name = 'zipfile_quota'
+    default = 0
+    verbose_name = 'Exordium Zip File Quota'
+    help_text = 'How large can the zip file generation path get (in megabytes) before the least-recently-used zipfiles are removed?  (0 for no limit)'
+
+@global_preferences_registry.register
+class ZipfileStreaming(BooleanPreference):
+    section = exordium
+    name = 'zipfile_streaming'
+    default = False
+    verbose_name = 'Exordium Stream Zip Files'
+    help_text = 'Stream album zipfiles straight to the browser as they are generated, rather than writing them to the zip file path first?'
+
+@global_preferences_registry.register
+class ImportJobs(IntegerPreference):
+    section = exordium
+    name = 'import_jobs'
+    default = 1
+    verbose_name = 'Exordium Import Worker Processes'
+    help_text = 'How many processes should compute checksums and read tags during add/update?  (0 for one per CPU)'
+
+@global_preferences_registry.register
+class ImportBatchSize(IntegerPreference):
+    section = exordium
+    name = 'import_batch_size'
+    default = 0
+    verbose_name = 'Exordium Import Batch Size'
+    help_text = 'How many tracks should be written to the database per transaction during add/update?  (0 to write each track individually)'
+
+@global_preferences_registry.register
+class DeferChecksums(BooleanPreference):
+    section = exordium
+    name = 'defer_checksums'
+    default = False
+    verbose_name = 'Exordium Defer Full Checksums'
+    help_text = 'Only compute quick fingerprints during add/update, leaving full checksums for the backfillchecksums command?'
+
+@global_preferences_registry.register
+class QuickScan(BooleanPreference):
+    section = exordium
+    name = 'quick_scan'
+    default = False
+    verbose_name = 'Exordium Quick Update Scans'
+    help_text = 'Skip over directories which have not changed since the last update, during updates?'
+
+@global_preferences_registry.register
+class PregenerateThumbnails(BooleanPreference):
+    section = exordium
+    name = 'pregenerate_thumbnails'
+    default = False
+    verbose_name = 'Exordium Pre-generate Thumbnails'
+    help_text = 'Generate resized album art for new or changed covers at the end of each add/update, rather than the first time they are viewed?'
+
+@global_preferences_registry.register
+class ThumbnailStorage(ChoicePreference):
+    section = exordium
+    name = 'thumbnail_storage'
+    choices = (
+        ('database', 'Database'),
+        ('pack', 'Pack file'),
+    )
+    default = 'database'
+    verbose_name = 'Exordium Thumbnail Storage'
+    help_text = 'Where should resized album art be stored?  (Use the migratethumbnails command to switch)'
+
+@global_preferences_registry.register
+class ThumbnailPackPath(StringPreference):
+    section = exordium
+    name = 'thumbnail_pack_path'
+    default = ''
+    verbose_name = 'Exordium Thumbnail Pack Path'
+    help_text = 'Where on the filesystem can we write the thumbnail pack file, when using pack file storage?'
+
+@global_preferences_registry.register
+class FileServing(ChoicePreference):
+    section = exordium
+    name = 'file_serving'
+    choices = (
+        ('django', 'Django'),
+        ('sendfile', 'X-Sendfile'),
+        ('accel', 'X-Accel-Redirect'),
+    )
+    default = 'django'
+    verbose_name = 'Exordium File Serving'
+    help_text = 'How should files from the library be sent?  X-Sendfile and X-Accel-Redirect hand the work over to the front-end web server.'
+
+@global_preferences_registry.register
+class AccelRedirectPrefix(StringPreference):
+    section = exordium
+    name = 'accel_redirect_prefix'
+    default = ''
+    verbose_name = 'Exordium X-Accel-Redirect Prefix'
+    help_text = 'Internal URL prefix which the front-end web server maps to the library base path, for X-Accel-Redirect'
+
 @user_preferences_registry.register
 class ShowLiveRecordings(BooleanPreference):
     section = exordium
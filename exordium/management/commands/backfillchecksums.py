@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+from django.core.management.base import BaseCommand, CommandError
+from exordium.models import App
+
+import os
+
+class Command(BaseCommand):
+
+    # Help text
+    help = 'Computes full checksums for tracks which were added with deferred checksums'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nice',
+                type=int,
+                default=10,
+                help='Niceness increment to run at, so as not to bog down the system (default: 10)')
+        parser.add_argument('--jobs',
+                type=int,
+                default=None,
+                help='Number of worker processes to use (defaults to the "Import Worker Processes" preference)')
+
+    def handle(self, *args, **options):
+
+        # Lower our priority (and that of any worker processes, which will
+        # inherit it).  On Linux this also lowers our I/O priority.
+        if options['nice'] > 0 and hasattr(os, 'nice'):
+            os.nice(options['nice'])
+
+        errors = 0
+        for (status, text) in App.backfill_checksums(jobs=options['jobs']):
+            if status == App.STATUS_ERROR:
+                errors += 1
+                self.stderr.write(text)
+            elif status != App.STATUS_DEBUG or options['verbosity'] > 1:
+                self.stdout.write(text)
+
+        if errors > 0:
+            raise CommandError('Errors encountered while computing checksums: %d' % (errors))
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+from django.core.management.base import BaseCommand, CommandError
+from exordium.models import App
+
+class Command(BaseCommand):
+
+    # Help text
+    help = 'Removes least-recently-used album zipfiles to keep the zipfile directory within its quota'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quota',
+                type=int,
+                default=None,
+                help='Size in megabytes to trim the zipfile directory to (defaults to the "Zip File Quota" preference)')
+        parser.add_argument('--max-age',
+                type=int,
+                default=0,
+                help='Also remove zipfiles which haven\'t been used in this many hours')
+
+    def handle(self, *args, **options):
+
+        errors = 0
+        for (status, text) in App.evict_zipfiles(quota=options['quota'], max_age=options['max_age']):
+            if status == App.STATUS_ERROR:
+                errors += 1
+                self.stderr.write(text)
+            elif status != App.STATUS_DEBUG or options['verbosity'] > 1:
+                self.stdout.write(text)
+
+        if errors > 0:
+            raise CommandError('Errors encountered while removing zipfiles: %d' % (errors))
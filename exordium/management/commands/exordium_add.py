@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from exordium.models import App
+
+import sys
+import json
+import time
+
+class Command(BaseCommand):
+
+    # Help text
+    help = 'Adds new music to the library, as with "Just Add New Music" on the Library Upkeep page'
+
+    # Exit statuses
+    EXIT_OK = 0
+    EXIT_ERRORS = 1
+    EXIT_INVALID = 2
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scope',
+                default='',
+                help='Only process this subdirectory of the library (relative to the base path)')
+        parser.add_argument('--jobs',
+                type=int,
+                default=None,
+                help='Number of worker processes to use (defaults to the "Import Worker Processes" preference)')
+        parser.add_argument('--batch-size',
+                type=int,
+                default=None,
+                help='Tracks to write per transaction (defaults to the "Import Batch Size" preference)')
+        parser.add_argument('--defer-checksums',
+                action='store_const',
+                const=True,
+                default=None,
+                help='Skip full checksums, leaving them for the backfillchecksums command')
+        parser.add_argument('--format',
+                choices=['json', 'text'],
+                default='json',
+                help='Output JSON lines (the default), or plain text')
+
+    def get_results(self, options):
+        """
+        Returns the generator which does our actual work.
+        """
+        return App.add(jobs=options['jobs'], batch_size=options['batch_size'],
+            defer_checksums=options['defer_checksums'], scope=options['scope'])
+
+    def scope_must_exist(self):
+        """
+        Returns whether our scope needs to exist on disk.
+        """
+        return True
+
+    def output(self, options, status, text, **extra):
+        """
+        Writes out a single status line.  Debug lines are only shown at
+        higher verbosities.
+        """
+        if status == App.STATUS_DEBUG and options['verbosity'] < 2:
+            return
+        if options['format'] == 'json':
+            line = {
+                'time': timezone.now().isoformat(),
+                'status': status,
+                'message': text,
+            }
+            line.update(extra)
+            self.stdout.write(json.dumps(line, sort_keys=True))
+        elif status == App.STATUS_ERROR:
+            self.stderr.write(text)
+        else:
+            self.stdout.write(text)
+
+    def handle(self, *args, **options):
+
+        try:
+            App.get_scope_base(options['scope'], must_exist=self.scope_must_exist())
+        except App.InvalidScope as e:
+            self.output(options, App.STATUS_ERROR, str(e))
+            sys.exit(self.EXIT_INVALID)
+
+        errors = 0
+        start_time = time.time()
+        for (status, text) in self.get_results(options):
+            if status == App.STATUS_ERROR:
+                errors += 1
+            self.output(options, status, text)
+
+        self.output(options, 'summary', 'Finished with %d error%s' % (errors, '' if errors == 1 else 's'),
+            errors=errors, elapsed=round(time.time() - start_time, 3))
+        if errors > 0:
+            sys.exit(self.EXIT_ERRORS)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+from exordium.models import App
+from exordium.management.commands.exordium_add import Command as AddCommand
+
+class Command(AddCommand):
+
+    # Help text
+    help = 'Adds, updates and cleans the library, as with "Full Update" on the Library Upkeep page'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--quick-scan',
+                dest='quick_scan',
+                action='store_const',
+                const=True,
+                default=None,
+                help='Skip over directories which have not changed since the last update')
+        group.add_argument('--full-verify',
+                dest='quick_scan',
+                action='store_const',
+                const=False,
+                help='Check every track, even in directories which have not changed')
+
+    def get_results(self, options):
+        """
+        Returns the generator which does our actual work.
+        """
+        return App.update(jobs=options['jobs'], batch_size=options['batch_size'],
+            defer_checksums=options['defer_checksums'], scope=options['scope'],
+            quick_scan=options['quick_scan'])
+
+    def scope_must_exist(self):
+        """
+        Updates are allowed to point at a directory which has gone away,
+        to clean out the songs which were in it.
+        """
+        return False
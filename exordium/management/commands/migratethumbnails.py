@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+from django.core.management.base import BaseCommand, CommandError
+from exordium.models import App
+
+class Command(BaseCommand):
+
+    # Help text
+    help = 'Moves resized album art into the given thumbnail storage, and switches over to using it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('storage',
+                choices=['database', 'pack'],
+                help='Thumbnail storage to move to')
+
+    def handle(self, *args, **options):
+
+        errors = 0
+        for (status, text) in App.migrate_thumbnails(options['storage']):
+            if status == App.STATUS_ERROR:
+                errors += 1
+                self.stderr.write(text)
+            elif status != App.STATUS_DEBUG or options['verbosity'] > 1:
+                self.stdout.write(text)
+
+        if errors > 0:
+            raise CommandError('Errors encountered while migrating thumbnails: %d' % (errors))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+from django.core.management.base import BaseCommand, CommandError
+from exordium.models import App
+from exordium.watcher import LibraryWatcher
+
+class Command(BaseCommand):
+
+    # Help text
+    help = 'Watches the library for changes with inotify, updating the database as they happen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debounce',
+                type=float,
+                default=5,
+                help='Seconds without any changes to wait before processing them (default: 5)')
+        parser.add_argument('--max-delay',
+                type=float,
+                default=60,
+                help='Maximum seconds to hold on to changes while they keep coming in (default: 60)')
+        parser.add_argument('--jobs',
+                type=int,
+                default=None,
+                help='Number of worker processes to use (defaults to the "Import Worker Processes" preference)')
+
+    def handle(self, *args, **options):
+
+        try:
+            watcher = LibraryWatcher(debounce=options['debounce'],
+                max_delay=options['max_delay'], jobs=options['jobs'])
+        except OSError as e:
+            raise CommandError('Could not start watching the library: %s' % (e))
+
+        try:
+            for (status, text) in watcher.run():
+                if status == App.STATUS_ERROR:
+                    self.stderr.write(text)
+                elif status != App.STATUS_DEBUG or options['verbosity'] > 1:
+                    self.stdout.write(text)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.inotify.close()
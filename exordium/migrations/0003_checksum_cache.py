@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 20:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exordium', '0002_add_m4a_support'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileChecksum',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.BigIntegerField()),
+                ('inode', models.BigIntegerField()),
+                ('size', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('sha256sum', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='album',
+            options={'ordering': ['artist', 'name']},
+        ),
+        migrations.AlterModelOptions(
+            name='albumart',
+            options={'ordering': ['album__artist__name', 'album__name', 'size'], 'verbose_name_plural': 'Album Art'},
+        ),
+        migrations.AlterModelOptions(
+            name='artist',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterModelOptions(
+            name='song',
+            options={'ordering': ['artist', 'album', 'tracknum', 'title']},
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='mtime_ns',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='art_ext',
+            field=models.CharField(blank=True, default=None, max_length=4, null=True),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='art_filename',
+            field=models.CharField(blank=True, default=None, max_length=4096, null=True),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='art_mime',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='art_mtime',
+            field=models.IntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='prefix',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='raw_composer',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='raw_conductor',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='raw_group',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterUniqueTogether(
+            name='filechecksum',
+            unique_together=set([('device', 'inode')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 20:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exordium', '0003_checksum_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='device',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='inode',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
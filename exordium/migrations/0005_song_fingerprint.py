@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 20:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exordium', '0004_song_file_identity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='fingerprint',
+            field=models.CharField(default='', max_length=64),
+        ),
+    ]
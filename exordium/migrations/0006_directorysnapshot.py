@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 20:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exordium', '0005_song_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectorySnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=4096)),
+                ('mtime_ns', models.BigIntegerField()),
+                ('entries', models.IntegerField()),
+                ('fingerprint', models.CharField(max_length=64)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 22:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exordium', '0007_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZipChecksum',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256sum', models.CharField(max_length=64, unique=True)),
+                ('crc32', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -3,18 +3,29 @@ import re
 import io
 import hashlib
 import mutagen
-import zipfile
 import datetime
+import queue
+import threading
+import contextlib
+import collections
+import multiprocessing
+import concurrent.futures
 
 from dynamic_preferences.registries import global_preferences_registry
 
 from django.db import models, transaction
 from django.db.utils import IntegrityError
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, F
+from django.urls import reverse
 
 from PIL import Image
 
+from .thumbnails import DatabaseThumbnailStore, PackThumbnailStore, get_pack_store
+from .zipstream import ZipMember, ZipStream
+from .zipcache import ZipCache, get_zip_queue
+from .workers import init_worker
+
 # Create your models here.
 
 # TODO: I actually don't think I like those "on_delete=models.CASCADE"
@@ -224,7 +235,7 @@ class Album(models.Model):
         Returns all tracks in our album, ordered.  A convenience function
         for inclusion in templates, basically.
         """
-        return self.song_set.all().order_by('tracknum')
+        return self.song_set.all().order_by('tracknum', 'filename')
 
     def get_secondary_artists_list(self):
         """
@@ -286,20 +297,25 @@ class Album(models.Model):
                 sorted(conductors.keys()), have_empty_conductor,
                 sorted(composers.keys()), have_empty_composer)
 
-    def get_album_image(self):
+    def get_album_image(self, base_dir=None, listings=None):
         """
         Find our album art filename.  Most of the heavy lifting here
         is done in some static methods from App.  Will return None
         if no album art was found.
+
+        ``base_dir`` is the full path to the directory to look in, and
+        will be taken from our first song if it's not passed in.
+        ``listings`` is as in ``App.list_directory()``.
         """
         if self.miscellaneous:
             return None
-        if self.song_set.count() > 0:
-            song = self.song_set.all()[0]
-            base_dir = song.full_base_dir()
-            return App.get_directory_cover_image(base_dir)
-        else:
-            return None
+        if base_dir is None:
+            if self.song_set.count() > 0:
+                song = self.song_set.all()[0]
+                base_dir = song.full_base_dir()
+            else:
+                return None
+        return App.get_directory_cover_image(base_dir, listings)
 
     def import_album_image_from_filename(self, filename, short_filename):
         """
@@ -355,7 +371,7 @@ class Album(models.Model):
             yield (App.STATUS_ERROR, 'Cover image %s found but not readable' % (filename))
             return False
 
-    def update_album_art(self, full_refresh=False):
+    def update_album_art(self, full_refresh=False, base_dir=None, listings=None):
         """
         Updates our album art based on what we find on-disk.  Yields a list of
         tuples like our App.add() and App.update() functions.
@@ -363,22 +379,31 @@ class Album(models.Model):
         Note that like those other funcs, since we're yielding things as we go,
         something needs to loop through our output in order for things to
         actually happen here.
+
+        ``base_dir`` and ``listings`` are passed through to ``get_album_image()``,
+        and ``listings`` is also used to check our existing art's mtime, if
+        its directory is in there.
         """
         # If we've not ben told to do a full refresh and we have
         # an existing album art record, check its mtime and exit if
         # there's no work to do.
         if not full_refresh and self.has_album_art():
-            try:
-                stat_result = os.stat(self.get_original_art_filename())
-                if int(stat_result.st_mtime) == self.art_mtime:
+            art_dir = os.path.dirname(self.art_filename)
+            if listings is not None and art_dir in listings:
+                if listings[art_dir].get(os.path.basename(self.art_filename)) == self.art_mtime:
                     return
-            except (FileNotFoundError, PermissionError):
-                pass
+            else:
+                try:
+                    stat_result = os.stat(self.get_original_art_filename())
+                    if int(stat_result.st_mtime) == self.art_mtime:
+                        return
+                except (FileNotFoundError, PermissionError):
+                    pass
         
         # If we got here, do a full refresh of the directory
         if self.miscellaneous:
             return
-        art_filename = self.get_album_image()
+        art_filename = self.get_album_image(base_dir, listings)
         if art_filename:
             yield (App.STATUS_DEBUG, 'Found art at %s' % (art_filename))
             short_filename = art_filename[len(App.prefs['exordium__base_path'])+1:]
@@ -420,6 +445,22 @@ class Album(models.Model):
         else:
             return None
 
+    @staticmethod
+    def annotate_totals(albums):
+        """
+        Annotates the queryset ``albums`` with each album's track count
+        (``num_tracks``) and total length in seconds (``total_time``), so
+        that listings of many albums can get them in the same query rather
+        than one query per album.  ``albums`` shouldn't already be joined
+        against songs (by a filter on them, say), or only the songs
+        matching that filter will be counted.
+        """
+        return albums.annotate(
+            num_tracks=models.Count('song'),
+            total_time=models.Sum(models.F('song__length'),
+                output_field=models.IntegerField()),
+        )
+
     def get_total_time(self):
         """
         Returns the total time taken up by the tracks in this album, as seconds.
@@ -451,46 +492,92 @@ class Album(models.Model):
     def get_total_size_str(self):
         """
         Returns a human-readable total size of all the tracks in this album.
-        Taken from http://stackoverflow.com/questions/14996453/python-libraries-to-calculate-human-readable-filesize-from-bytes
         """
-        suffixes = ['B', 'KB', 'MB', 'GB']
-        sz_bytes = self.get_total_size()
-        if sz_bytes is None or sz_bytes == 0:
-            return '0 B'
-        i = 0
-        while sz_bytes >= 1024 and i < len(suffixes)-1:
-            sz_bytes /= 1024
-            i += 1
-        return '%d %s' % (sz_bytes, suffixes[i])
+        return App.get_size_str(self.get_total_size())
 
-    def create_zip(self):
+    def get_zip_folder(self):
         """
-        Creates a zipfile of ourselves (if possible) and returns a tuple
-        containing:
-            1) filenames in the zip
-            2) zip filename
-        Can raise one of a few exceptions if things go awry.
+        Returns the name of the folder to put this album into, inside a
+        zipfile containing more than one album.
         """
-        
-        # Check to ensure that we're okay to even try this.
-        App.ensure_prefs()
-        if not App.support_zipfile():
-            raise App.AlbumZipfileNotSupported()
-
-        # Then make sure that the file doesn't already exist
-        # (provide a link if it does)
-        zip_dir = App.prefs['exordium__zipfile_path']
-        zip_filename = '%s_-_%s.zip' % (
+        return '%s_-_%s' % (
             App.norm_filename(str(self.artist)),
             App.norm_filename(self.name),
         )
-        zip_full = os.path.join(zip_dir, zip_filename)
-        if os.path.exists(zip_full):
-            timestamp = datetime.datetime.fromtimestamp(os.path.getmtime(zip_full))
-            raise App.AlbumZipfileAlreadyExists(zip_filename, timestamp)
+
+    def get_zip_filename(self):
+        """
+        Returns the filename to use for a zipfile of this album.
+        """
+        return '%s.zip' % (self.get_zip_folder())
+
+    # How many hex digits of our content digest to use
+    zip_digest_length = 16
+
+    @staticmethod
+    def compute_zip_digest(album_id, songs, art_filename, art_mtime):
+        """
+        Computes the digest returned by ``get_zip_digest()`` for the album
+        with ID ``album_id``.  ``songs`` is a list of ``(filename,
+        sha256sum, fingerprint, size, mtime_ns)`` tuples for each track, in
+        order.
+        """
+        hash_sha256 = hashlib.sha256()
+        for (filename, sha256sum, fingerprint, size, mtime_ns) in songs:
+            if sha256sum:
+                ident = sha256sum
+            else:
+                # Tracks added with deferred checksums don't have one yet
+                ident = '%s:%d:%d' % (fingerprint, size, mtime_ns)
+            hash_sha256.update(os.fsencode('%s\0%s\n' % (filename, ident)))
+        if art_filename:
+            hash_sha256.update(os.fsencode('art\0%s\0%d\n' % (art_filename, art_mtime or 0)))
+        return '%d-%s' % (album_id, hash_sha256.hexdigest()[:Album.zip_digest_length])
+
+    def get_zip_digest(self):
+        """
+        Returns a digest which identifies a zipfile of this album: our ID,
+        followed by a digest of its contents (the checksum and location of
+        each of our tracks, in order, and the location and mtime of our
+        album art).  Zipfiles are stored under this digest (see
+        ``start_zip()``), so any change to the album's files gets a fresh
+        zipfile, while renaming the album or artist can reuse the old one.
+        The ID lets older versions of our zipfile be found (see
+        ``ZipCache.evict_versions()``), since albums' filenames needn't be
+        unique.  Only the database is consulted.
+        """
+        songs = self.get_songs_ordered().values_list('filename', 'sha256sum',
+            'fingerprint', 'size', 'mtime_ns')
+        return Album.compute_zip_digest(self.pk, list(songs), self.art_filename, self.art_mtime)
+
+    @staticmethod
+    def get_all_zip_digests():
+        """
+        Returns a set of the current ``get_zip_digest()`` for every album,
+        using a couple of queries rather than a few per album.
+        """
+        songs = collections.defaultdict(list)
+        for (album_id, filename, sha256sum, fingerprint, size, mtime_ns) in Song.objects.order_by(
+                'album_id', 'tracknum', 'filename').values_list('album_id', 'filename',
+                'sha256sum', 'fingerprint', 'size', 'mtime_ns').iterator():
+            songs[album_id].append((filename, sha256sum, fingerprint, size, mtime_ns))
+        digests = set()
+        for (album_id, art_filename, art_mtime) in Album.objects.values_list('pk',
+                'art_filename', 'art_mtime').iterator():
+            digests.add(Album.compute_zip_digest(album_id, songs[album_id], art_filename, art_mtime))
+        return digests
+
+    def get_zip_members(self, folder=None):
+        """
+        Returns a list of ``ZipMember`` objects describing the files which
+        go into a zipfile of this album: all our tracks, in order, followed
+        by our album art.  They're put in ``folder`` inside the zipfile,
+        which defaults to the name of the directory our files are in.  Can
+        raise ``OSError`` if any of them can't be found.
+        """
 
         # Loop through and collect raw filenames
-        songs = self.song_set.order_by('tracknum')
+        songs = list(self.get_songs_ordered())
         filenames_raw = []
         filenames_inzip = []
         for song in songs:
@@ -511,37 +598,137 @@ class Album(models.Model):
             for filename in filenames_raw:
                 filenames_inzip.append(filename)
         else:
-            zip_container = os.path.basename(common_dir)
+            if folder is None:
+                zip_container = os.path.basename(common_dir)
+            else:
+                zip_container = folder
             for filename in filenames_raw:
                 filenames_inzip.append(
                     os.path.join(zip_container, filename[len(common_dir)+1:])
                 )
 
-        # Now actually get to work
-        try:
-            with zipfile.ZipFile(zip_full, 'w') as zf:
-                for (raw, inzip) in zip(filenames_raw, filenames_inzip):
-                    try:
-                        zf.write(raw, arcname=inzip)
-                    except ValueError:
-                        # Zipfiles can't support dates before 1980, and it seems
-                        # that I've got at least a file or two whose date is before
-                        # then.  Those should be updated, certainly, but this is
-                        # an annoying exception with no GOOD way to go about it
-                        # apart from loading in the file data ourself.  Lame.  Would
-                        # be nice if there was a flag that said "give invalid dates
-                        # some fake info" instead.
-                        with open(raw, 'rb') as df:
-                            zf.writestr(inzip, df.read())
-        except Exception as e:  # pragma: no cover
+        # Tracks which haven't changed since they were last scanned are
+        # identified by their checksums, which also lets us reuse the CRCs
+        # from any previous zipfile containing the same data.
+        members = []
+        for (idx, (raw, inzip)) in enumerate(zip(filenames_raw, filenames_inzip)):
+            stat_result = os.stat(raw)
+            sha256sum = None
+            if idx < len(songs):
+                song = songs[idx]
+                if (song.sha256sum and song.size == stat_result.st_size and
+                        not song.changed_on_disk(stat_result.st_mtime_ns)):
+                    sha256sum = song.sha256sum
+            members.append(ZipMember(raw, inzip, stat_result.st_size,
+                int(stat_result.st_mtime), sha256sum=sha256sum))
+        crcs = ZipChecksum.load([member.sha256sum for member in members if member.sha256sum])
+        for member in members:
+            if member.sha256sum in crcs:
+                member.crc = crcs[member.sha256sum]
+
+        return members
+
+    def get_zip_stream(self):
+        """
+        Returns a ``ZipStream`` which generates a zipfile of this album on
+        the fly.  Its contents only depend on our files, so any range of
+        it can be regenerated later (see ``ZipChecksum.fill()``).  Can raise
+        ``OSError`` as with ``get_zip_members()``.
+        """
+        return ZipStream(self.get_zip_members())
+
+    @staticmethod
+    def get_albums_zip_stream(albums):
+        """
+        Returns a ``ZipStream`` which generates a single zipfile containing
+        each of ``albums``, in order, each in its own folder (see
+        ``get_zip_folder()``).  Albums which would end up in the same
+        folder get a number tacked on to the end.  Can raise ``OSError`` as
+        with ``get_zip_members()``.
+        """
+        members = []
+        folders = set()
+        for album in albums:
+            base_folder = album.get_zip_folder()
+            folder = base_folder
+            idx = 2
+            while folder in folders:
+                folder = '%s_(%d)' % (base_folder, idx)
+                idx += 1
+            folders.add(folder)
+            members.extend(album.get_zip_members(folder=folder))
+        return ZipStream(members)
+
+    def start_zip(self):
+        """
+        Starts building a zipfile of ourselves in the background (see
+        ``App.get_zip_queue()``), and returns a tuple containing:
+            1) a ``Future`` for the build, whose result is our ``ZipStream``
+            2) zip filename, relative to our zipfile directory
+        Zipfiles are stored in a directory named after ``get_zip_digest()``,
+        so one whose contents are out of date is never handed out.  If the
+        same zipfile is already being built, we get that build's ``Future``
+        rather than starting another one.  Can raise the same exceptions as
+        ``create_zip()``, apart from ``AlbumZipfileInProgress``.
+        """
+
+        # Check to ensure that we're okay to even try this.
+        App.ensure_prefs()
+        if not App.support_zipfile():
+            raise App.AlbumZipfileNotSupported()
+
+        # Then make sure that the file doesn't already exist
+        # (provide a link if it does).  If we've been renamed since it
+        # was built, rename it to match.
+        cache = App.get_zip_cache()
+        digest = self.get_zip_digest()
+        zip_name = self.get_zip_filename()
+        zip_filename = cache.find(digest)
+        if zip_filename is not None:
             try:
-                os.remove(zip_full)
-            except Exception:
+                if os.path.basename(zip_filename) != zip_name:
+                    zip_filename = cache.rename(zip_filename, zip_name)
+                cache.touch(zip_filename)
+                timestamp = datetime.datetime.fromtimestamp(os.path.getmtime(cache.get_path(zip_filename)))
+                raise App.AlbumZipfileAlreadyExists(zip_filename, timestamp)
+            except FileNotFoundError:   # pragma: no cover
+                # Evicted out from under us; just build it again
                 pass
-            raise App.AlbumZipfileError(e)
+
+        # Now queue it up, unless someone beat us to it.  The build itself
+        # happens outside of this request, so we have to collect everything
+        # we need from the database first.
+        zip_queue = App.get_zip_queue()
+        future = zip_queue.get(digest)
+        if future is None:
+            try:
+                stream = self.get_zip_stream()
+            except OSError as e:
+                raise App.AlbumZipfileError(e)
+            future = zip_queue.submit(digest, App.build_zip, cache, digest, zip_name,
+                stream, App.get_zipfile_quota())
+        return (future, os.path.join(digest, zip_name))
+
+    def create_zip(self, timeout=None):
+        """
+        Creates a zipfile of ourselves (if possible) and returns a tuple
+        containing:
+            1) filenames in the zip
+            2) zip filename
+        Can raise one of a few exceptions if things go awry.  If ``timeout``
+        is given and the zipfile isn't finished within that many seconds,
+        ``App.AlbumZipfileInProgress`` is raised, and the build carries on
+        in the background.
+        """
+        (future, zip_filename) = self.start_zip()
+        try:
+            stream = future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise App.AlbumZipfileInProgress(zip_filename)
 
         # Now get out of here
-        return (filenames_inzip, zip_filename)
+        ZipChecksum.store_members(stream.members)
+        return ([member.arcname for member in stream.members], zip_filename)
 
 class AlbumArt(models.Model):
     """
@@ -627,7 +814,8 @@ class AlbumArt(models.Model):
         # See if we have an existing object
         try:
             art = AlbumArt.objects.get(album=album, size=size)
-            if art.from_mtime == album.art_mtime and art.resolution == res:
+            if (art.from_mtime == album.art_mtime and art.resolution == res
+                    and art.get_image() is not None):
                 return art
             else:
                 # We could do some updates here, but if we consider it
@@ -646,26 +834,62 @@ class AlbumArt(models.Model):
 
         # If we got here, we need to create a new AlbumArt object
         # based on the album's original art.
-        try:
-            with open(album.get_original_art_filename(), 'rb') as df:
-                image_data = df.read()
-                image_in = io.BytesIO(image_data)
-                with Image.open(image_in) as img:
-                    img.thumbnail((res, res))
-                    if img.mode not in ['L', 'RGB', 'CMYK']:
-                        img = img.convert('RGB')
-                    image_out = io.BytesIO()
-                    img.save(image_out, format='JPEG')
-                    image_out.seek(0)
-                    albumart = AlbumArt.objects.create(album=album,
-                        size=size,
-                        resolution=res,
-                        from_mtime=album.art_mtime,
-                        image=image_out.read())
-                    return albumart
-        except Exception as e:  # pragma: no cover
+        thumbnails = AlbumArt.try_render(album.get_original_art_filename(), [res])
+        if thumbnails is None:  # pragma: no cover
             # TODO: Should log this
             return None
+        art = AlbumArt(album=album,
+            size=size,
+            resolution=res,
+            from_mtime=album.art_mtime)
+        App.get_thumbnail_store().save(art, thumbnails[res])
+        art.save()
+        art.image_data = thumbnails[res]
+        return art
+
+    def get_image(self):
+        """
+        Returns our resized image data from whichever thumbnail store is
+        in use (see ``App.get_thumbnail_store()``), or ``None`` if it
+        can't be found there.
+        """
+        if getattr(self, 'image_data', None) is None:
+            self.image_data = App.get_thumbnail_store().load(self)
+        return self.image_data
+
+    @staticmethod
+    def render(filename, resolutions):
+        """
+        Resizes the image at ``filename`` to each of the given ``resolutions``,
+        returning a dict of the resulting JPEG data keyed on resolution.  This
+        doesn't touch the database, so it can be run in a worker process.
+        """
+        thumbnails = {}
+        with open(filename, 'rb') as df:
+            image_data = df.read()
+        for res in resolutions:
+            # Re-opening for each size lets Pillow do its fast JPEG
+            # downscaling while decoding, rather than decoding at full
+            # size once and scaling that down.
+            with Image.open(io.BytesIO(image_data)) as img:
+                img.thumbnail((res, res))
+                if img.mode not in ['L', 'RGB', 'CMYK']:
+                    img = img.convert('RGB')
+                image_out = io.BytesIO()
+                img.save(image_out, format='JPEG')
+                thumbnails[res] = image_out.getvalue()
+        return thumbnails
+
+    @staticmethod
+    def try_render(filename, resolutions):
+        """
+        As ``render()``, but returns ``None`` if the image can't be read or
+        resized, rather than raising an exception.
+        """
+        try:
+            return AlbumArt.render(filename, resolutions)
+        except Exception:
+            return None
 
 class Song(models.Model):
 
@@ -687,6 +911,12 @@ class Song(models.Model):
         (M4A, M4A),
     )
 
+    filetype_to_mime = {
+        MP3: 'audio/mpeg',
+        OGG: 'audio/ogg',
+        M4A: 'audio/mp4',
+    }
+
     # Filename
     filename = models.CharField(max_length=4096)
 
@@ -737,9 +967,21 @@ class Song(models.Model):
     # Timestamps
     time_added = models.DateTimeField(default=timezone.now)
     time_updated = models.IntegerField(default=0)
+    mtime_ns = models.BigIntegerField(default=0)
+
+    # Where the file lives on disk, used to spot moved files without
+    # having to read them (see ``App.update()``)
+    device = models.BigIntegerField(default=0)
+    inode = models.BigIntegerField(default=0)
     
-    # Checksum
+    # Checksums.  ``sha256sum`` may be blank if we've been told to defer
+    # full checksums, in which case ``App.backfill_checksums()`` will fill
+    # it in later.  See ``get_fingerprint()`` for ``fingerprint``.
     sha256sum = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64, default='')
+
+    # How many bytes from each end of a file go into our fingerprint
+    fingerprint_sample_size = 64*1024
 
     # See set_album_secondary_artist_counts(), below
     num_groups = 0
@@ -782,14 +1024,22 @@ class Song(models.Model):
         """
         return os.path.exists(self.full_filename())
 
-    def changed_on_disk(self):
+    def changed_on_disk(self, mtime_ns=None):
         """
         Returns True if the mtime of our filesystem file doesn't match
-        our database entry
+        our database entry.  Uses the full nanosecond mtime if we have it,
+        so that edits within the same second are still noticed.  Songs which
+        were added before we stored that only have second precision.
+
+        ``mtime_ns`` can be passed in if the file's mtime is already known
+        (from ``App.walk_media_dirs()``, for instance), to avoid looking at
+        the file again.
         """
-        full_filename = self.full_filename()
-        stat_result = os.stat(full_filename)
-        return int(stat_result.st_mtime) != self.time_updated
+        if mtime_ns is None:
+            mtime_ns = os.stat(self.full_filename()).st_mtime_ns
+        if self.mtime_ns:
+            return mtime_ns != self.mtime_ns
+        return mtime_ns // 10**9 != self.time_updated
 
     def set_title(self, title):
         """
@@ -893,7 +1143,7 @@ class Song(models.Model):
         else:
             return ''
 
-    def update_from_disk(self, retlines=[]):
+    def update_from_disk(self, retlines=[], new_checksums=None, full_checksum=True, scan_result=None):
         """
         Updates what values we can from disk.  Will not process Artist or
         Album changes, though, since those depend on a lot of other factors
@@ -904,6 +1154,13 @@ class Song(models.Model):
         feel free to add to.  If not passed in, any logging information will
         be lost.
 
+        If ``new_checksums`` is passed in as a list, our new checksum will be
+        added to it (in the format that ``FileChecksum.store()`` takes) rather
+        than being stored in the checksum cache right away.  ``full_checksum``
+        is passed along to ``scan_file()``.  If ``scan_result`` is passed in,
+        it should be what ``scan_file()`` returned for our file (from a
+        worker process, say), and our file won't be read again.
+
         Returns ``None`` if there is an error in updating the object, or
         a tuple containing:
            1. ``artist_full``, the "new" full artist name as a string, taken from tags
@@ -911,9 +1168,18 @@ class Song(models.Model):
            3. Ourself - a bit silly, but enables us to take some syntax shortcuts
         """
 
-        song_info = Song.from_filename(
-            self.full_filename(), self.filename, retlines
-        )
+        if scan_result is None:
+            scan_result = Song.scan_file(
+                self.full_filename(), self.filename, full_checksum=full_checksum
+            )
+        (scan_retlines, song_info) = scan_result
+        retlines.extend(scan_retlines)
+        if song_info is not None and song_info[6] is not None:
+            if new_checksums is None:
+                FileChecksum.store([(song_info[6], song_info[5]['sha256sum'])])
+            else:
+                new_checksums.append((song_info[6], song_info[5]['sha256sum']))
+        song_info = Song.from_song_info(song_info)
         if song_info is None:
             return None
 
@@ -933,7 +1199,11 @@ class Song(models.Model):
         self.length = new_song.length
         self.filetype = new_song.filetype
         self.time_updated = new_song.time_updated
+        self.mtime_ns = new_song.mtime_ns
+        self.device = new_song.device
+        self.inode = new_song.inode
         self.sha256sum = new_song.sha256sum
+        self.fingerprint = new_song.fingerprint
 
         # Now return the artist and album we got from the new tags.
         return (artist_full, group, conductor, composer, album, self)
@@ -941,11 +1211,21 @@ class Song(models.Model):
     def get_download_url(self):
         """
         Returns a URL direct to this track for downloading, based on
-        our prefs.
+        our prefs.  If ``exordium__stream_tracks`` is set, this is our own
+        ``SongStreamView`` (a URL relative to this server), and otherwise
+        it's underneath ``exordium__media_url``.
         """
         App.ensure_prefs()
+        if App.prefs['exordium__stream_tracks']:
+            return reverse('exordium:songstream', args=(self.pk,))
         return '%s/%s' % (App.prefs['exordium__media_url'], self.filename)
 
+    def get_mime_type(self):
+        """
+        Returns the MIME type to serve our file as.
+        """
+        return Song.filetype_to_mime.get(self.filetype, 'application/octet-stream')
+
     def set_album_secondary_artist_counts(self, num_groups=0, num_conductors=0, num_composers=0):
         """
         This function is stupid, and just in support of showing tracklists
@@ -972,6 +1252,26 @@ class Song(models.Model):
                 hash_sha256.update(chunk)
         return hash_sha256.hexdigest()
 
+    @staticmethod
+    def get_fingerprint(filename):
+        """
+        Given a filename, return a quick "fingerprint" for it: a sha256sum of
+        the file's size plus the first and last ``fingerprint_sample_size``
+        bytes of the file.  This is nowhere near as thorough as a full
+        checksum, but it only has to read a fraction of the file, and is
+        plenty good enough to tell whether a file is the same one we saw
+        earlier.
+        """
+        hash_sha256 = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            hash_sha256.update(str(size).encode('ascii'))
+            hash_sha256.update(f.read(Song.fingerprint_sample_size))
+            if size > Song.fingerprint_sample_size:
+                f.seek(max(size - Song.fingerprint_sample_size, Song.fingerprint_sample_size))
+                hash_sha256.update(f.read(Song.fingerprint_sample_size))
+        return hash_sha256.hexdigest()
+
     @staticmethod
     def from_filename(full_filename, short_filename, retlines=[], sha256sum=None):
         """
@@ -1000,6 +1300,48 @@ class Song(models.Model):
         If you call this method like ``(a, b, c) = Song.from_filename()``, you'll
         probably want to catch a ``TypeError`` to catch the ``None`` possibility.
         """
+        (scan_retlines, song_info) = Song.scan_file(full_filename,
+            short_filename, sha256sum=sha256sum)
+        retlines.extend(scan_retlines)
+        return Song.from_song_info(song_info)
+
+    @staticmethod
+    def from_song_info(song_info):
+        """
+        Takes the ``song_info`` tuple returned by ``scan_file()`` and turns it
+        into the tuple that ``from_filename()`` returns, creating the new
+        (unsaved) ``Song`` object along the way.  Returns ``None`` if
+        ``song_info`` is ``None``.
+        """
+        if song_info is None:
+            return None
+        (artist_full, group, conductor, composer, album, song_fields, file_key) = song_info
+        song_obj = Song(time_added=timezone.now(), **song_fields)
+        return (artist_full, group, conductor, composer, album, song_obj)
+
+    @staticmethod
+    def scan_file(full_filename, short_filename, sha256sum=None, full_checksum=True):
+        """
+        Does the actual work for ``from_filename()``: reads the tags and
+        technical information from the given file and computes a checksum
+        if ``sha256sum`` isn't passed in.  If ``full_checksum`` is ``False``,
+        only our fingerprint is computed, and ``sha256sum`` is left blank
+        (if not passed in) to be filled in later.  This never touches the database,
+        and everything passed in or returned is a plain picklable value,
+        so it's safe to call from a worker process (see ``App.pool_map()``).
+
+        Returns a tuple containing:
+           1. A list of status lines, in the same ``(status, text)`` format
+              that ``from_filename()`` adds to its ``retlines``.
+           2. ``None`` if there is an error reading the file, or a tuple
+              containing ``artist_full``, ``group``, ``conductor``, ``composer``,
+              ``album`` (as described in ``from_filename()``), a dict of
+              field values for the new ``Song`` object, and finally the
+              ``FileChecksum`` key for the file if we computed its checksum
+              (``None`` otherwise, or if the file changed while we read it).
+        """
+
+        retlines = []
 
         # Set up some vars
         raw_artist = ''
@@ -1026,7 +1368,7 @@ class Song(models.Model):
             retlines.append((App.STATUS_DEBUG,
                 'Audio file is not readable: %s' % (
                     short_filename)))
-            return None
+            return (retlines, None)
 
         # Load the audio file into Mutagen
         audio = mutagen.File(full_filename)
@@ -1172,7 +1514,7 @@ class Song(models.Model):
             retlines.append((App.STATUS_ERROR,
                 'ERROR: audio type of %s not yet understood: %s' % (
                     short_filename, type(audio))))
-            return None
+            return (retlines, None)
 
         # Some data validation here.  We can have a song without an album,
         # but we won't allow one which doesn't have an artist or title.
@@ -1180,12 +1522,12 @@ class Song(models.Model):
             retlines.append((App.STATUS_ERROR,
                 'ERROR: Artist name not found, from audio file %s' % (
                     short_filename)))
-            return None
+            return (retlines, None)
         if title == '':
             retlines.append((App.STATUS_ERROR,
                 'ERROR: Title not found, from audio file %s' % (
                     short_filename)))
-            return None
+            return (retlines, None)
 
         # A bit of data validation here - "Various" is a protected
         # special artist name, unfortunately.  Hope I never get into a
@@ -1194,142 +1536,746 @@ class Song(models.Model):
             retlines.append((App.STATUS_ERROR,
                 'ERROR: Artist name "Various" is reserved, from audio file %s' % (
                     short_filename)))
-            return None
+            return (retlines, None)
 
         # Get some data independent of file type
         stat_result = os.stat(full_filename)
         #file_mtime = datetime.datetime.fromtimestamp(stat_result.st_mtime)
         file_mtime = stat_result.st_mtime
         file_size = stat_result.st_size
+        file_key = None
+        fingerprint = Song.get_fingerprint(full_filename)
         if sha256sum is None:
-            sha256sum = Song.get_sha256sum(full_filename)
-
-        # Create the object
-        song_obj = Song(
-            filename = short_filename,
-            raw_artist = raw_artist,
-            raw_group = raw_group,
-            raw_conductor = raw_conductor,
-            raw_composer = raw_composer,
-            year = year,
-            title = title,
-            normtitle = App.norm_name(title),
-            tracknum = tracknum,
-            bitrate = bitrate,
-            mode = mode,
-            size = file_size,
-            length = length,
-            filetype = filetype,
-            time_added = timezone.now(),
-            time_updated = file_mtime,
-            sha256sum = sha256sum,
-        )
+            if full_checksum:
+                (sha256sum, file_key) = FileChecksum.compute(full_filename)
+            else:
+                sha256sum = ''
+
+        # Collect the field values for the object
+        song_fields = {
+            'filename': short_filename,
+            'raw_artist': raw_artist,
+            'raw_group': raw_group,
+            'raw_conductor': raw_conductor,
+            'raw_composer': raw_composer,
+            'year': year,
+            'title': title,
+            'normtitle': App.norm_name(title),
+            'tracknum': tracknum,
+            'bitrate': bitrate,
+            'mode': mode,
+            'size': file_size,
+            'length': length,
+            'filetype': filetype,
+            'time_updated': file_mtime,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'device': FileChecksum.to_signed(stat_result.st_dev),
+            'inode': FileChecksum.to_signed(stat_result.st_ino),
+            'sha256sum': sha256sum,
+            'fingerprint': fingerprint,
+        }
 
         # Return
-        return (artist_full, group, conductor, composer, album, song_obj)
+        return (retlines, (artist_full, group, conductor, composer, album, song_fields, file_key))
 
-class App(object):
+class FileChecksum(models.Model):
     """
-    Mostly just a collection of static methods used to do various things
-    in Exordium (adds/updates/etc).
+    A cache of file checksums, so that we don't have to re-read files whose
+    contents can't have changed.  Entries are keyed on the file's identity
+    on disk (its device and inode numbers) rather than its path, so they
+    survive files being moved around, and they live in their own table, so
+    they survive the library being cleared out and re-added.  An entry is
+    only trusted if the file's size and nanosecond mtime also still match.
+
+    This is a table rather than a file on disk because, as with ``AlbumArt``,
+    I'd rather not need Django to have write access anywhere on the
+    filesystem.
     """
 
-    STATUS_DEBUG = 'debug'
-    STATUS_INFO = 'info'
-    STATUS_ERROR = 'error'
-    STATUS_SUCCESS = 'success'
+    device = models.BigIntegerField()
+    inode = models.BigIntegerField()
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    sha256sum = models.CharField(max_length=64)
 
-    prefs = None
+    # How many entries to replace per query in ``store()``
+    store_batch_size = 100
 
-    prefixre = re.compile('^((the)\s+)?(.+)$', re.IGNORECASE)
-    livere = re.compile('^....[-\._]..[-\._].. - live', re.IGNORECASE)
+    class Meta:
+        unique_together = (('device', 'inode'),)
 
-    norm_translation = str.maketrans('äáàâãåëéèêẽïíìîĩöóòôõøüúùûũůÿýỳŷỹðçřğş“”‘’', 'aaaaaaeeeeeiiiiioooooouuuuuuyyyyydcrgs""\'\'')
-    norm_translation_filename = str.maketrans(
-        'äÄáÁàÀâÂãÃåÅëËéÉèÈêÊẽẼïÏíÍìÌîÎĩĨİöÖóÓòÒôÔõÕøØüÜúÚùÙûÛũŨůŮÿŸýÝỳỲŷŶỹỸðÐçÇřŘğĞşŞ',
-        'aAaAaAaAaAaAeEeEeEeEeEiIiIiIiIiIIoOoOoOoOoOoOuuuUuUuUuUuUyYyYyYyYyYdDcCrRgGsS'
-    )
+    def __str__(self):
+        """
+        Returns a string representation of ourselves
+        """
+        return '%d:%d' % (self.device, self.inode)
 
-    cover_extensions = ['.png', '.jpg', '.gif']
-    image_format_to_mime = {
-        'PNG': ('image/png', 'png'),
-        'JPEG': ('image/jpeg', 'jpg'),
-        'GIF': ('image/gif', 'gif'),
-    }
+    @staticmethod
+    def get_file_key(stat_result):
+        """
+        Returns a tuple of ``(device, inode, size, mtime_ns)`` for the given
+        ``os.stat()`` result.  Device and inode numbers are unsigned 64-bit
+        values on some filesystems, so they're wrapped around to fit in a
+        signed database column.
+        """
+        return (
+            FileChecksum.to_signed(stat_result.st_dev),
+            FileChecksum.to_signed(stat_result.st_ino),
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+        )
 
-    class AlbumZipfileError(Exception):
+    @staticmethod
+    def to_signed(value):
         """
-        Custom exception to indicate that there was a problem zipping
+        Wraps an unsigned 64-bit ``value`` into the signed 64-bit range
         """
+        if value >= 2**63:
+            return value - 2**64
+        return value
 
-        def __init__(self, orig_exception, *args, **kwargs):
-            super(App.AlbumZipfileError, self).__init__(*args, **kwargs)
-            self.orig_exception = orig_exception
+    @staticmethod
+    def compute(full_filename):
+        """
+        Computes the checksum for ``full_filename``.  Returns a tuple of
+        ``(sha256sum, file_key)``, where ``file_key`` is as returned by
+        ``get_file_key()``, or ``None`` if the file changed while we were
+        reading it (in which case the checksum shouldn't be cached).  Doesn't
+        touch the database, so is safe to call from a worker process.
+        """
+        hash_sha256 = hashlib.sha256()
+        with open(full_filename, 'rb') as f:
+            file_key = FileChecksum.get_file_key(os.fstat(f.fileno()))
+            for chunk in iter(lambda: f.read(4096), b''):
+                hash_sha256.update(chunk)
+            if FileChecksum.get_file_key(os.fstat(f.fileno())) != file_key:
+                file_key = None
+        return (hash_sha256.hexdigest(), file_key)
 
-    class AlbumZipfileNotSupported(Exception):
+    @staticmethod
+    def try_compute(full_filename):
         """
-        Custom exception to indicate that we're not set up to deal with
-        zipfile creation
+        As with ``compute()``, but returns ``None`` if the file can't be read,
+        rather than raising an exception.
         """
+        try:
+            return FileChecksum.compute(full_filename)
+        except OSError:
+            return None
 
-    class AlbumZipfileAlreadyExists(Exception):
+    @staticmethod
+    def load(keys=None):
         """
-        Custom exception to indicate that an attempted zipfile creation
-        has already taken place.
+        Returns the cache as a dict mapping ``(device, inode)`` to a tuple of
+        ``(size, mtime_ns, sha256sum)``, suitable for passing to ``lookup()``.
+        If ``keys`` is passed in (as a list of keys as returned by
+        ``get_file_key()``), only the entries for those files are loaded,
+        rather than the whole table.
         """
+        if keys is None:
+            querysets = [FileChecksum.objects.all()]
+        else:
+            by_device = {}
+            for (device, inode, size, mtime_ns) in keys:
+                if device not in by_device:
+                    by_device[device] = set()
+                by_device[device].add(inode)
+            querysets = []
+            for (device, inodes) in by_device.items():
+                inodes = sorted(inodes)
+                for idx in range(0, len(inodes), App.query_chunk_size):
+                    querysets.append(FileChecksum.objects.filter(device=device,
+                        inode__in=inodes[idx:idx+App.query_chunk_size]))
+        cache = {}
+        for queryset in querysets:
+            for (device, inode, size, mtime_ns, sha256sum) in queryset.values_list(
+                    'device', 'inode', 'size', 'mtime_ns', 'sha256sum'):
+                cache[(device, inode)] = (size, mtime_ns, sha256sum)
+        return cache
 
-        def __init__(self, filename, timestamp, *args, **kwargs):
-            super(App.AlbumZipfileAlreadyExists, self).__init__(*args, **kwargs)
-            self.filename = filename
-            self.timestamp = timestamp
+    @staticmethod
+    def lookup(cache, full_filename):
+        """
+        Returns the cached checksum for ``full_filename`` from ``cache`` (as
+        returned by ``load()``), or ``None`` if we don't have a valid one.
+        Doesn't touch the database.
+        """
+        try:
+            file_key = FileChecksum.get_file_key(os.stat(full_filename))
+        except OSError:
+            return None
+        return FileChecksum.lookup_key(cache, file_key)
 
     @staticmethod
-    def norm_name(name):
+    def lookup_key(cache, file_key):
         """
-        Returns a name which can be used to compare against other
-        names, disregarding case and special characters like umlauts.
-        and the like.
+        As with ``lookup()``, but for a file whose key (as returned by
+        ``get_file_key()``) is already known, so we don't need to look at
+        the file at all.
+        """
+        (device, inode, size, mtime_ns) = file_key
+        entry = cache.get((device, inode))
+        if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2]
+        return None
 
-        This process used to do a few things which aren't done anymore.
-        We used to use ``unicodedata.normalize('NFKD', name)`` in here
-        but was running into problems such as the following:
+    @staticmethod
+    def store(entries):
+        """
+        Stores a list of ``(file_key, sha256sum)`` tuples in the cache,
+        replacing any existing entries for the same files.
+        """
+        checksums = {}
+        for ((device, inode, size, mtime_ns), sha256sum) in entries:
+            checksums[(device, inode)] = FileChecksum(device=device, inode=inode,
+                size=size, mtime_ns=mtime_ns, sha256sum=sha256sum)
+        checksums = list(checksums.values())
+        with transaction.atomic():
+            for idx in range(0, len(checksums), FileChecksum.store_batch_size):
+                batch = checksums[idx:idx+FileChecksum.store_batch_size]
+                q = Q()
+                for checksum in batch:
+                    q |= Q(device=checksum.device, inode=checksum.inode)
+                FileChecksum.objects.filter(q).delete()
+                FileChecksum.objects.bulk_create(batch)
+
+class ZipChecksum(models.Model):
+    """
+    A cache of the CRC-32 checksums which zipfiles need for each file they
+    contain, keyed on the file's SHA256 checksum.  Zipfiles store each
+    file's CRC after its data, and all of them again at the end, so without
+    these we'd have to read every track in an album before being able to
+    send the end of its zipfile (when resuming an interrupted download,
+    for instance).
+    """
 
-            >>> len('umläut')
-            6
-            >>> len(unicodedata.normalize('NFKD', 'umläut'))
-            7
+    sha256sum = models.CharField(max_length=64, unique=True)
+    crc32 = models.BigIntegerField()
 
-        ... since the normalized form would technically be taking
-        two characters to combine the umlauts.  In the end I 
-        figured it just wasn't worth it.
+    def __str__(self):
+        """
+        Returns a string representation of ourselves
+        """
+        return '%s:%08x' % (self.sha256sum, self.crc32)
 
-        Then, after doing some initial manual translations, the final
-        step used to be to convert to plain ASCII - if we ended up
-        losing any string length due to that conversion, we'd
-        assume that we don't know enough to safely denormalize it
-        and just return the original string again.  In the end I opted
-        not to do that either, since we'd then have some warring data
-        types with explicitly-encoded strings and the like.
+    @staticmethod
+    def load(sha256sums):
+        """
+        Returns a dict mapping each of ``sha256sums`` which we have a CRC
+        for to that CRC.
+        """
+        crcs = {}
+        sha256sums = list(set(sha256sums))
+        for idx in range(0, len(sha256sums), App.query_chunk_size):
+            for (sha256sum, crc32) in ZipChecksum.objects.filter(
+                    sha256sum__in=sha256sums[idx:idx+App.query_chunk_size]).values_list(
+                    'sha256sum', 'crc32'):
+                crcs[sha256sum] = crc32
+        return crcs
 
-        Note that if this method doesn't include some characters which
-        are considered identical in your database's current collation
-        settings, you can end up with IntegrityErrors when trying to
-        insert new records, even if this method doesn't equate the two
-        values.
+    @staticmethod
+    def store_members(members):
         """
-        # TODO: Translations and replacements could use some expansion
+        Stores the CRCs for any of ``members`` (a list of ``ZipMember``
+        objects) which have both a CRC and a SHA256 checksum, and which we
+        don't already have.
+        """
+        crcs = {}
+        for member in members:
+            if member.sha256sum and member.crc is not None:
+                crcs[member.sha256sum] = member.crc
+        existing = ZipChecksum.load(crcs.keys())
+        try:
+            with transaction.atomic():
+                ZipChecksum.objects.bulk_create([ZipChecksum(sha256sum=sha256sum, crc32=crc32)
+                    for (sha256sum, crc32) in sorted(crcs.items()) if sha256sum not in existing])
+        except IntegrityError:  # pragma: no cover
+            # Another download stored some of these at the same time; we'll
+            # just pick them up next time.
+            pass
 
-        # We do an initial replacement on "İ", before calling .lower(),
-        # because calling .lower() on that character ends up resulting in
-        # a "regular" lowercase "i" plus a combining upper dot character
-        # (COMBINING DOT ABOVE, or U+0307).  There's no "single" char which
-        # can represent it, since it's visually indistinguishable from a
-        # regular lowercase i.  So it'll never get hit by our norm_translation
-        # stuff, and ends up looking a bit weird regardless.  Anyway, we'll
-        # just special-case getting rid of it before anything else.
+    @staticmethod
+    def fill(stream, ranges=None):
+        """
+        Computes any CRCs which ``stream`` (a ``ZipStream``) is missing,
+        reading those files in full, and stores them for next time.
+        Afterwards, any range of ``stream`` can be generated.  If
+        ``ranges`` is given, only the CRCs which those ranges need up front
+        are computed (see ``ZipStream.get_missing_crcs()``).
+        """
+        missing = stream.get_missing_crcs(ranges)
+        for member in missing:
+            stream.compute_crc(member)
+        if missing:
+            ZipChecksum.store_members(missing)
 
-        return name.replace('İ', 'I').lower().translate(App.norm_translation).replace(
-            'æ', 'ae').replace('ß', 'ss').replace('þ', 'th').replace(
+class DirectorySnapshot(models.Model):
+    """
+    A snapshot of a directory in the library as of the last update: the
+    directory's own mtime, how many entries it had, and a fingerprint of the
+    names of all its entries, along with the sizes and mtimes of the media
+    files in it.  If all of those still match, nothing in the directory
+    itself can have changed, so updates can skip over its songs entirely
+    (subdirectories have snapshots of their own).
+    """
+
+    path = models.CharField(max_length=4096)
+    mtime_ns = models.BigIntegerField()
+    entries = models.IntegerField()
+    fingerprint = models.CharField(max_length=64)
+
+    # How many snapshots to replace per query in ``store()``
+    store_batch_size = 500
+
+    def __str__(self):
+        """
+        Returns a string representation of ourselves
+        """
+        return self.path
+
+    @staticmethod
+    def compute(dir_stat, entries, media):
+        """
+        Returns a snapshot tuple of ``(mtime_ns, entries, fingerprint)`` for
+        a directory, given its ``os.stat()`` result, a list of ``(name, is_dir)``
+        tuples for everything in it, and a list of ``MediaFile`` objects for
+        the media files in it.
+        """
+        media_stats = {}
+        for media_file in media:
+            media_stats[os.path.basename(media_file.filename)] = (media_file.size, media_file.mtime_ns)
+        hash_sha256 = hashlib.sha256()
+        for (name, is_dir) in sorted(entries):
+            if is_dir:
+                line = '%s/\n' % (name)
+            elif name in media_stats:
+                line = '%s\0%d\0%d\n' % (name, media_stats[name][0], media_stats[name][1])
+            else:
+                line = '%s\n' % (name)
+            hash_sha256.update(os.fsencode(line))
+        return (dir_stat.st_mtime_ns, len(entries), hash_sha256.hexdigest())
+
+    @staticmethod
+    def load(scope=''):
+        """
+        Returns a dict mapping directory paths to tuples of ``(pk, snapshot)``
+        for all our snapshots inside the (normalized) library subdirectory
+        ``scope``, including ``scope`` itself.
+        """
+        snapshots = DirectorySnapshot.objects.all()
+        if scope != '':
+            snapshots = snapshots.filter(Q(path=scope) | Q(path__startswith='%s/' % (scope)))
+        loaded = {}
+        for (pk, path, mtime_ns, entries, fingerprint) in snapshots.values_list(
+                'pk', 'path', 'mtime_ns', 'entries', 'fingerprint'):
+            if path == scope or App.in_scope(path, scope):
+                loaded[path] = (pk, (mtime_ns, entries, fingerprint))
+        return loaded
+
+    @staticmethod
+    def store(snapshots, delete_pks):
+        """
+        Deletes the snapshots whose primary keys are in ``delete_pks``, and then
+        stores ``snapshots``, a dict mapping directory paths to snapshot tuples
+        (as returned by ``compute()``).  Any snapshots being replaced should be
+        included in ``delete_pks``.
+        """
+        delete_pks = list(delete_pks)
+        new_snapshots = [DirectorySnapshot(path=path, mtime_ns=mtime_ns,
+                entries=entries, fingerprint=fingerprint)
+            for (path, (mtime_ns, entries, fingerprint)) in snapshots.items()]
+        with transaction.atomic():
+            for idx in range(0, len(delete_pks), DirectorySnapshot.store_batch_size):
+                DirectorySnapshot.objects.filter(
+                    pk__in=delete_pks[idx:idx+DirectorySnapshot.store_batch_size]).delete()
+            DirectorySnapshot.objects.bulk_create(new_snapshots,
+                batch_size=DirectorySnapshot.store_batch_size)
+
+class ImportCheckpoint(models.Model):
+    """
+    A journal entry for an ``App.add()`` which is in progress.  It's updated
+    as each directory is committed to the database, and removed once the
+    add finishes, so if one is still around when an add starts, the
+    previous add for that library subdirectory (``scope``) never finished,
+    and we'll pick up where it left off.
+    """
+
+    scope = models.CharField(max_length=4096, blank=True, default='')
+    started = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(default=timezone.now)
+    last_dir = models.CharField(max_length=4096, blank=True, default='')
+    dirs_done = models.IntegerField(default=0)
+    songs_added = models.IntegerField(default=0)
+
+    def __str__(self):
+        """
+        Returns a string representation of ourselves
+        """
+        if self.scope == '':
+            return 'Import started %s' % (self.started)
+        else:
+            return 'Import of %s started %s' % (self.scope, self.started)
+
+    def record(self, last_dir, dirs_done, songs_added):
+        """
+        Records that ``dirs_done`` more directories (the last of which was
+        ``last_dir``) have been committed, adding ``songs_added`` songs.
+        Two adds of the same scope running at once will share a checkpoint,
+        so the counts are incremented in the database rather than saved
+        from here, and if the other add has already finished and removed
+        it, there's nothing left to record and we return ``False``.
+        """
+        self.last_dir = last_dir
+        self.dirs_done += dirs_done
+        self.songs_added += songs_added
+        self.updated = timezone.now()
+        return ImportCheckpoint.objects.filter(pk=self.pk).update(last_dir=last_dir,
+            dirs_done=F('dirs_done') + dirs_done, songs_added=F('songs_added') + songs_added,
+            updated=self.updated) > 0
+
+class MediaFile(collections.namedtuple('MediaFile',
+        ['filename', 'device', 'inode', 'size', 'mtime_ns'])):
+    """
+    A media file found by ``App.walk_media_dirs()``, along with the stat
+    information we collected for it during the walk.  ``filename`` is
+    relative to the library base path, and ``device`` and ``inode`` are
+    wrapped to fit in the database as with ``FileChecksum.get_file_key()``.
+    """
+
+    __slots__ = ()
+
+    @staticmethod
+    def from_stat(filename, stat_result):
+        """
+        Creates a new ``MediaFile`` for ``filename`` from an ``os.stat()`` result
+        """
+        return MediaFile(filename, *FileChecksum.get_file_key(stat_result))
+
+    def file_key(self):
+        """
+        Returns our key for the ``FileChecksum`` cache
+        """
+        return (self.device, self.inode, self.size, self.mtime_ns)
+
+class ImportPipeline(object):
+    """
+    Streams files through the stages of an import, so that disk I/O, CPU
+    and database work can all happen at the same time:
+
+    1. A walker thread, which iterates over ``batches`` (which will generally
+       be walking the filesystem).
+    2. A scanner thread, which reads tags and computes checksums (possibly
+       farming the work out to worker processes via ``App.pool_map()``).
+       Any worker processes are started from the iterating thread before
+       either of our threads are, so that they're never forked from a
+       process with our threads running.
+    3. Whatever is iterating over this object, which should be the only
+       thing writing to the database.
+
+    The stages are joined by bounded queues, so a fast walker can't get too
+    far ahead of the scanner, and the scanner can't get too far ahead of
+    the database.  Neither of our threads touch the database (or our
+    preferences, which live in the database), so ``base_path`` has to be
+    passed in.
+
+    ``batches`` should yield one tuple of ``(base_dir, to_add, retlines)`` per
+    directory, where ``to_add`` is a list of ``(short_filename, sha256sum)``
+    tuples as passed to ``App.add()``, and ``retlines`` is a list of status
+    lines to pass along.  Iterating over the pipeline yields, in the same
+    order, a tuple of ``(base_dir, retlines, results)`` per directory, where
+    ``results`` is a list of ``(short_filename, sha256sum, song_info)`` tuples,
+    ``sha256sum`` being the value passed in (or found in ``checksum_cache``)
+    and ``song_info`` coming from ``Song.scan_file()``.  Status lines from
+    scanning are appended to ``retlines``.
+
+    ``checksum_cache``, if passed in, is a dict as returned by
+    ``FileChecksum.load()``, which the scanner thread will check before
+    computing any checksums.  ``full_checksums`` is passed along to
+    ``Song.scan_file()``.
+
+    Any exception raised in one of the threads will be re-raised from the
+    iterating thread.  If iteration is abandoned partway through, the
+    threads will be shut down.
+    """
+
+    # How many directories can be waiting in each of our queues
+    queue_size = 16
+
+    # How often (in seconds) our threads check to see if they've been
+    # told to stop, while waiting on a queue
+    poll_interval = 0.2
+
+    # Marks the end of a queue
+    done = object()
+
+    def __init__(self, batches, base_path, jobs=1, checksum_cache=None,
+            full_checksums=True):
+        self.batches = batches
+        self.base_path = base_path
+        self.jobs = jobs
+        self.checksum_cache = checksum_cache
+        self.full_checksums = full_checksums
+        self.walk_queue = queue.Queue(maxsize=self.queue_size)
+        self.result_queue = queue.Queue(maxsize=self.queue_size)
+        self.stop_event = threading.Event()
+        self.pool = None
+        self.error = None
+
+    def put(self, q, item):
+        """
+        Puts ``item`` on the queue ``q``, waiting for space if needed.  Returns
+        ``False`` if we've been told to stop before the item could be queued.
+        """
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, q):
+        """
+        Gets an item from the queue ``q``, waiting for one if needed.  Returns
+        our ``done`` marker if we've been told to stop in the meantime.
+        """
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+        return self.done
+
+    def walk(self):
+        """
+        The walker stage
+        """
+        try:
+            for (base_dir, to_add, retlines) in self.batches:
+                if len(to_add) > 0:
+                    if not self.put(self.walk_queue, (base_dir, to_add, retlines)):
+                        return
+        except Exception as e:
+            self.error = e
+        finally:
+            self.put(self.walk_queue, self.done)
+
+    def scan_args(self, pending_dirs):
+        """
+        Generator which pulls directories off our walk queue and yields the
+        arguments to ``Song.scan_file()`` for each of the files in them.
+        Directories are added to ``pending_dirs`` as they're pulled off the
+        queue, so that results can be matched back up with them, with any
+        checksums found in our checksum cache filled in.
+        """
+        while True:
+            batch = self.get(self.walk_queue)
+            if batch is self.done:
+                return
+            (base_dir, to_add, retlines) = batch
+            scan_args = []
+            for (short_filename, sha256sum) in to_add:
+                full_filename = os.path.join(self.base_path, short_filename)
+                if sha256sum is None and self.checksum_cache:
+                    sha256sum = FileChecksum.lookup(self.checksum_cache, full_filename)
+                scan_args.append((full_filename, short_filename, sha256sum,
+                    self.full_checksums))
+            pending_dirs.append((base_dir, [args[1:3] for args in scan_args], retlines))
+            for args in scan_args:
+                yield args
+
+    def scan(self):
+        """
+        The scanner stage
+        """
+        try:
+            pending_dirs = collections.deque()
+            results = []
+            for (scan_retlines, song_info) in App.pool_map(Song.scan_file,
+                    self.scan_args(pending_dirs), jobs=self.jobs, pool=self.pool):
+                (base_dir, to_add, retlines) = pending_dirs[0]
+                (short_filename, sha256sum) = to_add[len(results)]
+                retlines.extend(scan_retlines)
+                results.append((short_filename, sha256sum, song_info))
+                if len(results) == len(to_add):
+                    pending_dirs.popleft()
+                    if not self.put(self.result_queue, (base_dir, retlines, results)):
+                        return
+                    results = []
+        except Exception as e:
+            self.error = e
+        finally:
+            self.put(self.result_queue, self.done)
+
+    def __iter__(self):
+        """
+        Starts up our worker processes (if any) and threads, and yields
+        results as they come in.
+        """
+        if self.jobs > 1:
+            self.pool = App.get_pool(self.jobs)
+        threads = [
+            threading.Thread(target=self.walk, name='exordium-walker', daemon=True),
+            threading.Thread(target=self.scan, name='exordium-scanner', daemon=True),
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            while True:
+                result = self.get(self.result_queue)
+                if result is self.done:
+                    break
+                yield result
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                if thread.is_alive():
+                    thread.join()
+            # The scanner is done waiting on the pool by now, so it's safe
+            # to shut it down.
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+                self.pool = None
+        if self.error is not None:
+            raise self.error
+
+class App(object):
+    """
+    Mostly just a collection of static methods used to do various things
+    in Exordium (adds/updates/etc).
+    """
+
+    STATUS_DEBUG = 'debug'
+    STATUS_INFO = 'info'
+    STATUS_ERROR = 'error'
+    STATUS_SUCCESS = 'success'
+
+    prefs = None
+
+    # How many tasks per worker process that ``pool_map()`` will queue up
+    # ahead of whatever's consuming its results.
+    pool_queue_depth = 4
+
+    # How ``get_pool()`` starts its worker processes ("fork", "spawn" or
+    # "forkserver"; see ``multiprocessing``), or ``None`` for the platform's
+    # default.
+    pool_start_method = None
+
+    # How many values to put in a single ``__in`` query (SQLite can't
+    # handle more than 999 parameters at once)
+    query_chunk_size = 500
+
+    # Related records to load along with songs, when we know we're going
+    # to need them
+    song_related_fields = ['artist', 'group', 'conductor', 'composer',
+        'album', 'album__artist']
+
+    prefixre = re.compile('^((the)\s+)?(.+)$', re.IGNORECASE)
+    livere = re.compile('^....[-\._]..[-\._].. - live', re.IGNORECASE)
+
+    norm_translation = str.maketrans('äáàâãåëéèêẽïíìîĩöóòôõøüúùûũůÿýỳŷỹðçřğş“”‘’', 'aaaaaaeeeeeiiiiioooooouuuuuuyyyyydcrgs""\'\'')
+    norm_translation_filename = str.maketrans(
+        'äÄáÁàÀâÂãÃåÅëËéÉèÈêÊẽẼïÏíÍìÌîÎĩĨİöÖóÓòÒôÔõÕøØüÜúÚùÙûÛũŨůŮÿŸýÝỳỲŷŶỹỸðÐçÇřŘğĞşŞ',
+        'aAaAaAaAaAaAeEeEeEeEeEiIiIiIiIiIIoOoOoOoOoOoOuuuUuUuUuUuUyYyYyYyYyYdDcCrRgGsS'
+    )
+
+    cover_extensions = ['.png', '.jpg', '.gif']
+    image_format_to_mime = {
+        'PNG': ('image/png', 'png'),
+        'JPEG': ('image/jpeg', 'jpg'),
+        'GIF': ('image/gif', 'gif'),
+    }
+
+    class AlbumZipfileError(Exception):
+        """
+        Custom exception to indicate that there was a problem zipping
+        """
+
+        def __init__(self, orig_exception, *args, **kwargs):
+            super(App.AlbumZipfileError, self).__init__(*args, **kwargs)
+            self.orig_exception = orig_exception
+
+    class AlbumZipfileNotSupported(Exception):
+        """
+        Custom exception to indicate that we're not set up to deal with
+        zipfile creation
+        """
+
+    class AlbumZipfileAlreadyExists(Exception):
+        """
+        Custom exception to indicate that an attempted zipfile creation
+        has already taken place.
+        """
+
+        def __init__(self, filename, timestamp, *args, **kwargs):
+            super(App.AlbumZipfileAlreadyExists, self).__init__(*args, **kwargs)
+            self.filename = filename
+            self.timestamp = timestamp
+
+    class AlbumZipfileInProgress(Exception):
+        """
+        Custom exception to indicate that a zipfile is still being built
+        in the background.
+        """
+
+        def __init__(self, filename, *args, **kwargs):
+            super(App.AlbumZipfileInProgress, self).__init__(*args, **kwargs)
+            self.filename = filename
+
+    class InvalidScope(Exception):
+        """
+        Custom exception to indicate that a library subdirectory passed in
+        to ``add()`` or ``update()`` can't be used.
+        """
+
+    @staticmethod
+    def norm_name(name):
+        """
+        Returns a name which can be used to compare against other
+        names, disregarding case and special characters like umlauts.
+        and the like.
+
+        This process used to do a few things which aren't done anymore.
+        We used to use ``unicodedata.normalize('NFKD', name)`` in here
+        but was running into problems such as the following:
+
+            >>> len('umläut')
+            6
+            >>> len(unicodedata.normalize('NFKD', 'umläut'))
+            7
+
+        ... since the normalized form would technically be taking
+        two characters to combine the umlauts.  In the end I 
+        figured it just wasn't worth it.
+
+        Then, after doing some initial manual translations, the final
+        step used to be to convert to plain ASCII - if we ended up
+        losing any string length due to that conversion, we'd
+        assume that we don't know enough to safely denormalize it
+        and just return the original string again.  In the end I opted
+        not to do that either, since we'd then have some warring data
+        types with explicitly-encoded strings and the like.
+
+        Note that if this method doesn't include some characters which
+        are considered identical in your database's current collation
+        settings, you can end up with IntegrityErrors when trying to
+        insert new records, even if this method doesn't equate the two
+        values.
+        """
+        # TODO: Translations and replacements could use some expansion
+
+        # We do an initial replacement on "İ", before calling .lower(),
+        # because calling .lower() on that character ends up resulting in
+        # a "regular" lowercase "i" plus a combining upper dot character
+        # (COMBINING DOT ABOVE, or U+0307).  There's no "single" char which
+        # can represent it, since it's visually indistinguishable from a
+        # regular lowercase i.  So it'll never get hit by our norm_translation
+        # stuff, and ends up looking a bit weird regardless.  Anyway, we'll
+        # just special-case getting rid of it before anything else.
+
+        return name.replace('İ', 'I').lower().translate(App.norm_translation).replace(
+            'æ', 'ae').replace('ß', 'ss').replace('þ', 'th').replace(
             'œ', 'oe').replace('&', 'and')
 
         #lower = name.lower()
@@ -1341,6 +2287,21 @@ class App(object):
         #else:
         #    return final
 
+    @staticmethod
+    def get_size_str(sz_bytes):
+        """
+        Returns a human-readable version of the size ``sz_bytes``.
+        Taken from http://stackoverflow.com/questions/14996453/python-libraries-to-calculate-human-readable-filesize-from-bytes
+        """
+        suffixes = ['B', 'KB', 'MB', 'GB']
+        if sz_bytes is None or sz_bytes == 0:
+            return '0 B'
+        i = 0
+        while sz_bytes >= 1024 and i < len(suffixes)-1:
+            sz_bytes /= 1024
+            i += 1
+        return '%d %s' % (sz_bytes, suffixes[i])
+
     @staticmethod
     def norm_filename(name):
         """
@@ -1369,10 +2330,12 @@ class App(object):
             App.prefs = global_preferences_registry.manager()
 
     @staticmethod
-    def get_filesystem_media(extra_base=None):
+    def get_filesystem_media(extra_base=None, skip_unchanged=False):
         """
         Returns a list of all media found on the filesystem.  Optionally
-        also only find files within ``extra_base``.
+        also only find files within ``extra_base``.  If ``skip_unchanged``
+        is ``True``, files in directories which haven't changed since their
+        ``DirectorySnapshot`` was taken will be left out.
         """
         App.ensure_prefs()
         base_path = App.prefs['exordium__base_path']
@@ -1381,14 +2344,395 @@ class App(object):
             start_base = base_path
         else:
             start_base = os.path.join(base_path, extra_base)
-        for (dirpath, dirnames, filenames) in os.walk(start_base, followlinks=True):
-            for filename in filenames:
-                filename_lower = filename.lower()
-                if filename_lower[-4:] in ['.mp3', '.ogg', '.m4a']:
-                    short_filename = os.path.join(dirpath, filename)[len(base_path)+1:]
-                    all_files.append(short_filename)
+        if skip_unchanged:
+            snapshots = DirectorySnapshot.load(App.get_scope_base(extra_base, must_exist=False)[0])
+        else:
+            snapshots = {}
+        for (base_dir, media, snapshot) in App.walk_media_dirs(base_path, start_base):
+            if base_dir in snapshots and snapshots[base_dir][1] == snapshot:
+                continue
+            all_files.extend([media_file.filename for media_file in media])
         return all_files
 
+    @staticmethod
+    def get_scope_base(scope, must_exist=True):
+        """
+        Checks a library subdirectory ``scope`` (as passed in to ``add()`` and
+        ``update()``), returning a tuple of ``(scope, start_base)``, where
+        ``scope`` has been normalized (no leading, trailing or doubled slashes)
+        and ``start_base`` is the full path to start walking from.  An empty or
+        ``None`` scope means the whole library.
+
+        Raises ``App.InvalidScope`` if the scope is an absolute path, tries to
+        escape the library with ``..``, or (if ``must_exist`` is ``True``) isn't
+        a directory.
+        """
+        App.ensure_prefs()
+        base_path = App.prefs['exordium__base_path']
+        if scope is None or scope == '':
+            return ('', base_path)
+        if scope.startswith('/'):
+            raise App.InvalidScope('Library subdirectory must be relative to the base path: "%s"' % (scope))
+        parts = [part for part in scope.split('/') if part not in ['', '.']]
+        if '..' in parts:
+            raise App.InvalidScope('Library subdirectory cannot contain "..": "%s"' % (scope))
+        if len(parts) == 0:
+            return ('', base_path)
+        norm_scope = '/'.join(parts)
+        start_base = os.path.join(base_path, norm_scope)
+        if must_exist and not os.path.isdir(start_base):
+            raise App.InvalidScope('Library subdirectory not found: "%s"' % (norm_scope))
+        return (norm_scope, start_base)
+
+    @staticmethod
+    def in_scope(filename, scope):
+        """
+        Returns True if ``filename`` is inside the (normalized) library
+        subdirectory ``scope``.
+        """
+        return scope == '' or filename.startswith('%s/' % (scope))
+
+    @staticmethod
+    def filter_scope(queryset, scope, field='filename'):
+        """
+        Restricts a queryset to records whose ``field`` is inside the
+        (normalized) library subdirectory ``scope``.  Note that on some
+        databases (SQLite, notably) this comparison is case-insensitive, so
+        use ``in_scope()`` on the results if that matters.
+        """
+        if scope == '':
+            return queryset
+        return queryset.filter(**{'%s__startswith' % (field): '%s/' % (scope)})
+
+    @staticmethod
+    def walk_media_dirs(base_path, start_base, sort=False, listings=None):
+        """
+        Generator which walks the filesystem from ``start_base`` (which should
+        be ``base_path`` or a directory inside it), yielding a tuple of
+        ``(base_dir, media, snapshot)`` for each directory found, where ``media``
+        is a list of ``MediaFile`` objects for the media files in that directory,
+        and ``snapshot`` is as returned by ``DirectorySnapshot.compute()``.
+        Paths will be relative to ``base_path``.
+
+        Directories are visited in the same order as ``os.walk()`` would (or,
+        if ``sort`` is ``True``, in order of their names, with files also
+        sorted by name), and symlinks to directories are followed, but any
+        directory we've already seen (by device and inode) is skipped, so
+        symlink loops can't send us around in circles.  Anything we can't
+        read or stat is skipped.
+
+        If ``listings`` is passed in as a dict, it will be filled in with the
+        possible cover images in each directory we walk, keyed on the directory
+        (relative to ``base_path``), as dicts of their filenames and integer
+        mtimes.  ``get_directory_cover_image()`` and ``Album.update_album_art()``
+        can use that instead of having to look at the filesystem again.
+
+        This doesn't look at our preferences, so it's safe to call from
+        outside the main thread.
+        """
+        try:
+            start_stat = os.stat(start_base)
+        except OSError:
+            return
+        visited = set([(start_stat.st_dev, start_stat.st_ino)])
+        to_visit = [(start_base, start_stat)]
+        while len(to_visit) > 0:
+            (dirpath, dir_stat) = to_visit.pop()
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            if sort:
+                entries.sort(key=lambda entry: entry.name)
+            media = []
+            subdirs = []
+            names = []
+            images = {}
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        names.append((entry.name, True))
+                        stat_result = entry.stat()
+                        dir_key = (stat_result.st_dev, stat_result.st_ino)
+                        if dir_key not in visited:
+                            visited.add(dir_key)
+                            subdirs.append((entry.path, stat_result))
+                    else:
+                        names.append((entry.name, False))
+                        if entry.name.lower()[-4:] in ['.mp3', '.ogg', '.m4a']:
+                            media.append(MediaFile.from_stat(
+                                entry.path[len(base_path)+1:], entry.stat()))
+                        elif listings is not None and App.is_cover_filename(entry.name):
+                            images[entry.name] = int(entry.stat().st_mtime)
+                except OSError:
+                    pass
+            if listings is not None:
+                listings[dirpath[len(base_path)+1:]] = images
+            yield (dirpath[len(base_path)+1:], media, DirectorySnapshot.compute(dir_stat, names, media))
+            to_visit.extend(reversed(subdirs))
+
+    @staticmethod
+    def find_new_media(base_path, known_song_paths, start_base=None, listings=None,
+            file_keys=None):
+        """
+        Generator which walks the library (or just ``start_base``, if it's
+        passed in) looking for media files which aren't in ``known_song_paths``,
+        yielding batches suitable for an ``ImportPipeline``: a tuple of
+        ``(base_dir, to_add, retlines)`` for each directory.  ``listings`` is
+        passed along to ``walk_media_dirs()``.  If ``file_keys`` is passed in
+        as a list, the ``FileChecksum`` key of each new file will be added
+        to it.
+        """
+        if start_base is None:
+            start_base = base_path
+        for (base_dir, media, snapshot) in App.walk_media_dirs(base_path, start_base,
+                sort=True, listings=listings):
+            to_add = []
+            retlines = []
+            for media_file in media:
+                short_filename = media_file.filename
+                if short_filename not in known_song_paths:
+                    retlines.append((App.STATUS_DEBUG, 'Found file: %s' % (short_filename)))
+                    to_add.append((short_filename, None))
+                    if file_keys is not None:
+                        file_keys.append(media_file.file_key())
+            yield (base_dir, to_add, retlines)
+
+    @staticmethod
+    def group_by_dir(to_add):
+        """
+        Generator which takes a ``to_add`` list (as passed in to ``add()``) and
+        yields batches suitable for an ``ImportPipeline``: a tuple of
+        ``(base_dir, to_add, retlines)`` for each directory, in the order in
+        which the directories first show up in the list.
+        """
+        dirs = collections.OrderedDict()
+        for (short_filename, sha256sum) in to_add:
+            base_dir = os.path.dirname(short_filename)
+            if base_dir not in dirs:
+                dirs[base_dir] = []
+            dirs[base_dir].append((short_filename, sha256sum))
+        for (base_dir, dir_to_add) in dirs.items():
+            yield (base_dir, dir_to_add, [])
+
+    @staticmethod
+    def get_jobs(jobs=None):
+        """
+        Returns the number of worker processes to use while checksumming
+        and reading tags during ``add()`` and ``update()``.  If ``jobs`` is
+        ``None``, our ``exordium__import_jobs`` preference is used instead.
+        A value less than one means "one process per CPU."
+        """
+        if jobs is None:
+            App.ensure_prefs()
+            jobs = App.prefs['exordium__import_jobs']
+        if jobs < 1:
+            jobs = os.cpu_count() or 1
+        return jobs
+
+    @staticmethod
+    def get_songs_by_filename(filenames):
+        """
+        Returns a dict mapping each of ``filenames`` to its ``Song`` object
+        (with artists and albums already loaded), using as few queries as
+        we can get away with.  Filenames not in the database are left out.
+        """
+        songs = {}
+        for idx in range(0, len(filenames), App.query_chunk_size):
+            for song in Song.objects.filter(
+                    filename__in=filenames[idx:idx+App.query_chunk_size]
+                    ).select_related(*App.song_related_fields):
+                songs[song.filename] = song
+        return songs
+
+    @staticmethod
+    def get_songs_by_pk(pks):
+        """
+        Generator which yields the ``Song`` objects (with artists and albums
+        already loaded) for each of the primary keys in ``pks``, a chunk at
+        a time.
+        """
+        for idx in range(0, len(pks), App.query_chunk_size):
+            for song in Song.objects.filter(
+                    pk__in=pks[idx:idx+App.query_chunk_size]
+                    ).select_related(*App.song_related_fields):
+                yield song
+
+    @staticmethod
+    def save_in_chunks(objects, chunk_size, update_fields=None):
+        """
+        Saves all of ``objects``, ``chunk_size`` at a time, each chunk inside
+        a single transaction.  ``update_fields`` is passed through to
+        ``save()``.
+        """
+        for idx in range(0, len(objects), chunk_size):
+            with transaction.atomic():
+                for obj in objects[idx:idx+chunk_size]:
+                    obj.save(update_fields=update_fields)
+
+    @staticmethod
+    def get_batch_size(batch_size=None):
+        """
+        Returns the number of tracks to write to the database per transaction
+        during ``add()``.  If ``batch_size`` is ``None``, our
+        ``exordium__import_batch_size`` preference is used instead.  Zero
+        (or less) means to write each track individually, as it's processed.
+        """
+        if batch_size is None:
+            App.ensure_prefs()
+            batch_size = App.prefs['exordium__import_batch_size']
+        return max(batch_size, 0)
+
+    @staticmethod
+    def get_defer_checksums(defer_checksums=None):
+        """
+        Returns whether full checksums should be deferred during ``add()``
+        and ``update()``.  If ``defer_checksums`` is ``None``, our
+        ``exordium__defer_checksums`` preference is used instead.
+        """
+        if defer_checksums is None:
+            App.ensure_prefs()
+            defer_checksums = App.prefs['exordium__defer_checksums']
+        return defer_checksums
+
+    @staticmethod
+    def get_quick_scan(quick_scan=None):
+        """
+        Returns whether ``update()`` should skip over directories which
+        haven't changed since their last ``DirectorySnapshot``.  If
+        ``quick_scan`` is ``None``, our ``exordium__quick_scan`` preference
+        is used instead.
+        """
+        if quick_scan is None:
+            App.ensure_prefs()
+            quick_scan = App.prefs['exordium__quick_scan']
+        return quick_scan
+
+    @staticmethod
+    def get_pregenerate_thumbnails(pregenerate=None):
+        """
+        Returns whether ``add()`` and ``update()`` should finish up by
+        generating resized album art with ``generate_thumbnails()``.  If
+        ``pregenerate`` is ``None``, our ``exordium__pregenerate_thumbnails``
+        preference is used instead.
+        """
+        if pregenerate is None:
+            App.ensure_prefs()
+            pregenerate = App.prefs['exordium__pregenerate_thumbnails']
+        return pregenerate
+
+    @staticmethod
+    def get_file_serving():
+        """
+        Returns how files from the library should be sent to clients: one of
+        ``django`` (streamed by Django itself), ``sendfile`` (via an
+        ``X-Sendfile`` header) or ``accel`` (via an ``X-Accel-Redirect``
+        header), based on our ``exordium__file_serving`` preference.  We fall
+        back to ``django`` if ``accel`` is chosen but
+        ``exordium__accel_redirect_prefix`` hasn't been set.
+        """
+        App.ensure_prefs()
+        serving = App.prefs['exordium__file_serving']
+        if serving == 'accel' and App.prefs['exordium__accel_redirect_prefix'] == '':
+            return 'django'
+        return serving
+
+    @staticmethod
+    def get_thumbnail_store(name=None):
+        """
+        Returns the thumbnail store which resized album art should be saved
+        to and loaded from: a ``PackThumbnailStore`` if our
+        ``exordium__thumbnail_storage`` preference (or ``name``, if given) is
+        ``pack`` and ``exordium__thumbnail_pack_path`` is set, or a
+        ``DatabaseThumbnailStore`` otherwise.
+        """
+        App.ensure_prefs()
+        if name is None:
+            name = App.prefs['exordium__thumbnail_storage']
+        pack_path = App.prefs['exordium__thumbnail_pack_path']
+        if name == PackThumbnailStore.name and pack_path != '':
+            return get_pack_store(pack_path)
+        return DatabaseThumbnailStore()
+
+    @staticmethod
+    def batch_dirs(dirs, batch_size):
+        """
+        Generator which groups the ``(base_dir, retlines, results)`` tuples
+        coming out of an ``ImportPipeline`` into lists holding at least
+        ``batch_size`` tracks (directories are never split up).  The final
+        list may be smaller.  If ``batch_size`` is zero, each directory is
+        yielded in a list of its own.
+        """
+        batch = []
+        tracks = 0
+        for item in dirs:
+            batch.append(item)
+            tracks += len(item[2])
+            if tracks >= batch_size:
+                yield batch
+                batch = []
+                tracks = 0
+        if len(batch) > 0:
+            yield batch
+
+    @staticmethod
+    def get_pool(jobs):
+        """
+        Returns a ``multiprocessing.Pool`` of ``jobs`` worker processes, for
+        passing to ``pool_map()``.  All of the workers are started right
+        away, from the calling thread, and each one sets Django up for
+        itself if it wasn't forked from a process which already had (see
+        ``exordium.workers.init_worker()``).  The caller is responsible for
+        shutting the pool down.
+        """
+        context = multiprocessing.get_context(App.pool_start_method)
+        return context.Pool(processes=jobs, initializer=init_worker)
+
+    @staticmethod
+    def pool_map(func, arglist, jobs=1, pool=None):
+        """
+        Generator which calls ``func(*args)`` for each tuple ``args`` in
+        ``arglist``, yielding the results in the same order as ``arglist``.
+        If ``jobs`` is greater than one, the calls will be farmed out to a
+        pool of that many worker processes, so ``func``, its arguments, and
+        its return value all need to be picklable, and ``func`` shouldn't
+        go anywhere near the database.
+
+        ``pool``, if passed in, should be a pool from ``get_pool()`` with
+        ``jobs`` workers, which will be used (and left running) instead of
+        starting up a new one.
+
+        Only ``pool_queue_depth`` tasks per worker are submitted ahead of
+        whatever's consuming our results, so if the generator is abandoned
+        partway through we don't have to wait for the whole library to be
+        processed before the pool shuts down.
+        """
+        if pool is None and jobs <= 1:
+            for args in arglist:
+                yield func(*args)
+            return
+
+        own_pool = pool is None
+        if own_pool:
+            pool = App.get_pool(jobs)
+        pending = collections.deque()
+        finished = False
+        try:
+            for args in arglist:
+                pending.append(pool.apply_async(func, args))
+                if len(pending) >= jobs*App.pool_queue_depth:
+                    yield pending.popleft().get()
+            while len(pending) > 0:
+                yield pending.popleft().get()
+            finished = True
+        finally:
+            if own_pool:
+                if finished:
+                    pool.close()
+                else:
+                    pool.terminate()
+                pool.join()
+
     @staticmethod
     def support_zipfile():
         """
@@ -1405,6 +2749,107 @@ class App(object):
             return False
         return True
 
+    @staticmethod
+    def get_zip_cache():
+        """
+        Returns the ``ZipCache`` for our zipfile directory.
+        """
+        App.ensure_prefs()
+        return ZipCache(App.prefs['exordium__zipfile_path'])
+
+    @staticmethod
+    def get_zip_queue():
+        """
+        Returns the ``ZipBuildQueue`` which builds zipfiles in the
+        background, running as many builds at once as our
+        ``exordium__zipfile_build_jobs`` preference allows.
+        """
+        App.ensure_prefs()
+        return get_zip_queue(max(App.prefs['exordium__zipfile_build_jobs'], 1))
+
+    @staticmethod
+    def get_zipfile_quota(quota=None):
+        """
+        Returns the number of bytes our zipfile directory is allowed to
+        take up before the least-recently-used zipfiles are removed, or 0
+        for no limit.  If ``quota`` (in megabytes) is ``None``, our
+        ``exordium__zipfile_quota`` preference is used instead.
+        """
+        if quota is None:
+            App.ensure_prefs()
+            quota = App.prefs['exordium__zipfile_quota']
+        return max(quota, 0)*1024*1024
+
+    @staticmethod
+    def build_zip(cache, digest, zip_name, stream, quota=0):
+        """
+        Writes ``stream`` out to ``zip_name`` under ``digest`` in ``cache``
+        (a ``ZipCache``), removes any older versions of the same album's
+        zipfile (see ``ZipCache.evict_versions()``), and then
+        trims the zipfile directory down to ``quota`` bytes, if we have one.
+        Returns ``stream``.  This is what ``Album.start_zip()`` runs in the
+        background, so it doesn't touch the database.  Raises
+        ``App.AlbumZipfileAlreadyExists`` if another process built the same
+        zipfile while we were waiting for it, or ``App.AlbumZipfileError``
+        if the zipfile couldn't be written.
+        """
+        with cache.build_lock(digest):
+            zip_filename = cache.find(digest)
+            if zip_filename is not None:
+                timestamp = datetime.datetime.fromtimestamp(os.path.getmtime(cache.get_path(zip_filename)))
+                raise App.AlbumZipfileAlreadyExists(zip_filename, timestamp)
+            try:
+                zip_filename = cache.write(digest, zip_name, stream)
+            except Exception as e:
+                raise App.AlbumZipfileError(e)
+        cache.evict_versions(digest, keep=[zip_filename])
+        if quota > 0:
+            cache.evict(quota, keep=[zip_filename])
+        return stream
+
+    @staticmethod
+    def evict_zipfiles(quota=None, max_age=0):
+        """
+        Removes zipfiles from our zipfile directory to bring it under
+        ``quota`` megabytes (defaulting to our ``exordium__zipfile_quota``
+        preference), least-recently-used first, along with any which
+        haven't been used in ``max_age`` hours.  Zipfiles whose albums have
+        changed since they were built (or which no longer belong to any
+        album) are removed first.  Zipfiles which are still being built
+        aren't touched.
+
+        Yields status lines as we go, as with ``add()``.
+        """
+        if not App.support_zipfile():
+            yield (App.STATUS_ERROR, 'Exordium is not currently configured to allow zipfile creation')
+            return
+        quota = App.get_zipfile_quota(quota)
+        cache = App.get_zip_cache()
+        total = sum([size for (filename, size, last_used) in cache.get_entries()])
+        yield (App.STATUS_DEBUG, 'Zipfile directory currently uses %s' % (App.get_size_str(total)))
+        removed = cache.evict_stale(Album.get_all_zip_digests())
+        for (filename, size) in removed:
+            yield (App.STATUS_INFO, 'Removed out-of-date zipfile %s (%s)' % (filename, App.get_size_str(size)))
+        evicted = cache.evict(quota, max_age*3600)
+        for (filename, size) in evicted:
+            yield (App.STATUS_INFO, 'Removed zipfile %s (%s)' % (filename, App.get_size_str(size)))
+        removed.extend(evicted)
+        cache.clean_locks()
+        yield (App.STATUS_SUCCESS, 'Removed %d zipfile%s, freeing %s' % (len(removed),
+            '' if len(removed) == 1 else 's',
+            App.get_size_str(sum([size for (filename, size) in removed]))))
+
+    @staticmethod
+    def support_zipfile_streaming():
+        """
+        Returns True if album zipfiles should be streamed straight to the
+        browser as they're generated (see ``Album.get_zip_stream()``), via
+        our ``exordium__zipfile_streaming`` preference.  This doesn't need
+        anywhere to write the zipfiles to.
+        """
+        App.ensure_prefs()
+        return App.prefs['exordium__zipfile_streaming']
+
     @staticmethod
     def ensure_various_artists():
         """
@@ -1420,7 +2865,7 @@ class App(object):
             return True
 
     @staticmethod
-    def add(to_add=None):
+    def add(to_add=None, jobs=None, batch_size=None, defer_checksums=None, scope=None):
         """
         Looks through our base_dir for new files we don't know anything
         about yet.  Yields its entire processing status log as a generator,
@@ -1440,9 +2885,50 @@ class App(object):
         ``to_add`` should be a list of tuples, where the first field is the
         filename and the second is either the sha256sum or ``None``, if the
         checksum has not yet been computed.
+
+        ``jobs`` is the number of worker processes to use while computing
+        checksums and reading tags (see ``get_jobs()`` for the default).
+        Results are still processed in order, so the end result is the same
+        regardless of how many processes are used.
+
+        Files are processed a directory at a time through an ``ImportPipeline``,
+        so the filesystem walk, checksumming and database writes all overlap
+        with each other.  Each directory is written to the database as soon
+        as it's been scanned, with directories walked in order of their names.
+
+        While we're adding, progress is journaled in an ``ImportCheckpoint``
+        after each directory (or batch of directories) is committed, and any
+        checksums we compute are stored before the songs are, so if we're
+        interrupted, very little work is lost.  The next add for the same
+        ``scope`` will report that it's resuming the previous one, and will
+        make sure that albums created by the previous add get their album
+        art, which would otherwise only have happened at the very end.
+
+        ``batch_size``, if greater than zero, turns on batched writes: whole
+        directories are grouped together until there are at least that many
+        tracks, and each group is written inside a single transaction, with
+        the new songs inserted via ``bulk_create()``.  See ``get_batch_size()``
+        for the default.
+
+        ``defer_checksums``, if ``True``, means that only quick fingerprints
+        are computed for new tracks (see ``Song.get_fingerprint()``), leaving
+        their full checksums for ``backfill_checksums()`` to fill in later.
+        See ``get_defer_checksums()`` for the default.
+
+        ``scope``, if passed in, is a subdirectory of the library (relative to
+        our base path), and only that part of the library will be walked and
+        loaded from the database.  See ``get_scope_base()``.
         """
 
         App.ensure_prefs()
+        base_path = App.prefs['exordium__base_path']
+        batch_size = App.get_batch_size(batch_size)
+        defer_checksums = App.get_defer_checksums(defer_checksums)
+        try:
+            (scope, start_base) = App.get_scope_base(scope)
+        except App.InvalidScope as e:
+            yield (App.STATUS_ERROR, str(e))
+            return
 
         # Some statistics
         artists_added = 0
@@ -1451,31 +2937,40 @@ class App(object):
 
         # Check to see if we're in the middle of an update or not
         updating = True
+        total_checksums = None
         if to_add is None:
-            to_add = []
             yield (App.STATUS_INFO, 'Starting process...')
+            if scope != '':
+                yield (App.STATUS_INFO, 'Only processing library subdirectory: %s' % (scope))
             updating = False
 
+            # Start our journal, or pick up an interrupted one
+            checkpoint = ImportCheckpoint.objects.filter(scope=scope).order_by('started').first()
+            resumed = checkpoint is not None
+            if not resumed:
+                checkpoint = ImportCheckpoint.objects.create(scope=scope)
+            else:
+                yield (App.STATUS_INFO, 'Resuming interrupted add from %s (%d directories and %d songs already done, last directory: %s)' % (
+                    timezone.localtime(checkpoint.started).strftime('%Y-%m-%d %I:%M:%S %p'),
+                    checkpoint.dirs_done, checkpoint.songs_added, checkpoint.last_dir))
+
             # First grab a dict of all songs we already know about
             known_song_paths = {}
-            for song in Song.objects.all():
-                known_song_paths[song.filename] = True
-
-            # Now walk through our directory structure looking for more music
-            for short_filename in App.get_filesystem_media():
-                if short_filename not in known_song_paths:
-                    yield (App.STATUS_DEBUG, 'Found file: %s' % (short_filename))
-                    to_add.append((short_filename, None))
-            
-            # If we have no data, just get out of here
-            if len(to_add) == 0:
-                yield (App.STATUS_SUCCESS, 'No new music found!')
-                return
-
-            # Ensure that we have a Various artist.
-            if App.ensure_various_artists():
-                yield (App.STATUS_INFO, 'Created new artist "Various" (meta-artist)')
-                artists_added += 1
+            for filename in App.filter_scope(Song.objects.all(), scope).values_list('filename', flat=True):
+                known_song_paths[filename] = True
+
+            # Now walk through our directory structure looking for more music,
+            # keeping track of what images we see for the album art scan.  A
+            # scoped add walks its directories up front, so that we know which
+            # files to look for in our checksum cache.
+            listings = {}
+            file_keys = None
+            if scope != '':
+                file_keys = []
+            batches = App.find_new_media(base_path, known_song_paths, start_base, listings,
+                file_keys=file_keys)
+            if scope != '':
+                batches = list(batches)
 
         else:
 
@@ -1484,233 +2979,313 @@ class App(object):
             if len(to_add) == 0:
                 return
 
-        # Grab a nested dict of all artists and their albums
+            batches = App.group_by_dir(to_add)
+            total_checksums = 0
+            for (short_filename, sha256sum) in to_add:
+                if sha256sum is None:
+                    total_checksums += 1
+            if total_checksums > 0:
+                yield (App.STATUS_INFO, 'Total track checksums to compute: %d' % (total_checksums))
+
+        # Load up our checksum cache, if we might need it.  Only a whole-library
+        # add loads the entire table; otherwise we only load the entries for the
+        # files we're about to add.
+        if total_checksums == 0:
+            checksum_cache = None
+        elif updating:
+            file_keys = []
+            for (short_filename, sha256sum) in to_add:
+                if sha256sum is None:
+                    try:
+                        file_keys.append(FileChecksum.get_file_key(
+                            os.stat(os.path.join(base_path, short_filename))))
+                    except OSError:
+                        pass
+            checksum_cache = FileChecksum.load(file_keys)
+        else:
+            checksum_cache = FileChecksum.load(file_keys)
+
+        # And now loop through our files-to-add, a directory at a time.
+        # The songlist for each dir is what we're using to figure out
+        # "Various Artists" type albums.
         album_art_needed = []
-        known_artists = {}
-        for artist in Artist.objects.all():
-            known_artists[artist.normname] = (artist, {}, {})
-        for album in Album.objects.all():
-            if album.miscellaneous:
-                known_artists[album.artist.normname][2]['miscellaneous'] = album
-            else:
-                known_artists[album.artist.normname][1][album.normname] = album
-
-        # Also grab songs and sort by what directory they're in.  We only
-        # need this for the following scenario: An album exists in a
-        # directory, by a single artist, but later a new track is added
-        # the album with a second artist (thus turning it into a VA album)
-        existing_songs_in_dir = {}
-        for song in Song.objects.all():
-            song_base_dir = song.base_dir()
-            if song_base_dir not in existing_songs_in_dir:
-                existing_songs_in_dir[song_base_dir] = []
-            existing_songs_in_dir[song_base_dir].append(song)
-
-        # And now loop through our files-to-add.
-        # The songs_in_dir dict is what we're using to figure out
-        # "Various Artists" type albums - the keys are the directory
-        # names in which the files are found, and the values are
-        # lists of all the songs in that dir (as a SongHelper object)
-        songs_in_dir = {}
+        known_artists = None
         checksums_computed = 0
         checksum_start_time = timezone.localtime(timezone.now())
         checksum_last_notification = timezone.localtime(timezone.now())
-        total_checksums = 0
-        for (short_filename, sha256sum) in to_add:
-            if sha256sum is None:
-                total_checksums += 1
-        if total_checksums > 0:
-            yield (App.STATUS_INFO, 'Total track checksums to compute: %d' % (total_checksums))
-        for (short_filename, sha256sum) in to_add:
-            full_filename = os.path.join(App.prefs['exordium__base_path'], short_filename)
+        pipeline = ImportPipeline(batches, base_path, jobs=App.get_jobs(jobs),
+            checksum_cache=checksum_cache, full_checksums=not defer_checksums)
+        for dir_batch in App.batch_dirs(pipeline, batch_size):
+
+            # Store any checksums we had to compute before anything else, and
+            # outside of any batch transaction, so they survive even if the
+            # batch doesn't.
+            new_checksums = []
+            for (base_dir, retlines, results) in dir_batch:
+                for (short_filename, sha256sum, song_info) in results:
+                    if song_info is not None and song_info[6] is not None:
+                        new_checksums.append((song_info[6], song_info[5]['sha256sum']))
+            FileChecksum.store(new_checksums)
+
+            # In batched mode, everything for a batch of directories is
+            # written inside a single transaction, and songs are inserted
+            # all at once at the end.  Either way, status lines are
+            # collected and passed along once the batch has been written.
+            status = []
+            new_songs = []
+            if batch_size > 0:
+                context = transaction.atomic()
+            else:
+                context = contextlib.ExitStack()
+            with context:
+                for (base_dir, retlines, results) in dir_batch:
+
+                    # Some setup which is only necessary once we know we have
+                    # something to add.
+                    if known_artists is None:
+
+                        # Ensure that we have a Various artist.
+                        if not updating and App.ensure_various_artists():
+                            status.append((App.STATUS_INFO, 'Created new artist "Various" (meta-artist)'))
+                            artists_added += 1
+
+                        # Grab a nested dict of all artists and their albums
+                        known_artists = {}
+                        for artist in Artist.objects.all():
+                            known_artists[artist.normname] = (artist, {}, {})
+                        for album in Album.objects.select_related('artist'):
+                            if album.miscellaneous:
+                                known_artists[album.artist.normname][2]['miscellaneous'] = album
+                            else:
+                                known_artists[album.artist.normname][1][album.normname] = album
+
+                        # Also grab songs and sort by what directory they're in.  We only
+                        # need this for the following scenario: An album exists in a
+                        # directory, by a single artist, but later a new track is added
+                        # the album with a second artist (thus turning it into a VA album)
+                        existing_songs_in_dir = {}
+                        for song in App.filter_scope(Song.objects.all(), scope):
+                            song_base_dir = song.base_dir()
+                            if song_base_dir not in existing_songs_in_dir:
+                                existing_songs_in_dir[song_base_dir] = []
+                            existing_songs_in_dir[song_base_dir].append(song)
+
+                    status.extend(retlines)
+
+                    songlist = []
+                    for (short_filename, sha256sum, song_info) in results:
+
+                        # Report on our progress - ensure we have a new line to show the user
+                        # at least every ten seconds.  We only check every 20 files, though, so
+                        # technically this could go a bit over if we're real slow.  Show an ETA
+                        # if we've been processing for more than 30 seconds total, and we know
+                        # how many files there are in total (ie: we're being called from update())
+                        if sha256sum is None:
+                            checksums_computed += 1
+                            if checksums_computed % 20 == 0:
+                                current_check_time = timezone.localtime(timezone.now())
+                                interval = current_check_time - checksum_last_notification
+                                total_interval = current_check_time - checksum_start_time
+                                if interval.seconds > 10:   # pragma: no cover
+                                    # Excluding this from coverage.py since I really don't want to
+                                    # have a test that runs >10 seconds.
+                                    checksum_last_notification = current_check_time
+                                    if total_checksums is None:
+                                        status.append((App.STATUS_INFO, 'Checksums gathered for %d tracks' % (
+                                            checksums_computed)))
+                                    elif total_interval.seconds > 30:
+                                        checksums_per_sec = checksums_computed / total_interval.seconds
+                                        eta = checksum_start_time + datetime.timedelta(seconds=(total_checksums/checksums_per_sec))
+                                        status.append((App.STATUS_INFO, 'Checksums gathered for %d/%d tracks (%d%%) - ETA of checksum completion: %s' % (
+                                            checksums_computed, total_checksums, (checksums_computed/total_checksums*100),
+                                            eta.strftime('%I:%M:%S %p'))))
+                                    else:
+                                        status.append((App.STATUS_INFO, 'Checksums gathered for %d/%d tracks (%d%%)' % (
+                                            checksums_computed, total_checksums, (checksums_computed/total_checksums*100))))
+
+                        song_info = Song.from_song_info(song_info)
+                        if song_info is not None:
+                            songlist.append(SongHelper(*song_info))
+
+                    # Figure out any Various-Artists type places
+                    # There's some extra weirdness in here to deal with a possible
+                    # scenario where a single directory contains both multiple
+                    # artists and multiple albums - not all albums in that dir
+                    # would necessarily be Various
+                    albums_to_update = {}
+                    album_artist = {}
+
+                    # Step 1: Loop through new tracks and populate album_artist
+                    for helper in songlist:
+                        if helper.norm_album not in album_artist:
+                            album_artist[helper.norm_album] = helper.artist_name
+                        if helper.norm_artist_name != App.norm_name(album_artist[helper.norm_album]):
+                            album_artist[helper.norm_album] = 'Various'
+
+                    # Step 2: Loop through any existing tracks in this
+                    # directory and potentially mark them for update as well.
+                    if base_dir in existing_songs_in_dir:
+                        for song in existing_songs_in_dir[base_dir]:
+                            if song.album.normname not in album_artist:
+                                album_artist[song.album.normname] = song.album.artist.name
+                            if song.artist.normname != App.norm_name(album_artist[song.album.normname]):
+                                album_artist[song.album.normname] = 'Various'
+                                albums_to_update[song.album.normname] = song.album
+
+                    # Step 3: actually assign the artist to the SongHelper
+                    for helper in songlist:
+                        helper.set_album_artist(album_artist[helper.norm_album])
+
+                    # Step 4: update existing album records if we need to
+                    for (albumname, album) in albums_to_update.items():
+                        try:
+                            del known_artists[album.artist.normname][1][album.normname]
+                            status.append((App.STATUS_INFO, 'Updating album "%s / %s" to artist "%s"' %
+                                (album.artist, album, album_artist[album.normname])))
+                            album.artist = Artist.objects.get(normname=App.norm_name(album_artist[album.normname]))
+                            album.save()
+                            known_artists[album.artist.normname][1][album.normname] = album
+                        except Artist.DoesNotExist: # pragma: no cover
+                            # This section is written somewhat generically, but the only possible artist
+                            # that we'd be updating to here is "Various," since we're just in to_add()
+                            # and the nature of this loop.  The only way we could get here is if our
+                            # earlier call to App.ensure_various() somehow failed.
+                            status.append((App.STATUS_ERROR, 'Cannot find artist "%s" to convert to Various' %
+                                (album_artist[albumname])))
+
+                    # Now create artists, albums and songs
+                    for helper in songlist:
+
+                        # Check to see if we know the artist yet, and if not create it.
+                        for (norm_name, artist_name, artist_prefix) in [
+                                (helper.norm_artist_name, helper.artist_name, helper.artist_prefix),
+                                (helper.norm_group_name, helper.group_name, helper.group_prefix),
+                                (helper.norm_conductor_name, helper.conductor_name, helper.conductor_prefix),
+                                (helper.norm_composer_name, helper.composer_name, helper.composer_prefix)]:
+                            if artist_name != '':
+                                if norm_name not in known_artists:
+                                    try:
+                                        artist_obj = Artist.objects.create(name=artist_name, prefix=artist_prefix)
+                                        known_artists[norm_name] = (artist_obj, {}, {})
+                                        status.append((App.STATUS_INFO, 'Created new artist "%s"' % (artist_obj)))
+                                        artists_added += 1
+                                    except IntegrityError:  # pragma: no cover
+                                        # Apparently in this case we're not associating things according to our
+                                        # database's collation values.  We'll just try to load the matching artist
+                                        # for now.  Excluding this from coverage.py because we hope never to get
+                                        # in here, and if I found a repeatable case I'd be updating my normalization
+                                        # routines anyway.
+                                        artist_obj = Artist.objects.get(normname=norm_name)
+                                        known_artists[norm_name] = (artist_obj, {}, {})
+                                        status.append((App.STATUS_DEBUG, 'Loaded existing artist for "%s"' % (artist_obj)))
+                                elif artist_prefix != '' and known_artists[norm_name][0].prefix == '':
+                                    # While we're at it, if our artist didn't have a prefix originally
+                                    # but we see one now, update the artist record with that prefix.
+                                    known_artists[norm_name][0].prefix = artist_prefix
+                                    known_artists[norm_name][0].save()
+                                    status.append((App.STATUS_DEBUG, 'Updated artist to include prefix: "%s"' %
+                                        (known_artists[norm_name][0])))
+
+                        # Check to see if we know the album yet, and if not create it.
+                        album_obj = None
+                        if helper.miscellaneous_album:
+                            if 'miscellaneous' not in known_artists[helper.norm_album_artist][2]:
+                                try:
+                                    with transaction.atomic():
+                                        album_obj = Album.objects.create(name=helper.album,
+                                                artist=known_artists[helper.norm_album_artist][0],
+                                                year=helper.song_obj.year,
+                                                miscellaneous=helper.miscellaneous_album,
+                                                live=helper.live_album)
+                                        known_artists[helper.norm_album_artist][2]['miscellaneous'] = album_obj
+                                        status.append((App.STATUS_INFO, 'Created new miscellaneous album "%s / %s"' % (album_obj.artist, album_obj)))
+                                        albums_added += 1
+                                except IntegrityError:  # pragma: no cover
+                                    # I'm not sure how we'd actually get in here.  Something would have
+                                    # to have changed in the database while we were in the middle of this
+                                    # whole processing loop.
+                                    album_obj = Album.objects.get(miscellaneous=True, artist=known_artists[helper.norm_album_artist][0])
+                                    known_artists[helper.norm_album_artist][2]['miscellaneous'] = album_obj
+                                    status.append((App.STATUS_DEBUG, 'Loaded existing miscellaneous album for "%s / %s"' % (album_obj.artist, album_obj)))
+                        else:
+                            if helper.norm_album not in known_artists[helper.norm_album_artist][1]:
+                                try:
+                                    with transaction.atomic():
+                                        album_obj = Album.objects.create(name=helper.album,
+                                                artist=known_artists[helper.norm_album_artist][0],
+                                                year=helper.song_obj.year,
+                                                miscellaneous=helper.miscellaneous_album,
+                                                live=helper.live_album)
+                                        known_artists[helper.norm_album_artist][1][helper.norm_album] = album_obj
+                                        status.append((App.STATUS_INFO, 'Created new album "%s / %s"' % (album_obj.artist, album_obj)))
+                                        albums_added += 1
+                                except IntegrityError:  # pragma: no cover
+                                    # As with above, there really shouldn't be any way to get in this loop,
+                                    # so we're excluding from coverage.
+                                    album_obj = Album.objects.get(normname=helper.norm_album, artist=known_artists[helper.norm_album_artist][0])
+                                    known_artists[helper.norm_album_artist][1][helper.norm_album] = album_obj
+                                    status.append((App.STATUS_DEBUG, 'Loaded existing album for "%s / %s"' % (album_obj.artist, album_obj)))
+
+                        # Mark this album as possibly needing an album art update
+                        if album_obj and not album_obj.art_filename:
+                            album_art_needed.append(album_obj)
+                
+                        # And now, update and save our song_obj
+                        helper.song_obj.artist = known_artists[helper.norm_artist_name][0]
+                        if helper.norm_group_name != '' and helper.norm_group_name in known_artists:
+                            helper.song_obj.group = known_artists[helper.norm_group_name][0]
+                        if helper.norm_conductor_name != '' and helper.norm_conductor_name in known_artists:
+                            helper.song_obj.conductor = known_artists[helper.norm_conductor_name][0]
+                        if helper.norm_composer_name != '' and helper.norm_composer_name in known_artists:
+                            helper.song_obj.composer = known_artists[helper.norm_composer_name][0]
+                        if helper.miscellaneous_album:
+                            helper.song_obj.album = known_artists[helper.norm_album_artist][2]['miscellaneous']
+                        else:
+                            helper.song_obj.album = known_artists[helper.norm_album_artist][1][helper.norm_album]
+                        if batch_size > 0:
+                            new_songs.append(helper.song_obj)
+                        else:
+                            helper.song_obj.save()
+                        songs_added += 1
 
-            retlines = []
+                if len(new_songs) > 0:
+                    Song.objects.bulk_create(new_songs, batch_size=batch_size)
 
-            # Report on our progress - ensure we have a new line to show the user
-            # at least every ten seconds.  We only check every 20 files, though, so
-            # technically this could go a bit over if we're real slow.  Show an ETA
-            # if we've been processing for more than 30 seconds total
-            if sha256sum is None:
-                checksums_computed += 1
-                if checksums_computed % 20 == 0:
-                    current_check_time = timezone.localtime(timezone.now())
-                    interval = current_check_time - checksum_last_notification
-                    total_interval = current_check_time - checksum_start_time
-                    if interval.seconds > 10:   # pragma: no cover
-                        # Excluding this from coverage.py since I really don't want to
-                        # have a test that runs >10 seconds.
-                        checksum_last_notification = current_check_time
-                        if total_interval.seconds > 30:
-                            checksums_per_sec = checksums_computed / total_interval.seconds
-                            eta = checksum_start_time + datetime.timedelta(seconds=(total_checksums/checksums_per_sec))
-                            yield (App.STATUS_INFO, 'Checksums gathered for %d/%d tracks (%d%%) - ETA of checksum completion: %s' % (
-                                checksums_computed, total_checksums, (checksums_computed/total_checksums*100),
-                                eta.strftime('%I:%M:%S %p')))
-                        else:
-                            yield (App.STATUS_INFO, 'Checksums gathered for %d/%d tracks (%d%%)' % (
-                                checksums_computed, total_checksums, (checksums_computed/total_checksums*100)))
+            # Journal our progress, if anything was added
+            if not updating:
+                batch_songs = sum([len(results) for (base_dir, retlines, results) in dir_batch])
+                if batch_songs > 0:
+                    checkpoint.record(dir_batch[-1][0], len(dir_batch), batch_songs)
 
-            song_info = Song.from_filename(
-                full_filename, short_filename,
-                retlines=retlines, sha256sum=sha256sum)
-            for retline in retlines:
-                yield retline
-            if song_info is None:
-                continue
-            else:
-                helper = SongHelper(*song_info)
-                if helper.base_dir not in songs_in_dir:
-                    songs_in_dir[helper.base_dir] = []
-                songs_in_dir[helper.base_dir].append(helper)
-
-        # Figure out any Various-Artists type places
-        # There's some extra weirdness in here to deal with a possible
-        # scenario where a single directory contains both multiple
-        # artists and multiple albums - not all albums in that dir
-        # would necessarily be Various
-        for (base_dir, songlist) in songs_in_dir.items():
-            albums_to_update = {}
-            album_artist = {}
+            for line in status:
+                yield line
 
-            # Step 1: Loop through new tracks and populate album_artist
-            for helper in songlist:
-                if helper.norm_album not in album_artist:
-                    album_artist[helper.norm_album] = helper.artist_name
-                if helper.norm_artist_name != App.norm_name(album_artist[helper.norm_album]):
-                    album_artist[helper.norm_album] = 'Various'
-
-            # Step 2: Loop through any existing tracks in this
-            # directory and potentially mark them for update as well.
-            if base_dir in existing_songs_in_dir:
-                for song in existing_songs_in_dir[base_dir]:
-                    if song.album.normname not in album_artist:
-                        album_artist[song.album.normname] = song.album.artist.name
-                    if song.artist.normname != App.norm_name(album_artist[song.album.normname]):
-                        album_artist[song.album.normname] = 'Various'
-                        albums_to_update[song.album.normname] = song.album
-
-            # Step 3: actually assign the artist to the SongHelper
-            for helper in songlist:
-                helper.set_album_artist(album_artist[helper.norm_album])
-
-            # Step 4: update existing album records if we need to
-            for (albumname, album) in albums_to_update.items():
-                try:
-                    del known_artists[album.artist.normname][1][album.normname]
-                    yield (App.STATUS_INFO, 'Updating album "%s / %s" to artist "%s"' %
-                        (album.artist, album, album_artist[album.normname]))
-                    album.artist = Artist.objects.get(normname=App.norm_name(album_artist[album.normname]))
-                    album.save()
-                    known_artists[album.artist.normname][1][album.normname] = album
-                except Artist.DoesNotExist: # pragma: no cover
-                    # This section is written somewhat generically, but the only possible artist
-                    # that we'd be updating to here is "Various," since we're just in to_add()
-                    # and the nature of this loop.  The only way we could get here is if our
-                    # earlier call to App.ensure_various() somehow failed.
-                    yield (App.STATUS_ERROR, 'Cannot find artist "%s" to convert to Various' %
-                        (album_artist[albumname]))
-
-        # Loop through helper objects
-        for (base_dir, songlist) in songs_in_dir.items():
-
-            for helper in songlist:
-
-                # Check to see if we know the artist yet, and if not create it.
-                for (norm_name, artist_name, artist_prefix) in [
-                        (helper.norm_artist_name, helper.artist_name, helper.artist_prefix),
-                        (helper.norm_group_name, helper.group_name, helper.group_prefix),
-                        (helper.norm_conductor_name, helper.conductor_name, helper.conductor_prefix),
-                        (helper.norm_composer_name, helper.composer_name, helper.composer_prefix)]:
-                    if artist_name != '':
-                        if norm_name not in known_artists:
-                            try:
-                                artist_obj = Artist.objects.create(name=artist_name, prefix=artist_prefix)
-                                known_artists[norm_name] = (artist_obj, {}, {})
-                                yield (App.STATUS_INFO, 'Created new artist "%s"' % (artist_obj))
-                                artists_added += 1
-                            except IntegrityError:  # pragma: no cover
-                                # Apparently in this case we're not associating things according to our
-                                # database's collation values.  We'll just try to load the matching artist
-                                # for now.  Excluding this from coverage.py because we hope never to get
-                                # in here, and if I found a repeatable case I'd be updating my normalization
-                                # routines anyway.
-                                artist_obj = Artist.objects.get(normname=norm_name)
-                                known_artists[norm_name] = (artist_obj, {}, {})
-                                yield (App.STATUS_DEBUG, 'Loaded existing artist for "%s"' % (artist_obj))
-                        elif artist_prefix != '' and known_artists[norm_name][0].prefix == '':
-                            # While we're at it, if our artist didn't have a prefix originally
-                            # but we see one now, update the artist record with that prefix.
-                            known_artists[norm_name][0].prefix = artist_prefix
-                            known_artists[norm_name][0].save()
-                            yield (App.STATUS_DEBUG, 'Updated artist to include prefix: "%s"' %
-                                (known_artists[norm_name][0]))
+        # Albums created by an interrupted add won't have had a chance to
+        # get their album art, so pick those up too.  Once that's done, our
+        # journal isn't needed anymore.
+        if not updating:
+            if resumed:
+                seen_albums = set([album.pk for album in album_art_needed])
+                for album in Album.objects.filter(Q(art_filename__isnull=True) | Q(art_filename=''),
+                        time_added__gte=checkpoint.started, miscellaneous=False).select_related('artist'):
+                    if album.pk not in seen_albums:
+                        album_art_needed.append(album)
+            for retline in App.update_album_art(album_art_needed, listings):
+                yield retline
+            if App.get_pregenerate_thumbnails():
+                for retline in App.generate_thumbnails(album_art_needed, jobs):
+                    yield retline
+            checkpoint.delete()
 
-                # Check to see if we know the album yet, and if not create it.
-                album_obj = None
-                if helper.miscellaneous_album:
-                    if 'miscellaneous' not in known_artists[helper.norm_album_artist][2]:
-                        try:
-                            with transaction.atomic():
-                                album_obj = Album.objects.create(name=helper.album,
-                                        artist=known_artists[helper.norm_album_artist][0],
-                                        year=helper.song_obj.year,
-                                        miscellaneous=helper.miscellaneous_album,
-                                        live=helper.live_album)
-                                known_artists[helper.norm_album_artist][2]['miscellaneous'] = album_obj
-                                yield (App.STATUS_INFO, 'Created new miscellaneous album "%s / %s"' % (album_obj.artist, album_obj))
-                                albums_added += 1
-                        except IntegrityError:  # pragma: no cover
-                            # I'm not sure how we'd actually get in here.  Something would have
-                            # to have changed in the database while we were in the middle of this
-                            # whole processing loop.
-                            album_obj = Album.objects.get(miscellaneous=True, artist=known_artists[helper.norm_album_artist][0])
-                            known_artists[helper.norm_album_artist][2]['miscellaneous'] = album_obj
-                            yield (App.STATUS_DEBUG, 'Loaded existing miscellaneous album for "%s / %s"' % (album_obj.artist, album_obj))
-                else:
-                    if helper.norm_album not in known_artists[helper.norm_album_artist][1]:
-                        try:
-                            with transaction.atomic():
-                                album_obj = Album.objects.create(name=helper.album,
-                                        artist=known_artists[helper.norm_album_artist][0],
-                                        year=helper.song_obj.year,
-                                        miscellaneous=helper.miscellaneous_album,
-                                        live=helper.live_album)
-                                known_artists[helper.norm_album_artist][1][helper.norm_album] = album_obj
-                                yield (App.STATUS_INFO, 'Created new album "%s / %s"' % (album_obj.artist, album_obj))
-                                albums_added += 1
-                        except IntegrityError:  # pragma: no cover
-                            # As with above, there really shouldn't be any way to get in this loop,
-                            # so we're excluding from coverage.
-                            album_obj = Album.objects.get(normname=helper.norm_album, artist=known_artists[helper.norm_album_artist][0])
-                            known_artists[helper.norm_album_artist][1][helper.norm_album] = album_obj
-                            yield (App.STATUS_DEBUG, 'Loaded existing album for "%s / %s"' % (album_obj.artist, album_obj))
-
-                # Mark this album as possibly needing an album art update
-                if album_obj and not album_obj.art_filename:
-                    album_art_needed.append(album_obj)
-                
-                # And now, update and save our song_obj
-                helper.song_obj.artist = known_artists[helper.norm_artist_name][0]
-                if helper.norm_group_name != '' and helper.norm_group_name in known_artists:
-                    helper.song_obj.group = known_artists[helper.norm_group_name][0]
-                if helper.norm_conductor_name != '' and helper.norm_conductor_name in known_artists:
-                    helper.song_obj.conductor = known_artists[helper.norm_conductor_name][0]
-                if helper.norm_composer_name != '' and helper.norm_composer_name in known_artists:
-                    helper.song_obj.composer = known_artists[helper.norm_composer_name][0]
-                if helper.miscellaneous_album:
-                    helper.song_obj.album = known_artists[helper.norm_album_artist][2]['miscellaneous']
-                else:
-                    helper.song_obj.album = known_artists[helper.norm_album_artist][1][helper.norm_album]
-                helper.song_obj.save()
-                songs_added += 1
+        # If we have no data, just get out of here
+        if known_artists is None:
+            if not updating:
+                yield (App.STATUS_SUCCESS, 'No new music found!')
+            return
 
         # Report
         if not updating:
 
-            # Get album art
-            for retline in App.update_album_art(album_art_needed):
-                yield retline
-
             yield (App.STATUS_SUCCESS, 'Finished adding new music!')
             yield (App.STATUS_SUCCESS, 'Artists added: %d' % (artists_added))
             yield (App.STATUS_SUCCESS, 'Albums added: %d' % (albums_added))
@@ -1720,7 +3295,7 @@ class App(object):
         return
 
     @staticmethod
-    def update():
+    def update(jobs=None, batch_size=None, defer_checksums=None, scope=None, quick_scan=None):
         """
         Looks through our base_dir for any files which may have been changed,
         deleted, moved, or added (will call out to ``add()`` to handle the latter,
@@ -1743,11 +3318,46 @@ class App(object):
         This whole procedure is... messy.  Lots of weird little custom dicts and
         lists flying around to keep everything straight, and not always terribly
         well documented in-code.
+
+        ``jobs`` is the number of worker processes to use while computing
+        checksums and reading tags, and ``batch_size`` is the number of new
+        tracks to write per transaction, both as in ``add()``.
+
+        ``defer_checksums`` works as in ``add()``, and also applies to changed
+        tracks.  When it's on, tracks whose mtime has changed only have their
+        tags and fingerprint re-read, and their checksum is cleared so that
+        ``backfillchecksums`` will compute it again.  (Even if the fingerprint
+        matches, the middle of the file may have changed.)
+
+        ``scope``, if passed in, restricts the update to a subdirectory of the
+        library, as in ``add()``.  Songs outside of that subdirectory are left
+        alone entirely, so a file moved into the subdirectory from elsewhere in
+        the library will show up as a new file (and the old record won't be
+        cleaned up until the next update which covers its old location).  If
+        the subdirectory no longer exists, any songs which were in it will be
+        cleaned up.
+
+        A ``DirectorySnapshot`` is kept for each directory we walk.  If
+        ``quick_scan`` is ``True``, songs in directories whose snapshot hasn't
+        changed since the last update aren't looked at at all.  Passing
+        ``False`` does a full verification of every song, while still keeping
+        the snapshots up to date.  See ``get_quick_scan()`` for the default.
         """
 
         App.ensure_prefs()
+        jobs = App.get_jobs(jobs)
+        batch_size = App.get_batch_size(batch_size)
+        defer_checksums = App.get_defer_checksums(defer_checksums)
+        quick_scan = App.get_quick_scan(quick_scan)
+        try:
+            (scope, start_base) = App.get_scope_base(scope, must_exist=False)
+        except App.InvalidScope as e:
+            yield (App.STATUS_ERROR, str(e))
+            return
 
         yield (App.STATUS_INFO, 'Starting process...')
+        if scope != '':
+            yield (App.STATUS_INFO, 'Only processing library subdirectory: %s' % (scope))
 
         to_update = []
         to_delete = {}
@@ -1756,7 +3366,35 @@ class App(object):
         if App.ensure_various_artists():
             yield (App.STATUS_INFO, 'Created new artist "Various" (meta-artist)')
 
-        # Step one - loop through the database and find any files which are missing
+        # Step one - walk the filesystem, collecting stat information for every media
+        # file (and possible album art) we find along the way, so we don't have to
+        # look at any of them again.
+        # Directories whose snapshots have changed get new ones stored at the end of
+        # the update, and in quick-scan mode, directories whose snapshots haven't
+        # changed are skipped entirely.  Snapshots left in ``old_snapshots`` after
+        # the walk are for directories which no longer exist.
+        disk_media = collections.OrderedDict()
+        old_snapshots = DirectorySnapshot.load(scope)
+        new_snapshots = {}
+        unchanged_dirs = set()
+        listings = {}
+        for (base_dir, media, snapshot) in App.walk_media_dirs(App.prefs['exordium__base_path'],
+                start_base, sort=True, listings=listings):
+            old_snapshot = old_snapshots.pop(base_dir, None)
+            if old_snapshot is not None and old_snapshot[1] == snapshot:
+                if quick_scan:
+                    unchanged_dirs.add(base_dir)
+                    continue
+            else:
+                new_snapshots[base_dir] = snapshot
+                if old_snapshot is not None:
+                    old_snapshots[base_dir] = old_snapshot
+            for media_file in media:
+                disk_media[media_file.filename] = media_file
+        if quick_scan:
+            yield (App.STATUS_DEBUG, 'Unchanged directories skipped: %d' % (len(unchanged_dirs)))
+
+        # Step two - loop through the database and find any files which are missing
         # or have been updated.  Create ``digest_dict`` which is a mapping of sha256sums
         # to the database Song object, and ``db_paths`` which is a mapping of filenames
         # to database Song objects, used below to find out which new files have been
@@ -1766,41 +3404,140 @@ class App(object):
         # the ``to_delete`` dict which at this point is technically only *possible*
         # deletions - our ``digest_dict`` structure will be used to determine below if
         # that deleted file has merely moved
+        #
+        # Songs whose device/inode don't match what's on disk (which will be every
+        # song, the first time around after upgrading) get those values updated.
+        #
+        # Only songs without a fingerprint go in ``digest_dict``, since songs with
+        # one can be matched up by fingerprint instead.
         db_paths = {}
         digest_dict = {}
-        for song in Song.objects.all():
+        identity_changes = []
+        songs = App.filter_scope(Song.objects.all(), scope)
+        if len(unchanged_dirs) > 0:
+            songs = App.get_songs_by_pk([pk for (pk, filename) in songs.values_list('pk', 'filename')
+                if os.path.dirname(filename) not in unchanged_dirs])
+        else:
+            songs = songs.select_related(*App.song_related_fields)
+        for song in songs:
 
-            if song.exists_on_disk():
+            if not App.in_scope(song.filename, scope):
+                continue
+            if song.filename in disk_media:
                 db_paths[song.filename] = song
-                if song.changed_on_disk():
+                media_file = disk_media[song.filename]
+                if song.changed_on_disk(media_file.mtime_ns):
                     to_update.append(song)
                     yield (App.STATUS_DEBUG, 'Updated file: %s' % (song.filename))
+                elif song.device != media_file.device or song.inode != media_file.inode:
+                    song.device = media_file.device
+                    song.inode = media_file.inode
+                    identity_changes.append(song)
             else:
                 # Just store some data for now
                 to_delete[song] = True
-                digest_dict[song.sha256sum] = song
+                if song.fingerprint == '' and song.sha256sum != '':
+                    digest_dict[song.sha256sum] = song
 
         # Figure out what new files might exist (deleted files might have just moved)
-        to_add = []
-        for path in App.get_filesystem_media():
+        new_paths = []
+        for path in disk_media.keys():
             if path not in db_paths:
                 if os.access(os.path.join(App.prefs['exordium__base_path'], path), os.R_OK):
-                    sha256sum = Song.get_sha256sum(os.path.join(App.prefs['exordium__base_path'], path))
-                    if sha256sum in digest_dict:
-                        song = digest_dict[sha256sum]
-                        yield (App.STATUS_INFO, 'File move detected: %s -> %s' % (
-                            song.filename, path
-                        ))
-                        song.filename = path
-                        song.save()
-                        del digest_dict[sha256sum]
-                        del to_delete[song]
-                    else:
-                        yield (App.STATUS_DEBUG, 'Found new file: %s' % (path))
-                        to_add.append((path, sha256sum))
+                    new_paths.append(path)
                 else:
+                    # Don't snapshot this directory, so we notice if it becomes readable
+                    new_snapshots.pop(os.path.dirname(path), None)
                     yield (App.STATUS_DEBUG, 'Audio file is not readable: %s' % (path))
 
+        App.save_in_chunks(identity_changes, App.query_chunk_size,
+            update_fields=['device', 'inode'])
+
+        # Figure out which of the new files are actually missing songs which have
+        # moved.  If nothing's missing, there's nothing to do.  Otherwise, songs are
+        # matched first by device and inode, which catches renames within the same
+        # filesystem without reading anything, then by fingerprint, and finally (for
+        # songs which don't have a fingerprint yet) by checksum.  Only new files which
+        # are the same size as a missing song need fingerprinting or checksumming.
+        # Files which are left over get checksummed while they're being added.
+        moves = {}
+        matched = set()
+        checksums = {}
+        if len(to_delete) > 0:
+            by_inode = {}
+            for song in to_delete.keys():
+                if song.inode != 0:
+                    by_inode[(song.device, song.inode)] = song
+            for path in new_paths:
+                media_file = disk_media[path]
+                song = by_inode.pop((media_file.device, media_file.inode), None)
+                if (song is not None and song.size == media_file.size and
+                        not song.changed_on_disk(media_file.mtime_ns)):
+                    moves[path] = song
+                    matched.add(song)
+
+            # Fingerprint anything which might match a song with a fingerprint
+            by_fingerprint = {}
+            for song in to_delete.keys():
+                if song not in matched and song.fingerprint != '':
+                    by_fingerprint[song.fingerprint] = song
+            fingerprint_sizes = set([song.size for song in by_fingerprint.values()])
+            to_fingerprint = [path for path in new_paths
+                if path not in moves and disk_media[path].size in fingerprint_sizes]
+            fingerprint_args = [(os.path.join(App.prefs['exordium__base_path'], path),) for path in to_fingerprint]
+            for (path, fingerprint) in zip(to_fingerprint,
+                    App.pool_map(Song.get_fingerprint, fingerprint_args, jobs=jobs)):
+                song = by_fingerprint.pop(fingerprint, None)
+                if song is not None:
+                    moves[path] = song
+                    matched.add(song)
+
+            # Checksum whatever's left which might match, using our cache where we can
+            checksum_sizes = set([song.size for song in digest_dict.values() if song not in matched])
+            checksum_paths = [path for path in new_paths
+                if path not in moves and disk_media[path].size in checksum_sizes]
+            checksum_cache = FileChecksum.load([disk_media[path].file_key() for path in checksum_paths])
+            to_checksum = []
+            for path in checksum_paths:
+                sha256sum = FileChecksum.lookup_key(checksum_cache, disk_media[path].file_key())
+                if sha256sum is None:
+                    to_checksum.append(path)
+                else:
+                    checksums[path] = sha256sum
+            new_checksums = []
+            checksum_args = [(os.path.join(App.prefs['exordium__base_path'], path),) for path in to_checksum]
+            for (path, (sha256sum, file_key)) in zip(to_checksum,
+                    App.pool_map(FileChecksum.compute, checksum_args, jobs=jobs)):
+                checksums[path] = sha256sum
+                if file_key is not None:
+                    new_checksums.append((file_key, sha256sum))
+            FileChecksum.store(new_checksums)
+
+        to_add = []
+        moved_songs = []
+        for path in new_paths:
+            song = moves.get(path)
+            if song is None and checksums.get(path) in digest_dict:
+                song = digest_dict[checksums[path]]
+                if song in matched:
+                    song = None
+            if song is not None:
+                yield (App.STATUS_INFO, 'File move detected: %s -> %s' % (
+                    song.filename, path
+                ))
+                song.filename = path
+                song.device = disk_media[path].device
+                song.inode = disk_media[path].inode
+                moved_songs.append(song)
+                db_paths[path] = song
+                if digest_dict.get(song.sha256sum) is song:
+                    del digest_dict[song.sha256sum]
+                del to_delete[song]
+            else:
+                yield (App.STATUS_DEBUG, 'Found new file: %s' % (path))
+                to_add.append((path, checksums.get(path)))
+        App.save_in_chunks(moved_songs, App.query_chunk_size)
+
         # Report on deleted files here, and delete them
         delete_rel_albums = {}
         delete_rel_artists = {}
@@ -1822,22 +3559,42 @@ class App(object):
         # effort between here and the update section below, and some various unnecessary
         # duplication of work, but whatever.  We'll cope.
         if len(to_add) > 0:
-            for retline in App.add(to_add=to_add):
+            add_errors = False
+            for retline in App.add(to_add=to_add, jobs=jobs, batch_size=batch_size,
+                    defer_checksums=defer_checksums, scope=scope):
+                if retline[0] == App.STATUS_ERROR:
+                    add_errors = True
                 yield retline
-
-        # Updates next, pull in the new data
+            if add_errors:
+                for (path, sha256sum) in to_add:
+                    new_snapshots.pop(os.path.dirname(path), None)
+
+        # Updates next, pull in the new data.  Grab all our artists up front, so
+        # that artist changes don't have to be looked up one at a time.  The files
+        # themselves are read (and checksummed) by our worker pool, and the results
+        # applied here in order as they come back.
         to_update_helpers = {}
         possible_artist_updates = {}
-        for song in to_update:
+        known_artists = {}
+        if len(to_update) > 0:
+            for artist in Artist.objects.all():
+                known_artists[artist.normname] = artist
+        new_checksums = []
+        scan_args = [(song.full_filename(), song.filename, None, not defer_checksums)
+            for song in to_update]
+        for (song, scan_result) in zip(to_update,
+                App.pool_map(Song.scan_file, scan_args, jobs=jobs)):
 
             retlines = []
-            song_info = song.update_from_disk(retlines)
+            song_info = song.update_from_disk(retlines, new_checksums,
+                full_checksum=not defer_checksums, scan_result=scan_result)
             for retline in retlines:
                 yield retline
             if song_info is None:
                 # We could probably queue up this song for possible deletion,
                 # but we'll err on the side of caution and keep it around.
                 # Perhaps the permission thing is a transient issue.
+                new_snapshots.pop(song.base_dir(), None)
                 yield (App.STATUS_ERROR, 'Could not read updated information for: %s' % (song.filename))
                 continue
 
@@ -1874,15 +3631,16 @@ class App(object):
                             possible_artist_updates[loop_artist_obj.normname] = True
                     else:
                         # Otherwise, try to load in the artist we should be, or create a new one
-                        try:
-                            artist_obj = Artist.objects.get(normname=norm_name)
+                        if norm_name in known_artists:
+                            artist_obj = known_artists[norm_name]
                             if artist_prefix != '' and artist_obj.prefix == '':
                                 artist_obj.prefix = artist_prefix
                                 artist_obj.save()
                                 yield (App.STATUS_DEBUG, 'Updated artist to include prefix: "%s"' %
                                     (artist_obj))
-                        except Artist.DoesNotExist:
+                        else:
                             artist_obj = Artist.objects.create(name=artist_name, prefix=artist_prefix)
+                            known_artists[norm_name] = artist_obj
                             yield (App.STATUS_INFO, 'Created new artist "%s"' % (artist_obj))
                         if loop_artist_obj is not None:
                             delete_rel_artists[loop_artist_obj] = True
@@ -1905,10 +3663,17 @@ class App(object):
                 delete_rel_albums[song.album] = True
                 album_changes[helper.base_dir] = True
                 to_update_helpers[song.filename] = helper
+        FileChecksum.store(new_checksums)
 
-        # If we have any album changes to make, do so.
+        # If we have any album changes to make, do so.  Songs we already know
+        # about are taken from ``db_paths``, so that any changes we've made to
+        # them above aren't lost, and the rest (which will have just been added)
+        # are loaded a directory at a time.
+        to_update_pks = set([song.pk for song in to_update])
         for album_basedir in album_changes.keys():
             files = App.get_filesystem_media(extra_base=album_basedir)
+            dir_songs = App.get_songs_by_filename([filename for filename in files
+                if filename not in db_paths and filename not in to_update_helpers])
             album_artist = {}
             album_tracks = {}
             album_denorm = {}
@@ -1923,20 +3688,24 @@ class App(object):
                             helper.song_obj.artist.name, helper.song_obj.artist.normname,
                             helper.song_obj)
                 else:
-                    try:
-                        song = Song.objects.get(filename=filename)
-                        # This is fudging a bit; these songs would only need a save() later
-                        # if they actually change, but whatever.
-                        to_update.append(song)
-                        album_tuple = (song.album.miscellaneous, song.album.live,
-                                song.album.name, song.album.normname,
-                            song.artist.name, song.artist.normname,
-                            song)
-                    except Song.DoesNotExist:   # pragma: no cover
+                    if filename in db_paths:
+                        song = db_paths[filename]
+                    elif filename in dir_songs:
+                        song = dir_songs[filename]
+                    else:   # pragma: no cover
                         # I'm not sure how we'd ever get in here.  Either the song will be in
                         # to_update_helpers or it'll be in the database.
                         yield (App.STATUS_ERROR, 'Could not find Song record for: %s' % (filename))
                         continue
+                    # This is fudging a bit; these songs would only need a save() later
+                    # if they actually change, but whatever.
+                    if song.pk not in to_update_pks:
+                        to_update.append(song)
+                        to_update_pks.add(song.pk)
+                    album_tuple = (song.album.miscellaneous, song.album.live,
+                            song.album.name, song.album.normname,
+                        song.artist.name, song.artist.normname,
+                        song)
 
                 # Album Artist Name detection
                 (miscellaneous, live, album, norm_album, artist, norm_artist, song_obj) = album_tuple
@@ -1973,12 +3742,16 @@ class App(object):
                 live = live_albums[norm_album]
                 yield (App.STATUS_DEBUG, 'Looking at album %s, artist %s, tracks %d' % (album, artist, len(tracks)))
 
-                try:
-                    artist_obj = Artist.objects.get(name=artist)
-                except Artist.DoesNotExist: # pragma: no cover
-                    # I don't think it should be possible to get here.
-                    yield (App.STATUS_ERROR, 'Artist "%s" not found for file change on album "%s"' % (artist, album))
-                    continue
+                if norm_artist in known_artists:
+                    artist_obj = known_artists[norm_artist]
+                else:
+                    try:
+                        artist_obj = Artist.objects.get(name=artist)
+                        known_artists[norm_artist] = artist_obj
+                    except Artist.DoesNotExist: # pragma: no cover
+                        # I don't think it should be possible to get here.
+                        yield (App.STATUS_ERROR, 'Artist "%s" not found for file change on album "%s"' % (artist, album))
+                        continue
 
                 # Check to see if we should update our current album record,
                 # use a different, existing album record, or create a brand-new
@@ -2041,10 +3814,15 @@ class App(object):
                         yield (App.STATUS_INFO, 'Updated album to "%s / %s" for: %s' % (album_obj.artist, album_obj, track.filename))
 
         # Now that we theoretically have song-change albums sorted, loop through
-        # again and save out all the song changes.
-        for song in to_update:
-            song.save()
-            yield (App.STATUS_DEBUG, 'Processed file changes for: %s' % (song.filename))
+        # again and save out all the song changes, a chunk at a time, each
+        # chunk inside a single transaction.
+        for idx in range(0, len(to_update), App.query_chunk_size):
+            chunk = to_update[idx:idx+App.query_chunk_size]
+            with transaction.atomic():
+                for song in chunk:
+                    song.save()
+            for song in chunk:
+                yield (App.STATUS_DEBUG, 'Processed file changes for: %s' % (song.filename))
 
         # Loop through the database for all albums/artists which have had records
         # deleted, and delete the album/artist if there's no more dependent data
@@ -2093,14 +3871,91 @@ class App(object):
                 # shouldn't be possible to get in here.
                 pass
 
+        # Now that everything's been processed, remember what our directories
+        # look like for next time.
+        DirectorySnapshot.store(new_snapshots,
+            [pk for (pk, snapshot) in old_snapshots.values()])
+
         # Get album art
-        for retline in App.update_album_art():
+        if scope == '':
+            art_albums = None
+        else:
+            art_albums = App.filter_scope(Album.objects.all(), scope,
+                field='song__filename').select_related('artist').distinct()
+        for retline in App.update_album_art(art_albums, listings):
+            yield retline
+        if App.get_pregenerate_thumbnails():
+            for retline in App.generate_thumbnails(art_albums, jobs):
+                yield retline
+        for retline in App.compact_thumbnails():
             yield retline
 
         # Finally, return
         yield (App.STATUS_SUCCESS, 'Finished update/clean!')
         return
 
+    @staticmethod
+    def move_songs(moves, skipped=[]):
+        """
+        Applies a list of moves which we already know about (from inotify,
+        for instance), so that no checksums are needed to match them up.
+        ``moves`` should be a list of tuples of ``(old_path, new_path, is_dir)``,
+        with paths relative to our base path, applied in order.  When
+        ``is_dir`` is ``True``, every song underneath ``old_path`` is moved
+        along with it.
+
+        Moves whose old path isn't a song we know about are ignored, since
+        whatever's at the new path will need a regular add anyway.  Moves
+        which would land on top of an existing song are appended to
+        ``skipped``, and left for a regular update to sort out.
+
+        Yields its processing status log as a generator, as tuples of the
+        form (status, text), like ``add()`` and ``update()``.
+        """
+        App.ensure_prefs()
+        base_path = App.prefs['exordium__base_path']
+        status = []
+        with transaction.atomic():
+            for (old_path, new_path, is_dir) in moves:
+                if is_dir:
+                    songs = [song for song in App.filter_scope(Song.objects.all(), old_path)
+                        if App.in_scope(song.filename, old_path)]
+                    new_filenames = ['%s%s' % (new_path, song.filename[len(old_path):])
+                        for song in songs]
+                else:
+                    songs = list(Song.objects.filter(filename=old_path))
+                    new_filenames = [new_path for song in songs]
+                if len(songs) == 0:
+                    continue
+                song_pks = set([song.pk for song in songs])
+                existing = set()
+                for idx in range(0, len(new_filenames), App.query_chunk_size):
+                    existing.update(Song.objects.filter(
+                        filename__in=new_filenames[idx:idx+App.query_chunk_size]
+                        ).values_list('pk', flat=True))
+                if len(existing - song_pks) > 0:
+                    status.append((App.STATUS_DEBUG, 'Not moving onto existing file: %s -> %s' % (
+                        old_path, new_path)))
+                    skipped.append((old_path, new_path, is_dir))
+                    continue
+                for (song, new_filename) in zip(songs, new_filenames):
+                    status.append((App.STATUS_INFO, 'File move detected: %s -> %s' % (
+                        song.filename, new_filename)))
+                    song.filename = new_filename
+                    try:
+                        media_file = MediaFile.from_stat(new_filename,
+                            os.stat(os.path.join(base_path, new_filename)))
+                        song.device = media_file.device
+                        song.inode = media_file.inode
+                    except OSError:
+                        # Presumably it's moved again since; our next update
+                        # will figure it out.
+                        pass
+                    song.save(update_fields=['filename', 'device', 'inode'])
+
+        for line in status:
+            yield line
+
     @staticmethod
     def get_cover_images(filelist):
         """
@@ -2152,20 +4007,53 @@ class App(object):
         return retlist
 
     @staticmethod
-    def get_directory_cover_image(directory):
+    def is_cover_filename(filename):
+        """
+        Returns True if ``filename`` has one of our ``cover_extensions``,
+        and so could be picked up by ``get_cover_images()``.
+        """
+        for ext in App.cover_extensions:
+            if filename.endswith(ext):
+                return True
+        return False
+
+    @staticmethod
+    def list_directory(directory, listings=None):
+        """
+        Returns the filenames in ``directory`` (a full path), for passing to
+        ``get_cover_images()``.  If the directory is found in ``listings``
+        (as filled in by ``walk_media_dirs()``), that will be used rather
+        than reading the directory again, in which case only the possible
+        cover images will be returned.
+        """
+        if listings is not None:
+            base_path = os.path.normpath(App.prefs['exordium__base_path'])
+            norm_dir = os.path.normpath(directory)
+            if norm_dir == base_path:
+                rel_dir = ''
+            elif norm_dir.startswith('%s/' % (base_path)):
+                rel_dir = norm_dir[len(base_path)+1:]
+            else:
+                rel_dir = None
+            if rel_dir in listings:
+                return list(listings[rel_dir].keys())
+        return os.listdir(directory)
+
+    @staticmethod
+    def get_directory_cover_image(directory, listings=None):
         """
         Scans our directory for a preferred cover image and returns
         the filename, or None.  Will do a reverse-recursion to the
         parent directory if no image files are found in the given
-        directory.
+        directory.  ``listings`` is as in ``list_directory()``.
         """
-        images = App.get_cover_images(os.listdir(directory))
+        images = App.get_cover_images(App.list_directory(directory, listings))
         if len(images) == 0:
             # Make sure we don't try to go outside of our library
             if os.path.normpath(directory) == os.path.normpath(App.prefs['exordium__base_path']):
                 return None
             else:
-                images = App.get_cover_images(os.listdir(os.path.join(directory, '..')))
+                images = App.get_cover_images(App.list_directory(os.path.join(directory, '..'), listings))
                 if len(images) == 0:
                     return None
                 else:
@@ -2174,12 +4062,87 @@ class App(object):
             return os.path.join(directory, images[0])
 
     @staticmethod
-    def update_album_art(albums=None):
+    def backfill_checksums(jobs=None):
+        """
+        Computes full checksums for any tracks which were added or updated
+        with deferred checksums, and so only have a fingerprint so far.
+        Yields its status log as tuples of (status, text), like ``add()``
+        and ``update()``.  ``jobs`` is as in ``add()``.
+
+        Tracks which have changed on disk since they were last scanned are
+        skipped, since the next ``update()`` will take care of them.
+        """
+
+        App.ensure_prefs()
+        jobs = App.get_jobs(jobs)
+        base_path = App.prefs['exordium__base_path']
+
+        songs = list(Song.objects.filter(sha256sum='').only('pk', 'filename', 'mtime_ns'))
+        if len(songs) == 0:
+            yield (App.STATUS_SUCCESS, 'No tracks need checksums!')
+            return
+        yield (App.STATUS_INFO, 'Total track checksums to compute: %d' % (len(songs)))
+
+        checksums_computed = 0
+        new_checksums = []
+        checksum_args = [(os.path.join(base_path, song.filename),) for song in songs]
+        for (song, result) in zip(songs,
+                App.pool_map(FileChecksum.try_compute, checksum_args, jobs=jobs)):
+            if result is None:
+                yield (App.STATUS_ERROR, 'Could not read file to compute checksum: %s' % (song.filename))
+                continue
+            (sha256sum, file_key) = result
+            if file_key is None or file_key[3] != song.mtime_ns:
+                yield (App.STATUS_DEBUG, 'File changed since it was last scanned, skipping: %s' % (song.filename))
+                continue
+
+            # Only fill in the checksum if the song hasn't been touched
+            # by anything else in the meantime.
+            Song.objects.filter(pk=song.pk, sha256sum='',
+                mtime_ns=song.mtime_ns).update(sha256sum=sha256sum)
+            new_checksums.append((file_key, sha256sum))
+            checksums_computed += 1
+            if len(new_checksums) >= App.query_chunk_size:
+                FileChecksum.store(new_checksums)
+                new_checksums = []
+                yield (App.STATUS_INFO, 'Checksums gathered for %d/%d tracks' % (
+                    checksums_computed, len(songs)))
+        FileChecksum.store(new_checksums)
+
+        yield (App.STATUS_SUCCESS, 'Finished computing checksums!')
+        yield (App.STATUS_SUCCESS, 'Checksums computed: %d' % (checksums_computed))
+
+    @staticmethod
+    def get_album_dirs(albums):
+        """
+        Returns a dict mapping the IDs of the given albums to the full path of
+        the directory their album art should be looked for in (that of their
+        first track, as with ``Album.get_album_image()``), using a query per
+        ``query_chunk_size`` albums rather than a couple per album.  Albums
+        without any tracks will be left out.
+        """
+        base_path = App.prefs['exordium__base_path']
+        album_pks = [album.pk for album in albums if not album.miscellaneous]
+        album_dirs = {}
+        for idx in range(0, len(album_pks), App.query_chunk_size):
+            for (album_id, filename) in Song.objects.filter(
+                    album_id__in=album_pks[idx:idx+App.query_chunk_size]
+                    ).values_list('album_id', 'filename'):
+                if album_id not in album_dirs:
+                    album_dirs[album_id] = os.path.dirname(os.path.join(base_path, filename))
+        return album_dirs
+
+    @staticmethod
+    def update_album_art(albums=None, listings=None):
         """
         Imports/Updates album art.  If ``albums`` is passed as a list of album objects,
         only those albums will be checked for album art, rather than looping through the
         whole database
 
+        ``listings`` is the directory listing cache filled in by ``walk_media_dirs()``.
+        Albums whose directories are found there are checked without having to touch
+        the filesystem at all, unless their art needs to be imported.
+
         Yields its entire processing status log as a generator, as tuples of the form
         (status, text).
 
@@ -2192,7 +4155,7 @@ class App(object):
         """
 
         if albums is None:
-            albums = Album.objects.all()
+            albums = Album.objects.all().select_related('artist')
 
         if len(albums) == 0:
             return
@@ -2200,14 +4163,16 @@ class App(object):
         yield (App.STATUS_INFO, 'Scanning for album art - albums to scan: %d' % (len(albums)))
 
         base_path = App.prefs['exordium__base_path']
+        album_dirs = App.get_album_dirs(albums)
         for album in albums:
-            if album.miscellaneous:
+            if album.miscellaneous or album.pk not in album_dirs:
                 continue
             if album.has_album_art():
-                for retline in album.update_album_art():
+                for retline in album.update_album_art(base_dir=album_dirs[album.pk],
+                        listings=listings):
                     yield retline
             else:
-                art_filename = album.get_album_image()
+                art_filename = album.get_album_image(album_dirs[album.pk], listings)
                 if art_filename:
                     yield (App.STATUS_DEBUG, 'Found art at %s' % (art_filename))
                     short_filename = art_filename[len(base_path)+1:]
@@ -2218,4 +4183,167 @@ class App(object):
                         (album.artist, album))
 
         yield (App.STATUS_INFO, 'Album art scanning finished')
+
+    @staticmethod
+    def generate_thumbnails(albums=None, jobs=None):
+        """
+        Generates resized album art (``AlbumArt`` records) at every size, for
+        the given list of albums (or the whole database), so that nobody
+        viewing the site has to wait for them.  Albums whose resized art is
+        already up to date (matching both the album's art mtime and our
+        current resolutions) are skipped.  The resizing itself is farmed out
+        to ``jobs`` worker processes, as in ``add()``.
+
+        Yields its processing status log as tuples of (status, text), like
+        ``update_album_art()``.
+        """
+
+        App.ensure_prefs()
+        jobs = App.get_jobs(jobs)
+        if albums is None:
+            albums = Album.objects.all().select_related('artist')
+        albums = [album for album in albums if album.has_album_art() and not album.miscellaneous]
+
+        # Find out which albums already have everything they need, without
+        # loading any of the image data.
+        current = set()
+        album_pks = [album.pk for album in albums]
+        for idx in range(0, len(album_pks), App.query_chunk_size):
+            current.update(AlbumArt.objects.filter(
+                album_id__in=album_pks[idx:idx+App.query_chunk_size]
+                ).values_list('album_id', 'size', 'from_mtime', 'resolution'))
+        to_render = []
+        for album in albums:
+            for (size, label) in AlbumArt.SIZE_CHOICES:
+                if (album.pk, size, album.art_mtime, AlbumArt.resolutions[size]) not in current:
+                    to_render.append(album)
+                    break
+        if len(to_render) == 0:
+            return
+
+        yield (App.STATUS_INFO, 'Generating album art thumbnails - albums to process: %d' % (len(to_render)))
+
+        # Every size gets regenerated for an album which needs any of them,
+        # so we can just replace whatever's there.
+        resolutions = [AlbumArt.resolutions[size] for (size, label) in AlbumArt.SIZE_CHOICES]
+        render_args = [(album.get_original_art_filename(), resolutions) for album in to_render]
+        generated = []
+        for (album, thumbnails) in zip(to_render,
+                App.pool_map(AlbumArt.try_render, render_args, jobs=jobs)):
+            if thumbnails is None:
+                yield (App.STATUS_ERROR, 'Could not generate album art thumbnails for "%s / %s"' % (
+                    album.artist, album))
+                continue
+            generated.append((album, thumbnails))
+            if len(generated) >= App.query_chunk_size:
+                for retline in App.store_thumbnails(generated):
+                    yield retline
+                generated = []
+        for retline in App.store_thumbnails(generated):
+            yield retline
+
+        yield (App.STATUS_INFO, 'Album art thumbnail generation finished')
+
+    @staticmethod
+    def store_thumbnails(generated):
+        """
+        Saves a list of ``(album, thumbnails)`` tuples from ``generate_thumbnails()``
+        to the database in a single transaction, replacing any existing resized
+        art for those albums.  Yields status lines like ``generate_thumbnails()``.
+        """
+        if len(generated) == 0:
+            return
+        new_art = []
+        for (album, thumbnails) in generated:
+            for (size, label) in AlbumArt.SIZE_CHOICES:
+                res = AlbumArt.resolutions[size]
+                new_art.append((AlbumArt(album=album, size=size, resolution=res,
+                    from_mtime=album.art_mtime), thumbnails[res]))
+        App.get_thumbnail_store().save_all(new_art)
+        try:
+            with transaction.atomic():
+                AlbumArt.objects.filter(album__in=[album for (album, thumbnails) in generated]).delete()
+                AlbumArt.objects.bulk_create([art for (art, data) in new_art])
+        except IntegrityError:  # pragma: no cover
+            # Someone viewing the site must have generated one of these at
+            # the same time; they'll be sorted out as they're viewed.
+            yield (App.STATUS_DEBUG, 'Album art thumbnails were created elsewhere while storing them')
+            return
+        for (album, thumbnails) in generated:
+            yield (App.STATUS_DEBUG, 'Generated album art thumbnails for "%s / %s"' % (album.artist, album))
         return
+
+    @staticmethod
+    def compact_thumbnails(force=False):
+        """
+        Compacts our thumbnail pack file (if we're using one), dropping
+        thumbnails which have since been replaced, or whose ``AlbumArt``
+        records no longer exist.  This only happens once enough of the pack
+        is taken up by them to be worthwhile, unless ``force`` is ``True``.
+
+        Yields its processing status log as tuples of (status, text), like
+        ``update_album_art()``.
+        """
+        store = App.get_thumbnail_store()
+        if not isinstance(store, PackThumbnailStore):
+            return
+        if not force and not store.needs_compaction():
+            return
+        keep = set(AlbumArt.objects.values_list('album_id', 'size', 'from_mtime', 'resolution'))
+        kept = store.compact(keep)
+        yield (App.STATUS_INFO, 'Compacted thumbnail pack file - thumbnails kept: %d' % (kept))
+
+    @staticmethod
+    def migrate_thumbnails(name):
+        """
+        Moves all our resized album art into the thumbnail store called
+        ``name`` (``database`` or ``pack``), and switches our
+        ``exordium__thumbnail_storage`` preference over to it.  Thumbnails
+        which can't be found get their ``AlbumArt`` records removed, so that
+        they'll be regenerated.
+
+        Yields its processing status log as tuples of (status, text), like
+        ``update_album_art()``.
+        """
+        App.ensure_prefs()
+        if name not in [PackThumbnailStore.name, DatabaseThumbnailStore.name]:
+            yield (App.STATUS_ERROR, 'Unknown thumbnail storage: %s' % (name))
+            return
+        if name == PackThumbnailStore.name and App.prefs['exordium__thumbnail_pack_path'] == '':
+            yield (App.STATUS_ERROR, 'Exordium Thumbnail Pack Path must be set to use pack file storage')
+            return
+        pack = App.get_thumbnail_store(PackThumbnailStore.name)
+
+        moved = 0
+        missing = 0
+        pks = list(AlbumArt.objects.order_by('pk').values_list('pk', flat=True))
+        for idx in range(0, len(pks), App.query_chunk_size):
+            arts = list(AlbumArt.objects.filter(pk__in=pks[idx:idx+App.query_chunk_size]))
+            if name == PackThumbnailStore.name:
+                to_move = [(art, bytes(art.image)) for art in arts if art.image]
+                pack.save_all(to_move)
+                AlbumArt.objects.filter(pk__in=[art.pk for (art, data) in to_move]).update(image=b'')
+                moved += len(to_move)
+            else:
+                with transaction.atomic():
+                    for art in arts:
+                        if art.image:
+                            continue
+                        data = None
+                        if isinstance(pack, PackThumbnailStore):
+                            data = pack.load(art)
+                        if data is None:
+                            art.delete()
+                            missing += 1
+                        else:
+                            art.image = data
+                            art.save(update_fields=['image'])
+                            moved += 1
+
+        App.prefs['exordium__thumbnail_storage'] = name
+        yield (App.STATUS_INFO, 'Thumbnails moved: %d' % (moved))
+        if missing > 0:
+            yield (App.STATUS_INFO, 'Thumbnails not found (to be regenerated when viewed): %d' % (missing))
+        for retline in App.compact_thumbnails(force=True):
+            yield retline
+        yield (App.STATUS_SUCCESS, 'Thumbnail storage is now: %s' % (name))
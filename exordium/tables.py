@@ -97,16 +97,23 @@ class AlbumTable(tables.Table):
 
     def render_tracks(self, record, **kwargs):
         """
-        Get a count of tracks for this album
+        Get a count of tracks for this album.  Uses the count from
+        ``Album.annotate_totals()`` if our data was annotated with it.
         """
+        if hasattr(record, 'num_tracks'):
+            return(record.num_tracks)
         return(record.song_set.count())
 
     def render_time(self, record, **kwargs):
         """
-        Get a total time for this album
+        Get a total time for this album.  Uses the total from
+        ``Album.annotate_totals()`` if our data was annotated with it.
         """
         #delta = datetime.timedelta(seconds=record.get_total_time())
-        length = record.get_total_time()
+        if hasattr(record, 'total_time'):
+            length = record.total_time or 0
+        else:
+            length = record.get_total_time() or 0
         minutes, seconds = divmod(length, 60)
         if minutes > 60:
             hours, minutes = divmod(minutes, 60)
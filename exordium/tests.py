@@ -1,6 +1,7 @@
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone, html
+from django.utils.http import http_date
 from django.db.models import Q
 from django.core.management import call_command
 from django.core.management.base import CommandError
@@ -12,25 +13,46 @@ from dynamic_preferences.registries import global_preferences_registry
 
 import io
 import os
+import json
+import time
 import shutil
 import pathlib
 import zipfile
 import datetime
 import tempfile
+import threading
+import unittest
 
 from mutagen.id3 import ID3, TIT2, TALB, TPE1, TDRC, TRCK, TDRL, TPE2, TPE3, TCOM
 from mutagen.oggvorbis import OggVorbis
 from mutagen.mp4 import MP4
 from PIL import Image
 
-from .models import Artist, Album, Song, App, AlbumArt
-from .views import UserAwareView, IndexView, add_session_success, add_session_fail, add_session_msg
+from .models import Artist, Album, Song, App, AlbumArt, ImportPipeline, FileChecksum, MediaFile, DirectorySnapshot
+from .models import ImportCheckpoint, ZipChecksum
+from .thumbnails import PackThumbnailStore, DatabaseThumbnailStore
+from .zipstream import ZipMember, ZipStream
+from .zipcache import ZipCache, ZipBuildQueue
+from .tables import AlbumTable
+from .views import UserAwareView, IndexView, AlbumDownloadView, AlbumSelectionZipStreamView, add_session_success, add_session_fail, add_session_msg
+from .watcher import Inotify, LibraryWatcher
 
 # These two imports are just here in case we want to examine SQL while running tests.
 # If so, set "settings.DEBUG = True" in the test and then use connection.queries
 #from django.conf import settings
 #from django.db import connection
 
+
+def inotify_available():
+    """
+    Returns True if we can use inotify on this system, for our watcher tests.
+    """
+    try:
+        Inotify().close()
+        return True
+    except OSError:
+        return False
+
 class ExordiumTests(TestCase):
     """
     Custom TestCase class for Exordium.  Includes our ``initial_data``
@@ -61,6 +83,19 @@ class ExordiumTests(TestCase):
         self.prefs = global_preferences_registry.manager()
         self.prefs['exordium__base_path'] = self.library_path
         self.prefs['exordium__media_url'] = 'http://testserver-media/music'
+        self.prefs['exordium__import_jobs'] = 1
+        self.prefs['exordium__import_batch_size'] = 0
+        self.prefs['exordium__defer_checksums'] = False
+        self.prefs['exordium__quick_scan'] = False
+        self.prefs['exordium__pregenerate_thumbnails'] = False
+        self.prefs['exordium__thumbnail_storage'] = 'database'
+        self.prefs['exordium__thumbnail_pack_path'] = ''
+        self.prefs['exordium__file_serving'] = 'django'
+        self.prefs['exordium__accel_redirect_prefix'] = ''
+        self.prefs['exordium__stream_tracks'] = False
+        self.prefs['exordium__zipfile_streaming'] = False
+        self.prefs['exordium__zipfile_build_jobs'] = 1
+        self.prefs['exordium__zipfile_quota'] = 0
 
         # We have one test which alters the following value, which
         # will stay changed between tests unless we restore it.
@@ -2592,6 +2627,48 @@ class BasicUpdateAsAddTests(BasicAddTests):
         """
         return self.assertErrors(list(App.update()), errors_min, error=error)
 
+class BasicAddParallelTests(BasicAddTests):
+    """
+    Runs all our add() tests again, but with checksums and tag parsing
+    farmed out to a pool of worker processes.  Results are consumed in
+    order, so everything should come out identically.
+    """
+
+    def run_add(self):
+        """
+        Runs an ``add`` operation on our library with two worker processes,
+        and checks for errors.
+        """
+        return self.assertNoErrors(list(App.add(jobs=2)))
+
+    def run_add_errors(self, errors_min=1, error=None):
+        """
+        Runs an ``add`` operation on our library with two worker processes,
+        and ensures that there's at least one error
+        """
+        return self.assertErrors(list(App.add(jobs=2)), errors_min, error=error)
+
+class BasicAddBatchedTests(BasicAddTests):
+    """
+    Runs all our add() tests again, but with batched database writes.  The
+    batch size is kept tiny so that most tests cover batches which span
+    more than one directory.
+    """
+
+    def run_add(self):
+        """
+        Runs an ``add`` operation on our library with batched writes, and
+        checks for errors.
+        """
+        return self.assertNoErrors(list(App.add(batch_size=3)))
+
+    def run_add_errors(self, errors_min=1, error=None):
+        """
+        Runs an ``add`` operation on our library with batched writes, and
+        ensures that there's at least one error
+        """
+        return self.assertErrors(list(App.add(batch_size=3)), errors_min, error=error)
+
 class BasicUpdateTests(ExordiumTests):
     """
     Tests for the update procedure - this time, tests specifically related
@@ -5542,6 +5619,46 @@ class BasicUpdateTests(ExordiumTests):
         self.assertEqual(album.art_mime, None)
         self.assertEqual(album.art_ext, None)
 
+    def test_update_album_change_keeps_other_tag_changes(self):
+        """
+        When one track in a directory changes albums and another track in the
+        same directory has some other tag change, both changes should stick.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', artist='Artist',
+            album='Album', title='Title 1', tracknum=1)
+        self.add_mp3(path='album', filename='song2.mp3', artist='Artist',
+            album='Album', title='Title 2', tracknum=2)
+        self.run_add()
+
+        self.update_mp3('album/song1.mp3', album='New Album')
+        self.update_mp3('album/song2.mp3', title='New Title 2')
+        self.run_update()
+
+        song1 = Song.objects.get(filename='album/song1.mp3')
+        song2 = Song.objects.get(filename='album/song2.mp3')
+        self.assertEqual(song1.album.name, 'New Album')
+        self.assertEqual(song2.album.name, 'Album')
+        self.assertEqual(song2.title, 'New Title 2')
+
+class BasicUpdateBatchedTests(BasicUpdateTests):
+    """
+    Runs all our update() tests again, but with batched database writes.
+    """
+
+    def run_update(self):
+        """
+        Runs an ``update`` operation on our library with batched writes,
+        and checks for errors.
+        """
+        return self.assertNoErrors(list(App.update(batch_size=3)))
+
+    def run_update_errors(self, errors_min=1, error=None):
+        """
+        Runs an ``update`` operation on our library with batched writes,
+        and ensures that there's at least one error.
+        """
+        return self.assertErrors(list(App.update(batch_size=3)), errors_min, error=error)
+
 class AlbumArtTests(ExordiumUserTests):
     """
     Tests about album art specifically
@@ -6047,7 +6164,7 @@ class AlbumArtTests(ExordiumUserTests):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'image/jpeg')
-        self.assertEqual(response.content, filedata, 'File data differs')
+        self.assertEqual(b''.join(response.streaming_content), filedata, 'File data differs')
 
     def test_album_art_view_retrieve_original_gif(self):
         """
@@ -6068,7 +6185,7 @@ class AlbumArtTests(ExordiumUserTests):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'image/gif')
-        self.assertEqual(response.content, filedata, 'File data differs')
+        self.assertEqual(b''.join(response.streaming_content), filedata, 'File data differs')
 
     def test_album_art_view_retrieve_original_png(self):
         """
@@ -6089,7 +6206,7 @@ class AlbumArtTests(ExordiumUserTests):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'image/png')
-        self.assertEqual(response.content, filedata, 'File data differs')
+        self.assertEqual(b''.join(response.streaming_content), filedata, 'File data differs')
 
     def test_album_art_view_retrieve_original_no_cover(self):
         """
@@ -6131,7 +6248,7 @@ class AlbumArtTests(ExordiumUserTests):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'image/jpeg')
-        self.assertEqual(response.content, filedata, 'File data differs')
+        self.assertEqual(b''.join(response.streaming_content), filedata, 'File data differs')
 
     def test_album_art_generate_album_thumb(self):
         """
@@ -6816,6 +6933,452 @@ class AlbumArtTests(ExordiumUserTests):
         al = Album.objects.get()
         self.assertEqual(al.has_album_art(), False)
 
+    def test_album_art_view_conditional(self):
+        """
+        Resized art should come with validators, and requests which send
+        them back should get a 304 without the image being loaded.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_art()
+        self.run_add()
+        al = Album.objects.get()
+        url = reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_ALBUM))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn(str(al.art_mtime), etag)
+        self.assertIn(str(AlbumArt.resolutions[AlbumArt.SZ_ALBUM]), etag)
+        self.assertEqual(response['Last-Modified'], http_date(al.art_mtime))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        # With the resized art gone, a 304 proves that we never went
+        # looking for it.
+        AlbumArt.objects.all().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(AlbumArt.objects.count(), 0)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(al.art_mtime))
+        self.assertEqual(response.status_code, 304)
+
+        # A different size has a different ETag
+        response = self.client.get(reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_LIST)),
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_album_art_view_conditional_changed(self):
+        """
+        Changed art, or a changed resolution, should invalidate the old
+        validators.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_art()
+        self.run_add()
+        al = Album.objects.get()
+        url = reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_ALBUM))
+        etag = self.client.get(url)['ETag']
+
+        AlbumArt.resolutions[AlbumArt.SZ_ALBUM] -= 10
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        self.touch_file('cover.jpg')
+        self.run_update()
+        al = Album.objects.get()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(str(al.art_mtime), response['ETag'])
+        self.assertEqual(AlbumArt.objects.get(album=al, size=AlbumArt.SZ_ALBUM).from_mtime, al.art_mtime)
+
+    def test_album_art_view_versioned(self):
+        """
+        URLs with the art's current mtime can be cached indefinitely, but
+        out-of-date versions can't.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_art()
+        self.run_add()
+        al = Album.objects.get()
+        for url in [reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_LIST)),
+                reverse('exordium:origalbumart', args=(al.pk, al.art_ext))]:
+            response = self.client.get(url, {'v': al.art_mtime})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('max-age=31536000', response['Cache-Control'])
+            self.assertIn('immutable', response['Cache-Control'])
+            response = self.client.get(url, {'v': al.art_mtime - 1})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_album_art_view_original_conditional(self):
+        """
+        Original art should also answer conditional requests.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_art()
+        self.run_add()
+        al = Album.objects.get()
+        url = reverse('exordium:origalbumart', args=(al.pk, al.art_ext))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(response['Last-Modified'], http_date(al.art_mtime))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(al.art_mtime))
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"something-else"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_album_art_view_original_sendfile(self):
+        """
+        Original art can be handed off to the web server with X-Sendfile.
+        """
+        self.prefs['exordium__file_serving'] = 'sendfile'
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Some Album')
+        self.add_art(path='Some Album')
+        self.run_add()
+        al = Album.objects.get()
+        response = self.client.get(reverse('exordium:origalbumart', args=(al.pk, al.art_ext)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.library_path, 'Some Album', 'cover.jpg'))
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+    def test_album_art_view_original_accel(self):
+        """
+        Original art can be handed off to the web server with
+        X-Accel-Redirect, but only once we have a prefix to send it to.
+        """
+        self.prefs['exordium__file_serving'] = 'accel'
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Some Album')
+        self.add_art(path='Some Album')
+        self.run_add()
+        al = Album.objects.get()
+        url = reverse('exordium:origalbumart', args=(al.pk, al.art_ext))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(b''.join(response.streaming_content), self.get_file_contents('Some Album/cover.jpg'))
+
+        self.prefs['exordium__accel_redirect_prefix'] = '/internal/music/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/music/Some%20Album/cover.jpg')
+        self.assertEqual(response.content, b'')
+
+    def test_album_art_view_original_content_length(self):
+        """
+        Original art streamed by Django should still have its length set.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_art()
+        self.run_add()
+        al = Album.objects.get()
+        response = self.client.get(reverse('exordium:origalbumart', args=(al.pk, al.art_ext)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(self.get_file_contents('cover.jpg')))
+
+    def test_album_art_view_conditional_no_art(self):
+        """
+        Albums without art should still 404, even for conditional requests.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.run_add()
+        al = Album.objects.get()
+        for url in [reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_LIST)),
+                reverse('exordium:origalbumart', args=(al.pk, 'jpg'))]:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+            self.assertEqual(response.status_code, 404)
+
+class PackThumbnailStoreTests(TestCase):
+    """
+    Tests for our ``PackThumbnailStore``, which don't need a library.
+    """
+
+    def setUp(self):
+        self.pack_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.pack_path)
+
+    def test_put_and_fetch(self):
+        """
+        Thumbnails should be retrievable only with a matching mtime and
+        resolution.
+        """
+        store = PackThumbnailStore(self.pack_path)
+        self.assertEqual(store.fetch(1, 'list', 100, 75), None)
+        store.put([(1, 'list', 75, 100, b'list data'), (1, 'album', 300, 100, b'album data')])
+        self.assertEqual(store.fetch(1, 'list', 100, 75), b'list data')
+        self.assertEqual(store.fetch(1, 'album', 100, 300), b'album data')
+        self.assertEqual(store.fetch(1, 'list', 101, 75), None)
+        self.assertEqual(store.fetch(1, 'list', 100, 80), None)
+        self.assertEqual(store.fetch(2, 'list', 100, 75), None)
+        self.assertEqual(store.get_entries(), {(1, 'list'): (100, 75), (1, 'album'): (100, 300)})
+
+    def test_other_writers(self):
+        """
+        Thumbnails written by another process should show up, and replace
+        the ones we've already seen.
+        """
+        reader = PackThumbnailStore(self.pack_path)
+        writer = PackThumbnailStore(self.pack_path)
+        writer.put([(1, 'list', 75, 100, b'old data')])
+        self.assertEqual(reader.fetch(1, 'list', 100, 75), b'old data')
+        writer.put([(1, 'list', 75, 200, b'new data')])
+        self.assertEqual(reader.fetch(1, 'list', 100, 75), None)
+        self.assertEqual(reader.fetch(1, 'list', 200, 75), b'new data')
+
+    def test_partial_index_entry(self):
+        """
+        A partially-written index entry should be ignored, and then written
+        over by the next thumbnail.
+        """
+        store = PackThumbnailStore(self.pack_path)
+        store.put([(1, 'list', 75, 100, b'list data')])
+        with open(store.index_path, 'ab') as df:
+            df.write(b'junk')
+        self.assertEqual(store.fetch(1, 'list', 100, 75), b'list data')
+        store.put([(2, 'list', 75, 100, b'more data')])
+        self.assertEqual(os.stat(store.index_path).st_size % PackThumbnailStore.entry.size, 0)
+        self.assertEqual(PackThumbnailStore(self.pack_path).fetch(2, 'list', 100, 75), b'more data')
+
+    def test_mismatched_pack(self):
+        """
+        If our pack doesn't agree with our index, we shouldn't return data.
+        """
+        store = PackThumbnailStore(self.pack_path)
+        store.put([(1, 'list', 75, 100, b'list data')])
+        with open(store.pack_path, 'r+b') as df:
+            df.write(b'XXXX')
+        self.assertEqual(PackThumbnailStore(self.pack_path).fetch(1, 'list', 100, 75), None)
+
+    def test_compact(self):
+        """
+        Compaction should drop replaced thumbnails, along with any we
+        weren't asked to keep, while readers carry on seeing the live ones.
+        """
+        store = PackThumbnailStore(self.pack_path)
+        reader = PackThumbnailStore(self.pack_path)
+        for mtime in range(10):
+            store.put([(1, 'list', 75, mtime, b'x'*1000)])
+        store.put([(1, 'album', 300, 9, b'album data'), (2, 'list', 75, 5, b'gone')])
+        self.assertEqual(reader.fetch(1, 'list', 9, 75), b'x'*1000)
+        self.assertFalse(store.needs_compaction())
+
+        store.compact_min_size = 0
+        self.assertTrue(store.needs_compaction())
+        self.assertEqual(store.compact(set([(1, 'list', 9, 75), (1, 'album', 9, 300)])), 2)
+        self.assertFalse(store.needs_compaction())
+        self.assertLess(os.stat(store.pack_path).st_size, 2000)
+        self.assertEqual(reader.fetch(1, 'list', 9, 75), b'x'*1000)
+        self.assertEqual(reader.fetch(1, 'album', 9, 300), b'album data')
+        self.assertEqual(reader.fetch(2, 'list', 5, 75), None)
+        self.assertEqual([f for f in os.listdir(self.pack_path) if f.startswith('.')], [])
+
+class ThumbnailStorageTests(ExordiumUserTests):
+    """
+    Tests for storing resized album art in a thumbnail pack rather than
+    the database.
+    """
+
+    def setUp(self):
+        super(ThumbnailStorageTests, self).setUp()
+        self.pack_path = tempfile.mkdtemp()
+        self.prefs['exordium__thumbnail_pack_path'] = self.pack_path
+
+    def tearDown(self):
+        super(ThumbnailStorageTests, self).tearDown()
+        shutil.rmtree(self.pack_path)
+
+    def add_album(self):
+        """
+        Adds a single album with art, returning it.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album')
+        self.run_add()
+        return Album.objects.get()
+
+    def test_get_store(self):
+        """
+        We should only use a pack if it's selected and has a path.
+        """
+        self.assertIsInstance(App.get_thumbnail_store(), DatabaseThumbnailStore)
+        self.prefs['exordium__thumbnail_storage'] = 'pack'
+        self.assertIsInstance(App.get_thumbnail_store(), PackThumbnailStore)
+        self.prefs['exordium__thumbnail_pack_path'] = ''
+        self.assertIsInstance(App.get_thumbnail_store(), DatabaseThumbnailStore)
+
+    def test_view_pack(self):
+        """
+        Art viewed with pack storage should end up in the pack rather than
+        the database, and versioned URLs should be served straight from the
+        pack.
+        """
+        self.prefs['exordium__thumbnail_storage'] = 'pack'
+        al = self.add_album()
+        url = reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_LIST))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        image = response.content
+        self.assertEqual(Image.open(io.BytesIO(image)).width, AlbumArt.resolutions[AlbumArt.SZ_LIST])
+        art = AlbumArt.objects.get()
+        self.assertEqual(bytes(art.image), b'')
+        self.assertEqual(art.get_image(), image)
+
+        # Without the album in the database, only versioned URLs can work.
+        Album.objects.all().delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(url, {'v': al.art_mtime})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, image)
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+        response = self.client.get(url, {'v': al.art_mtime}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, {'v': al.art_mtime - 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_missing_from_store(self):
+        """
+        Art whose record exists but whose data has gone missing from the
+        store should just be regenerated.
+        """
+        self.prefs['exordium__thumbnail_storage'] = 'pack'
+        al = self.add_album()
+        url = reverse('exordium:albumart', args=(al.pk, AlbumArt.SZ_LIST))
+        image = self.client.get(url).content
+        self.prefs['exordium__thumbnail_storage'] = 'database'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, image)
+        self.assertEqual(bytes(AlbumArt.objects.get().image), image)
+
+    def test_generate_thumbnails_pack(self):
+        """
+        Pre-generated art should go into the pack too.
+        """
+        self.prefs['exordium__thumbnail_storage'] = 'pack'
+        al = self.add_album()
+        self.assertNoErrors(list(App.generate_thumbnails()))
+        self.assertEqual(AlbumArt.objects.count(), len(AlbumArt.SIZE_CHOICES))
+        store = App.get_thumbnail_store()
+        for art in AlbumArt.objects.all():
+            self.assertEqual(bytes(art.image), b'')
+            self.assertIsNotNone(store.fetch(al.pk, art.size, al.art_mtime, art.resolution))
+
+    def test_migrate(self):
+        """
+        Thumbnails should move back and forth between stores, switching
+        our preference along with them.
+        """
+        al = self.add_album()
+        self.assertNoErrors(list(App.generate_thumbnails()))
+        images = dict([(art.size, bytes(art.image)) for art in AlbumArt.objects.all()])
+
+        results = self.assertNoErrors(list(App.migrate_thumbnails('pack')))
+        self.assertIn((App.STATUS_INFO, 'Thumbnails moved: %d' % (len(images))), results)
+        self.assertEqual(self.prefs['exordium__thumbnail_storage'], 'pack')
+        for art in AlbumArt.objects.all():
+            self.assertEqual(bytes(art.image), b'')
+            self.assertEqual(art.get_image(), images[art.size])
+
+        results = self.assertNoErrors(list(App.migrate_thumbnails('database')))
+        self.assertIn((App.STATUS_INFO, 'Thumbnails moved: %d' % (len(images))), results)
+        self.assertEqual(self.prefs['exordium__thumbnail_storage'], 'database')
+        for art in AlbumArt.objects.all():
+            self.assertEqual(bytes(art.image), images[art.size])
+
+    def test_migrate_missing(self):
+        """
+        Thumbnails missing from the pack should have their records removed
+        when moving to the database.
+        """
+        self.add_album()
+        self.assertNoErrors(list(App.migrate_thumbnails('pack')))
+        self.assertNoErrors(list(App.generate_thumbnails()))
+        for filename in [PackThumbnailStore.pack_filename, PackThumbnailStore.index_filename]:
+            os.unlink(os.path.join(self.pack_path, filename))
+        results = self.assertNoErrors(list(App.migrate_thumbnails('database')))
+        self.assertIn((App.STATUS_INFO, 'Thumbnails not found (to be regenerated when viewed): %d' % (
+            len(AlbumArt.SIZE_CHOICES))), results)
+        self.assertEqual(AlbumArt.objects.count(), 0)
+
+    def test_migrate_no_path(self):
+        """
+        We can't move to a pack without a path for it.
+        """
+        self.prefs['exordium__thumbnail_pack_path'] = ''
+        self.assertErrors(list(App.migrate_thumbnails('pack')),
+            error='Exordium Thumbnail Pack Path must be set')
+        self.assertEqual(self.prefs['exordium__thumbnail_storage'], 'database')
+
+    def test_migrate_command(self):
+        """
+        Our ``migratethumbnails`` management command should do the same.
+        """
+        self.add_album()
+        self.assertNoErrors(list(App.generate_thumbnails()))
+        out = io.StringIO()
+        call_command('migratethumbnails', 'pack', stdout=out)
+        self.assertIn('Thumbnail storage is now: pack', out.getvalue())
+        self.assertEqual(self.prefs['exordium__thumbnail_storage'], 'pack')
+
+        self.prefs['exordium__thumbnail_pack_path'] = ''
+        out = io.StringIO()
+        err = io.StringIO()
+        with self.assertRaises(CommandError) as cm:
+            call_command('migratethumbnails', 'pack', stdout=out, stderr=err)
+        self.assertIn('Errors encountered while migrating thumbnails: 1', cm.exception.args[0])
+
+    def test_update_compacts(self):
+        """
+        Updates should compact the pack once it's worth doing, dropping
+        art which has been replaced.
+        """
+        self.prefs['exordium__thumbnail_storage'] = 'pack'
+        self.prefs['exordium__pregenerate_thumbnails'] = True
+        al = self.add_album()
+        store = App.get_thumbnail_store()
+        for basefile in ['cover_400.gif', 'cover_400.png']:
+            self.add_art(path='album', basefile=basefile, filename='cover.jpg')
+            self.touch_file('album/cover.jpg')
+            self.run_update()
+        self.assertEqual(len(store.get_entries()), len(AlbumArt.SIZE_CHOICES))
+        pack_size = os.stat(store.pack_path).st_size
+
+        store.compact_min_size = 0
+        try:
+            results = self.run_update()
+        finally:
+            del store.compact_min_size
+        self.assertIn((App.STATUS_INFO, 'Compacted thumbnail pack file - thumbnails kept: %d' % (
+            len(AlbumArt.SIZE_CHOICES))), results)
+        self.assertLess(os.stat(store.pack_path).st_size, pack_size)
+        al = Album.objects.get()
+        for art in AlbumArt.objects.all():
+            self.assertIsNotNone(store.fetch(al.pk, art.size, al.art_mtime, art.resolution))
+
 class BasicAlbumArtTests(TestCase):
     """
     Album art related tests which don't actually require our full
@@ -6866,6 +7429,21 @@ class AlbumModelTests(TestCase):
         al = Album.objects.create(artist = ar, name = 'Album', normname = 'album')
         self.assertEqual(al.get_total_size_str(), '0 B')
 
+    def test_annotate_totals_no_songs(self):
+        """
+        ``Album.annotate_totals()`` should give a zero track count and no
+        total time for an album without any songs, which ``AlbumTable``
+        should render as zero.
+        """
+        ar = Artist.objects.create(name='Artist', normname='artist')
+        al = Album.objects.create(artist = ar, name = 'Album', normname = 'album')
+        al = Album.annotate_totals(Album.objects.all()).get()
+        self.assertEqual(al.num_tracks, 0)
+        self.assertEqual(al.total_time, None)
+        table = AlbumTable(Album.objects.all())
+        self.assertEqual(table.render_tracks(record=al), 0)
+        self.assertEqual(table.render_time(record=al), '0m')
+
 class AlbumZipfileErrorModelTests(TestCase):
     """
     Tests for our App.AlbumZipfileError exception, since we don't have
@@ -6934,81 +7512,2197 @@ class AppModelTests(TestCase):
         self.assertEqual(Album.objects.count(), 0)
         self.assertEqual(Song.objects.count(), 0)
 
-class IndexViewTests(ExordiumUserTests):
+class AppPoolTests(ExordiumTests):
     """
-    Tests of our main index view.  (Not a whole lot going on, really)
+    Tests for the worker-pool support used by ``App.add()`` and
+    ``App.update()``.
     """
 
-    def test_no_albums(self):
+    def test_get_jobs_default(self):
         """
-        Test what happens if there are no albums defined.  (No albums should
-        be found in the view's context.)  This test also tests for the various
-        links which are supposed to be present on the main page.
+        With nothing specified, we should use our preference, which
+        defaults to a single process.
         """
-        response = self.client.get(reverse('exordium:index'))
-        self.assertEqual(response.status_code, 200)
-        self.assertQuerysetEqual(response.context['album_list'].data, [])
+        self.assertEqual(App.get_jobs(), 1)
 
-        self.assertContains(response, 'AnonymousUser')
-        self.assertContains(response, reverse('exordium:browse_artist'))
-        self.assertContains(response, reverse('exordium:browse_album'))
-        self.assertContains(response, reverse('exordium:updateprefs'))
+    def test_get_jobs_preference(self):
+        """
+        Our preference should be used if we don't pass anything in.
+        """
+        self.prefs['exordium__import_jobs'] = 3
+        self.assertEqual(App.get_jobs(), 3)
+        self.assertEqual(App.get_jobs(2), 2)
 
-        # We are not authenticated, so we should NOT see any of the admin
-        # links anywhere.
-        self.assertNotContains(response, reverse('exordium:library'))
-        self.assertNotContains(response, reverse('admin:dynamic_preferences_globalpreferencemodel_changelist'))
-        self.assertNotContains(response, '%s"' % (reverse('admin:index')))
+    def test_get_jobs_auto(self):
+        """
+        Zero means one process per CPU.
+        """
+        self.assertEqual(App.get_jobs(0), os.cpu_count() or 1)
 
-        # But we SHOULD see a login link
-        self.assertContains(response, reverse('admin:login'))
+    def test_pool_map_inline(self):
+        """
+        With a single job, ``pool_map()`` just runs the function in-process.
+        """
+        results = list(App.pool_map(max, [(1, 2), (4, 3), (5, 6)], jobs=1))
+        self.assertEqual(results, [2, 4, 6])
 
-    def test_no_albums_admin(self):
+    def test_pool_map_preserves_order(self):
         """
-        Test what happens if there are no albums defined.  (No albums should
-        be found in the view's context.)  This test also tests for the various
-        links which are supposed to be present on the main page.  This time,
-        request as if we're an admin.
+        With a pool, results should still come back in the order we
+        asked for them, even when there are more tasks than we queue
+        up at once.
         """
-        self.login()
-        response = self.client.get(reverse('exordium:index'))
-        self.assertContains(response, 'mainuser')
-        self.assertEqual(response.status_code, 200)
-        self.assertQuerysetEqual(response.context['album_list'].data, [])
+        arglist = [(i, 50-i) for i in range(50)]
+        results = list(App.pool_map(max, arglist, jobs=2))
+        self.assertEqual(results, [max(a, b) for (a, b) in arglist])
 
-        self.assertContains(response, 'mainuser')
-        self.assertContains(response, reverse('exordium:browse_artist'))
-        self.assertContains(response, reverse('exordium:browse_album'))
-        self.assertContains(response, reverse('exordium:updateprefs'))
+    def test_pool_map_abandoned(self):
+        """
+        Abandoning the generator partway through shouldn't cause any
+        problems.
+        """
+        gen = App.pool_map(max, [(i, i) for i in range(100)], jobs=2)
+        self.assertEqual(next(gen), 0)
+        self.assertEqual(next(gen), 1)
+        gen.close()
 
-        # We are authenticated, so we should see the admin links.
-        self.assertContains(response, reverse('exordium:library'))
-        self.assertContains(response, reverse('admin:dynamic_preferences_globalpreferencemodel_changelist'))
-        self.assertContains(response, reverse('admin:index'))
+    def test_pool_map_spawn(self):
+        """
+        Workers which are started from scratch (as on Windows and macOS)
+        rather than forked should set Django up for themselves, so that
+        they can run functions from our models.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        full_filename = os.path.join(self.library_path, 'song.mp3')
+        orig_start_method = App.pool_start_method
+        App.pool_start_method = 'spawn'
+        try:
+            results = list(App.pool_map(Song.get_fingerprint, [(full_filename,)]*3, jobs=2))
+        finally:
+            App.pool_start_method = orig_start_method
+        self.assertEqual(results, [Song.get_fingerprint(full_filename)]*3)
+
+    def test_pool_map_shared_pool(self):
+        """
+        A pool passed in to ``pool_map()`` should be used, and left running
+        for the caller to shut down.
+        """
+        pool = App.get_pool(2)
+        try:
+            self.assertEqual(list(App.pool_map(max, [(1, 2), (4, 3)], jobs=2, pool=pool)), [2, 4])
+            self.assertEqual(list(App.pool_map(max, [(5, 6)], jobs=2, pool=pool)), [6])
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def test_update_parallel(self):
+        """
+        Runs an update with multiple processes, including a move and a
+        new file, and make sure everything ends up where it should be.
+        """
+        self.add_mp3(path='Album', filename='song1.mp3', artist='Artist',
+            title='Title 1', album='Album', tracknum=1)
+        self.add_mp3(path='Album', filename='song2.mp3', artist='Artist',
+            title='Title 2', album='Album', tracknum=2)
+        self.assertNoErrors(list(App.add(jobs=2)))
+        self.assertEqual(Song.objects.count(), 2)
+
+        self.move_file('Album/song2.mp3', 'Album/Moved')
+        self.add_mp3(path='Album', filename='song3.mp3', artist='Artist',
+            title='Title 3', album='Album', tracknum=3)
+        self.update_mp3('Album/song1.mp3', title='New Title 1')
+        self.assertNoErrors(list(App.update(jobs=2)))
 
-        # But we should NOT see a login link
-        self.assertNotContains(response, reverse('admin:login'))
+        self.assertEqual(Song.objects.count(), 3)
+        self.assertEqual(Album.objects.count(), 1)
+        self.assertEqual(Song.objects.get(tracknum=1).title, 'New Title 1')
+        self.assertEqual(Song.objects.get(tracknum=2).filename, 'Album/Moved/song2.mp3')
+        self.assertEqual(Song.objects.get(tracknum=3).title, 'Title 3')
 
-    def test_single_album(self):
+    def test_update_parallel_retag(self):
         """
-        Test what happens when there's a single album.  We should see that
-        album!
+        Runs an update with multiple processes where lots of files have
+        been retagged (and one can't be read), making sure each song gets
+        its own new tags.
         """
-        self.add_mp3(artist='Artist', title='Title 1',
-            album='Test Album', filename='song1.mp3')
-        self.run_add()
-        self.assertEqual(Album.objects.count(), 1)
-        album = Album.objects.get()
+        for num in range(1, 7):
+            self.add_mp3(path='Album', filename='song%d.mp3' % (num), artist='Artist',
+                title='Title %d' % (num), album='Album', tracknum=num)
+        self.assertNoErrors(list(App.add(jobs=2)))
+        self.assertEqual(Song.objects.count(), 6)
 
-        response = self.client.get(reverse('exordium:index'))
-        self.assertEqual(response.status_code, 200)
-        self.assertQuerysetEqual(response.context['album_list'].data, [repr(album)])
-        self.assertContains(response, 'Test Album')
-        self.assertContains(response, reverse('exordium:album', args=(album.pk,)))
-        self.assertContains(response, reverse('exordium:artist', args=(album.artist.normname,)))
-        self.assertContains(response, '1 album')
+        for num in range(1, 7):
+            self.update_mp3('Album/song%d.mp3' % (num), title='New Title %d' % (num))
+        os.chmod(os.path.join(self.library_path, 'Album', 'song3.mp3'), 0)
+        self.assertErrors(list(App.update(jobs=2)), 1,
+            error='Could not read updated information for: Album/song3.mp3')
 
-        # May as well verify that we're seeing the no-album-art cover, as well
+        for num in range(1, 7):
+            song = Song.objects.get(tracknum=num)
+            if num == 3:
+                self.assertEqual(song.title, 'Title 3')
+            else:
+                self.assertEqual(song.title, 'New Title %d' % (num))
+                self.assertEqual(song.sha256sum, Song.get_sha256sum(song.full_filename()))
+
+class AppBatchTests(ExordiumTests):
+    """
+    Tests for the batched database writes used by ``App.add()``
+    """
+
+    def test_get_batch_size_default(self):
+        """
+        With nothing specified, we should use our preference, which
+        defaults to writing tracks individually.
+        """
+        self.assertEqual(App.get_batch_size(), 0)
+
+    def test_get_batch_size_preference(self):
+        """
+        Our preference should be used if we don't pass anything in, and
+        negative values are treated as zero.
+        """
+        self.prefs['exordium__import_batch_size'] = 100
+        self.assertEqual(App.get_batch_size(), 100)
+        self.assertEqual(App.get_batch_size(5), 5)
+        self.assertEqual(App.get_batch_size(-5), 0)
+
+    def test_batch_dirs(self):
+        """
+        Directories should be grouped until they hold at least the batch
+        size in tracks, without splitting any directory up.
+        """
+        dirs = [('a', [], [1, 2]), ('b', [], [1]), ('c', [], [1, 2, 3]), ('d', [], [1])]
+        self.assertEqual([[d[0] for d in batch] for batch in App.batch_dirs(dirs, 3)],
+            [['a', 'b'], ['c'], ['d']])
+        self.assertEqual([[d[0] for d in batch] for batch in App.batch_dirs(dirs, 0)],
+            [['a'], ['b'], ['c'], ['d']])
+        self.assertEqual(list(App.batch_dirs([], 3)), [])
+
+    def test_add_preference(self):
+        """
+        Setting our preference should result in batched writes, with the
+        same results as usual.
+        """
+        self.prefs['exordium__import_batch_size'] = 2
+        for num in range(5):
+            self.add_mp3(path='album', filename='song%d.mp3' % (num),
+                artist='Artist', album='Album', title='Title %d' % (num), tracknum=num+1)
+        self.add_mp3(path='other', filename='song.mp3', artist='Artist 2',
+            album='Album 2', title='Title')
+        results = self.run_add()
+        self.assertIn((App.STATUS_SUCCESS, 'Songs added: 6'), results)
+        self.assertEqual(Song.objects.count(), 6)
+        self.assertEqual(Album.objects.get(name='Album').song_set.count(), 5)
+        self.assertEqual(Album.objects.get(name='Album 2').artist.name, 'Artist 2')
+
+    def test_update_batched(self):
+        """
+        New files found during an update should be written in batches too.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', artist='Artist',
+            album='Album', title='Title 1', tracknum=1)
+        self.run_add()
+        for num in range(2, 6):
+            self.add_mp3(path='album', filename='song%d.mp3' % (num),
+                artist='Artist', album='Album', title='Title %d' % (num), tracknum=num)
+        self.assertNoErrors(list(App.update(batch_size=2)))
+        self.assertEqual(Song.objects.count(), 5)
+        self.assertEqual(Album.objects.count(), 1)
+
+class ImportPipelineTests(ExordiumTests):
+    """
+    Tests for the threaded ``ImportPipeline`` which ``App.add()`` uses to
+    overlap filesystem, checksum and database work.
+    """
+
+    def test_no_new_music(self):
+        """
+        An add with nothing to do should tell us so.
+        """
+        results = self.run_add()
+        self.assertIn((App.STATUS_SUCCESS, 'No new music found!'), results)
+        self.assertEqual(Song.objects.count(), 0)
+
+    def test_results_in_order(self):
+        """
+        Results should come out a directory at a time, in the order the
+        directories were handed to us, with files in their original order.
+        """
+        for (path, num) in [('one', 3), ('two', 1), ('three', 2)]:
+            for tracknum in range(num):
+                self.add_mp3(path=path, filename='song%d.mp3' % (tracknum),
+                    artist='Artist', title='Title %d' % (tracknum))
+        to_add = [
+            ('three/song1.mp3', None),
+            ('one/song0.mp3', None),
+            ('three/song0.mp3', None),
+            ('one/song2.mp3', None),
+            ('two/song0.mp3', None),
+            ('one/song1.mp3', None),
+        ]
+        pipeline = ImportPipeline(App.group_by_dir(to_add), self.library_path, jobs=2)
+        results = list(pipeline)
+        self.assertEqual([base_dir for (base_dir, retlines, dir_results) in results],
+            ['three', 'one', 'two'])
+        self.assertEqual([r[0] for r in results[0][2]], ['three/song1.mp3', 'three/song0.mp3'])
+        self.assertEqual([r[0] for r in results[1][2]], ['one/song0.mp3', 'one/song2.mp3', 'one/song1.mp3'])
+        for (base_dir, retlines, dir_results) in results:
+            for (short_filename, sha256sum, song_info) in dir_results:
+                self.assertEqual(sha256sum, None)
+                self.assertEqual(song_info[5]['filename'], short_filename)
+                self.assertEqual(len(song_info[5]['sha256sum']), 64)
+
+    def test_pool_started_before_threads(self):
+        """
+        Worker processes should be started from the iterating thread before
+        our own threads are, and shut down once we're done.
+        """
+        self.add_mp3(path='one', filename='song.mp3', artist='Artist', title='Title')
+        orig_get_pool = App.get_pool
+        thread_names = []
+        def get_pool(jobs):
+            thread_names.extend([thread.name for thread in threading.enumerate()])
+            return orig_get_pool(jobs)
+        App.get_pool = staticmethod(get_pool)
+        try:
+            pipeline = ImportPipeline(App.group_by_dir([('one/song.mp3', None)]),
+                self.library_path, jobs=2)
+            results = list(pipeline)
+        finally:
+            App.get_pool = orig_get_pool
+        self.assertEqual(len(results), 1)
+        self.assertNotEqual(thread_names, [])
+        self.assertNotIn('exordium-walker', thread_names)
+        self.assertNotIn('exordium-scanner', thread_names)
+        self.assertEqual(pipeline.pool, None)
+
+    def test_scan_errors_passed_through(self):
+        """
+        Status lines from scanning a file should be attached to its
+        directory's results.
+        """
+        self.add_mp3(path='album', filename='song.mp3', title='Title')
+        results = list(ImportPipeline(App.find_new_media(self.library_path, {}),
+            self.library_path))
+        self.assertEqual(len(results), 1)
+        (base_dir, retlines, dir_results) = results[0]
+        self.assertEqual(base_dir, 'album')
+        self.assertIn((App.STATUS_DEBUG, 'Found file: album/song.mp3'), retlines)
+        self.assertIn('Artist name not found', retlines[-1][1])
+        self.assertEqual(dir_results[0][2], None)
+
+    def test_walker_exception(self):
+        """
+        An exception in the walker thread should be raised in the thread
+        iterating over the pipeline.
+        """
+        def batches():
+            yield ('', [], [])
+            raise ValueError('walker failure')
+
+        with self.assertRaises(ValueError) as cm:
+            list(ImportPipeline(batches(), self.library_path))
+        self.assertEqual(cm.exception.args[0], 'walker failure')
+
+    def test_abandoned(self):
+        """
+        Abandoning the pipeline before it's finished should shut down our
+        threads without any trouble, even if they're waiting on full queues.
+        """
+        def batches():
+            while True:
+                yield ('', [('file.mp3', None)], [])
+
+        self.add_mp3(filename='file.mp3', artist='Artist', title='Title')
+        pipeline = ImportPipeline(batches(), self.library_path)
+        gen = iter(pipeline)
+        next(gen)
+        gen.close()
+        self.assertTrue(pipeline.stop_event.is_set())
+
+    def test_add_multiple_directories(self):
+        """
+        A Various Artists directory and a regular album in separate
+        directories, processed through the pipeline, should come out the
+        same way they always have.
+        """
+        self.add_mp3(path='va', filename='song1.mp3', artist='Artist 1',
+            title='Title 1', album='Comp')
+        self.add_mp3(path='va', filename='song2.mp3', artist='Artist 2',
+            title='Title 2', album='Comp')
+        self.add_mp3(path='album', filename='song1.mp3', artist='Artist 1',
+            title='Title 3', album='Album')
+        self.run_add()
+
+        self.assertEqual(Song.objects.count(), 3)
+        self.assertEqual(Album.objects.get(name='Comp').artist.name, 'Various')
+        self.assertEqual(Album.objects.get(name='Album').artist.name, 'Artist 1')
+
+class FileChecksumTests(ExordiumTests):
+    """
+    Tests for our ``FileChecksum`` cache, and for nanosecond mtime
+    tracking on songs.
+    """
+
+    fake_sum = '0'*64
+
+    def set_cached_sum(self, sha256sum):
+        """
+        Sets the checksum in all our cache entries to ``sha256sum``, so
+        that we can tell whether the cache was used or not.
+        """
+        FileChecksum.objects.all().update(sha256sum=sha256sum)
+
+    def clear_library(self):
+        """
+        Removes everything from the database except the checksum cache,
+        as if the library had been rebuilt.
+        """
+        Song.objects.all().delete()
+        Album.objects.all().delete()
+        Artist.objects.all().delete()
+
+    def test_add_populates_cache(self):
+        """
+        Adding a file should store its checksum in the cache, along with
+        its on-disk identity.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.assertEqual(Song.objects.count(), 1)
+        song = Song.objects.get()
+        stat_result = os.stat(song.full_filename())
+        self.assertEqual(FileChecksum.objects.count(), 1)
+        checksum = FileChecksum.objects.get()
+        self.assertEqual(checksum.sha256sum, song.sha256sum)
+        self.assertEqual(checksum.inode, stat_result.st_ino)
+        self.assertEqual(checksum.size, stat_result.st_size)
+        self.assertEqual(checksum.mtime_ns, stat_result.st_mtime_ns)
+        self.assertEqual(song.mtime_ns, stat_result.st_mtime_ns)
+
+    def test_add_uses_cache(self):
+        """
+        Re-adding a file after the library has been cleared out should
+        pull its checksum from the cache rather than re-reading it.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.set_cached_sum(self.fake_sum)
+        self.clear_library()
+        self.run_add()
+        self.assertEqual(Song.objects.get().sha256sum, self.fake_sum)
+        self.assertEqual(FileChecksum.objects.count(), 1)
+
+    def test_add_ignores_stale_cache(self):
+        """
+        A cache entry for a file which has since changed should be ignored
+        and replaced.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.set_cached_sum(self.fake_sum)
+        self.clear_library()
+        self.update_mp3('song.mp3', title='New Title')
+        self.run_add()
+        song = Song.objects.get()
+        self.assertNotEqual(song.sha256sum, self.fake_sum)
+        self.assertEqual(FileChecksum.objects.count(), 1)
+        self.assertEqual(FileChecksum.objects.get().sha256sum, song.sha256sum)
+
+    def test_update_move_uses_cache(self):
+        """
+        Move detection during an update should use the cache for the
+        moved file's checksum.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.set_cached_sum(self.fake_sum)
+        Song.objects.all().update(sha256sum=self.fake_sum)
+        self.move_file('song.mp3', 'moved')
+        self.run_update()
+        self.assertEqual(Song.objects.count(), 1)
+        song = Song.objects.get()
+        self.assertEqual(song.filename, 'moved/song.mp3')
+        self.assertEqual(song.sha256sum, self.fake_sum)
+
+    def test_update_refreshes_cache(self):
+        """
+        Updating a changed file should store its new checksum in the cache.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        old_sum = Song.objects.get().sha256sum
+        self.update_mp3('song.mp3', title='New Title')
+        self.run_update()
+        song = Song.objects.get()
+        self.assertEqual(song.title, 'New Title')
+        self.assertNotEqual(song.sha256sum, old_sum)
+        self.assertEqual(FileChecksum.objects.count(), 1)
+        self.assertEqual(FileChecksum.objects.get().sha256sum, song.sha256sum)
+
+    def test_update_same_second_change(self):
+        """
+        A change to a file within the same second as its last known mtime
+        should still be noticed.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        full_filename = os.path.join(self.library_path, 'song.mp3')
+        base_ns = 1500000000 * 10**9 + 1000
+        os.utime(full_filename, ns=(base_ns, base_ns))
+        self.run_add()
+        self.assertEqual(Song.objects.get().mtime_ns, base_ns)
+
+        self.update_mp3('song.mp3', title='New Title')
+        os.utime(full_filename, ns=(base_ns+1000, base_ns+1000))
+        self.run_update()
+        song = Song.objects.get()
+        self.assertEqual(song.title, 'New Title')
+        self.assertEqual(song.mtime_ns, base_ns+1000)
+
+    def test_changed_on_disk_without_mtime_ns(self):
+        """
+        Songs without a nanosecond mtime (added by older versions) should
+        fall back to comparing whole seconds.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        full_filename = os.path.join(self.library_path, 'song.mp3')
+        base_ns = 1500000000 * 10**9 + 1000
+        os.utime(full_filename, ns=(base_ns, base_ns))
+        self.run_add()
+        Song.objects.all().update(mtime_ns=0)
+        os.utime(full_filename, ns=(base_ns+1000, base_ns+1000))
+        self.assertFalse(Song.objects.get().changed_on_disk())
+        self.touch_file('song.mp3')
+        self.assertTrue(Song.objects.get().changed_on_disk())
+
+    def test_lookup_missing_file(self):
+        """
+        Looking up a file which doesn't exist should return ``None``
+        """
+        self.assertEqual(FileChecksum.lookup({},
+            os.path.join(self.library_path, 'missing.mp3')), None)
+
+    def test_store_replaces(self):
+        """
+        Storing a new checksum for a file should replace the old entry.
+        """
+        FileChecksum.store([((1, 2, 3, 4), self.fake_sum)])
+        FileChecksum.store([((1, 2, 5, 6), 'f'*64), ((1, 2, 5, 6), 'f'*64)])
+        self.assertEqual(FileChecksum.objects.count(), 1)
+        checksum = FileChecksum.objects.get()
+        self.assertEqual(checksum.size, 5)
+        self.assertEqual(checksum.mtime_ns, 6)
+        self.assertEqual(checksum.sha256sum, 'f'*64)
+
+    def test_load_keys(self):
+        """
+        Loading the cache for a list of keys should only return the
+        entries for those files.
+        """
+        FileChecksum.store([((1, 2, 3, 4), self.fake_sum), ((1, 5, 3, 4), 'e'*64),
+            ((6, 2, 3, 4), 'f'*64)])
+        self.assertEqual(len(FileChecksum.load()), 3)
+        cache = FileChecksum.load([(1, 2, 3, 4), (6, 2, 0, 0), (7, 8, 9, 10)])
+        self.assertEqual(cache, {(1, 2): (3, 4, self.fake_sum), (6, 2): (3, 4, 'f'*64)})
+        self.assertEqual(FileChecksum.load([]), {})
+
+    def test_scoped_add_uses_cache(self):
+        """
+        A scoped add should still pull checksums for the files it finds
+        from the cache, without loading entries for files elsewhere.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', artist='Artist', title='Title 1')
+        self.add_mp3(path='other', filename='song2.mp3', artist='Artist', title='Title 2')
+        self.run_add()
+        self.set_cached_sum(self.fake_sum)
+        self.clear_library()
+        self.assertNoErrors(list(App.add(scope='album')))
+        self.assertEqual(Song.objects.get().sha256sum, self.fake_sum)
+        self.assertEqual(FileChecksum.objects.count(), 2)
+
+    def test_to_signed(self):
+        """
+        Unsigned 64-bit device and inode numbers should wrap around into
+        the signed range.
+        """
+        self.assertEqual(FileChecksum.to_signed(5), 5)
+        self.assertEqual(FileChecksum.to_signed(2**63-1), 2**63-1)
+        self.assertEqual(FileChecksum.to_signed(2**63), -2**63)
+        self.assertEqual(FileChecksum.to_signed(2**64-1), -1)
+
+class WalkMediaDirsTests(ExordiumTests):
+    """
+    Tests for ``App.walk_media_dirs()``, our scandir-based library walker
+    """
+
+    def walk(self):
+        """
+        Walks our whole library and returns a dict of ``MediaFile`` objects
+        by filename, plus the list of directories in the order walked.
+        """
+        media = {}
+        dirs = []
+        for (base_dir, dir_media, snapshot) in App.walk_media_dirs(self.library_path, self.library_path):
+            dirs.append(base_dir)
+            for media_file in dir_media:
+                self.assertNotIn(media_file.filename, media)
+                media[media_file.filename] = media_file
+        return (media, dirs)
+
+    def test_stat_info(self):
+        """
+        Media files should come back with the stat information we need.
+        """
+        self.add_mp3(path='album', filename='song.mp3')
+        self.add_ogg(path='album', filename='song.ogg')
+        self.add_art(path='album')
+        (media, dirs) = self.walk()
+        self.assertEqual(sorted(media.keys()), ['album/song.mp3', 'album/song.ogg'])
+        stat_result = os.stat(os.path.join(self.library_path, 'album', 'song.mp3'))
+        media_file = media['album/song.mp3']
+        self.assertEqual(media_file, MediaFile.from_stat('album/song.mp3', stat_result))
+        self.assertEqual(media_file.size, stat_result.st_size)
+        self.assertEqual(media_file.mtime_ns, stat_result.st_mtime_ns)
+        self.assertEqual(media_file.inode, stat_result.st_ino)
+        self.assertEqual(media_file.file_key(), FileChecksum.get_file_key(stat_result))
+
+    def test_order_matches_os_walk(self):
+        """
+        Directories should be walked in the same order as ``os.walk()``
+        """
+        for path in ['a', 'a/b', 'a/b/c', 'a/d', 'e', 'e/f', 'g']:
+            self.add_mp3(path=path, filename='song.mp3')
+        (media, dirs) = self.walk()
+        walk_dirs = [dirpath[len(self.library_path)+1:] for (dirpath, dirnames, filenames)
+            in os.walk(self.library_path, followlinks=True)]
+        self.assertEqual(dirs, walk_dirs)
+        self.assertEqual(len(media), 7)
+
+    def test_symlink_loop(self):
+        """
+        A symlink back to a parent directory shouldn't send us around in
+        circles.
+        """
+        self.add_mp3(path='album', filename='song.mp3', artist='Artist',
+            title='Title')
+        os.symlink('..', os.path.join(self.library_path, 'album', 'loop'))
+        (media, dirs) = self.walk()
+        self.assertEqual(list(media.keys()), ['album/song.mp3'])
+
+        self.run_add()
+        self.assertEqual(Song.objects.count(), 1)
+        self.run_update()
+        self.assertEqual(Song.objects.count(), 1)
+
+    def test_symlink_outside_library(self):
+        """
+        Symlinks to directories outside the library should still be followed.
+        """
+        external_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, external_path)
+        shutil.copyfile(os.path.join(self.testdata_path, 'silence-vbr.mp3'),
+            os.path.join(external_path, 'song.mp3'))
+        os.symlink(external_path, os.path.join(self.library_path, 'external'))
+        (media, dirs) = self.walk()
+        self.assertEqual(list(media.keys()), ['external/song.mp3'])
+
+    def test_missing_start(self):
+        """
+        Walking a directory which doesn't exist should just return nothing
+        """
+        self.assertEqual(list(App.walk_media_dirs(self.library_path,
+            os.path.join(self.library_path, 'missing'))), [])
+
+    def test_update_same_second_legacy(self):
+        """
+        ``update()`` should use the walker's mtimes, falling back to whole
+        seconds for songs which don't have a nanosecond mtime.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        Song.objects.all().update(mtime_ns=0)
+        self.run_update()
+        self.assertEqual(Song.objects.get().mtime_ns, 0)
+        self.update_mp3('song.mp3', title='New Title')
+        self.run_update()
+        song = Song.objects.get()
+        self.assertEqual(song.title, 'New Title')
+        self.assertNotEqual(song.mtime_ns, 0)
+
+class DirectoryListingTests(ExordiumTests):
+    """
+    Tests for the directory listings collected by ``App.walk_media_dirs()``,
+    used to look for album art without going back to the filesystem.
+    """
+
+    def get_listings(self):
+        """
+        Walks our whole library and returns the listings it collected.
+        """
+        listings = {}
+        for retline in App.walk_media_dirs(self.library_path, self.library_path, listings=listings):
+            pass
+        return listings
+
+    def test_walk_listings(self):
+        """
+        Listings should have the possible cover images in every directory
+        we walk, along with their mtimes.
+        """
+        self.add_mp3(path='album', filename='song.mp3')
+        self.add_art(path='album', filename='cover.jpg')
+        self.add_art(path='album', filename='back.png', basefile='cover_400.png')
+        self.add_art(path='album', filename='shouting.JPG')
+        self.add_mp3(path='album/cd1', filename='song.mp3')
+        listings = self.get_listings()
+        self.assertEqual(sorted(listings.keys()), ['', 'album', 'album/cd1'])
+        self.assertEqual(listings[''], {})
+        self.assertEqual(listings['album/cd1'], {})
+        self.assertEqual(sorted(listings['album'].keys()), ['back.png', 'cover.jpg'])
+        self.assertEqual(listings['album']['cover.jpg'],
+            int(os.stat(os.path.join(self.library_path, 'album', 'cover.jpg')).st_mtime))
+
+    def test_no_listings_by_default(self):
+        """
+        Walking without a listings dict shouldn't stat any images, or fail.
+        """
+        self.add_mp3(path='album', filename='song.mp3')
+        self.add_art(path='album')
+        self.assertEqual([base_dir for (base_dir, media, snapshot) in
+            App.walk_media_dirs(self.library_path, self.library_path)], ['', 'album'])
+
+    def test_cover_image_from_listings(self):
+        """
+        ``get_directory_cover_image()`` should use listings where it can,
+        including for the parent directory, and fall back to the filesystem
+        for directories which aren't in there.
+        """
+        self.add_art(path='album', filename='cover.jpg')
+        self.add_art(path='artist', filename='cover.png', basefile='cover_400.png')
+        self.add_mp3(path='artist/album', filename='song.mp3')
+        album_dir = os.path.join(self.library_path, 'album')
+        self.assertEqual(App.get_directory_cover_image(album_dir, {'album': {'cover.gif': 0}}),
+            os.path.join(album_dir, 'cover.gif'))
+        self.assertEqual(App.get_directory_cover_image(album_dir, {'other': {}}),
+            os.path.join(album_dir, 'cover.jpg'))
+        self.assertEqual(App.get_directory_cover_image(os.path.join(self.library_path, 'artist', 'album'),
+            {'artist/album': {}, 'artist': {'front.gif': 0}}),
+            os.path.join(self.library_path, 'artist', 'front.gif'))
+        self.assertEqual(App.get_directory_cover_image(self.library_path, {'': {}}), None)
+
+    def test_get_album_dirs(self):
+        """
+        ``get_album_dirs()`` should find the directory for each album with
+        tracks, leaving out miscellaneous albums.
+        """
+        self.add_mp3(path='album1', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 1')
+        self.add_mp3(path='album2', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 2')
+        self.add_mp3(path='misc', filename='song1.mp3', title='Title 1', artist='Artist')
+        self.run_add()
+        album_dirs = App.get_album_dirs(list(Album.objects.all()))
+        self.assertEqual(sorted(album_dirs.values()), [
+            os.path.join(self.library_path, 'album1'),
+            os.path.join(self.library_path, 'album2'),
+            ])
+        self.assertEqual(album_dirs[Album.objects.get(name='Album 1').pk],
+            os.path.join(self.library_path, 'album1'))
+
+    def test_art_scan_without_changes(self):
+        """
+        With listings available, an album art scan where nothing has changed
+        shouldn't need more than a couple of queries, regardless of how many
+        albums there are.
+        """
+        for num in range(5):
+            path = 'album%d' % (num)
+            self.add_mp3(path=path, filename='song1.mp3', title='Title 1', artist='Artist', album='Album %d' % (num))
+            self.add_mp3(path=path, filename='song2.mp3', title='Title 2', artist='Artist', album='Album %d' % (num))
+            self.add_art(path=path)
+        self.add_mp3(path='noart', filename='song1.mp3', title='Title 1', artist='Artist', album='No Art')
+        self.run_add()
+        self.assertEqual(Album.objects.filter(art_filename='album0/cover.jpg').count(), 1)
+        listings = self.get_listings()
+        with self.assertNumQueries(2):
+            results = list(App.update_album_art(listings=listings))
+        self.assertNoErrors(results)
+        self.assertNotIn('Found album art', ' '.join([line for (status, line) in results]))
+
+    def test_art_scan_listing_changes(self):
+        """
+        Art scans using listings should still notice art which has been
+        replaced or removed.
+        """
+        self.add_mp3(path='album1', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 1')
+        self.add_art(path='album1')
+        self.add_mp3(path='album2', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 2')
+        self.add_art(path='album2')
+        self.run_add()
+        self.touch_file('album1/cover.jpg')
+        self.delete_file('album2/cover.jpg')
+        results = list(App.update_album_art(listings=self.get_listings()))
+        self.assertIn((App.STATUS_INFO, 'Found album art for "Artist / Album 1"'), results)
+        self.assertIn((App.STATUS_INFO, 'Removed art from "Artist / Album 2"'), results)
+        album = Album.objects.get(name='Album 1')
+        self.assertEqual(album.art_mtime,
+            int(os.stat(os.path.join(self.library_path, 'album1', 'cover.jpg')).st_mtime))
+        self.assertFalse(Album.objects.get(name='Album 2').has_album_art())
+
+    def test_quick_update_replaced_art(self):
+        """
+        A quick-scan update should pick up art which has been replaced in
+        a directory whose tracks haven't changed.
+        """
+        self.prefs['exordium__quick_scan'] = True
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album', basefile='cover_400.jpg', filename='cover.jpg')
+        self.run_add()
+        self.run_update()
+        self.add_art(path='album', basefile='cover_400.gif', filename='cover.jpg')
+        self.touch_file('album/cover.jpg')
+        self.run_update()
+        album = Album.objects.get()
+        self.assertEqual(album.art_mime, 'image/gif')
+
+class ThumbnailTests(ExordiumTests):
+    """
+    Tests for pre-generating resized album art via ``App.generate_thumbnails()``
+    """
+
+    def assertThumbnails(self, album):
+        """
+        Asserts that the given album has up-to-date resized art at every size.
+        """
+        self.assertEqual(AlbumArt.objects.filter(album=album).count(), len(AlbumArt.SIZE_CHOICES))
+        for (size, label) in AlbumArt.SIZE_CHOICES:
+            art = AlbumArt.objects.get(album=album, size=size)
+            self.assertEqual(art.resolution, AlbumArt.resolutions[size])
+            self.assertEqual(art.from_mtime, album.art_mtime)
+            with Image.open(io.BytesIO(bytes(art.image))) as im:
+                self.assertEqual(im.width, AlbumArt.resolutions[size])
+
+    def test_generate(self):
+        """
+        Every size should be generated for albums with art, and albums
+        without art should be left alone.
+        """
+        self.add_mp3(path='album1', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 1')
+        self.add_art(path='album1')
+        self.add_mp3(path='album2', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 2')
+        self.run_add()
+        self.assertEqual(AlbumArt.objects.count(), 0)
+        results = self.assertNoErrors(list(App.generate_thumbnails()))
+        self.assertIn((App.STATUS_INFO, 'Generating album art thumbnails - albums to process: 1'), results)
+        self.assertThumbnails(Album.objects.get(name='Album 1'))
+        self.assertEqual(AlbumArt.objects.count(), len(AlbumArt.SIZE_CHOICES))
+
+    def test_generate_parallel(self):
+        """
+        Generating thumbnails with worker processes should give us the same
+        results.
+        """
+        self.add_mp3(path='album1', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 1')
+        self.add_art(path='album1')
+        self.add_mp3(path='album2', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 2')
+        self.add_art(path='album2', basefile='cover_400.png', filename='cover.png')
+        self.run_add()
+        self.assertNoErrors(list(App.generate_thumbnails(jobs=2)))
+        for album in Album.objects.all():
+            self.assertThumbnails(album)
+
+    def test_generate_skips_current(self):
+        """
+        Albums whose resized art is already current shouldn't be touched,
+        but ones with stale art (or a changed resolution) should be redone.
+        """
+        self.add_mp3(path='album1', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 1')
+        self.add_art(path='album1')
+        self.add_mp3(path='album2', filename='song1.mp3', title='Title 1', artist='Artist', album='Album 2')
+        self.add_art(path='album2')
+        self.run_add()
+        self.assertNoErrors(list(App.generate_thumbnails()))
+        self.assertEqual(list(App.generate_thumbnails()), [])
+
+        al2 = Album.objects.get(name='Album 2')
+        AlbumArt.objects.filter(album=al2, size=AlbumArt.SZ_LIST).update(from_mtime=0)
+        results = self.assertNoErrors(list(App.generate_thumbnails()))
+        self.assertIn((App.STATUS_INFO, 'Generating album art thumbnails - albums to process: 1'), results)
+        self.assertThumbnails(al2)
+
+        AlbumArt.resolutions[AlbumArt.SZ_ALBUM] -= 10
+        results = self.assertNoErrors(list(App.generate_thumbnails()))
+        self.assertIn((App.STATUS_INFO, 'Generating album art thumbnails - albums to process: 2'), results)
+        for album in Album.objects.all():
+            self.assertThumbnails(album)
+
+    def test_generate_invalid_art(self):
+        """
+        Art which can't be read should be reported as an error.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album')
+        self.run_add()
+        with open(os.path.join(self.library_path, 'album', 'cover.jpg'), 'wb') as df:
+            df.write(b'not an image')
+        self.assertErrors(list(App.generate_thumbnails()),
+            error='Could not generate album art thumbnails for "Artist / Album"')
+        self.assertEqual(AlbumArt.objects.count(), 0)
+
+    def test_add_and_update_pregenerate(self):
+        """
+        With our preference turned on, adds and updates should generate
+        resized art for new or changed covers, so viewing it doesn't have to.
+        """
+        self.prefs['exordium__pregenerate_thumbnails'] = True
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album')
+        self.run_add()
+        al = Album.objects.get()
+        self.assertThumbnails(al)
+
+        old_mtime = al.art_mtime
+        self.add_art(path='album', basefile='cover_400.gif', filename='cover.jpg')
+        self.touch_file('album/cover.jpg')
+        self.run_update()
+        al = Album.objects.get()
+        self.assertNotEqual(al.art_mtime, old_mtime)
+        self.assertThumbnails(al)
+        res = AlbumArt.resolutions[AlbumArt.SZ_ALBUM]
+        self.assertEqual(bytes(AlbumArt.objects.get(album=al, size=AlbumArt.SZ_ALBUM).image),
+            AlbumArt.render(al.get_original_art_filename(), [res])[res])
+
+    def test_add_without_pregenerate(self):
+        """
+        With our preference turned off, no resized art should be created
+        during adds.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album')
+        self.run_add()
+        self.assertEqual(AlbumArt.objects.count(), 0)
+
+    def test_generate_command(self):
+        """
+        Our ``generatethumbnails`` management command should do the same.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album')
+        self.run_add()
+        out = io.StringIO()
+        call_command('generatethumbnails', nice=0, stdout=out)
+        self.assertIn('albums to process: 1', out.getvalue())
+        self.assertThumbnails(Album.objects.get())
+
+    def test_generate_command_errors(self):
+        """
+        Errors during the ``generatethumbnails`` command should result in a
+        ``CommandError``.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1', artist='Artist', album='Album')
+        self.add_art(path='album')
+        self.run_add()
+        os.chmod(os.path.join(self.library_path, 'album', 'cover.jpg'), 0)
+        out = io.StringIO()
+        err = io.StringIO()
+        with self.assertRaises(CommandError) as cm:
+            call_command('generatethumbnails', nice=0, stdout=out, stderr=err)
+        self.assertIn('Errors encountered while generating thumbnails: 1', cm.exception.args[0])
+        self.assertIn('Could not generate album art thumbnails', err.getvalue())
+
+class MoveDetectionTests(ExordiumTests):
+    """
+    Tests for how ``App.update()`` decides which new files are actually
+    songs which have moved, without reading any more files than it needs to.
+    """
+
+    fake_sum = '0'*64
+
+    def add_album(self, path='album', num=3, basefile='silence-vbr.mp3'):
+        """
+        Adds a quick album with ``num`` tracks to the library at ``path``,
+        and imports it.
+        """
+        for tracknum in range(1, num+1):
+            self.add_mp3(path=path, filename='song%d.mp3' % (tracknum),
+                artist='Artist', album='Album', title='Title %d' % (tracknum),
+                tracknum=tracknum, basefile=basefile)
+        self.run_add()
+        self.assertEqual(Song.objects.count(), num)
+
+    def test_rename_directory_no_checksums(self):
+        """
+        Renaming a directory within the library should be detected purely by
+        device and inode, without computing any checksums.
+        """
+        self.add_album()
+        Song.objects.all().update(sha256sum=self.fake_sum)
+        FileChecksum.objects.all().delete()
+        os.rename(os.path.join(self.library_path, 'album'),
+            os.path.join(self.library_path, 'renamed'))
+        results = self.run_update()
+
+        self.assertEqual(Song.objects.count(), 3)
+        for song in Song.objects.all():
+            self.assertEqual(song.filename[:8], 'renamed/')
+            self.assertEqual(song.sha256sum, self.fake_sum)
+        self.assertEqual(FileChecksum.objects.count(), 0)
+        self.assertEqual(len([r for r in results if r[1].startswith('File move detected')]), 3)
+
+    def test_move_without_inode_uses_checksum(self):
+        """
+        Songs without a stored inode (from before we stored them) should
+        still be matched up by checksum, and get their inode filled in.
+        """
+        self.add_album(num=1)
+        Song.objects.all().update(device=0, inode=0)
+        self.move_file('album/song1.mp3', 'moved')
+        self.run_update()
+
+        song = Song.objects.get()
+        stat_result = os.stat(song.full_filename())
+        self.assertEqual(song.filename, 'moved/song1.mp3')
+        self.assertEqual(song.inode, stat_result.st_ino)
+
+    def test_inode_backfill(self):
+        """
+        Songs without a stored inode should get one filled in during an
+        update, even if nothing else has changed.
+        """
+        self.add_album(num=1)
+        stat_result = os.stat(Song.objects.get().full_filename())
+        Song.objects.all().update(device=0, inode=0)
+        self.run_update()
+        song = Song.objects.get()
+        self.assertEqual(song.inode, stat_result.st_ino)
+        self.assertEqual(song.device, stat_result.st_dev)
+
+    def test_new_file_checksum_deferred(self):
+        """
+        With no missing songs, new files found during an update shouldn't
+        be checksummed until they're actually added.
+        """
+        self.add_album(num=1)
+        self.add_mp3(path='album', filename='song2.mp3', artist='Artist',
+            album='Album', title='Title 2', tracknum=2)
+        results = self.run_update()
+        self.assertIn((App.STATUS_INFO, 'Total track checksums to compute: 1'), results)
+        self.assertEqual(Song.objects.count(), 2)
+
+    def test_different_size_not_checksummed(self):
+        """
+        A new file which isn't the same size as any missing song can't be a
+        moved song, so shouldn't be checksummed before it's added - even if
+        the filesystem happens to have reused the missing song's inode.
+        """
+        self.add_album(num=1)
+        os.unlink(os.path.join(self.library_path, 'album', 'song1.mp3'))
+        self.add_mp3(path='album', filename='other.mp3', artist='Artist',
+            album='Album', title='Other', basefile='silence-cbr.mp3')
+        results = self.run_update()
+        self.assertIn((App.STATUS_INFO, 'Total track checksums to compute: 1'), results)
+        self.assertIn((App.STATUS_INFO, 'Deleted file: album/song1.mp3'), results)
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertEqual(Song.objects.get().filename, 'album/other.mp3')
+
+    def test_moved_and_changed(self):
+        """
+        A file which was moved and also changed isn't a move as far as we're
+        concerned; it gets deleted and re-added.
+        """
+        self.add_album(num=1)
+        song_pk = Song.objects.get().pk
+        self.move_file('album/song1.mp3', 'moved')
+        self.update_mp3('moved/song1.mp3', title='New Title')
+        self.run_update()
+        song = Song.objects.get()
+        self.assertEqual(song.filename, 'moved/song1.mp3')
+        self.assertEqual(song.title, 'New Title')
+        self.assertNotEqual(song.pk, song_pk)
+
+class FingerprintTests(ExordiumTests):
+    """
+    Tests for song fingerprints, deferred full checksums, and backfilling
+    those checksums later.
+    """
+
+    fake_sum = '0'*64
+
+    def write_file(self, filename, data):
+        """
+        Writes ``data`` to ``filename`` in our library, returning the full
+        path.
+        """
+        full_filename = self.check_library_filename(filename)
+        with open(full_filename, 'wb') as f:
+            f.write(data)
+        return full_filename
+
+    def test_fingerprint_samples(self):
+        """
+        Fingerprints should change with the size, start or end of a file,
+        but not with anything in the middle.
+        """
+        sample = Song.fingerprint_sample_size
+        base = bytearray(sample*3)
+        middle = bytearray(base)
+        middle[sample+5] = 1
+        end = bytearray(base)
+        end[-1] = 1
+        start = bytearray(base)
+        start[0] = 1
+        fingerprints = {}
+        for (name, data) in [('base', base), ('middle', middle), ('end', end),
+                ('start', start), ('longer', base + b'\0')]:
+            fingerprints[name] = Song.get_fingerprint(self.write_file('%s.dat' % (name), data))
+        self.assertEqual(fingerprints['base'], fingerprints['middle'])
+        self.assertNotEqual(fingerprints['base'], fingerprints['end'])
+        self.assertNotEqual(fingerprints['base'], fingerprints['start'])
+        self.assertNotEqual(fingerprints['base'], fingerprints['longer'])
+        self.assertEqual(len(fingerprints['base']), 64)
+
+    def test_fingerprint_small_file(self):
+        """
+        Files smaller than our sample size should still fingerprint fine.
+        """
+        self.assertNotEqual(Song.get_fingerprint(self.write_file('one.dat', b'one')),
+            Song.get_fingerprint(self.write_file('two.dat', b'two')))
+
+    def test_add_stores_fingerprint(self):
+        """
+        Adding a track should store both its fingerprint and full checksum.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        song = Song.objects.get()
+        self.assertEqual(song.fingerprint, Song.get_fingerprint(song.full_filename()))
+        self.assertEqual(song.sha256sum, Song.get_sha256sum(song.full_filename()))
+
+    def test_add_deferred(self):
+        """
+        With deferred checksums, only the fingerprint should be stored.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        song = Song.objects.get()
+        self.assertEqual(song.fingerprint, Song.get_fingerprint(song.full_filename()))
+        self.assertEqual(song.sha256sum, '')
+        self.assertEqual(FileChecksum.objects.count(), 0)
+
+    def test_add_deferred_preference(self):
+        """
+        Our preference should turn on deferred checksums.
+        """
+        self.prefs['exordium__defer_checksums'] = True
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.assertEqual(Song.objects.get().sha256sum, '')
+
+    def test_add_deferred_uses_cache(self):
+        """
+        Even with deferred checksums, a checksum we already have cached
+        should be used.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        sha256sum = Song.objects.get().sha256sum
+        Song.objects.all().delete()
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        self.assertEqual(Song.objects.get().sha256sum, sha256sum)
+
+    def test_backfill(self):
+        """
+        Backfilling should fill in missing checksums.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        results = self.assertNoErrors(list(App.backfill_checksums()))
+        self.assertIn((App.STATUS_SUCCESS, 'Checksums computed: 1'), results)
+        song = Song.objects.get()
+        self.assertEqual(song.sha256sum, Song.get_sha256sum(song.full_filename()))
+        self.assertEqual(FileChecksum.objects.get().sha256sum, song.sha256sum)
+
+    def test_backfill_nothing_to_do(self):
+        """
+        Backfilling with nothing to do should say so.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        results = self.assertNoErrors(list(App.backfill_checksums()))
+        self.assertEqual(results, [(App.STATUS_SUCCESS, 'No tracks need checksums!')])
+
+    def test_backfill_skips_changed(self):
+        """
+        Tracks which have changed since they were scanned should be left
+        for the next update.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        self.update_mp3('song.mp3', title='New Title')
+        results = self.assertNoErrors(list(App.backfill_checksums()))
+        self.assertIn((App.STATUS_SUCCESS, 'Checksums computed: 0'), results)
+        self.assertIn((App.STATUS_DEBUG,
+            'File changed since it was last scanned, skipping: song.mp3'), results)
+        self.assertEqual(Song.objects.get().sha256sum, '')
+
+    def test_backfill_unreadable(self):
+        """
+        Unreadable tracks should be reported as errors.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        os.chmod(os.path.join(self.library_path, 'song.mp3'), 0)
+        self.assertErrors(list(App.backfill_checksums()),
+            error='Could not read file to compute checksum: song.mp3')
+        self.assertEqual(Song.objects.get().sha256sum, '')
+
+    def test_backfill_command(self):
+        """
+        Our ``backfillchecksums`` management command should do the same.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        out = io.StringIO()
+        call_command('backfillchecksums', nice=0, stdout=out)
+        self.assertIn('Checksums computed: 1', out.getvalue())
+        self.assertNotEqual(Song.objects.get().sha256sum, '')
+
+    def test_backfill_command_errors(self):
+        """
+        Errors during the ``backfillchecksums`` command should result in a
+        ``CommandError``.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        os.chmod(os.path.join(self.library_path, 'song.mp3'), 0)
+        out = io.StringIO()
+        err = io.StringIO()
+        with self.assertRaises(CommandError) as cm:
+            call_command('backfillchecksums', nice=0, stdout=out, stderr=err)
+        self.assertIn('Errors encountered while computing checksums: 1', cm.exception.args[0])
+        self.assertIn('Could not read file', err.getvalue())
+
+    def test_move_by_fingerprint(self):
+        """
+        Moved songs without a usable inode should be matched up by their
+        fingerprint, without needing a full checksum.
+        """
+        self.add_mp3(path='album', filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        Song.objects.all().update(device=0, inode=0, sha256sum=self.fake_sum)
+        FileChecksum.objects.all().delete()
+        self.move_file('album/song.mp3', 'moved')
+        self.run_update()
+        song = Song.objects.get()
+        self.assertEqual(song.filename, 'moved/song.mp3')
+        self.assertEqual(song.sha256sum, self.fake_sum)
+        self.assertEqual(FileChecksum.objects.count(), 0)
+
+    def test_move_deferred(self):
+        """
+        Songs without a full checksum should be matched up on a move, too.
+        """
+        self.add_mp3(path='album', filename='song.mp3', artist='Artist', title='Title')
+        self.assertNoErrors(list(App.add(defer_checksums=True)))
+        Song.objects.all().update(device=0, inode=0)
+        song_pk = Song.objects.get().pk
+        self.move_file('album/song.mp3', 'moved')
+        self.assertNoErrors(list(App.update(defer_checksums=True)))
+        song = Song.objects.get()
+        self.assertEqual(song.pk, song_pk)
+        self.assertEqual(song.filename, 'moved/song.mp3')
+
+    def test_update_deferred_touch(self):
+        """
+        With deferred checksums, a file which has only been touched should
+        still have its tags re-read, and its checksum cleared out for a
+        later backfill (which should put it back).
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        orig_sum = Song.objects.get().sha256sum
+        self.touch_file('song.mp3')
+        results = self.assertNoErrors(list(App.update(defer_checksums=True)))
+        self.assertIn((App.STATUS_DEBUG, 'Updated file: song.mp3'), results)
+        song = Song.objects.get()
+        self.assertEqual(song.sha256sum, '')
+        self.assertEqual(song.mtime_ns, os.stat(song.full_filename()).st_mtime_ns)
+        self.assertFalse(song.changed_on_disk())
+
+        out = io.StringIO()
+        call_command('backfillchecksums', nice=0, stdout=out)
+        self.assertEqual(Song.objects.get().sha256sum, orig_sum)
+
+    def test_update_deferred_same_size_edit(self):
+        """
+        With deferred checksums, a same-size edit which the fingerprint
+        can't see (outside the start and end of the file) shouldn't leave
+        the old checksum behind.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        orig_sum = Song.objects.get().sha256sum
+        full_filename = os.path.join(self.library_path, 'song.mp3')
+        orig_sample_size = Song.fingerprint_sample_size
+        Song.fingerprint_sample_size = 16
+        try:
+            Song.objects.all().update(fingerprint=Song.get_fingerprint(full_filename))
+            size = os.stat(full_filename).st_size
+            with open(full_filename, 'r+b') as df:
+                df.seek(size // 2)
+                data = df.read(1)
+                df.seek(size // 2)
+                df.write(bytes([data[0] ^ 0xFF]))
+            self.touch_file('song.mp3')
+            self.assertNoErrors(list(App.update(defer_checksums=True)))
+        finally:
+            Song.fingerprint_sample_size = orig_sample_size
+        self.assertEqual(Song.objects.get().sha256sum, '')
+
+        out = io.StringIO()
+        call_command('backfillchecksums', nice=0, stdout=out)
+        song = Song.objects.get()
+        self.assertNotEqual(song.sha256sum, orig_sum)
+        self.assertEqual(song.sha256sum, Song.get_sha256sum(full_filename))
+
+    def test_update_touch_not_deferred(self):
+        """
+        Without deferred checksums, touched files get a full update as usual.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.touch_file('song.mp3')
+        results = self.run_update()
+        self.assertIn((App.STATUS_DEBUG, 'Updated file: song.mp3'), results)
+
+    def test_update_deferred_change(self):
+        """
+        With deferred checksums, a changed file should be updated, and
+        have its checksum cleared out for a later backfill.
+        """
+        self.add_mp3(filename='song.mp3', artist='Artist', title='Title')
+        self.run_add()
+        self.update_mp3('song.mp3', title='New Title')
+        results = self.assertNoErrors(list(App.update(defer_checksums=True)))
+        self.assertIn((App.STATUS_DEBUG, 'Updated file: song.mp3'), results)
+        song = Song.objects.get()
+        self.assertEqual(song.title, 'New Title')
+        self.assertEqual(song.sha256sum, '')
+        self.assertEqual(song.fingerprint, Song.get_fingerprint(song.full_filename()))
+
+class ScopeTests(ExordiumTests):
+    """
+    Tests for restricting adds and updates to a subdirectory of the library.
+    """
+
+    def add_albums(self):
+        """
+        Sets up a couple of albums in different directories, including one
+        whose name starts with the other's, and one which only differs
+        by case.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.add_mp3(path='album2', filename='song2.mp3',
+            artist='Artist', album='Album 2', title='Title 2')
+        self.add_mp3(path='ALBUM', filename='song3.mp3',
+            artist='Artist', album='Album 3', title='Title 3')
+
+    def test_get_scope_base(self):
+        """
+        Scopes should be normalized, and come back with the right starting
+        directory.
+        """
+        self.add_mp3(path='album/disc1', filename='song.mp3')
+        for scope in ['album/disc1', 'album/disc1/', 'album//disc1', './album/disc1/.']:
+            self.assertEqual(App.get_scope_base(scope),
+                ('album/disc1', os.path.join(self.library_path, 'album/disc1')))
+        for scope in [None, '', '.', './']:
+            self.assertEqual(App.get_scope_base(scope), ('', self.library_path))
+
+    def test_get_scope_base_invalid(self):
+        """
+        Absolute paths, paths which try to leave the library, and directories
+        which don't exist should be refused.
+        """
+        self.add_mp3(path='album', filename='song.mp3')
+        self.add_mp3(path='other', filename='song.mp3')
+        for scope in ['/album', '..', 'album/../../foo', 'album/../other', 'missing',
+                'album/song.mp3']:
+            with self.assertRaises(App.InvalidScope):
+                App.get_scope_base(scope)
+
+    def test_in_scope(self):
+        """
+        Only files actually inside our scope should match.
+        """
+        self.assertTrue(App.in_scope('album/song.mp3', ''))
+        self.assertTrue(App.in_scope('album/song.mp3', 'album'))
+        self.assertTrue(App.in_scope('album/disc1/song.mp3', 'album'))
+        self.assertFalse(App.in_scope('album2/song.mp3', 'album'))
+        self.assertFalse(App.in_scope('ALBUM/song.mp3', 'album'))
+        self.assertFalse(App.in_scope('album.mp3', 'album'))
+
+    def test_add_scoped(self):
+        """
+        A scoped add should only pick up files inside the scope.
+        """
+        self.add_albums()
+        results = self.assertNoErrors(list(App.add(scope='album/')))
+        self.assertIn((App.STATUS_INFO, 'Only processing library subdirectory: album'), results)
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertEqual(Song.objects.get().filename, 'album/song1.mp3')
+
+        # And then the rest of the library
+        self.run_add()
+        self.assertEqual(Song.objects.count(), 3)
+        self.assertEqual(Album.objects.count(), 3)
+
+    def test_add_scoped_nested(self):
+        """
+        A scoped add should pick up files in subdirectories of the scope.
+        """
+        self.add_mp3(path='album/disc1', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.add_mp3(path='album/disc2', filename='song2.mp3',
+            artist='Artist', album='Album', title='Title 2')
+        self.add_mp3(path='other', filename='song3.mp3',
+            artist='Artist', album='Album 2', title='Title 3')
+        self.assertNoErrors(list(App.add(scope='album')))
+        self.assertEqual(sorted(Song.objects.values_list('filename', flat=True)),
+            ['album/disc1/song1.mp3', 'album/disc2/song2.mp3'])
+
+    def test_add_scoped_nothing_new(self):
+        """
+        A scoped add with nothing new to find should say so.
+        """
+        self.add_albums()
+        self.run_add()
+        results = self.assertNoErrors(list(App.add(scope='album')))
+        self.assertIn((App.STATUS_SUCCESS, 'No new music found!'), results)
+
+    def test_add_scoped_various(self):
+        """
+        A scoped add should still turn an existing album into a Various
+        Artists album when a track by another artist shows up.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.run_add()
+        self.add_mp3(path='album', filename='song2.mp3',
+            artist='Artist 2', album='Album', title='Title 2')
+        self.assertNoErrors(list(App.add(scope='album')))
+        self.assertEqual(Album.objects.get().artist.name, 'Various')
+
+    def test_add_scoped_invalid(self):
+        """
+        An invalid scope should just result in an error.
+        """
+        self.add_albums()
+        for scope in ['/album', '../album', 'missing']:
+            self.assertErrors(list(App.add(scope=scope)))
+        self.assertEqual(Song.objects.count(), 0)
+
+    def test_update_scoped(self):
+        """
+        A scoped update should only process changes inside the scope.
+        """
+        self.add_albums()
+        self.run_add()
+        self.update_mp3('album/song1.mp3', title='New Title 1')
+        self.update_mp3('album2/song2.mp3', title='New Title 2')
+        self.add_mp3(path='album', filename='song4.mp3',
+            artist='Artist', album='Album', title='Title 4')
+        self.add_mp3(path='album2', filename='song5.mp3',
+            artist='Artist', album='Album 2', title='Title 5')
+        self.delete_file('ALBUM/song3.mp3')
+
+        results = self.assertNoErrors(list(App.update(scope='album')))
+        self.assertIn((App.STATUS_INFO, 'Only processing library subdirectory: album'), results)
+        self.assertEqual(Song.objects.get(filename='album/song1.mp3').title, 'New Title 1')
+        self.assertEqual(Song.objects.get(filename='album2/song2.mp3').title, 'Title 2')
+        self.assertEqual(Song.objects.filter(filename='album/song4.mp3').count(), 1)
+        self.assertEqual(Song.objects.filter(filename='album2/song5.mp3').count(), 0)
+        self.assertEqual(Song.objects.filter(filename='ALBUM/song3.mp3').count(), 1)
+
+        # And now a full update should catch up with the rest
+        self.run_update()
+        self.assertEqual(Song.objects.get(filename='album2/song2.mp3').title, 'New Title 2')
+        self.assertEqual(Song.objects.filter(filename='album2/song5.mp3').count(), 1)
+        self.assertEqual(Song.objects.filter(filename='ALBUM/song3.mp3').count(), 0)
+
+    def test_update_scoped_delete(self):
+        """
+        Deleted files inside our scope should be cleaned up, along with
+        their orphaned albums.
+        """
+        self.add_albums()
+        self.run_add()
+        self.delete_file('album/song1.mp3')
+        self.assertNoErrors(list(App.update(scope='album')))
+        self.assertEqual(Song.objects.count(), 2)
+        self.assertEqual(Album.objects.filter(name='Album').count(), 0)
+
+    def test_update_scoped_move(self):
+        """
+        Moves within our scope should still be detected.
+        """
+        self.add_mp3(path='album/disc1', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.run_add()
+        song_pk = Song.objects.get().pk
+        self.move_file('album/disc1/song1.mp3', 'album/disc2')
+        results = self.assertNoErrors(list(App.update(scope='album')))
+        self.assertIn((App.STATUS_INFO, 'File move detected: album/disc1/song1.mp3 -> album/disc2/song1.mp3'),
+            results)
+        song = Song.objects.get()
+        self.assertEqual(song.pk, song_pk)
+        self.assertEqual(song.filename, 'album/disc2/song1.mp3')
+
+    def test_update_scoped_album_art(self):
+        """
+        A scoped update should only look for album art inside the scope.
+        """
+        self.add_albums()
+        self.run_add()
+        self.add_art(path='album')
+        self.add_art(path='album2')
+        self.assertNoErrors(list(App.update(scope='album')))
+        self.assertTrue(Album.objects.get(name='Album').has_album_art())
+        self.assertFalse(Album.objects.get(name='Album 2').has_album_art())
+
+    def test_update_scoped_invalid(self):
+        """
+        An invalid scope should just result in an error, and leave the
+        database alone.
+        """
+        self.add_albums()
+        self.run_add()
+        self.delete_file('album/song1.mp3')
+        for scope in ['/album', 'album/..']:
+            results = self.assertErrors(list(App.update(scope=scope)))
+        self.assertEqual(Song.objects.count(), 3)
+
+    def test_update_scoped_missing(self):
+        """
+        A scoped update on a directory which has gone away should clean up
+        the songs which were in it, and nothing else.
+        """
+        self.add_albums()
+        self.add_mp3(path='missing', filename='song4.mp3',
+            artist='Artist', album='Album 4', title='Title 4')
+        self.run_add()
+        self.delete_file('missing/song4.mp3')
+        os.rmdir(os.path.join(self.library_path, 'missing'))
+        self.delete_file('album/song1.mp3')
+        self.assertNoErrors(list(App.update(scope='missing')))
+        self.assertEqual(Song.objects.count(), 3)
+        self.assertEqual(Song.objects.filter(filename='missing/song4.mp3').count(), 0)
+        self.assertEqual(Album.objects.filter(name='Album 4').count(), 0)
+
+class ImportCheckpointTests(ExordiumTests):
+    """
+    Tests for journaling our adds, and resuming adds which were interrupted.
+    """
+
+    def add_albums(self):
+        """
+        Adds a few albums to our library, each with album art.
+        """
+        for (path, album) in [('album1', 'Album 1'), ('album2', 'Album 2'), ('album3', 'Album 3')]:
+            for num in [1, 2]:
+                self.add_mp3(path=path, filename='song%d.mp3' % (num),
+                    artist='Artist', album=album, title='Title %d' % (num))
+            self.add_art(path=path)
+
+    def interrupt_add(self, stop_line, **kwargs):
+        """
+        Starts an add, but abandons it right after the given status line
+        shows up (the same thing happens when a browser disconnects during
+        an add), returning the lines we saw.
+        """
+        lines = []
+        add = App.add(**kwargs)
+        for line in add:
+            lines.append(line)
+            if line == stop_line:
+                break
+        add.close()
+        self.assertIn(stop_line, lines)
+        return lines
+
+    def test_checkpoint_removed(self):
+        """
+        A completed add shouldn't leave a checkpoint behind.
+        """
+        self.add_albums()
+        self.run_add()
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+        self.run_add()
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+
+    def test_checkpoint_recorded(self):
+        """
+        An interrupted add should leave behind a checkpoint of how far it
+        got, with everything up to that point already in the database.
+        """
+        self.add_albums()
+        self.interrupt_add((App.STATUS_INFO, 'Created new album "Artist / Album 2"'))
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.scope, '')
+        self.assertEqual(checkpoint.last_dir, 'album2')
+        self.assertEqual(checkpoint.dirs_done, 2)
+        self.assertEqual(checkpoint.songs_added, 4)
+        self.assertEqual(Song.objects.count(), 4)
+        self.assertEqual(FileChecksum.objects.count(), 4)
+
+    def test_checkpoint_recorded_batched(self):
+        """
+        Checkpoints should be recorded per batch in batched mode.
+        """
+        self.add_albums()
+        self.interrupt_add((App.STATUS_INFO, 'Created new album "Artist / Album 2"'), batch_size=3)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.last_dir, 'album2')
+        self.assertEqual(checkpoint.dirs_done, 2)
+        self.assertEqual(Song.objects.count(), 4)
+
+    def test_checkpoint_removed_during_add(self):
+        """
+        If another add of the same scope finishes (removing the checkpoint
+        we share with it) while we're still going, we should carry on
+        without a checkpoint rather than erroring out.
+        """
+        self.add_albums()
+        lines = []
+        for line in App.add():
+            lines.append(line)
+            if line == (App.STATUS_INFO, 'Created new album "Artist / Album 1"'):
+                self.assertEqual(ImportCheckpoint.objects.get().dirs_done, 1)
+                ImportCheckpoint.objects.all().delete()
+        self.assertNoErrors(lines)
+        self.assertEqual(Song.objects.count(), 6)
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+
+    def test_checkpoint_record_shared(self):
+        """
+        Recording progress should add to whatever's in the database, since
+        another add may be sharing the same checkpoint, and should report
+        when the checkpoint has gone away.
+        """
+        checkpoint = ImportCheckpoint.objects.create(scope='')
+        other = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.record('album1', 1, 2), True)
+        self.assertEqual(other.record('album2', 1, 3), True)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.last_dir, 'album2')
+        self.assertEqual(checkpoint.dirs_done, 2)
+        self.assertEqual(checkpoint.songs_added, 5)
+        checkpoint.delete()
+        self.assertEqual(other.record('album3', 1, 2), False)
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+
+    def test_resume(self):
+        """
+        Adding after an interrupted add should pick up where it left off, and
+        get album art for the albums added the first time around.
+        """
+        self.add_albums()
+        self.interrupt_add((App.STATUS_INFO, 'Created new album "Artist / Album 1"'))
+        self.assertFalse(Album.objects.get(name='Album 1').has_album_art())
+
+        checkpoint = ImportCheckpoint.objects.get()
+        results = self.run_add()
+        self.assertIn((App.STATUS_INFO, 'Resuming interrupted add from %s (1 directories and 2 songs already done, last directory: album1)' % (
+            timezone.localtime(checkpoint.started).strftime('%Y-%m-%d %I:%M:%S %p'))), results)
+        self.assertEqual(Song.objects.count(), 6)
+        for album in Album.objects.exclude(artist__various=True):
+            self.assertTrue(album.has_album_art())
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+
+    def test_resume_nothing_new(self):
+        """
+        Resuming an add which had actually gotten through all its files should
+        still pick up the album art.
+        """
+        self.add_albums()
+        self.interrupt_add((App.STATUS_INFO, 'Created new album "Artist / Album 3"'))
+        results = self.run_add()
+        self.assertIn((App.STATUS_SUCCESS, 'No new music found!'), results)
+        for album in Album.objects.all():
+            self.assertTrue(album.has_album_art())
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+
+    def test_resume_only_new_albums(self):
+        """
+        Resuming should only look for art on albums added since the
+        interrupted add started.
+        """
+        self.add_albums()
+        self.run_add()
+        Album.objects.all().update(art_filename=None)
+        ImportCheckpoint.objects.create(scope='')
+        results = self.run_add()
+        self.assertIn((App.STATUS_SUCCESS, 'No new music found!'), results)
+        for album in Album.objects.all():
+            self.assertFalse(album.has_album_art())
+
+    def test_scoped_checkpoints(self):
+        """
+        Checkpoints are kept per library subdirectory.
+        """
+        self.add_albums()
+        self.interrupt_add((App.STATUS_INFO, 'Created new album "Artist / Album 1"'), scope='album1')
+        results = self.run_add()
+        self.assertNotIn('Resuming', ' '.join([line for (status, line) in results]))
+        self.assertEqual(ImportCheckpoint.objects.get().scope, 'album1')
+        results = self.assertNoErrors(list(App.add(scope='album1')))
+        self.assertIn('Resuming', ' '.join([line for (status, line) in results]))
+        self.assertEqual(ImportCheckpoint.objects.count(), 0)
+
+    def test_sorted_walk(self):
+        """
+        Sorted walks should visit directories and files in order of their
+        names.
+        """
+        for path in ['c', 'a/b', 'b', 'a', 'a/a']:
+            for filename in ['z.mp3', 'm.mp3']:
+                self.add_mp3(path=path, filename=filename)
+        dirs = []
+        for (base_dir, media, snapshot) in App.walk_media_dirs(self.library_path, self.library_path, sort=True):
+            dirs.append(base_dir)
+            self.assertEqual([os.path.basename(media_file.filename) for media_file in media],
+                ['m.mp3', 'z.mp3'][:len(media)])
+        self.assertEqual(dirs, ['', 'a', 'a/a', 'a/b', 'b', 'c'])
+
+class DirectorySnapshotTests(ExordiumTests):
+    """
+    Tests for our directory snapshots, and quick-scan updates which use them
+    to skip over directories which haven't changed.
+    """
+
+    def get_snapshots(self):
+        """
+        Walks our library, returning a dict of snapshots by directory.
+        """
+        snapshots = {}
+        for (base_dir, media, snapshot) in App.walk_media_dirs(self.library_path, self.library_path):
+            snapshots[base_dir] = snapshot
+        return snapshots
+
+    def get_stored_paths(self):
+        """
+        Returns a sorted list of the directories we have snapshots for.
+        """
+        return sorted(DirectorySnapshot.objects.values_list('path', flat=True))
+
+    def add_albums(self):
+        """
+        Adds a couple of albums to our library, and does an initial update
+        so that we have snapshots.
+        """
+        for (path, album) in [('album', 'Album'), ('album2', 'Album 2')]:
+            for num in [1, 2]:
+                self.add_mp3(path=path, filename='song%d.mp3' % (num),
+                    artist='Artist', album=album, title='Title %d' % (num))
+        self.run_add()
+        self.run_update()
+
+    def update_lines(self, results):
+        """
+        Returns the files which ``update()`` decided to re-read.
+        """
+        return sorted([line[14:] for (status, line) in results if line.startswith('Updated file: ')])
+
+    def test_snapshot_stable(self):
+        """
+        Walking the same library twice should give the same snapshots.
+        """
+        self.add_mp3(path='album', filename='song1.mp3')
+        self.add_art(path='album')
+        self.assertEqual(self.get_snapshots(), self.get_snapshots())
+
+    def test_snapshot_changes(self):
+        """
+        Snapshots should change when files are changed, added, removed, or
+        renamed, and only for the directory in which that happens.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title')
+        self.add_mp3(path='album2', filename='song2.mp3')
+        orig = self.get_snapshots()
+
+        self.update_mp3('album/song1.mp3', title='New Title')
+        changed = self.get_snapshots()
+        self.assertNotEqual(orig['album'], changed['album'])
+        self.assertEqual(orig['album2'], changed['album2'])
+
+        self.touch_file('album/song1.mp3')
+        touched = self.get_snapshots()
+        self.assertNotEqual(changed['album'], touched['album'])
+        self.assertEqual(changed['album'][1], touched['album'][1])
+
+        self.add_art(path='album')
+        with_art = self.get_snapshots()
+        self.assertNotEqual(touched['album'], with_art['album'])
+        self.assertEqual(with_art['album'][1], 2)
+
+        self.move_file('album/cover.jpg', 'album2')
+        moved = self.get_snapshots()
+        self.assertNotEqual(with_art['album'], moved['album'])
+        self.assertNotEqual(with_art['album2'], moved['album2'])
+
+    def test_update_stores_snapshots(self):
+        """
+        Updates should store a snapshot for every directory.
+        """
+        self.add_mp3(path='album/disc1', filename='song1.mp3', artist='Artist', title='Title 1')
+        self.add_mp3(path='album2', filename='song2.mp3', artist='Artist', title='Title 2')
+        self.run_add()
+        self.assertEqual(DirectorySnapshot.objects.count(), 0)
+        self.run_update()
+        self.assertEqual(self.get_stored_paths(), ['', 'album', 'album/disc1', 'album2'])
+        snapshots = self.get_snapshots()
+        for snapshot in DirectorySnapshot.objects.all():
+            self.assertEqual((snapshot.mtime_ns, snapshot.entries, snapshot.fingerprint),
+                snapshots[snapshot.path])
+
+    def test_update_removes_stale_snapshots(self):
+        """
+        Directories which go away should have their snapshots removed.
+        """
+        self.add_albums()
+        shutil.rmtree(os.path.join(self.library_path, 'album'))
+        self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertEqual(self.get_stored_paths(), ['', 'album2'])
+        self.assertEqual(Song.objects.count(), 2)
+
+    def test_quick_scan_skips_unchanged(self):
+        """
+        Quick scans shouldn't look at songs in directories which haven't
+        changed, whereas full verification should.
+        """
+        self.add_albums()
+        Song.objects.all().update(time_updated=0, mtime_ns=1)
+        results = self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertIn((App.STATUS_DEBUG, 'Unchanged directories skipped: 3'), results)
+        self.assertEqual(self.update_lines(results), [])
+
+        results = self.assertNoErrors(list(App.update(quick_scan=False)))
+        self.assertEqual(self.update_lines(results), ['album/song1.mp3', 'album/song2.mp3',
+            'album2/song1.mp3', 'album2/song2.mp3'])
+
+    def test_quick_scan_preference(self):
+        """
+        Our preference should turn on quick scans.
+        """
+        self.add_albums()
+        self.prefs['exordium__quick_scan'] = True
+        results = self.run_update()
+        self.assertIn((App.STATUS_DEBUG, 'Unchanged directories skipped: 3'), results)
+
+    def test_quick_scan_changed_file(self):
+        """
+        Quick scans should still pick up changed files.
+        """
+        self.add_albums()
+        self.update_mp3('album/song1.mp3', title='New Title')
+        results = self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertIn((App.STATUS_DEBUG, 'Unchanged directories skipped: 2'), results)
+        self.assertEqual(self.update_lines(results), ['album/song1.mp3'])
+        self.assertEqual(Song.objects.get(filename='album/song1.mp3').title, 'New Title')
+
+        # And next time around, that directory is unchanged as well
+        results = self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertIn((App.STATUS_DEBUG, 'Unchanged directories skipped: 3'), results)
+
+    def test_quick_scan_new_and_deleted(self):
+        """
+        Quick scans should pick up new and deleted files and directories.
+        """
+        self.add_albums()
+        self.add_mp3(path='album', filename='song3.mp3',
+            artist='Artist', album='Album', title='Title 3')
+        self.add_mp3(path='album3', filename='song1.mp3',
+            artist='Artist', album='Album 3', title='Title 1')
+        self.delete_file('album2/song2.mp3')
+        self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertEqual(sorted(Song.objects.values_list('filename', flat=True)),
+            ['album/song1.mp3', 'album/song2.mp3', 'album/song3.mp3',
+            'album2/song1.mp3', 'album3/song1.mp3'])
+
+    def test_quick_scan_moved_file(self):
+        """
+        Quick scans should still detect moves between directories.
+        """
+        self.add_albums()
+        song_pk = Song.objects.get(filename='album/song1.mp3').pk
+        self.move_file('album/song1.mp3', 'album2/disc2')
+        results = self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertIn((App.STATUS_INFO, 'File move detected: album/song1.mp3 -> album2/disc2/song1.mp3'),
+            results)
+        self.assertEqual(Song.objects.get(pk=song_pk).filename, 'album2/disc2/song1.mp3')
+
+    def test_quick_scan_unreadable(self):
+        """
+        Directories with unreadable files shouldn't be snapshotted, so that
+        we'll notice once the file becomes readable.
+        """
+        self.add_albums()
+        self.add_mp3(path='album3', filename='song1.mp3',
+            artist='Artist', album='Album 3', title='Title 1')
+        full_filename = os.path.join(self.library_path, 'album3', 'song1.mp3')
+        os.chmod(full_filename, 0)
+        self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertNotIn('album3', self.get_stored_paths())
+        self.assertEqual(Song.objects.filter(filename='album3/song1.mp3').count(), 0)
+
+        os.chmod(full_filename, 0o644)
+        self.assertNoErrors(list(App.update(quick_scan=True)))
+        self.assertIn('album3', self.get_stored_paths())
+        self.assertEqual(Song.objects.filter(filename='album3/song1.mp3').count(), 1)
+
+    def test_scoped_update_snapshots(self):
+        """
+        Scoped updates should only touch snapshots inside their scope.
+        """
+        self.add_albums()
+        DirectorySnapshot.objects.filter(path='album2').update(fingerprint='')
+        shutil.rmtree(os.path.join(self.library_path, 'album'))
+        self.assertNoErrors(list(App.update(scope='album2', quick_scan=True)))
+        self.assertEqual(self.get_stored_paths(), ['', 'album', 'album2'])
+        self.assertNotEqual(DirectorySnapshot.objects.get(path='album2').fingerprint, '')
+
+    def test_get_filesystem_media_skip_unchanged(self):
+        """
+        ``get_filesystem_media()`` should be able to leave out directories
+        which haven't changed.
+        """
+        self.add_albums()
+        self.add_mp3(path='album', filename='song3.mp3')
+        self.assertEqual(sorted(App.get_filesystem_media(skip_unchanged=True)),
+            ['album/song1.mp3', 'album/song2.mp3', 'album/song3.mp3'])
+        self.assertEqual(len(App.get_filesystem_media()), 5)
+        self.assertEqual(sorted(App.get_filesystem_media(extra_base='album2', skip_unchanged=True)), [])
+
+@unittest.skipUnless(inotify_available(), 'inotify is not available')
+class LibraryWatcherTests(ExordiumTests):
+    """
+    Tests for our inotify-driven library watcher.  These use real inotify
+    events from our test library.
+    """
+
+    def start_watcher(self):
+        """
+        Starts up a watcher on our library, which will be cleaned up for us
+        after the test.
+        """
+        self.watcher = LibraryWatcher(debounce=0, max_delay=0)
+        self.addCleanup(self.watcher.inotify.close)
+
+    def run_watcher(self):
+        """
+        Processes whatever events are waiting for our watcher, and then
+        applies them, returning the status lines (which are checked for
+        errors).
+        """
+        for i in range(3):
+            self.watcher.poll(0.1)
+        return self.assertNoErrors(list(self.watcher.flush()))
+
+    def add_album(self, path='album', album='Album', tracks=2):
+        """
+        Adds a simple album to our library, and runs an add.
+        """
+        for num in range(1, tracks+1):
+            self.add_mp3(path=path, filename='song%d.mp3' % (num),
+                artist='Artist', album=album, title='Title %d' % (num))
+        self.run_add()
+
+    def test_watch_tree(self):
+        """
+        All of the directories in our library should be watched.
+        """
+        self.add_mp3(path='album/disc1', filename='song1.mp3')
+        self.add_mp3(path='album2', filename='song2.mp3')
+        self.start_watcher()
+        self.assertEqual(sorted(self.watcher.wd_paths.values()),
+            ['', 'album', 'album/disc1', 'album2'])
+
+    def test_get_scopes(self):
+        """
+        Directories underneath other directories to update shouldn't get
+        updated twice.
+        """
+        self.start_watcher()
+        self.assertEqual(self.watcher.get_scopes(set(['b', 'a/c', 'a', 'ab', 'b/d/e'])),
+            ['a', 'ab', 'b'])
+        self.assertEqual(self.watcher.get_scopes(set(['b', '', 'a'])), [''])
+
+    def test_no_changes(self):
+        """
+        With nothing going on, we shouldn't have anything to do.
+        """
+        self.add_album()
+        self.start_watcher()
+        self.assertEqual(self.run_watcher(), [])
+        self.assertEqual(self.watcher.get_timeout(), None)
+
+    def test_ignore_other_files(self):
+        """
+        Changes to files which aren't media or album art should be ignored.
+        """
+        self.add_album()
+        self.start_watcher()
+        with open(os.path.join(self.library_path, 'album', 'notes.txt'), 'w') as df:
+            df.write('notes')
+        self.assertEqual(self.run_watcher(), [])
+
+    def test_modified_file(self):
+        """
+        A changed file should be updated, with only its directory looked at.
+        """
+        self.add_album()
+        self.add_album(path='album2', album='Album 2')
+        self.start_watcher()
+        self.update_mp3('album/song1.mp3', title='New Title')
+        results = self.run_watcher()
+        self.assertIn((App.STATUS_INFO, 'Only processing library subdirectory: album'), results)
+        self.assertNotIn((App.STATUS_INFO, 'Only processing library subdirectory: album2'), results)
+        self.assertEqual(Song.objects.get(filename='album/song1.mp3').title, 'New Title')
+
+    def test_new_directory(self):
+        """
+        New directories should be added, and watched for further changes.
+        """
+        self.add_album()
+        self.start_watcher()
+        self.add_mp3(path='album2', filename='song1.mp3',
+            artist='Artist', album='Album 2', title='Title 1')
+        self.run_watcher()
+        self.assertEqual(Song.objects.filter(filename='album2/song1.mp3').count(), 1)
+        self.assertIn('album2', self.watcher.wd_paths.values())
+
+        self.add_mp3(path='album2', filename='song2.mp3',
+            artist='Artist', album='Album 2', title='Title 2')
+        self.run_watcher()
+        self.assertEqual(Song.objects.filter(album__name='Album 2').count(), 2)
+
+    def test_deleted_file(self):
+        """
+        Deleted files should be removed.
+        """
+        self.add_album()
+        self.start_watcher()
+        self.delete_file('album/song1.mp3')
+        self.run_watcher()
+        self.assertEqual(Song.objects.count(), 1)
+
+    def test_deleted_directory(self):
+        """
+        Deleted directories should have their songs (and albums) removed.
+        """
+        self.add_album()
+        self.add_album(path='album2', album='Album 2')
+        self.start_watcher()
+        shutil.rmtree(os.path.join(self.library_path, 'album'))
+        self.run_watcher()
+        self.assertEqual(Song.objects.filter(album__name='Album').count(), 0)
+        self.assertEqual(Song.objects.filter(album__name='Album 2').count(), 2)
+        self.assertEqual(Album.objects.filter(name='Album').count(), 0)
+
+    def test_moved_file(self):
+        """
+        Files renamed within the library should be moved without needing any
+        checksums.
+        """
+        self.add_album()
+        os.mkdir(os.path.join(self.library_path, 'album2'))
+        self.start_watcher()
+        song = Song.objects.get(filename='album/song1.mp3')
+        FileChecksum.objects.all().delete()
+        self.move_file('album/song1.mp3', 'album2')
+        results = self.run_watcher()
+        self.assertIn((App.STATUS_INFO, 'File move detected: album/song1.mp3 -> album2/song1.mp3'), results)
+        moved_song = Song.objects.get(filename='album2/song1.mp3')
+        self.assertEqual(moved_song.pk, song.pk)
+        self.assertEqual(moved_song.sha256sum, song.sha256sum)
+        self.assertEqual(FileChecksum.objects.count(), 0)
+        self.assertEqual(Song.objects.count(), 2)
+
+    def test_moved_directory(self):
+        """
+        Directories renamed within the library should have all their songs
+        moved, and should keep being watched under their new name.
+        """
+        self.add_album(path='album/disc1')
+        self.start_watcher()
+        pks = sorted(Song.objects.values_list('pk', flat=True))
+        FileChecksum.objects.all().delete()
+        os.rename(os.path.join(self.library_path, 'album'),
+            os.path.join(self.library_path, 'renamed'))
+        self.run_watcher()
+        self.assertEqual(sorted(Song.objects.values_list('filename', flat=True)),
+            ['renamed/disc1/song1.mp3', 'renamed/disc1/song2.mp3'])
+        self.assertEqual(sorted(Song.objects.values_list('pk', flat=True)), pks)
+        self.assertEqual(FileChecksum.objects.count(), 0)
+        self.assertIn('renamed/disc1', self.watcher.wd_paths.values())
+
+        self.update_mp3('renamed/disc1/song1.mp3', title='New Title')
+        self.run_watcher()
+        self.assertEqual(Song.objects.get(filename='renamed/disc1/song1.mp3').title, 'New Title')
+
+    def test_moved_onto_existing(self):
+        """
+        A file renamed on top of another track should replace it.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.add_mp3(path='album', filename='song2.mp3',
+            artist='Artist', album='Album', title='Title 2')
+        self.run_add()
+        self.start_watcher()
+        os.rename(os.path.join(self.library_path, 'album', 'song1.mp3'),
+            os.path.join(self.library_path, 'album', 'song2.mp3'))
+        results = self.run_watcher()
+        self.assertIn((App.STATUS_DEBUG, 'Not moving onto existing file: album/song1.mp3 -> album/song2.mp3'),
+            results)
+        song = Song.objects.get()
+        self.assertEqual(song.filename, 'album/song2.mp3')
+        self.assertEqual(song.title, 'Title 1')
+
+    def test_moved_out_of_library(self):
+        """
+        Directories moved out of the library should have their songs removed,
+        and no longer be watched.
+        """
+        self.add_album()
+        self.start_watcher()
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        os.rename(os.path.join(self.library_path, 'album'), os.path.join(outside, 'album'))
+        self.run_watcher()
+        self.assertEqual(Song.objects.count(), 0)
+        self.assertNotIn('album', self.watcher.wd_paths.values())
+
+    def test_moved_into_library(self):
+        """
+        Directories moved into the library from elsewhere should be added.
+        """
+        self.start_watcher()
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        os.rename(os.path.join(self.library_path, 'album'), os.path.join(outside, 'album'))
+        self.run_watcher()
+        os.rename(os.path.join(outside, 'album'), os.path.join(self.library_path, 'album'))
+        self.run_watcher()
+        self.assertEqual(Song.objects.get().filename, 'album/song1.mp3')
+        self.assertIn('album', self.watcher.wd_paths.values())
+
+    def test_overflow(self):
+        """
+        If the kernel's event queue overflows, we should do a full update.
+        """
+        self.add_album()
+        self.start_watcher()
+        self.update_mp3('album/song1.mp3', title='New Title')
+        self.watcher.process_event(-1, Inotify.IN_Q_OVERFLOW, 0, '')
+        results = self.run_watcher()
+        self.assertIn((App.STATUS_INFO, 'Missed some filesystem events, running a full update'), results)
+        self.assertNotIn((App.STATUS_INFO, 'Only processing library subdirectory: album'), results)
+        self.assertEqual(Song.objects.get(filename='album/song1.mp3').title, 'New Title')
+
+    def test_debounce(self):
+        """
+        We shouldn't be ready to flush until things have been quiet for our
+        debounce time.
+        """
+        self.add_album()
+        self.start_watcher()
+        self.watcher.debounce = 60
+        self.watcher.max_delay = 120
+        self.assertEqual(self.watcher.get_timeout(), None)
+        self.update_mp3('album/song1.mp3', title='New Title')
+        self.watcher.poll(1)
+        self.assertGreater(self.watcher.get_timeout(), 50)
+        self.watcher.max_delay = 0
+        self.assertEqual(self.watcher.get_timeout(), 0)
+
+class IndexViewTests(ExordiumUserTests):
+    """
+    Tests of our main index view.  (Not a whole lot going on, really)
+    """
+
+    def test_no_albums(self):
+        """
+        Test what happens if there are no albums defined.  (No albums should
+        be found in the view's context.)  This test also tests for the various
+        links which are supposed to be present on the main page.
+        """
+        response = self.client.get(reverse('exordium:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerysetEqual(response.context['album_list'].data, [])
+
+        self.assertContains(response, 'AnonymousUser')
+        self.assertContains(response, reverse('exordium:browse_artist'))
+        self.assertContains(response, reverse('exordium:browse_album'))
+        self.assertContains(response, reverse('exordium:updateprefs'))
+
+        # We are not authenticated, so we should NOT see any of the admin
+        # links anywhere.
+        self.assertNotContains(response, reverse('exordium:library'))
+        self.assertNotContains(response, reverse('admin:dynamic_preferences_globalpreferencemodel_changelist'))
+        self.assertNotContains(response, '%s"' % (reverse('admin:index')))
+
+        # But we SHOULD see a login link
+        self.assertContains(response, reverse('admin:login'))
+
+    def test_no_albums_admin(self):
+        """
+        Test what happens if there are no albums defined.  (No albums should
+        be found in the view's context.)  This test also tests for the various
+        links which are supposed to be present on the main page.  This time,
+        request as if we're an admin.
+        """
+        self.login()
+        response = self.client.get(reverse('exordium:index'))
+        self.assertContains(response, 'mainuser')
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerysetEqual(response.context['album_list'].data, [])
+
+        self.assertContains(response, 'mainuser')
+        self.assertContains(response, reverse('exordium:browse_artist'))
+        self.assertContains(response, reverse('exordium:browse_album'))
+        self.assertContains(response, reverse('exordium:updateprefs'))
+
+        # We are authenticated, so we should see the admin links.
+        self.assertContains(response, reverse('exordium:library'))
+        self.assertContains(response, reverse('admin:dynamic_preferences_globalpreferencemodel_changelist'))
+        self.assertContains(response, reverse('admin:index'))
+
+        # But we should NOT see a login link
+        self.assertNotContains(response, reverse('admin:login'))
+
+    def test_single_album(self):
+        """
+        Test what happens when there's a single album.  We should see that
+        album!
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Test Album', filename='song1.mp3')
+        self.run_add()
+        self.assertEqual(Album.objects.count(), 1)
+        album = Album.objects.get()
+
+        response = self.client.get(reverse('exordium:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerysetEqual(response.context['album_list'].data, [repr(album)])
+        self.assertContains(response, 'Test Album')
+        self.assertContains(response, reverse('exordium:album', args=(album.pk,)))
+        self.assertContains(response, reverse('exordium:artist', args=(album.artist.normname,)))
+        self.assertContains(response, '1 album')
+
+        # May as well verify that we're seeing the no-album-art cover, as well
         self.assertContains(response, '"%s"' % (static('exordium/no_album_art_small.png')))
 
     def test_album_art(self):
@@ -7252,6 +9946,24 @@ class IndexViewTests(ExordiumUserTests):
         self.assertContains(response, 'Album 2')
         self.assertContains(response, '"?sort=-year"')
 
+    def test_album_totals(self):
+        """
+        Albums on the index should come annotated with their track count
+        and total length, which are shown in the table.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_mp3(artist='Artist', title='Title 2',
+            album='Album', filename='song2.mp3')
+        self.run_add()
+        album = Album.objects.get()
+
+        response = self.client.get(reverse('exordium:index'))
+        self.assertEqual(response.status_code, 200)
+        albums = list(response.context['album_list'].data)
+        self.assertEqual(albums[0].num_tracks, 2)
+        self.assertEqual(albums[0].total_time, album.get_total_time())
+
 class SessionViewTests(TestCase):
     """
     Tests dealing with the session variables we set (for success/fail messages).
@@ -7900,6 +10612,24 @@ class BrowseAlbumViewTests(ExordiumTests):
         self.assertQuerysetEqual(response.context['table'].data, [repr(al) for al in reversed(albums)])
         self.assertContains(response, '"?sort=-artist"')
 
+    def test_album_totals(self):
+        """
+        Albums being browsed should come annotated with their track count
+        and total length.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_mp3(artist='Artist', title='Title 2',
+            album='Album', filename='song2.mp3')
+        self.run_add()
+        album = Album.objects.get()
+
+        response = self.client.get(reverse('exordium:browse_album'))
+        self.assertEqual(response.status_code, 200)
+        albums = list(response.context['table'].data)
+        self.assertEqual(albums[0].num_tracks, 2)
+        self.assertEqual(albums[0].total_time, album.get_total_time())
+
 class ArtistViewTests(ExordiumTests):
     """
     Tests of our Artist info page
@@ -8347,6 +11077,35 @@ class ArtistViewTests(ExordiumTests):
         self.assertContains(response, '1 album')
         self.assertNotContains(response, '1 song')
 
+    def test_album_totals(self):
+        """
+        Albums on an artist's page should come annotated with their full
+        track count and total length, even for compilations which the
+        artist only appears on part of.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='album')
+        self.add_mp3(artist='Artist', title='Title 2',
+            album='Album', filename='song2.mp3', path='album')
+        self.add_mp3(artist='Artist', title='Title 3',
+            album='Compilation', filename='song3.mp3', path='comp')
+        self.add_mp3(artist='Artist 2', title='Title 4',
+            album='Compilation', filename='song4.mp3', path='comp')
+        self.add_mp3(artist='Artist 3', title='Title 5',
+            album='Compilation', filename='song5.mp3', path='comp')
+        self.run_add()
+        self.assertEqual(Album.objects.count(), 2)
+        comp = Album.objects.get(name='Compilation')
+        self.assertEqual(comp.artist.various, True)
+
+        response = self.client.get(reverse('exordium:artist', args=('artist',)))
+        self.assertEqual(response.status_code, 200)
+        albums = list(response.context['albums'].data)
+        self.assertEqual([album.name for album in albums], ['Album', 'Compilation'])
+        self.assertEqual(albums[0].num_tracks, 2)
+        self.assertEqual(albums[1].num_tracks, 3)
+        self.assertEqual(albums[1].total_time, comp.get_total_time())
+
 class AlbumViewTests(ExordiumUserTests):
     """
     Tests of our Album info page
@@ -8918,6 +11677,7 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.assertNotContains(response, 'Zipfile Support:</strong> No')
         self.assertContains(response, App.prefs['exordium__zipfile_url'])
         self.assertContains(response, App.prefs['exordium__zipfile_path'])
+        self.assertContains(response, 'Zipfile Quota:</strong> None')
 
     def test_download_button_present(self):
         """
@@ -8972,20 +11732,166 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.prefs['exordium__zipfile_url'] = ''
 
         self.add_mp3(artist='Artist', title='Title 1',
-            album='Album', filename='song1.mp3')
+            album='Album', filename='song1.mp3')
+        self.run_add()
+
+        self.assertEqual(Album.objects.count(), 1)
+        album = Album.objects.get()
+
+        self.assertRaises(App.AlbumZipfileNotSupported, album.create_zip)
+
+    def test_basic_album_download(self):
+        """
+        Test to ensure that we can generate zipfiles
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
+
+        self.assertEqual(Album.objects.count(), 1)
+        album = Album.objects.get()
+
+        self.assertEqual(Song.objects.count(), 1)
+        song = Song.objects.get()
+
+        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filenames', response.context)
+        self.assertIn('zip_file', response.context)
+        self.assertIn('zip_url', response.context)
+        self.assertEqual(response.context['filenames'], ['Album/song1.mp3'])
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertContains(response, 'Album/song1.mp3<')
+        self.assertContains(response, response.context['zip_file'])
+        self.assertContains(response, response.context['zip_url'])
+        self.assertContains(response, 'meta http-equiv')
+        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
+        self.assertEqual(os.path.exists(zip_file), True)
+
+        with zipfile.ZipFile(zip_file, 'r') as zf:
+            self.assertEqual(zf.namelist(), ['Album/song1.mp3'])
+
+    def test_basic_album_download_at_library_base(self):
+        """
+        Test to ensure that we can generate zipfiles from files stored
+        right at the library base directory.  The top-level dir stored
+        in the zipfile should be the name of the library dir itself,
+        which in our case is gonna be the bit of randomness provided
+        by ``tempfile.mkdtemp()``.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.run_add()
+
+        self.assertEqual(Album.objects.count(), 1)
+        album = Album.objects.get()
+
+        self.assertEqual(Song.objects.count(), 1)
+        song = Song.objects.get()
+
+        library_base = os.path.basename(self.library_path)
+        song_full = os.path.join(library_base, 'song1.mp3')
+
+        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filenames', response.context)
+        self.assertIn('zip_file', response.context)
+        self.assertIn('zip_url', response.context)
+        self.assertEqual(response.context['filenames'], [song_full])
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertContains(response, '%s<' % (song_full))
+        self.assertContains(response, response.context['zip_file'])
+        self.assertContains(response, response.context['zip_url'])
+        self.assertContains(response, 'meta http-equiv')
+        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
+        self.assertEqual(os.path.exists(zip_file), True)
+
+        with zipfile.ZipFile(zip_file, 'r') as zf:
+            self.assertEqual(zf.namelist(), [song_full])
+
+    def test_basic_album_download_song_before_1980(self):
+        """
+        Test to ensure that we can generate zipfiles with files created
+        before 1980.  Zipfiles can't store dates prior to 1980, so the
+        zip process will fail.  We catch that exception in the app and
+        then do some nonsense to inject the song with the current
+        timestamp, so we'd like to make sure that works.  Pretty unlikely,
+        but I ended up having a file right near the epoch (possibly on
+        the epoch) due to some past weirdness, no doubt.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
+        self.set_file_ancient('Album/song1.mp3')
+
+        self.assertEqual(Album.objects.count(), 1)
+        album = Album.objects.get()
+
+        self.assertEqual(Song.objects.count(), 1)
+        song = Song.objects.get()
+
+        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filenames', response.context)
+        self.assertIn('zip_file', response.context)
+        self.assertIn('zip_url', response.context)
+        self.assertEqual(response.context['filenames'], ['Album/song1.mp3'])
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertContains(response, 'Album/song1.mp3<')
+        self.assertContains(response, response.context['zip_file'])
+        self.assertContains(response, response.context['zip_url'])
+        self.assertContains(response, 'meta http-equiv')
+        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
+        self.assertEqual(os.path.exists(zip_file), True)
+
+        with zipfile.ZipFile(zip_file, 'r') as zf:
+            self.assertEqual(zf.namelist(), ['Album/song1.mp3'])
+
+    def test_basic_album_download_twice(self):
+        """
+        Generate a zipfile and then request the zipfile again.  Should get a page
+        back which has a link to the zipfile, and a message about how it was
+        generated previously.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
         self.run_add()
 
         self.assertEqual(Album.objects.count(), 1)
         album = Album.objects.get()
 
-        self.assertRaises(App.AlbumZipfileNotSupported, album.create_zip)
+        self.assertEqual(Song.objects.count(), 1)
+        song = Song.objects.get()
 
-    def test_basic_album_download(self):
+        # Original request
+        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+
+        # Subsequent request
+        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Zipfile already exists.  You should be able to download with the link below.')
+        self.assertNotIn('filenames', response.context)
+        self.assertIn('zip_file', response.context)
+        self.assertIn('zip_url', response.context)
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertNotContains(response, 'Album/song1.mp3<')
+        self.assertContains(response, response.context['zip_file'])
+        self.assertContains(response, response.context['zip_url'])
+        self.assertContains(response, 'meta http-equiv')
+        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
+        self.assertEqual(os.path.exists(zip_file), True)
+
+        with zipfile.ZipFile(zip_file, 'r') as zf:
+            self.assertEqual(zf.namelist(), ['Album/song1.mp3'])
+
+    def test_basic_album_download_with_art(self):
         """
-        Test to ensure that we can generate zipfiles
+        Test to ensure that we can generate zipfiles, with album art included.
         """
         self.add_mp3(artist='Artist', title='Title 1',
             album='Album', filename='song1.mp3', path='Album')
+        self.add_art(path='Album')
         self.run_add()
 
         self.assertEqual(Album.objects.count(), 1)
@@ -8999,9 +11905,10 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.assertIn('filenames', response.context)
         self.assertIn('zip_file', response.context)
         self.assertIn('zip_url', response.context)
-        self.assertEqual(response.context['filenames'], ['Album/song1.mp3'])
-        self.assertEqual(response.context['zip_file'], 'Artist_-_Album.zip')
+        self.assertEqual(response.context['filenames'], ['Album/song1.mp3', 'Album/cover.jpg'])
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
         self.assertContains(response, 'Album/song1.mp3<')
+        self.assertContains(response, 'Album/cover.jpg<')
         self.assertContains(response, response.context['zip_file'])
         self.assertContains(response, response.context['zip_url'])
         self.assertContains(response, 'meta http-equiv')
@@ -9009,18 +11916,16 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.assertEqual(os.path.exists(zip_file), True)
 
         with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(zf.namelist(), ['Album/song1.mp3'])
+            self.assertEqual(zf.namelist(), ['Album/song1.mp3', 'Album/cover.jpg'])
 
-    def test_basic_album_download_at_library_base(self):
+    def test_basic_album_download_with_art_in_parent_dir(self):
         """
-        Test to ensure that we can generate zipfiles from files stored
-        right at the library base directory.  The top-level dir stored
-        in the zipfile should be the name of the library dir itself,
-        which in our case is gonna be the bit of randomness provided
-        by ``tempfile.mkdtemp()``.
+        Test to ensure that we can generate zipfiles, with album art included
+        but in the parent directory.
         """
         self.add_mp3(artist='Artist', title='Title 1',
-            album='Album', filename='song1.mp3')
+            album='Album', filename='song1.mp3', path='Artist/Album')
+        self.add_art(path='Artist')
         self.run_add()
 
         self.assertEqual(Album.objects.count(), 1)
@@ -9029,17 +11934,15 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.assertEqual(Song.objects.count(), 1)
         song = Song.objects.get()
 
-        library_base = os.path.basename(self.library_path)
-        song_full = os.path.join(library_base, 'song1.mp3')
-
         response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
         self.assertEqual(response.status_code, 200)
         self.assertIn('filenames', response.context)
         self.assertIn('zip_file', response.context)
         self.assertIn('zip_url', response.context)
-        self.assertEqual(response.context['filenames'], [song_full])
-        self.assertEqual(response.context['zip_file'], 'Artist_-_Album.zip')
-        self.assertContains(response, '%s<' % (song_full))
+        self.assertEqual(response.context['filenames'], ['Artist/Album/song1.mp3', 'Artist/cover.jpg'])
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertContains(response, 'Artist/Album/song1.mp3<')
+        self.assertContains(response, 'Artist/cover.jpg<')
         self.assertContains(response, response.context['zip_file'])
         self.assertContains(response, response.context['zip_url'])
         self.assertContains(response, 'meta http-equiv')
@@ -9047,37 +11950,37 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.assertEqual(os.path.exists(zip_file), True)
 
         with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(zf.namelist(), [song_full])
+            self.assertEqual(zf.namelist(), ['Artist/Album/song1.mp3', 'Artist/cover.jpg'])
 
-    def test_basic_album_download_song_before_1980(self):
+    def test_miscellaneous_album_download_in_multiple_dirs(self):
         """
-        Test to ensure that we can generate zipfiles with files created
-        before 1980.  Zipfiles can't store dates prior to 1980, so the
-        zip process will fail.  We catch that exception in the app and
-        then do some nonsense to inject the song with the current
-        timestamp, so we'd like to make sure that works.  Pretty unlikely,
-        but I ended up having a file right near the epoch (possibly on
-        the epoch) due to some past weirdness, no doubt.
+        Test to ensure that we can generate zipfiles for an album which is contained
+        in more than one directory.  (Using a 'miscellaneous' album here but this'd
+        work for any album which happens to do this)
         """
         self.add_mp3(artist='Artist', title='Title 1',
-            album='Album', filename='song1.mp3', path='Album')
+            filename='song1.mp3', path='Artist/Tracks')
+        self.add_mp3(artist='Artist', title='Title 2',
+            filename='song2.mp3', path='Artist/MoreTracks')
         self.run_add()
-        self.set_file_ancient('Album/song1.mp3')
 
         self.assertEqual(Album.objects.count(), 1)
         album = Album.objects.get()
 
-        self.assertEqual(Song.objects.count(), 1)
-        song = Song.objects.get()
+        self.assertEqual(Song.objects.count(), 2)
 
         response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
         self.assertEqual(response.status_code, 200)
         self.assertIn('filenames', response.context)
         self.assertIn('zip_file', response.context)
         self.assertIn('zip_url', response.context)
-        self.assertEqual(response.context['filenames'], ['Album/song1.mp3'])
-        self.assertEqual(response.context['zip_file'], 'Artist_-_Album.zip')
-        self.assertContains(response, 'Album/song1.mp3<')
+        self.assertEqual(
+            sorted(response.context['filenames']),
+            sorted(['Artist/Tracks/song1.mp3', 'Artist/MoreTracks/song2.mp3'])
+        )
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_%s.zip' % (App.norm_filename(album.name)))
+        self.assertContains(response, 'Artist/Tracks/song1.mp3<')
+        self.assertContains(response, 'Artist/MoreTracks/song2.mp3<')
         self.assertContains(response, response.context['zip_file'])
         self.assertContains(response, response.context['zip_url'])
         self.assertContains(response, 'meta http-equiv')
@@ -9085,153 +11988,1247 @@ class AlbumDownloadViewTests(ExordiumUserTests):
         self.assertEqual(os.path.exists(zip_file), True)
 
         with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(zf.namelist(), ['Album/song1.mp3'])
+            self.assertEqual(
+                sorted(zf.namelist()),
+                sorted(['Artist/Tracks/song1.mp3', 'Artist/MoreTracks/song2.mp3'])
+            )
 
-    def test_basic_album_download_twice(self):
+    def test_album_download_in_progress(self):
         """
-        Generate a zipfile and then request the zipfile again.  Should get a page
-        back which has a link to the zipfile, and a message about how it was
-        generated previously.
+        If a zipfile takes too long to build, we should get a page which
+        reloads itself, and the zipfile should be waiting for us once the
+        build finishes.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
+        album = Album.objects.get()
+
+        # Tie up our only build job so that our zipfile has to wait
+        queue = App.get_zip_queue()
+        blocker = threading.Event()
+        blocking = queue.submit('blocker', blocker.wait)
+        saved_wait = AlbumDownloadView.zip_wait
+        AlbumDownloadView.zip_wait = 0.1
+        try:
+            response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        finally:
+            AlbumDownloadView.zip_wait = saved_wait
+            blocker.set()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['in_progress'], True)
+        self.assertNotIn('zip_file', response.context)
+        self.assertContains(response, 'still being generated')
+        self.assertContains(response, 'meta http-equiv="refresh" content="%d"' % (AlbumDownloadView.zip_refresh))
+
+        # Wait for the build to actually finish
+        digest = album.get_zip_digest()
+        zip_full = os.path.join(self.zipfile_path, digest, 'Artist_-_Album.zip')
+        blocking.result()
+        future = queue.get(digest)
+        if future is not None:
+            future.result()
+        self.assertEqual(os.path.exists(zip_full), True)
+
+        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertContains(response, 'Zipfile already exists.')
+
+    def test_model_start_zip_single_flight(self):
+        """
+        Starting the same zipfile twice while the first is still queued
+        should give us the same build.
         """
         self.add_mp3(artist='Artist', title='Title 1',
             album='Album', filename='song1.mp3', path='Album')
         self.run_add()
+        album = Album.objects.get()
 
-        self.assertEqual(Album.objects.count(), 1)
+        queue = App.get_zip_queue()
+        blocker = threading.Event()
+        blocking = queue.submit('blocker', blocker.wait)
+        try:
+            (future, zip_filename) = album.start_zip()
+            (future2, zip_filename2) = album.start_zip()
+        finally:
+            blocker.set()
+        self.assertIs(future, future2)
+        self.assertEqual(zip_filename, zip_filename2)
+        stream = future.result()
+        self.assertEqual(os.path.getsize(os.path.join(self.zipfile_path, zip_filename)), stream.size)
+        self.assertEqual(queue.get_pending(), [])
+
+    def test_model_create_zip_touches_existing(self):
+        """
+        Asking for a zipfile which already exists should mark it as
+        recently used.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
         album = Album.objects.get()
 
-        self.assertEqual(Song.objects.count(), 1)
-        song = Song.objects.get()
+        (filenames, zip_filename) = album.create_zip()
+        zip_full = os.path.join(self.zipfile_path, zip_filename)
+        os.utime(zip_full, times=(1000000000, 1000000000))
+        with self.assertRaises(App.AlbumZipfileAlreadyExists):
+            album.create_zip()
+        stat_result = os.stat(zip_full)
+        self.assertEqual(stat_result.st_mtime, 1000000000)
+        self.assertGreater(stat_result.st_atime, 1000000000)
+
+    def test_model_build_zip_quota(self):
+        """
+        Building a zipfile should evict older zipfiles once we're over
+        quota, but never the one we just built.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
+        album = Album.objects.get()
+
+        old_zip = os.path.join(self.zipfile_path, 'old.zip')
+        with open(old_zip, 'wb') as df:
+            df.write(b'0' * 1000)
+        os.utime(old_zip, times=(1000000000, 1000000000))
+
+        cache = App.get_zip_cache()
+        digest = album.get_zip_digest()
+        zip_full = os.path.join(self.zipfile_path, digest, 'Artist_-_Album.zip')
+        stream = album.get_zip_stream()
+        App.build_zip(cache, digest, 'Artist_-_Album.zip', stream, quota=stream.size)
+        self.assertEqual(os.path.exists(old_zip), False)
+        self.assertEqual(os.path.exists(zip_full), True)
+
+        # Even a tiny quota leaves our newest zipfile in place
+        os.unlink(zip_full)
+        App.build_zip(cache, digest, 'Artist_-_Album.zip', album.get_zip_stream(), quota=1)
+        self.assertEqual(os.path.exists(zip_full), True)
+
+    def test_evictzipfiles_command(self):
+        """
+        Tests our ``evictzipfiles`` management command.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album 1', filename='song1.mp3', path='Album 1')
+        self.add_mp3(artist='Artist', title='Title 2',
+            album='Album 2', filename='song2.mp3', path='Album 2')
+        self.run_add()
+        album1 = Album.objects.get(name='Album 1')
+        album2 = Album.objects.get(name='Album 2')
+        zip1 = os.path.join(self.zipfile_path, album1.create_zip()[1])
+        zip2 = os.path.join(self.zipfile_path, album2.create_zip()[1])
+        when = time.time() - 48*3600
+        os.utime(zip1, times=(when, when))
+
+        # A zipfile which doesn't match any album, and one from before
+        # zipfiles were stored by digest
+        os.mkdir(os.path.join(self.zipfile_path, '0123456789abcdef'))
+        for filename in ['0123456789abcdef/Artist_-_Gone.zip', 'legacy.zip']:
+            with open(os.path.join(self.zipfile_path, filename), 'wb') as df:
+                df.write(b'0' * 1000)
+
+        out = io.StringIO()
+        call_command('evictzipfiles', max_age=24, stdout=out)
+        self.assertIn('Removed out-of-date zipfile 0123456789abcdef/Artist_-_Gone.zip', out.getvalue())
+        self.assertIn('Removed out-of-date zipfile legacy.zip', out.getvalue())
+        self.assertIn('Removed zipfile %s' % (os.path.relpath(zip1, self.zipfile_path)), out.getvalue())
+        self.assertIn('Removed 3 zipfiles,', out.getvalue())
+        self.assertEqual(os.path.exists(zip1), False)
+        self.assertEqual(os.path.exists(zip2), True)
+        self.assertEqual(sorted(os.listdir(self.zipfile_path)), [album2.get_zip_digest()])
+
+        # With our quota pref
+        self.prefs['exordium__zipfile_quota'] = 1
+        with open(zip2, 'wb') as df:
+            df.write(b'0' * (2*1024*1024))
+        out = io.StringIO()
+        call_command('evictzipfiles', stdout=out)
+        self.assertIn('Removed zipfile %s' % (os.path.relpath(zip2, self.zipfile_path)), out.getvalue())
+        self.assertEqual(os.path.exists(zip2), False)
+
+    def test_zipfile_rebuilt_after_change(self):
+        """
+        Changing an album's tracks should get us a fresh zipfile, with the
+        old one removed.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
+        album = Album.objects.get()
+        old_digest = album.get_zip_digest()
+        (filenames, old_zip) = album.create_zip()
+
+        self.update_mp3('Album/song1.mp3', title='New Title')
+        self.run_update()
+        album = Album.objects.get()
+        self.assertNotEqual(album.get_zip_digest(), old_digest)
 
-        # Original request
         response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
         self.assertEqual(response.status_code, 200)
+        self.assertIn('filenames', response.context)
+        self.assertNotEqual(response.context['zip_file'], old_zip)
+        self.assertEqual(os.path.basename(response.context['zip_file']), 'Artist_-_Album.zip')
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, old_zip)), False)
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, old_digest)), False)
+        with zipfile.ZipFile(os.path.join(self.zipfile_path, response.context['zip_file']), 'r') as zf:
+            self.assertEqual(zf.read('Album/song1.mp3'), self.get_file_contents('Album/song1.mp3'))
 
-        # Subsequent request
+    def test_zipfile_same_name_kept(self):
+        """
+        Building a zipfile for one album shouldn't remove another album's
+        zipfile just because they'd be downloaded under the same name.
+        """
+        self.add_mp3(artist='東京事変', title='Title 1',
+            album='教育', filename='song1.mp3', path='Album 1')
+        self.add_mp3(artist='東京事変', title='Title 2',
+            album='大人', filename='song2.mp3', path='Album 2')
+        self.run_add()
+        album1 = Album.objects.get(name='教育')
+        album2 = Album.objects.get(name='大人')
+        self.assertEqual(album1.get_zip_filename(), album2.get_zip_filename())
+        (filenames, zip1) = album1.create_zip()
+        (filenames, zip2) = album2.create_zip()
+        self.assertNotEqual(zip1, zip2)
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, zip1)), True)
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, zip2)), True)
+
+    def test_zipfile_reused_after_rename(self):
+        """
+        Renaming an album (without changing its files) should reuse its
+        existing zipfile, renamed to match.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3', path='Album')
+        self.run_add()
+        album = Album.objects.get()
+        digest = album.get_zip_digest()
+        (filenames, old_zip) = album.create_zip()
+        self.assertEqual(old_zip, '%s/Artist_-_Album.zip' % (digest))
+
+        album.name = 'Renamed'
+        album.save()
+        self.assertEqual(album.get_zip_digest(), digest)
         response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'Zipfile already exists.  You should be able to download with the link below.')
-        self.assertNotIn('filenames', response.context)
-        self.assertIn('zip_file', response.context)
-        self.assertIn('zip_url', response.context)
-        self.assertEqual(response.context['zip_file'], 'Artist_-_Album.zip')
-        self.assertNotContains(response, 'Album/song1.mp3<')
-        self.assertContains(response, response.context['zip_file'])
-        self.assertContains(response, response.context['zip_url'])
-        self.assertContains(response, 'meta http-equiv')
-        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
-        self.assertEqual(os.path.exists(zip_file), True)
+        self.assertContains(response, 'Zipfile already exists.')
+        self.assertEqual(response.context['zip_file'], '%s/Artist_-_Renamed.zip' % (digest))
+        self.assertContains(response, '>Artist_-_Renamed.zip</a>')
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, old_zip)), False)
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, response.context['zip_file'])), True)
+
+    def test_model_zip_digest(self):
+        """
+        Our zip digest should change along with our tracks' checksums and
+        order, and our album art, and match ``get_all_zip_digests()``.
+        """
+        self.add_mp3(artist='Artist', title='Title 1', tracknum=1,
+            album='Album', filename='song1.mp3', path='Album')
+        self.add_mp3(artist='Artist', title='Title 2', tracknum=2,
+            album='Album', filename='song2.mp3', path='Album')
+        self.run_add()
+        album = Album.objects.get()
+        digest = album.get_zip_digest()
+        self.assertEqual(digest, '%d-%s' % (album.pk, digest.split('-')[1]))
+        self.assertEqual(len(digest.split('-')[1]), Album.zip_digest_length)
+        self.assertEqual(Album.get_all_zip_digests(), set([digest]))
+
+        # Track order
+        song = Song.objects.get(filename='Album/song1.mp3')
+        song.tracknum = 3
+        song.save()
+        self.assertNotEqual(album.get_zip_digest(), digest)
+        song.tracknum = 1
+        song.save()
+        self.assertEqual(album.get_zip_digest(), digest)
+
+        # Checksum
+        song.sha256sum = '0'*64
+        song.save()
+        self.assertNotEqual(album.get_zip_digest(), digest)
+
+        # Album art
+        self.add_art(path='Album')
+        self.run_update()
+        album = Album.objects.get()
+        art_digest = album.get_zip_digest()
+        self.assertNotEqual(art_digest, digest)
+        album.art_mtime += 1
+        album.save()
+        self.assertNotEqual(album.get_zip_digest(), art_digest)
+        self.assertEqual(Album.get_all_zip_digests(), set([album.get_zip_digest()]))
+
+    def test_evictzipfiles_command_without_configuration(self):
+        """
+        Running ``evictzipfiles`` without zipfile support should error out.
+        """
+        self.prefs['exordium__zipfile_path'] = ''
+        out = io.StringIO()
+        err = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('evictzipfiles', stdout=out, stderr=err)
+        self.assertIn('not currently configured', err.getvalue())
+
+class ZipCacheTests(TestCase):
+    """
+    Tests for our ``ZipCache`` and ``ZipBuildQueue`` classes, which don't
+    need a library.
+    """
+
+    def setUp(self):
+        self.zipfile_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.zipfile_path)
+
+    def add_zip(self, filename, size, last_used):
+        """
+        Adds a fake zipfile to our directory, last used at ``last_used``.
+        """
+        full = os.path.join(self.zipfile_path, filename)
+        with open(full, 'wb') as df:
+            df.write(b'0' * size)
+        os.utime(full, times=(last_used, last_used))
+
+    def test_get_entries(self):
+        """
+        Entries should come back least-recently-used first, without any
+        temporary files or locks.
+        """
+        self.add_zip('b.zip', 10, 2000000000)
+        self.add_zip('a.zip', 20, 1000000000)
+        self.add_zip('.tmp.c.zip.xyz', 30, 1000000000)
+        self.add_zip('.lock.c.zip', 0, 1000000000)
+        self.add_zip('notes.txt', 5, 1000000000)
+        cache = ZipCache(self.zipfile_path)
+        self.assertEqual(cache.get_entries(), [('a.zip', 20, 1000000000), ('b.zip', 10, 2000000000)])
+
+    def test_evict_quota(self):
+        """
+        Eviction should remove the least-recently-used zipfiles until we're
+        under quota, skipping any we're told to keep.
+        """
+        self.add_zip('a.zip', 100, 1000000000)
+        self.add_zip('b.zip', 100, 1000000100)
+        self.add_zip('c.zip', 100, 1000000200)
+        self.add_zip('d.zip', 100, 1000000300)
+        cache = ZipCache(self.zipfile_path)
+        self.assertEqual(cache.evict(0), [])
+        self.assertEqual(cache.evict(250, keep=['a.zip']), [('b.zip', 100), ('c.zip', 100)])
+        self.assertEqual(sorted(os.listdir(self.zipfile_path)), ['a.zip', 'd.zip'])
+
+    def test_evict_max_age(self):
+        """
+        Eviction should remove zipfiles which haven't been used recently.
+        """
+        self.add_zip('old.zip', 100, time.time() - 7200)
+        self.add_zip('new.zip', 100, time.time())
+        cache = ZipCache(self.zipfile_path)
+        self.assertEqual(cache.evict(max_age=3600), [('old.zip', 100)])
+        self.assertEqual(os.listdir(self.zipfile_path), ['new.zip'])
+
+    def test_touch(self):
+        """
+        Touching a zipfile should bump its access time, so it's evicted
+        after others, without changing its mtime.
+        """
+        self.add_zip('a.zip', 100, 1000000000)
+        self.add_zip('b.zip', 100, 1000000100)
+        cache = ZipCache(self.zipfile_path)
+        cache.touch('a.zip')
+        cache.touch('missing.zip')
+        self.assertEqual(os.stat(os.path.join(self.zipfile_path, 'a.zip')).st_mtime, 1000000000)
+        self.assertEqual(cache.evict(100), [('b.zip', 100)])
+
+    def test_write_and_clean_locks(self):
+        """
+        Writing a zipfile should leave only the finished zipfile behind,
+        plus its lock, which ``clean_locks()`` gets rid of.
+        """
+        filename = os.path.join(self.zipfile_path, 'file.mp3')
+        with open(filename, 'wb') as df:
+            df.write(b'data')
+        cache = ZipCache(self.zipfile_path)
+        stream = ZipStream([ZipMember.from_file(filename, 'file.mp3')])
+        with cache.build_lock('abcd'):
+            self.assertEqual(cache.write('abcd', 'test.zip', stream), 'abcd/test.zip')
+        self.assertEqual(sorted(os.listdir(self.zipfile_path)), ['.lock.abcd', 'abcd', 'file.mp3'])
+        self.assertEqual(os.listdir(os.path.join(self.zipfile_path, 'abcd')), ['test.zip'])
+        self.assertEqual(os.path.getsize(os.path.join(self.zipfile_path, 'abcd/test.zip')), stream.size)
+        self.assertEqual(cache.find('abcd'), 'abcd/test.zip')
+        self.assertEqual(cache.find('dcba'), None)
+        self.assertEqual(cache.find('file.mp3'), None)
+        with cache.build_lock('dcba'):
+            cache.clean_locks()
+            self.assertEqual(sorted(os.listdir(self.zipfile_path)), ['.lock.dcba', 'abcd', 'file.mp3'])
+
+    def test_digest_dirs(self):
+        """
+        Zipfiles stored under digests should be listed, renamed, and
+        removed (along with their directories) properly.
+        """
+        for digest in ['1-abcd', '1-dcba', '1-ef01', '2-abcd']:
+            os.mkdir(os.path.join(self.zipfile_path, digest))
+        self.add_zip('1-abcd/Album.zip', 100, 1000000000)
+        self.add_zip('1-abcd/.tmp.Album.zip.xyz', 100, 1000000000)
+        self.add_zip('1-dcba/Album.zip', 100, 1000000100)
+        self.add_zip('1-ef01/Album.zip', 100, 1000000100)
+        self.add_zip('2-abcd/Album.zip', 100, 1000000150)
+        self.add_zip('legacy.zip', 100, 1000000200)
+        cache = ZipCache(self.zipfile_path)
+        self.assertEqual([filename for (filename, size, last_used) in cache.get_entries()],
+            ['1-abcd/Album.zip', '1-dcba/Album.zip', '1-ef01/Album.zip', '2-abcd/Album.zip', 'legacy.zip'])
+
+        self.assertEqual(cache.rename('1-dcba/Album.zip', 'Renamed.zip'), '1-dcba/Renamed.zip')
+        self.assertEqual(cache.find('1-dcba'), '1-dcba/Renamed.zip')
+
+        # Other versions of the same digest go, whatever they're named, but
+        # other digests with the same filename stay.  The temporary file
+        # keeps its directory around.
+        self.assertEqual(cache.evict_versions('1-ef01'),
+            [('1-abcd/Album.zip', 100), ('1-dcba/Renamed.zip', 100)])
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, '1-abcd')), True)
+        self.assertEqual(os.path.exists(os.path.join(self.zipfile_path, '1-dcba')), False)
+        self.assertEqual(cache.evict_versions('abcd'), [])
+
+        self.assertEqual(cache.evict_stale(set(['1-abcd', '1-ef01'])),
+            [('2-abcd/Album.zip', 100), ('legacy.zip', 100)])
+        self.assertEqual(sorted(os.listdir(self.zipfile_path)), ['1-abcd', '1-ef01'])
+
+    def test_queue_single_flight(self):
+        """
+        Builds submitted under the same key while one is pending should
+        share it, and builds beyond our job count should wait their turn.
+        """
+        queue = ZipBuildQueue(1)
+        blocker = threading.Event()
+        first = queue.submit('a', blocker.wait)
+        self.assertIs(queue.submit('a', blocker.wait), first)
+        self.assertIs(queue.get('a'), first)
+        second = queue.submit('b', lambda: 'b')
+        self.assertEqual(queue.get_pending(), ['a', 'b'])
+        self.assertEqual(second.done(), False)
+        blocker.set()
+        self.assertEqual(second.result(), 'b')
+        self.assertEqual(queue.get_pending(), [])
+        self.assertIsNot(queue.submit('a', lambda: 'a'), first)
+
+class ZipStreamTests(TestCase):
+    """
+    Tests for our ``ZipStream`` class, which don't need a library.
+    """
+
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_path)
+
+    def get_members(self, sizes=(0, 10, 100000, 300000)):
+        """
+        Creates files of the given sizes, returning a list of ``ZipMember``
+        objects for them.
+        """
+        members = []
+        for (idx, size) in enumerate(sizes):
+            filename = os.path.join(self.data_path, 'file%d' % (idx))
+            with open(filename, 'wb') as df:
+                df.write(bytes([idx % 256]) * size)
+            members.append(ZipMember.from_file(filename, 'Album/file%d' % (idx), mtime=315532800))
+        return members
+
+    def test_full_stream(self):
+        """
+        A full stream should be a valid zipfile of exactly ``size`` bytes.
+        """
+        stream = ZipStream(self.get_members())
+        content = b''.join(stream)
+        self.assertEqual(len(content), stream.size)
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            self.assertEqual(zf.testzip(), None)
+            self.assertEqual(zf.namelist(), ['Album/file0', 'Album/file1', 'Album/file2', 'Album/file3'])
+            self.assertEqual(zf.read('Album/file2'), b'\x02' * 100000)
+
+    def test_range_needs_crcs(self):
+        """
+        Ranges can't be generated until the CRCs they need are known: those
+        of members whose data comes before the range, when the range
+        includes their descriptors or the central directory.
+        """
+        members = self.get_members()
+        stream = ZipStream(members)
+        self.assertEqual(len(stream.get_missing_crcs()), 4)
+        self.assertEqual(stream.get_missing_crcs([(0, 10)]), [])
+        self.assertEqual(len(b''.join(stream.iter_range(0, 10))), 11)
+        ranges = [(200, stream.size - 1)]
+        self.assertEqual(stream.get_missing_crcs(ranges), members[:3])
+        with self.assertRaises(ValueError):
+            list(stream.iter_range(200, stream.size - 1))
+        for member in stream.get_missing_crcs(ranges):
+            stream.compute_crc(member)
+        self.assertEqual(stream.get_missing_crcs(ranges), [])
+        self.assertEqual(stream.get_missing_crcs(), [members[3]])
+        self.assertEqual(len(b''.join(stream.iter_range(200, stream.size - 1))), stream.size - 200)
+        self.assertEqual(stream.get_missing_crcs(), [])
+
+    def test_range_computes_crcs(self):
+        """
+        Members whose data lies entirely inside a range should have their
+        CRCs computed as the range is generated, and passed along to our
+        CRC callback.
+        """
+        full = b''.join(ZipStream(self.get_members()))
+        members = self.get_members()
+        stream = ZipStream(members)
+        computed = []
+        stream.crc_callback = computed.append
+        self.assertEqual(stream.get_missing_crcs([(0, stream.size - 1)]), [])
+        self.assertEqual(b''.join(stream.iter_range(0, stream.size - 1)), full)
+        self.assertEqual(computed, members)
+        self.assertEqual(stream.get_missing_crcs(), [])
+
+    def test_deterministic_ranges(self):
+        """
+        Any range of a stream whose CRCs were known up front should match
+        the same range of a full stream of the same files.
+        """
+        full = b''.join(ZipStream(self.get_members()))
+        members = self.get_members()
+        for member in members:
+            ZipStream([member]).compute_crc(member)
+        stream = ZipStream(members)
+        self.assertEqual(b''.join(stream), full)
+        self.assertEqual(b''.join(stream.iter_range(0, stream.size - 1)), full)
+        for (start, end) in [(0, 0), (5, 200), (100, 150000), (150000, 250000),
+                (stream.size - 100, stream.size - 1), (stream.size - 1, stream.size - 1)]:
+            self.assertEqual(b''.join(stream.iter_range(start, end)), full[start:end+1])
+
+    def test_etag(self):
+        """
+        ETags should only depend on our members, not on what we know about
+        their CRCs.
+        """
+        stream = ZipStream(self.get_members())
+        etag = stream.get_etag()
+        for member in stream.get_missing_crcs():
+            stream.compute_crc(member)
+        self.assertEqual(stream.get_etag(), etag)
+        members = self.get_members()
+        members[0].mtime += 2
+        self.assertNotEqual(ZipStream(members).get_etag(), etag)
+
+    def test_file_shrunk(self):
+        """
+        If a file gets shorter after we've laid out the archive, we should
+        get an ``IOError`` rather than a broken zipfile.
+        """
+        members = self.get_members()
+        stream = ZipStream(members)
+        with open(members[3].filename, 'wb') as df:
+            df.write(b'short')
+        with self.assertRaises(IOError):
+            list(stream)
+
+class AlbumZipStreamViewTests(ExordiumTests):
+    """
+    Tests for streaming album zipfiles with ``AlbumZipStreamView``
+    """
+
+    def setUp(self):
+        """
+        Streaming doesn't need anywhere to store zipfiles, so just turn
+        it on.
+        """
+        super(AlbumZipStreamViewTests, self).setUp()
+        self.prefs['exordium__zipfile_streaming'] = True
+
+    def add_album(self):
+        """
+        Adds a two-track album with album art, returning the album.
+        """
+        self.add_mp3(artist='Artist', title='Title 1', tracknum=1,
+            album='Album', filename='song1.mp3', path='Album')
+        self.add_mp3(artist='Artist', title='Title 2', tracknum=2,
+            album='Album', filename='song2.mp3', path='Album')
+        self.add_art(path='Album')
+        self.run_add()
+        self.assertEqual(Album.objects.count(), 1)
+        return Album.objects.get()
+
+    def get_zip(self, album):
+        """
+        Requests the zipfile for ``album``, returning the response and the
+        full zipfile contents.
+        """
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        return (response, b''.join(response.streaming_content))
+
+    def test_model_support_zipfile_streaming(self):
+        """
+        ``App.support_zipfile_streaming()`` should just follow our pref,
+        regardless of whether regular zipfile support is configured.
+        """
+        self.assertEqual(App.support_zipfile(), False)
+        self.assertEqual(App.support_zipfile_streaming(), True)
+        self.prefs['exordium__zipfile_streaming'] = False
+        self.assertEqual(App.support_zipfile_streaming(), False)
+
+    def test_basic_stream(self):
+        """
+        Streams a basic album, making sure that we get a valid zipfile of
+        exactly the length we promised.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertIn('filename=Artist_-_Album.zip', response['Content-Disposition'])
+
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            self.assertEqual(zf.testzip(), None)
+            self.assertEqual(zf.namelist(),
+                ['Album/song1.mp3', 'Album/song2.mp3', 'Album/cover.jpg'])
+            self.assertEqual(zf.read('Album/song1.mp3'), self.get_file_contents('Album/song1.mp3'))
+            self.assertEqual(zf.read('Album/cover.jpg'), self.get_file_contents('Album/cover.jpg'))
+            for info in zf.infolist():
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+
+    def test_stream_song_before_1980(self):
+        """
+        Files from before 1980 can't have their real dates stored in a
+        zipfile, so they should be clamped to the start of 1980.
+        """
+        album = self.add_album()
+        self.set_file_ancient('Album/song1.mp3')
+        (response, content) = self.get_zip(album)
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            self.assertEqual(zf.testzip(), None)
+            self.assertEqual(zf.getinfo('Album/song1.mp3').date_time, (1980, 1, 1, 0, 0, 0))
+            self.assertEqual(zf.read('Album/song1.mp3'), self.get_file_contents('Album/song1.mp3'))
+
+    def test_stream_disabled(self):
+        """
+        With streaming turned off, we should get a 404.
+        """
+        album = self.add_album()
+        self.prefs['exordium__zipfile_streaming'] = False
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_invalid_album(self):
+        """
+        Requesting an album which doesn't exist should get a 404.
+        """
+        response = self.client.get(reverse('exordium:albumzip', args=(42,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_missing_file(self):
+        """
+        If one of our tracks has gone missing, we should get a 404 rather
+        than a broken zipfile.
+        """
+        album = self.add_album()
+        self.delete_file('Album/song2.mp3')
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_download_button_streaming(self):
+        """
+        The album page's download button should point at our streaming
+        URL when streaming is enabled.
+        """
+        album = self.add_album()
+        response = self.client.get(reverse('exordium:album', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '"%s"' % (reverse('exordium:albumzip', args=(album.pk,))))
+        self.assertNotContains(response, '"%s"' % (reverse('exordium:albumdownload', args=(album.pk,))))
+
+    def test_stream_deterministic(self):
+        """
+        Requesting the same album twice should get us identical zipfiles,
+        with the same ETag.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        (response2, content2) = self.get_zip(album)
+        self.assertEqual(content, content2)
+        self.assertEqual(response['ETag'], response2['ETag'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_stream_caches_crcs(self):
+        """
+        A full download should cache the CRCs for our tracks, keyed on
+        their checksums.  Album art doesn't have a checksum, so isn't
+        cached.
+        """
+        album = self.add_album()
+        self.assertEqual(ZipChecksum.objects.count(), 0)
+        (response, content) = self.get_zip(album)
+        self.assertEqual(ZipChecksum.objects.count(), 2)
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            for song in Song.objects.all():
+                checksum = ZipChecksum.objects.get(sha256sum=song.sha256sum)
+                self.assertEqual(checksum.crc32, zf.getinfo(song.filename).CRC)
 
-        with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(zf.namelist(), ['Album/song1.mp3'])
+    def test_stream_interrupted_caches_crcs(self):
+        """
+        A download which is interrupted partway through should still cache
+        the CRCs of the tracks which it got all the way through.
+        """
+        album = self.add_album()
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)))
+        self.assertEqual(response.status_code, 200)
+        received = 0
+        for chunk in response.streaming_content:
+            received += len(chunk)
+            if ZipChecksum.objects.count() > 0:
+                break
+        response.close()
+        self.assertLess(received, int(response['Content-Length']))
+        self.assertEqual(ZipChecksum.objects.count(), 1)
+
+    def test_etag_changes_with_file(self):
+        """
+        Changing one of our tracks should change the zipfile's ETag.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        self.touch_file('Album/song1.mp3')
+        (response2, content2) = self.get_zip(album)
+        self.assertNotEqual(response['ETag'], response2['ETag'])
+
+    def test_not_modified(self):
+        """
+        A request with a matching ETag should get a 304.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_single(self):
+        """
+        A single range should give us just that part of the zipfile.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_RANGE='bytes=100-2000')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-2000/%d' % (len(content)))
+        self.assertEqual(int(response['Content-Length']), 1901)
+        self.assertEqual(b''.join(response.streaming_content), content[100:2001])
+
+    def test_range_resume_without_cache(self):
+        """
+        Resuming a download whose CRCs aren't cached should read the files
+        to compute them (caching them for next time), and still give us
+        the same data as the full zipfile.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        ZipChecksum.objects.all().delete()
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_RANGE='bytes=%d-' % (len(content) // 2),
+            HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[len(content)//2:])
+        self.assertEqual(ZipChecksum.objects.count(), 2)
+
+    def test_range_resume_computes_later_crcs(self):
+        """
+        Resuming a download whose CRCs aren't cached should only read the
+        tracks which come before the resumed range up front; tracks inside
+        the range get their CRCs computed as they're sent.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            start = max([zf.getinfo(song.filename).header_offset for song in Song.objects.all()])
+        ZipChecksum.objects.all().delete()
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_RANGE='bytes=%d-' % (start), HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(ZipChecksum.objects.count(), 1)
+        self.assertEqual(b''.join(response.streaming_content), content[start:])
+        self.assertEqual(ZipChecksum.objects.count(), 2)
+
+    def test_range_multiple(self):
+        """
+        Multiple ranges should come back as a multipart response.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_RANGE='bytes=0-9,-20')
+        self.assertEqual(response.status_code, 206)
+        self.assertIn('multipart/byteranges', response['Content-Type'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(content[:10], body)
+        self.assertIn(content[-20:], body)
+
+    def test_range_if_range_mismatch(self):
+        """
+        A range request whose ``If-Range`` doesn't match should get the
+        whole zipfile.
+        """
+        album = self.add_album()
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_RANGE='bytes=100-2000', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+    def test_range_unsatisfiable(self):
+        """
+        A range past the end of the zipfile should get a 416.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        response = self.client.get(reverse('exordium:albumzip', args=(album.pk,)),
+            HTTP_RANGE='bytes=%d-' % (len(content)))
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % (len(content)))
+
+    def test_model_create_zip_matches_stream(self):
+        """
+        Zipfiles written by ``Album.create_zip()`` should be identical to
+        streamed ones, and cache their CRCs as well.
+        """
+        album = self.add_album()
+        (response, content) = self.get_zip(album)
+        ZipChecksum.objects.all().delete()
+        zipfile_path = tempfile.mkdtemp()
+        try:
+            self.prefs['exordium__zipfile_path'] = zipfile_path
+            self.prefs['exordium__zipfile_url'] = 'http://testserver-zip/zipfiles'
+            (filenames, zip_filename) = album.create_zip()
+            with open(os.path.join(zipfile_path, zip_filename), 'rb') as df:
+                self.assertEqual(df.read(), content)
+        finally:
+            shutil.rmtree(zipfile_path)
+        self.assertEqual(ZipChecksum.objects.count(), 2)
+
+class MultiAlbumZipStreamViewTests(ExordiumTests):
+    """
+    Tests for streaming zipfiles of more than one album, with
+    ``ArtistZipStreamView`` and ``AlbumSelectionZipStreamView``
+    """
 
-    def test_basic_album_download_with_art(self):
+    def setUp(self):
         """
-        Test to ensure that we can generate zipfiles, with album art included.
+        Streaming doesn't need anywhere to store zipfiles, so just turn
+        it on.
         """
-        self.add_mp3(artist='Artist', title='Title 1',
+        super(MultiAlbumZipStreamViewTests, self).setUp()
+        self.prefs['exordium__zipfile_streaming'] = True
+
+    def add_albums(self):
+        """
+        Adds two albums by the same artist (one with album art), a live
+        album by them, and an album by someone else.
+        """
+        self.add_mp3(artist='Artist', title='Title 1', tracknum=1,
             album='Album', filename='song1.mp3', path='Album')
+        self.add_mp3(artist='Artist', title='Title 2', tracknum=2,
+            album='Album', filename='song2.mp3', path='Album')
         self.add_art(path='Album')
+        self.add_mp3(artist='Artist', title='Title 3', tracknum=1,
+            album='Album 2', filename='song3.mp3', path='Album 2')
+        self.add_mp3(artist='Artist', title='Title 4', tracknum=1,
+            album='2016-09-20 - Live at Somewhere', filename='song4.mp3', path='Live')
+        self.add_mp3(artist='Other', title='Title 5', tracknum=1,
+            album='Other Album', filename='song5.mp3', path='Other')
         self.run_add()
+        self.assertEqual(Album.objects.count(), 4)
 
-        self.assertEqual(Album.objects.count(), 1)
-        album = Album.objects.get()
+    def get_zip(self, url):
+        """
+        Requests the zipfile at ``url``, returning the response and the
+        full zipfile contents.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return (response, b''.join(response.streaming_content))
 
-        self.assertEqual(Song.objects.count(), 1)
-        song = Song.objects.get()
+    def test_model_get_zip_folder(self):
+        """
+        An album's zipfile should be named after its folder.
+        """
+        self.add_albums()
+        album = Album.objects.get(name='Album 2')
+        self.assertEqual(album.get_zip_folder(), 'Artist_-_Album_2')
+        self.assertEqual(album.get_zip_filename(), 'Artist_-_Album_2.zip')
 
-        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
-        self.assertEqual(response.status_code, 200)
-        self.assertIn('filenames', response.context)
-        self.assertIn('zip_file', response.context)
-        self.assertIn('zip_url', response.context)
-        self.assertEqual(response.context['filenames'], ['Album/song1.mp3', 'Album/cover.jpg'])
-        self.assertEqual(response.context['zip_file'], 'Artist_-_Album.zip')
-        self.assertContains(response, 'Album/song1.mp3<')
-        self.assertContains(response, 'Album/cover.jpg<')
-        self.assertContains(response, response.context['zip_file'])
-        self.assertContains(response, response.context['zip_url'])
-        self.assertContains(response, 'meta http-equiv')
-        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
-        self.assertEqual(os.path.exists(zip_file), True)
+    def test_model_get_zip_members_folder(self):
+        """
+        Passing in a folder should put an album's files in that folder,
+        rather than one named after its directory.
+        """
+        self.add_albums()
+        album = Album.objects.get(name='Album')
+        self.assertEqual([member.arcname for member in album.get_zip_members()],
+            ['Album/song1.mp3', 'Album/song2.mp3', 'Album/cover.jpg'])
+        self.assertEqual([member.arcname for member in album.get_zip_members(folder='Folder')],
+            ['Folder/song1.mp3', 'Folder/song2.mp3', 'Folder/cover.jpg'])
 
-        with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(zf.namelist(), ['Album/song1.mp3', 'Album/cover.jpg'])
+    def test_model_get_albums_zip_stream_duplicate_folders(self):
+        """
+        Albums which would land in the same folder should have their
+        folders numbered.
+        """
+        self.add_albums()
+        album = Album.objects.get(name='Album')
+        stream = Album.get_albums_zip_stream([album, album])
+        self.assertEqual([member.arcname for member in stream.members],
+            ['Artist_-_Album/song1.mp3', 'Artist_-_Album/song2.mp3', 'Artist_-_Album/cover.jpg',
+            'Artist_-_Album_(2)/song1.mp3', 'Artist_-_Album_(2)/song2.mp3', 'Artist_-_Album_(2)/cover.jpg'])
+
+    def test_artist_stream(self):
+        """
+        Streams all of an artist's albums, each in its own folder, making
+        sure that we get a valid zipfile of exactly the length we promised.
+        Live albums shouldn't be included by default.
+        """
+        self.add_albums()
+        (response, content) = self.get_zip(reverse('exordium:artistzip', args=('artist',)))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertIn('filename=Artist.zip', response['Content-Disposition'])
+
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            self.assertEqual(zf.testzip(), None)
+            self.assertEqual(zf.namelist(),
+                ['Artist_-_Album/song1.mp3', 'Artist_-_Album/song2.mp3',
+                'Artist_-_Album/cover.jpg', 'Artist_-_Album_2/song3.mp3'])
+            self.assertEqual(zf.read('Artist_-_Album_2/song3.mp3'),
+                self.get_file_contents('Album 2/song3.mp3'))
+
+        # All of the CRCs should have been cached along the way
+        self.assertEqual(ZipChecksum.objects.count(), 3)
+
+    def test_artist_stream_show_live(self):
+        """
+        Live albums should be included if the user has asked to see them.
+        """
+        self.add_albums()
+        self.client.post(reverse('exordium:updateprefs'), {'show_live': 'yes'})
+        (response, content) = self.get_zip(reverse('exordium:artistzip', args=('artist',)))
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            self.assertEqual(zf.testzip(), None)
+            self.assertIn('Artist_-_2016-09-20_-_Live_at_Somewhere/song4.mp3', zf.namelist())
+
+    def test_artist_stream_range(self):
+        """
+        Ranges of an artist's zipfile should work just like those of a
+        single album.
+        """
+        self.add_albums()
+        url = reverse('exordium:artistzip', args=('artist',))
+        (response, content) = self.get_zip(url)
+        response = self.client.get(url, HTTP_RANGE='bytes=%d-' % (len(content) // 2),
+            HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[len(content)//2:])
+
+    def test_artist_stream_range_uncached(self):
+        """
+        Ranges of an artist's zipfile which would need us to read tracks
+        up front (because their CRCs aren't cached) should get the whole
+        zipfile instead, which then caches the CRCs for next time.
+        """
+        self.add_albums()
+        url = reverse('exordium:artistzip', args=('artist',))
+        (response, content) = self.get_zip(url)
+        ZipChecksum.objects.all().delete()
+        response = self.client.get(url, HTTP_RANGE='bytes=%d-' % (len(content) // 2),
+            HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ZipChecksum.objects.count(), 0)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertEqual(ZipChecksum.objects.count(), 3)
+        response = self.client.get(url, HTTP_RANGE='bytes=%d-' % (len(content) // 2),
+            HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[len(content)//2:])
 
-    def test_basic_album_download_with_art_in_parent_dir(self):
+    def test_artist_stream_non_latin_name(self):
         """
-        Test to ensure that we can generate zipfiles, with album art included
-        but in the parent directory.
+        Artists whose names don't leave anything behind once normalized
+        for a filename should get a generic one instead of ``.zip``.
         """
-        self.add_mp3(artist='Artist', title='Title 1',
-            album='Album', filename='song1.mp3', path='Artist/Album')
-        self.add_art(path='Artist')
+        self.add_mp3(artist='東京事変', title='Title 1', tracknum=1,
+            album='教育', filename='song1.mp3', path='Album')
         self.run_add()
+        artist = Artist.objects.get(name='東京事変')
+        (response, content) = self.get_zip(reverse('exordium:artistzip', args=(artist.normname,)))
+        self.assertIn('filename=Artist.zip', response['Content-Disposition'])
 
-        self.assertEqual(Album.objects.count(), 1)
-        album = Album.objects.get()
+    def test_artist_stream_not_found(self):
+        """
+        Unknown artists, and artists with no albums to send, should get
+        a 404.
+        """
+        self.add_albums()
+        response = self.client.get(reverse('exordium:artistzip', args=('nobody',)))
+        self.assertEqual(response.status_code, 404)
+        Album.objects.exclude(live=True).delete()
+        response = self.client.get(reverse('exordium:artistzip', args=('artist',)))
+        self.assertEqual(response.status_code, 404)
 
-        self.assertEqual(Song.objects.count(), 1)
-        song = Song.objects.get()
+    def test_artist_stream_disabled(self):
+        """
+        Artist zipfiles shouldn't be available (or linked to) unless
+        streaming is turned on.
+        """
+        self.add_albums()
+        response = self.client.get(reverse('exordium:artist', args=('artist',)))
+        self.assertContains(response, reverse('exordium:artistzip', args=('artist',)))
+        self.prefs['exordium__zipfile_streaming'] = False
+        response = self.client.get(reverse('exordium:artist', args=('artist',)))
+        self.assertNotContains(response, reverse('exordium:artistzip', args=('artist',)))
+        response = self.client.get(reverse('exordium:artistzip', args=('artist',)))
+        self.assertEqual(response.status_code, 404)
 
-        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+    def test_selection_stream(self):
+        """
+        Streams a selection of albums, which should show up in the order
+        they were given, without duplicates.
+        """
+        self.add_albums()
+        album = Album.objects.get(name='Album')
+        other = Album.objects.get(name='Other Album')
+        url = '%s?album=%d&album=%d&album=%d' % (reverse('exordium:albumszip'),
+            other.pk, album.pk, other.pk)
+        (response, content) = self.get_zip(url)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertIn('filename=Albums.zip', response['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(content), 'r') as zf:
+            self.assertEqual(zf.testzip(), None)
+            self.assertEqual(zf.namelist(),
+                ['Other_-_Other_Album/song5.mp3', 'Artist_-_Album/song1.mp3',
+                'Artist_-_Album/song2.mp3', 'Artist_-_Album/cover.jpg'])
+
+    def test_selection_stream_range_uncached(self):
+        """
+        Ranges of a selection's zipfile should only be sent once the CRCs
+        they need are cached; until then we send the whole zipfile.
+        """
+        self.add_albums()
+        url = '%s?album=%d' % (reverse('exordium:albumszip'), Album.objects.get(name='Album').pk)
+        (response, content) = self.get_zip(url)
+        ZipChecksum.objects.all().delete()
+        response = self.client.get(url, HTTP_RANGE='bytes=-20', HTTP_IF_RANGE=response['ETag'])
         self.assertEqual(response.status_code, 200)
-        self.assertIn('filenames', response.context)
-        self.assertIn('zip_file', response.context)
-        self.assertIn('zip_url', response.context)
-        self.assertEqual(response.context['filenames'], ['Artist/Album/song1.mp3', 'Artist/cover.jpg'])
-        self.assertEqual(response.context['zip_file'], 'Artist_-_Album.zip')
-        self.assertContains(response, 'Artist/Album/song1.mp3<')
-        self.assertContains(response, 'Artist/cover.jpg<')
-        self.assertContains(response, response.context['zip_file'])
-        self.assertContains(response, response.context['zip_url'])
-        self.assertContains(response, 'meta http-equiv')
-        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
-        self.assertEqual(os.path.exists(zip_file), True)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        response = self.client.get(url, HTTP_RANGE='bytes=-20', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[-20:])
 
-        with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(zf.namelist(), ['Artist/Album/song1.mp3', 'Artist/cover.jpg'])
+    def test_selection_stream_invalid(self):
+        """
+        Selections which are empty, malformed, too long, or which include
+        albums we don't have should get a 404.
+        """
+        self.add_albums()
+        album = Album.objects.get(name='Album')
+        base_url = reverse('exordium:albumszip')
+        for query in ['', '?album=', '?album=foo', '?album=%d&album=%d' % (album.pk, album.pk + 100)]:
+            response = self.client.get('%s%s' % (base_url, query))
+            self.assertEqual(response.status_code, 404)
+        query = '&'.join(['album=%d' % (idx) for idx in range(AlbumSelectionZipStreamView.max_albums + 1)])
+        response = self.client.get('%s?%s' % (base_url, query))
+        self.assertEqual(response.status_code, 404)
 
-    def test_miscellaneous_album_download_in_multiple_dirs(self):
+    def test_selection_stream_missing_files(self):
         """
-        Test to ensure that we can generate zipfiles for an album which is contained
-        in more than one directory.  (Using a 'miscellaneous' album here but this'd
-        work for any album which happens to do this)
+        If an album's files have gone missing, we should get a 404.
+        """
+        self.add_albums()
+        album = Album.objects.get(name='Album')
+        self.delete_file('Album/song1.mp3')
+        response = self.client.get('%s?album=%d' % (reverse('exordium:albumszip'), album.pk))
+        self.assertEqual(response.status_code, 404)
+
+class SongStreamViewTests(ExordiumTests):
+    """
+    Tests for streaming tracks through our own ``SongStreamView``
+    """
+
+    def add_song(self):
+        """
+        Adds a single song, returning it along with its file contents.
         """
         self.add_mp3(artist='Artist', title='Title 1',
-            filename='song1.mp3', path='Artist/Tracks')
-        self.add_mp3(artist='Artist', title='Title 2',
-            filename='song2.mp3', path='Artist/MoreTracks')
+            album='Album', filename='song1.mp3')
         self.run_add()
+        return (Song.objects.get(), self.get_file_contents('song1.mp3'))
 
-        self.assertEqual(Album.objects.count(), 1)
-        album = Album.objects.get()
+    def get_content(self, response):
+        """
+        Returns the full content of a (possibly streaming) response.
+        """
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
 
-        self.assertEqual(Song.objects.count(), 2)
+    def test_invalid_song(self):
+        """
+        Tests making a request for a song which can't be found.
+        """
+        response = self.client.get(reverse('exordium:songstream', args=(42,)))
+        self.assertEqual(response.status_code, 404)
 
-        response = self.client.get(reverse('exordium:albumdownload', args=(album.pk,)))
+    def test_missing_file(self):
+        """
+        A song whose file has gone missing should also 404.
+        """
+        (song, data) = self.add_song()
+        self.delete_file('song1.mp3')
+        response = self.client.get(reverse('exordium:songstream', args=(song.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_full(self):
+        """
+        A plain request should get the whole file, with validators.
+        """
+        (song, data) = self.add_song()
+        response = self.client.get(reverse('exordium:songstream', args=(song.pk,)))
         self.assertEqual(response.status_code, 200)
-        self.assertIn('filenames', response.context)
-        self.assertIn('zip_file', response.context)
-        self.assertIn('zip_url', response.context)
-        self.assertEqual(
-            sorted(response.context['filenames']),
-            sorted(['Artist/Tracks/song1.mp3', 'Artist/MoreTracks/song2.mp3'])
-        )
-        self.assertEqual(response.context['zip_file'], 'Artist_-_%s.zip' % (App.norm_filename(album.name)))
-        self.assertContains(response, 'Artist/Tracks/song1.mp3<')
-        self.assertContains(response, 'Artist/MoreTracks/song2.mp3<')
-        self.assertContains(response, response.context['zip_file'])
-        self.assertContains(response, response.context['zip_url'])
-        self.assertContains(response, 'meta http-equiv')
-        zip_file = os.path.join(self.zipfile_path, response.context['zip_file'])
-        self.assertEqual(os.path.exists(zip_file), True)
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], '"%s"' % (song.sha256sum))
+        self.assertEqual(int(response['Content-Length']), len(data))
+        self.assertEqual(self.get_content(response), data)
 
-        with zipfile.ZipFile(zip_file, 'r') as zf:
-            self.assertEqual(
-                sorted(zf.namelist()),
-                sorted(['Artist/Tracks/song1.mp3', 'Artist/MoreTracks/song2.mp3'])
-            )
+    def test_etag_without_checksum(self):
+        """
+        Songs without a checksum (or which have changed since it was
+        computed) should get an ETag based on their size and mtime.
+        """
+        (song, data) = self.add_song()
+        Song.objects.all().update(sha256sum='')
+        stat_result = os.stat(song.full_filename())
+        response = self.client.get(reverse('exordium:songstream', args=(song.pk,)))
+        self.assertEqual(response['ETag'], '"%d-%d"' % (stat_result.st_size, stat_result.st_mtime_ns))
+
+    def test_conditional(self):
+        """
+        Requests with matching validators should get a 304.
+        """
+        (song, data) = self.add_song()
+        url = reverse('exordium:songstream', args=(song.pk,))
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_single_range(self):
+        """
+        A single range should get a 206 with just that range.
+        """
+        (song, data) = self.add_song()
+        url = reverse('exordium:songstream', args=(song.pk,))
+        for (header, start, end) in [('bytes=100-199', 100, 199),
+                ('bytes=%d-' % (len(data)-10), len(data)-10, len(data)-1),
+                ('bytes=-20', len(data)-20, len(data)-1),
+                ('bytes=0-%d' % (len(data)+100), 0, len(data)-1)]:
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Type'], 'audio/mpeg')
+            self.assertEqual(response['Content-Range'], 'bytes %d-%d/%d' % (start, end, len(data)))
+            self.assertEqual(int(response['Content-Length']), end-start+1)
+            self.assertEqual(self.get_content(response), data[start:end+1])
+
+    def test_multiple_ranges(self):
+        """
+        Multiple ranges should come back as multipart/byteranges.
+        """
+        (song, data) = self.add_song()
+        response = self.client.get(reverse('exordium:songstream', args=(song.pk,)),
+            HTTP_RANGE='bytes=0-9, 50-59')
+        self.assertEqual(response.status_code, 206)
+        (content_type, boundary) = response['Content-Type'].split('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        content = self.get_content(response)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        parts = content.split(('--%s' % (boundary)).encode('ascii'))
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(parts[3], b'--\r\n')
+        for (part, (start, end)) in zip(parts[1:3], [(0, 9), (50, 59)]):
+            (headers, body) = part.split(b'\r\n\r\n', 1)
+            self.assertIn(('Content-Range: bytes %d-%d/%d' % (start, end, len(data))).encode('ascii'), headers)
+            self.assertIn(b'Content-Type: audio/mpeg', headers)
+            self.assertEqual(body, data[start:end+1] + b'\r\n')
+
+    def test_unsatisfiable_range(self):
+        """
+        Ranges past the end of the file should get a 416.
+        """
+        (song, data) = self.add_song()
+        response = self.client.get(reverse('exordium:songstream', args=(song.pk,)),
+            HTTP_RANGE='bytes=%d-' % (len(data)))
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % (len(data)))
+
+    def test_invalid_range(self):
+        """
+        Ranges we don't understand should be ignored.
+        """
+        (song, data) = self.add_song()
+        url = reverse('exordium:songstream', args=(song.pk,))
+        for header in ['bytes=10-5', 'lines=0-10', 'bytes=abc', 'bytes=' + ','.join(['0-1']*30)]:
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get_content(response), data)
+
+    def test_if_range(self):
+        """
+        Ranges should only be honored if If-Range matches.
+        """
+        (song, data) = self.add_song()
+        url = reverse('exordium:songstream', args=(song.pk,))
+        response = self.client.get(url)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        for (if_range, status) in [(etag, 206), ('"something-else"', 200),
+                (last_modified, 206), ('Sat, 01 Jan 2000 00:00:00 GMT', 200)]:
+            response = self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, status)
+
+    def test_offloaded(self):
+        """
+        With file serving offloaded, ranges are left to the web server.
+        """
+        self.prefs['exordium__file_serving'] = 'accel'
+        self.prefs['exordium__accel_redirect_prefix'] = '/internal/music'
+        (song, data) = self.add_song()
+        response = self.client.get(reverse('exordium:songstream', args=(song.pk,)),
+            HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/music/song1.mp3')
+        self.assertEqual(response['ETag'], '"%s"' % (song.sha256sum))
+        self.assertEqual(response.content, b'')
+
+    def test_download_url(self):
+        """
+        Our download URLs should point here if we're streaming tracks
+        ourselves, and M3U playlists should get absolute URLs.
+        """
+        (song, data) = self.add_song()
+        self.assertTrue(song.get_download_url().startswith('http://testserver-media/music/'))
+        self.prefs['exordium__stream_tracks'] = True
+        url = reverse('exordium:songstream', args=(song.pk,))
+        self.assertEqual(song.get_download_url(), url)
+        response = self.client.get(reverse('exordium:m3udownload', args=(song.album.pk,)))
+        self.assertContains(response, 'http://testserver%s' % (url))
 
 class AlbumM3UDownloadViewTests(ExordiumTests):
     """
@@ -9934,6 +13931,24 @@ class SearchViewTests(ExordiumTests):
         self.assertContains(response, 'song-sort=-album')
         self.assertContains(response, '3 songs')
 
+    def test_album_totals(self):
+        """
+        Albums in search results should come annotated with their track
+        count and total length.
+        """
+        self.add_mp3(artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_mp3(artist='Artist', title='Title 2',
+            album='Album', filename='song2.mp3')
+        self.run_add()
+        album = Album.objects.get()
+
+        response = self.client.get(reverse('exordium:search'), {'q': 'album'})
+        self.assertEqual(response.status_code, 200)
+        albums = list(response.context['album_results'].data)
+        self.assertEqual(albums[0].num_tracks, 2)
+        self.assertEqual(albums[0].total_time, album.get_total_time())
+
 class LibraryViewTests(ExordiumUserTests):
     """
     Tests for our main library view index.  Not a whole lot here, honestly.
@@ -9965,6 +13980,7 @@ class LibraryViewTests(ExordiumUserTests):
         self.assertContains(response, App.prefs['exordium__media_url'])
         self.assertNotContains(response, 'Zipfile Support:</strong> Yes')
         self.assertContains(response, 'Zipfile Support:</strong> No')
+        self.assertContains(response, 'Quick Update Scans:</strong> No')
 
 class LibraryUpdateViewTests(ExordiumUserTests):
     """
@@ -10109,6 +14125,92 @@ class LibraryUpdateViewTests(ExordiumUserTests):
 
         self.assertIn('Showing debug output', content, msg='Debug output not found')
 
+    def test_scoped_add(self):
+        """
+        Test passing in a library subdirectory to process.
+        """
+
+        self.add_mp3(path='album', artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_mp3(path='other', artist='Artist', title='Title 2',
+            album='Album 2', filename='song2.mp3')
+
+        self.login()
+        response = self.client.get(reverse('exordium:library_update'),
+            {'type': 'add', 'scope': ' album/ '})
+        self.assertEqual(response.status_code, 200)
+        content = self.get_content(response.streaming_content)
+        self.assertIn('Only processing library subdirectory: album', content)
+
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertEqual(Song.objects.get().filename, 'album/song1.mp3')
+
+    def test_scoped_update(self):
+        """
+        Test passing in a library subdirectory to process during an update.
+        """
+
+        self.add_mp3(path='album', artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.add_mp3(path='other', artist='Artist', title='Title 2',
+            album='Album 2', filename='song2.mp3')
+        self.run_add()
+        self.update_mp3(filename='album/song1.mp3', title='New Title 1')
+        self.update_mp3(filename='other/song2.mp3', title='New Title 2')
+
+        self.login()
+        response = self.client.get(reverse('exordium:library_update'),
+            {'type': 'update', 'scope': 'album'})
+        self.assertEqual(response.status_code, 200)
+        self.get_content(response.streaming_content)
+
+        self.assertEqual(Song.objects.get(filename='album/song1.mp3').title, 'New Title 1')
+        self.assertEqual(Song.objects.get(filename='other/song2.mp3').title, 'Title 2')
+
+    def test_invalid_scope(self):
+        """
+        Test what happens when we pass in a subdirectory which isn't valid.
+        Should be redirected back to the library page with an error.
+        """
+
+        self.login()
+        for (scope, error) in [
+                ('../etc', 'Library subdirectory cannot contain'),
+                ('/etc', 'Library subdirectory must be relative'),
+                ('missing', 'Library subdirectory not found'),
+                ]:
+            response = self.client.get(reverse('exordium:library_update'),
+                {'type': 'add', 'scope': scope})
+            self.assertRedirects(response, reverse('exordium:library'),
+                fetch_redirect_response=False)
+
+            response = self.client.get(reverse('exordium:library'))
+            self.assertContains(response, error)
+
+    def test_full_verify(self):
+        """
+        Test the full verification checkbox, which should check every track
+        even when quick scans are turned on.
+        """
+
+        self.prefs['exordium__quick_scan'] = True
+        self.add_mp3(path='album', artist='Artist', title='Title 1',
+            album='Album', filename='song1.mp3')
+        self.run_add()
+        self.run_update()
+        Song.objects.all().update(time_updated=0, mtime_ns=1)
+
+        self.login()
+        response = self.client.get(reverse('exordium:library_update'),
+            {'type': 'update', 'debug': 'yes'})
+        content = self.get_content(response.streaming_content)
+        self.assertNotIn('Updated file: album/song1.mp3', content)
+
+        response = self.client.get(reverse('exordium:library_update'),
+            {'type': 'update', 'debug': 'yes', 'full_verify': 'yes'})
+        content = self.get_content(response.streaming_content)
+        self.assertIn('Updated file: album/song1.mp3', content)
+
 class LiveAlbumViewTestsAnonymous(ExordiumUserTests):
     """
     Tests of our live album viewing functionality.  They can be either
@@ -10360,3 +14462,136 @@ class ImportMysqlAmpacheDatesSubcommandTests(TestCase):
             call_command('importmysqlampachedates', stdout=out)
 
         self.assertIn('the following arguments are required', cm.exception.args[0])
+
+class LibrarySubcommandTests(ExordiumTests):
+    """
+    Tests for our ``exordium_add`` and ``exordium_update`` management
+    subcommands.
+    """
+
+    def run_command(self, command, exit_code=0, **options):
+        """
+        Runs the given command, checking its exit code and returning a list
+        of its JSON output lines.
+        """
+        out = io.StringIO()
+        if exit_code == 0:
+            call_command(command, stdout=out, **options)
+        else:
+            with self.assertRaises(SystemExit) as cm:
+                call_command(command, stdout=out, **options)
+            self.assertEqual(cm.exception.code, exit_code)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_add(self):
+        """
+        Adding via our subcommand should work, and give us JSON output with
+        a summary at the end.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        lines = self.run_command('exordium_add')
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertIn('Songs added: 1', [line['message'] for line in lines])
+        self.assertEqual(lines[-1]['status'], 'summary')
+        self.assertEqual(lines[-1]['errors'], 0)
+        for line in lines:
+            self.assertIn('time', line)
+            self.assertNotEqual(line['status'], App.STATUS_DEBUG)
+
+    def test_add_verbose(self):
+        """
+        Debug output should only show up with a higher verbosity.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        lines = self.run_command('exordium_add', verbosity=2)
+        self.assertIn({'status': App.STATUS_DEBUG, 'message': 'Found file: album/song1.mp3'},
+            [{'status': line['status'], 'message': line['message']} for line in lines])
+
+    def test_add_options(self):
+        """
+        Our options should be passed through.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.add_mp3(path='album2', filename='song2.mp3',
+            artist='Artist', album='Album 2', title='Title 2')
+        self.run_command('exordium_add', scope='album', jobs=2, batch_size=10,
+            defer_checksums=True)
+        song = Song.objects.get()
+        self.assertEqual(song.filename, 'album/song1.mp3')
+        self.assertEqual(song.sha256sum, '')
+
+    def test_add_text(self):
+        """
+        Plain text output should be available too, with errors going to
+        stderr.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1')
+        out = io.StringIO()
+        err = io.StringIO()
+        with self.assertRaises(SystemExit) as cm:
+            call_command('exordium_add', format='text', stdout=out, stderr=err)
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn('Finished with 1 error', out.getvalue())
+        self.assertIn('Artist name not found', err.getvalue())
+
+    def test_add_errors(self):
+        """
+        Errors should give us a nonzero exit status.
+        """
+        self.add_mp3(path='album', filename='song1.mp3', title='Title 1')
+        lines = self.run_command('exordium_add', exit_code=1)
+        self.assertEqual(lines[-1]['errors'], 1)
+        self.assertIn(App.STATUS_ERROR, [line['status'] for line in lines])
+
+    def test_add_invalid_scope(self):
+        """
+        An invalid scope should give us a different nonzero exit status.
+        """
+        for scope in ['/album', '../album', 'missing']:
+            lines = self.run_command('exordium_add', exit_code=2, scope=scope)
+            self.assertEqual(len(lines), 1)
+            self.assertEqual(lines[0]['status'], App.STATUS_ERROR)
+
+    def test_update(self):
+        """
+        Updating via our subcommand should work.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.run_add()
+        self.update_mp3('album/song1.mp3', title='New Title')
+        lines = self.run_command('exordium_update')
+        self.assertEqual(Song.objects.get().title, 'New Title')
+        self.assertIn('Finished update/clean!', [line['message'] for line in lines])
+        self.assertEqual(lines[-1]['status'], 'summary')
+
+    def test_update_quick_scan(self):
+        """
+        Quick scans and full verification should be selectable.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.run_add()
+        self.run_update()
+        Song.objects.all().update(time_updated=0, mtime_ns=1)
+        lines = self.run_command('exordium_update', quick_scan=True, verbosity=2)
+        self.assertNotIn('Updated file: album/song1.mp3', [line['message'] for line in lines])
+        self.prefs['exordium__quick_scan'] = True
+        lines = self.run_command('exordium_update', quick_scan=False, verbosity=2)
+        self.assertIn('Updated file: album/song1.mp3', [line['message'] for line in lines])
+
+    def test_update_missing_scope(self):
+        """
+        Updates can clean out a directory which has gone away, but still
+        refuse scopes which aren't valid.
+        """
+        self.add_mp3(path='album', filename='song1.mp3',
+            artist='Artist', album='Album', title='Title 1')
+        self.run_add()
+        shutil.rmtree(os.path.join(self.library_path, 'album'))
+        self.run_command('exordium_update', scope='album')
+        self.assertEqual(Song.objects.count(), 0)
+        self.run_command('exordium_update', exit_code=2, scope='../album')
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+import os
+import mmap
+import struct
+import tempfile
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:     # pragma: no cover
+    fcntl = None
+
+class DatabaseThumbnailStore(object):
+    """
+    Thumbnail storage which keeps resized album art in the ``image``
+    field of each ``AlbumArt`` record.  This is our default, and needs no
+    filesystem access at all.
+
+    Thumbnail stores are handed ``AlbumArt`` objects (or anything else with
+    ``album_id``, ``size``, ``resolution``, ``from_mtime`` and ``image``
+    attributes), and never touch the database themselves.
+    """
+
+    name = 'database'
+
+    def save(self, art, data):
+        """
+        Stores ``data`` as the image for ``art``.  ``art`` still needs to
+        be saved by the caller.
+        """
+        art.image = data
+
+    def save_all(self, arts):
+        """
+        As ``save()``, for a list of ``(art, data)`` tuples.
+        """
+        for (art, data) in arts:
+            self.save(art, data)
+
+    def load(self, art):
+        """
+        Returns the image data for ``art``, or ``None`` if we don't have it.
+        """
+        if art.image:
+            return bytes(art.image)
+        return None
+
+    def fetch(self, album_id, size, from_mtime, resolution):
+        """
+        Returns image data without needing an ``AlbumArt`` record, if we
+        can.  We can't, since our data lives in those records.
+        """
+        return None
+
+class PackThumbnailStore(object):
+    """
+    Thumbnail storage which keeps resized album art in an append-only pack
+    file on disk, so that serving a thumbnail only needs a lookup in an
+    in-memory index and a slice of a memory-mapped file, rather than a
+    database query.  ``AlbumArt`` records are still used to keep track of
+    which thumbnails exist, but their ``image`` field is left empty.
+
+    Three files are kept in ``directory``:
+
+    ``thumbnails.pack``
+        Each thumbnail, preceded by a header describing it.
+    ``thumbnails.idx``
+        A fixed-size entry for each thumbnail appended to the pack, giving
+        its offset.  Later entries replace earlier ones for the same album
+        and size.
+    ``thumbnails.lock``
+        Used to keep writers (and compaction) from stepping on each other.
+
+    Both files are only ever appended to, except by ``compact()``, which
+    writes out fresh copies containing only live thumbnails and swaps them
+    into place.  Readers notice that via the index's inode changing, and
+    check each thumbnail's header in the pack against the index before
+    returning it, so a reader which catches the swap halfway through will
+    just reload (or miss) rather than return the wrong image.
+    """
+
+    name = 'pack'
+
+    pack_filename = 'thumbnails.pack'
+    index_filename = 'thumbnails.idx'
+    lock_filename = 'thumbnails.lock'
+
+    # Pack headers: magic, album ID, size, resolution, source mtime, length
+    header = struct.Struct('<4sI8sHqI')
+    magic = b'EXTH'
+
+    # Index entries: album ID, size, resolution, source mtime, data offset, length
+    entry = struct.Struct('<I8sHqQI')
+
+    # Compact once dead data takes up at least this fraction of a pack
+    # which is at least this large.
+    compact_ratio = 0.5
+    compact_min_size = 1024*1024
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pack_path = os.path.join(directory, self.pack_filename)
+        self.index_path = os.path.join(directory, self.index_filename)
+        self.lock_path = os.path.join(directory, self.lock_filename)
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """
+        Forgets everything we've read, so our next lookup starts over.
+        """
+        self.index = {}
+        self.index_id = None
+        self.index_pos = 0
+        self.live_bytes = 0
+        if getattr(self, 'pack_map', None) is not None:
+            self.pack_map.close()
+        self.pack_map = None
+
+    @contextlib.contextmanager
+    def write_lock(self):
+        """
+        Context manager which holds an exclusive lock on our store, across
+        processes.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lf:
+            if fcntl is not None:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def encode_size(size):
+        return size.encode('ascii')
+
+    def _refresh(self):
+        """
+        Reads any index entries which have been added since we last looked,
+        starting over if the index has been replaced by compaction.  Must be
+        called with ``self.lock`` held.
+        """
+        try:
+            stat_result = os.stat(self.index_path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        index_id = (stat_result.st_dev, stat_result.st_ino)
+        if index_id != self.index_id:
+            self._reset()
+            self.index_id = index_id
+        if stat_result.st_size - self.index_pos < self.entry.size:
+            return
+        with open(self.index_path, 'rb') as df:
+            df.seek(self.index_pos)
+            data = df.read()
+        usable = len(data) - (len(data) % self.entry.size)
+        for (album_id, size, resolution, from_mtime, offset, length) in self.entry.iter_unpack(data[:usable]):
+            key = (album_id, size.rstrip(b'\0').decode('ascii'))
+            if key in self.index:
+                self.live_bytes -= self.index[key][3]
+            self.index[key] = (from_mtime, resolution, offset, length)
+            self.live_bytes += length
+        self.index_pos += usable
+
+    def _read(self, album_id, size, from_mtime, resolution, offset, length):
+        """
+        Returns the given thumbnail from our memory-mapped pack, making
+        sure that the pack's header agrees with our index, or ``None`` if
+        it doesn't.  Must be called with ``self.lock`` held.
+        """
+        start = offset - self.header.size
+        if start < 0:
+            return None
+        if self.pack_map is None or len(self.pack_map) < offset + length:
+            if self.pack_map is not None:
+                self.pack_map.close()
+                self.pack_map = None
+            try:
+                with open(self.pack_path, 'rb') as df:
+                    if os.fstat(df.fileno()).st_size < offset + length:
+                        return None
+                    self.pack_map = mmap.mmap(df.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+        expected = self.header.pack(self.magic, album_id, self.encode_size(size),
+            resolution, from_mtime, length)
+        if self.pack_map[start:offset] != expected:
+            return None
+        return self.pack_map[offset:offset+length]
+
+    def fetch(self, album_id, size, from_mtime, resolution):
+        """
+        Returns the image data for the given album and size, provided that
+        it was generated from art with the given mtime at the given
+        resolution.  Returns ``None`` otherwise.
+        """
+        from_mtime = from_mtime or 0
+        with self.lock:
+            for attempt in range(2):
+                self._refresh()
+                found = self.index.get((album_id, size))
+                if found is None or found[0] != from_mtime or found[1] != resolution:
+                    return None
+                data = self._read(album_id, size, from_mtime, resolution, found[2], found[3])
+                if data is not None:
+                    return data
+                # Our index and pack disagree, presumably because of a
+                # compaction; start over and try once more.
+                self._reset()
+        return None
+
+    def load(self, art):
+        """
+        Returns the image data for ``art``, or ``None`` if we don't have it.
+        Records which still have their data in the database (from before
+        the pack was in use) are read from there instead.
+        """
+        if art.image:
+            return bytes(art.image)
+        return self.fetch(art.album_id, art.size, art.from_mtime, art.resolution)
+
+    def _truncate_index(self):
+        """
+        Chops any partially-written entry off the end of our index, so that
+        new entries stay aligned.  Must be called with our write lock held.
+        """
+        try:
+            index_size = os.stat(self.index_path).st_size
+        except FileNotFoundError:
+            return
+        if index_size % self.entry.size != 0:
+            os.truncate(self.index_path, index_size - (index_size % self.entry.size))
+
+    def put(self, thumbnails):
+        """
+        Appends thumbnails to the pack.  ``thumbnails`` is a list of
+        ``(album_id, size, resolution, from_mtime, data)`` tuples.  The
+        data is all written before any of the index entries, so a reader
+        will never find an entry whose data isn't there yet.
+        """
+        entries = []
+        with self.write_lock():
+            self._truncate_index()
+            with open(self.pack_path, 'ab') as df:
+                for (album_id, size, resolution, from_mtime, data) in thumbnails:
+                    from_mtime = from_mtime or 0
+                    df.write(self.header.pack(self.magic, album_id, self.encode_size(size),
+                        resolution, from_mtime, len(data)))
+                    entries.append(self.entry.pack(album_id, self.encode_size(size),
+                        resolution, from_mtime, df.tell(), len(data)))
+                    df.write(data)
+            with open(self.index_path, 'ab') as df:
+                df.write(b''.join(entries))
+
+    def save(self, art, data):
+        """
+        Stores ``data`` as the image for ``art``, leaving its ``image``
+        field empty.  ``art`` still needs to be saved by the caller.
+        """
+        self.save_all([(art, data)])
+
+    def save_all(self, arts):
+        """
+        As ``save()``, for a list of ``(art, data)`` tuples, appending them
+        all to the pack at once.
+        """
+        self.put([(art.album_id, art.size, art.resolution, art.from_mtime, data)
+            for (art, data) in arts])
+        for (art, data) in arts:
+            art.image = b''
+
+    def get_entries(self):
+        """
+        Returns a dict of every live thumbnail in the pack, keyed on
+        ``(album_id, size)``, with values of ``(from_mtime, resolution)``.
+        """
+        with self.lock:
+            self._refresh()
+            return dict([(key, value[:2]) for (key, value) in self.index.items()])
+
+    def needs_compaction(self):
+        """
+        Returns ``True`` if enough of our pack is taken up by replaced or
+        deleted thumbnails to be worth compacting.
+        """
+        try:
+            pack_size = os.stat(self.pack_path).st_size
+        except FileNotFoundError:
+            return False
+        with self.lock:
+            self._refresh()
+            live_size = self.live_bytes + len(self.index)*self.header.size
+        if pack_size < self.compact_min_size:
+            return False
+        return (pack_size - live_size) >= pack_size*self.compact_ratio
+
+    def compact(self, keep=None):
+        """
+        Rewrites our pack and index to contain only live thumbnails, dropping
+        any data which has since been replaced or deleted.  If ``keep`` is
+        given, it should be a set of ``(album_id, size, from_mtime, resolution)``
+        tuples, and only thumbnails found in it are kept.  Returns the number
+        of thumbnails kept.
+        """
+        with self.write_lock():
+            with self.lock:
+                self._reset()
+                self._refresh()
+                entries = sorted(self.index.items(), key=lambda item: item[1][2])
+                (pack_fd, pack_tmp) = tempfile.mkstemp(dir=self.directory, prefix='.thumbnails.pack.')
+                (index_fd, index_tmp) = tempfile.mkstemp(dir=self.directory, prefix='.thumbnails.idx.')
+                kept = 0
+                try:
+                    with open(pack_fd, 'wb') as pack_out, open(index_fd, 'wb') as index_out:
+                        for ((album_id, size), (from_mtime, resolution, offset, length)) in entries:
+                            if keep is not None and (album_id, size, from_mtime, resolution) not in keep:
+                                continue
+                            data = self._read(album_id, size, from_mtime, resolution, offset, length)
+                            if data is None:    # pragma: no cover
+                                continue
+                            pack_out.write(self.header.pack(self.magic, album_id,
+                                self.encode_size(size), resolution, from_mtime, length))
+                            new_offset = pack_out.tell()
+                            pack_out.write(data)
+                            index_out.write(self.entry.pack(album_id, self.encode_size(size),
+                                resolution, from_mtime, new_offset, length))
+                            kept += 1
+                        pack_out.flush()
+                        os.fsync(pack_out.fileno())
+                        index_out.flush()
+                        os.fsync(index_out.fileno())
+                    # The pack has to go first; see our class docstring.
+                    os.replace(pack_tmp, self.pack_path)
+                    os.replace(index_tmp, self.index_path)
+                except:
+                    for filename in [pack_tmp, index_tmp]:
+                        if os.path.exists(filename):
+                            os.unlink(filename)
+                    raise
+                self._reset()
+                return kept
+
+pack_stores = {}
+pack_stores_lock = threading.Lock()
+
+def get_pack_store(directory):
+    """
+    Returns the ``PackThumbnailStore`` for ``directory``, so that each
+    process only keeps one index and memory map per pack.
+    """
+    with pack_stores_lock:
+        if directory not in pack_stores:
+            pack_stores[directory] = PackThumbnailStore(directory)
+        return pack_stores[directory]
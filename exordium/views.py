@@ -5,13 +5,19 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Q
 from django.urls import reverse
 from django.template import loader
-from django.http import HttpResponse, StreamingHttpResponse, Http404, HttpResponseRedirect
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse, Http404, HttpResponseRedirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
 
 from django_tables2 import RequestConfig
 
 from dynamic_preferences.registries import global_preferences_registry
 
-from .models import Artist, Album, Song, App, AlbumArt
+import os
+import uuid
+import urllib.parse
+
+from .models import Artist, Album, Song, App, AlbumArt, ZipChecksum
 from .tables import ArtistTable, AlbumTable, SongTableNoAlbum, SongTableWithAlbumNoTracknum, SongTableNoAlbumNoTracknum
 from . import __version__
 
@@ -166,7 +172,7 @@ class IndexView(TitleTemplateView):
             albums = Album.objects.all().order_by('-time_added')
         else:
             albums = Album.objects.filter(live=False).order_by('-time_added')
-        table = AlbumTable(albums)
+        table = AlbumTable(Album.annotate_totals(albums))
         RequestConfig(self.request, paginate={'per_page': 20}).configure(table)
         context['album_list'] = table
         return context
@@ -216,7 +222,7 @@ class SearchView(TitleTemplateView):
         albums = Album.objects.filter(*album_filter).order_by('name')
         if albums.count() > 0:
             show_albums = True
-            table = AlbumTable(albums, prefix='album-')
+            table = AlbumTable(Album.annotate_totals(albums), prefix='album-')
             RequestConfig(self.request, paginate={'per_page': 25}).configure(table)
             context['album_results'] = table
 
@@ -239,21 +245,33 @@ class ArtistView(TitleDetailView):
     slug_field = 'normname'
     template_name = 'exordium/artist.html'
 
+    @staticmethod
+    def get_albums(artist, show_live):
+        """
+        Returns a queryset of all the albums which ``artist`` appears on,
+        including live albums only if ``show_live`` is set.  Matching on
+        the artist's songs happens in a subquery, so that the queryset can
+        still be passed to ``Album.annotate_totals()``.
+        """
+        album_filter=[(Q(artist=artist) |
+            Q(song__artist=artist) |
+            Q(song__group=artist) |
+            Q(song__conductor=artist) |
+            Q(song__composer=artist))]
+        if not show_live:
+            album_filter.append(Q(live=False))
+        return Album.objects.filter(
+            pk__in=Album.objects.filter(*album_filter).values('pk')
+        ).order_by('artist__various', 'miscellaneous', 'name')
+
     def get_context_data(self, **kwargs):
         context = super(ArtistView, self).get_context_data(**kwargs)
 
-        album_filter=[(Q(artist=self.object) |
-            Q(song__artist=self.object) |
-            Q(song__group=self.object) |
-            Q(song__conductor=self.object) |
-            Q(song__composer=self.object))]
-        if not self.get_preference('show_live'):
-            album_filter.append(Q(live=False))
-        albums = Album.objects.filter(*album_filter).distinct().order_by(
-            'artist__various', 'miscellaneous', 'name')
-        table = AlbumTable(albums, prefix='album-')
+        albums = self.get_albums(self.object, self.get_preference('show_live'))
+        table = AlbumTable(Album.annotate_totals(albums), prefix='album-')
         RequestConfig(self.request).configure(table)
         context['albums'] = table
+        context['zip_streaming'] = App.support_zipfile_streaming()
 
         # If the artist has too many songs, this query takes forever.
         # Only show songs if we've got <= 500 tracks.
@@ -306,7 +324,10 @@ class AlbumView(TitleDetailView):
         else:
             table = SongTableNoAlbum(data)
         RequestConfig(self.request).configure(table)
-        if App.support_zipfile():
+        if App.support_zipfile_streaming():
+            context['show_download_button'] = True
+            context['zip_streaming'] = True
+        elif App.support_zipfile():
             context['show_download_button'] = True
         context['songs'] = table
         context['exordium_title'] = '%s / %s' % (self.object.artist, self.object)
@@ -319,8 +340,16 @@ class AlbumView(TitleDetailView):
         return context
 
 class AlbumDownloadView(TitleDetailView):
+    """
+    Builds a zipfile of an album and hands out a link to it.  Builds happen
+    in the background (see ``Album.start_zip()``); if one takes longer than
+    ``zip_wait`` seconds, we show a page which reloads itself until it's
+    done.
+    """
     model = Album
     template_name = 'exordium/album_download.html'
+    zip_wait = 20
+    zip_refresh = 5
 
     def get_context_data(self, **kwargs):
         context = super(AlbumDownloadView, self).get_context_data(**kwargs)
@@ -329,9 +358,12 @@ class AlbumDownloadView(TitleDetailView):
             composers, have_empty_composer) = self.object.get_secondary_artists_tuple()
         if App.support_zipfile():
             try:
-                (filenames, zipfile) = self.object.create_zip()
+                (filenames, zipfile) = self.object.create_zip(timeout=self.zip_wait)
                 context['filenames'] = filenames
                 context['zip_file'] = zipfile
+            except App.AlbumZipfileInProgress:
+                context['in_progress'] = True
+                context['zip_refresh'] = self.zip_refresh
             except App.AlbumZipfileError as e:  # pragma: no cover
                 context['error'] = 'There was a problem generating the zipfile: %s' % (e.orig_exception)
             except App.AlbumZipfileNotSupported: # pragma: no cover
@@ -347,6 +379,7 @@ class AlbumDownloadView(TitleDetailView):
             finally:
                 if 'zip_file' in context:
                     context['zip_url'] = '%s/%s' % (App.prefs['exordium__zipfile_url'], context['zip_file'])
+                    context['zip_name'] = os.path.basename(context['zip_file'])
         else:
             context['error'] = 'Exordium is not currently configured to allow zipfile creation'
         context['exordium_title'] = '%s / %s' % (self.object.artist, self.object)
@@ -382,7 +415,7 @@ class BrowseAlbumView(TitleListView):
             albums = Album.objects.all().order_by('miscellaneous', 'name', 'artist__name')
         else:
             albums = Album.objects.filter(live=False).order_by('miscellaneous', 'name', 'artist__name')
-        table = AlbumTable(albums)
+        table = AlbumTable(Album.annotate_totals(albums))
         RequestConfig(self.request).configure(table)
         context['table'] = table
         return context
@@ -397,9 +430,19 @@ class LibraryView(TitleTemplateView):
         App.ensure_prefs()
         context['base_path'] = App.prefs['exordium__base_path']
         context['media_url'] = App.prefs['exordium__media_url']
+        context['import_jobs'] = App.get_jobs()
+        context['import_batch_size'] = App.get_batch_size()
+        context['quick_scan'] = App.get_quick_scan()
+        context['pregenerate_thumbnails'] = App.get_pregenerate_thumbnails()
+        context['thumbnail_storage'] = App.get_thumbnail_store().name
+        context['thumbnail_pack_path'] = App.prefs['exordium__thumbnail_pack_path']
+        context['file_serving'] = App.get_file_serving()
+        context['accel_redirect_prefix'] = App.prefs['exordium__accel_redirect_prefix']
         context['support_zipfile'] = App.support_zipfile()
+        context['zipfile_streaming'] = App.support_zipfile_streaming()
         context['zipfile_url'] = App.prefs['exordium__zipfile_url']
         context['zipfile_path'] = App.prefs['exordium__zipfile_path']
+        context['zipfile_quota'] = App.prefs['exordium__zipfile_quota']
         context['count_artists'] = Artist.objects.count()
         context['count_albums'] = Album.objects.count()
         context['count_songs'] = Song.objects.count()
@@ -426,10 +469,17 @@ class LibraryUpdateView(generic.View, UserAwareView):
             return HttpResponseRedirect(reverse('exordium:library'))
         
         debug = 'debug' in request.GET
+        full_verify = 'full_verify' in request.GET
 
-        return StreamingHttpResponse((line for line in self.update_generator(update_type, debug)))
+        try:
+            (scope, start_base) = App.get_scope_base(request.GET.get('scope', '').strip())
+        except App.InvalidScope as e:
+            add_session_fail(request, str(e))
+            return HttpResponseRedirect(reverse('exordium:library'))
 
-    def update_generator(self, update_type, debug=False):
+        return StreamingHttpResponse((line for line in self.update_generator(update_type, debug, scope, full_verify)))
+
+    def update_generator(self, update_type, debug=False, scope='', full_verify=False):
         template_page = loader.get_template('exordium/library_update.html')
         template_line = loader.get_template('exordium/library_update_line.html')
         if update_type == 'add':
@@ -438,18 +488,22 @@ class LibraryUpdateView(generic.View, UserAwareView):
         else:
             title = 'Add/Update/Clean Library'
             update_func = App.update
+        update_kwargs = {'scope': scope}
+        if update_type == 'update' and full_verify:
+            update_kwargs['quick_scan'] = False
         context = {
             'request': self.request,
             'exordium_title': title,
             'exordium_version': __version__,
             'update_type': update_type,
             'debug': debug,
+            'scope': scope,
         }
         populate_session_msg_context(self.request, context)
         page = template_page.render(context)
         for line in page.split("\n"):
             if line == '@__LIBRARY_UPDATE_AREA__@':
-                for (status, line) in update_func():
+                for (status, line) in update_func(**update_kwargs):
                     yield template_line.render({
                         'status': status,
                         'line': line,
@@ -458,6 +512,66 @@ class LibraryUpdateView(generic.View, UserAwareView):
             else:
                 yield "%s\n" % (line)
 
+def file_response(filename, content_type):
+    """
+    Returns a response which sends the file ``filename`` from our library,
+    as chosen by ``App.get_file_serving()``.  By default the file is
+    streamed by Django in chunks (letting the WSGI server use ``sendfile()``
+    if it can), but we can also just hand the front-end web server an
+    ``X-Sendfile`` header with the full path, or an ``X-Accel-Redirect``
+    header with the path under ``exordium__accel_redirect_prefix``, and let
+    it send the file itself.  Files outside of the library can't be
+    reached via that prefix, so those are always streamed by Django.
+    """
+    serving = App.get_file_serving()
+    if serving == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = filename
+        return response
+    elif serving == 'accel':
+        relative = os.path.relpath(filename, App.prefs['exordium__base_path'])
+        if not relative.startswith('..'):
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = '%s/%s' % (
+                App.prefs['exordium__accel_redirect_prefix'].rstrip('/'),
+                urllib.parse.quote(relative.replace(os.sep, '/')))
+            return response
+    df = open(filename, 'rb')
+    response = FileResponse(df, content_type=content_type)
+    response['Content-Length'] = os.fstat(df.fileno()).st_size
+    return response
+
+def art_response(request, album, get_etag, get_response):
+    """
+    Handles conditional requests and caching headers for our album art
+    views.  ``get_etag(album)`` should return the (unquoted) entity tag of
+    the image we'd be sending, which along with ``album.art_mtime`` is
+    checked against the request's ``If-None-Match`` and ``If-Modified-Since``
+    headers.  If the client's copy is still good we send a 304 without ever
+    calling ``get_response``; otherwise ``get_response()`` is called to build
+    the actual response (it may raise ``Http404``).  Since building the
+    response may refresh the album's art, our headers are taken from the
+    album afterwards.
+
+    URLs which include the art's current mtime as a ``v`` parameter (as
+    our templates generate) can never refer to different art, so they're
+    marked as cacheable for a year.  Anything else has to be revalidated
+    on each use, which is cheap thanks to the above.
+    """
+    response = get_conditional_response(request,
+        etag='"%s"' % (get_etag(album)), last_modified=album.art_mtime or None)
+    if response is None:
+        response = get_response()
+    last_modified = album.art_mtime or None
+    response['ETag'] = '"%s"' % (get_etag(album))
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    if request.GET.get('v') == str(album.art_mtime):
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
 class OriginalAlbumArtView(generic.View):
     """
     Class to handle showing the original album art for an
@@ -483,12 +597,16 @@ class OriginalAlbumArtView(generic.View):
         album = get_object_or_404(Album, pk=albumid)
 
         filename = album.get_original_art_filename()
-        if filename:
-            with open(filename, 'rb') as df:
-                return HttpResponse(df.read(), content_type=album.art_mime)
-        else:
+        if not filename:
             raise Http404('Album art not found for album "%s / %s"' % (album.artist, album))
 
+        def get_response():
+            return file_response(filename, album.art_mime)
+
+        return art_response(request, album,
+            lambda album: 'orig-%d-%d' % (album.pk, album.art_mtime or 0),
+            get_response)
+
 class AlbumArtView(generic.View, UserAwareView):
     """
     Class to handle showing album art.
@@ -512,14 +630,404 @@ class AlbumArtView(generic.View, UserAwareView):
             # Shouldn't be able to get here since our urls.py will
             # only accept digits for albumid
             albumid = -1
+
+        # Our ETag is made from the same things which AlbumArt.get_or_create()
+        # checks to see if existing resized art is current, so we can answer
+        # conditional requests without touching the AlbumArt table at all.
+        get_etag = lambda album: '%d-%s-%d-%d' % (album.pk, size, album.art_mtime or 0,
+            AlbumArt.resolutions[size])
+
+        # If we've been given the art's mtime in our URL, and our thumbnail
+        # store has a matching thumbnail, we can send it along without
+        # looking up the album in the database at all.
+        try:
+            art_mtime = int(request.GET.get('v', ''))
+        except ValueError:
+            art_mtime = None
+        if art_mtime is not None:
+            image = App.get_thumbnail_store().fetch(albumid, size, art_mtime,
+                AlbumArt.resolutions[size])
+            if image is not None:
+                # art_response() only needs our album's pk and art mtime.
+                return art_response(request, Album(pk=albumid, art_mtime=art_mtime), get_etag,
+                    lambda: HttpResponse(image, content_type='image/jpeg'))
+
         album = get_object_or_404(Album, pk=albumid)
+        if not album.has_album_art():
+            raise Http404('Album art not found for album "%s / %s"' % (album.artist, album))
+
+        # Try to grab the album art and display it.
+        def get_response():
+            art = AlbumArt.get_or_create(album, size)
+            if art:
+                return HttpResponse(art.get_image(), content_type='image/jpeg')
+            else:
+                raise Http404('Album art not found for album "%s / %s"' % (album.artist, album))
+
+        return art_response(request, album, get_etag, get_response)
 
-        # Try to grab the album art and display it
-        art = AlbumArt.get_or_create(album, size)
-        if art:
-            return HttpResponse(art.image, content_type='image/jpeg')
+def parse_range_header(header, size, max_ranges=20):
+    """
+    Parses an HTTP ``Range`` header for a file which is ``size`` bytes
+    long, returning a list of ``(start, end)`` tuples (with ``end`` being
+    inclusive, as in the header itself).  Returns ``None`` if the header
+    isn't something we understand, or asks for more than ``max_ranges``
+    ranges, in which case it should just be ignored.  Returns an empty list
+    if none of the requested ranges can be satisfied.
+    """
+    (unit, sep, specs) = header.partition('=')
+    if unit.strip().lower() != 'bytes' or sep == '':
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        (first, dash, last) = spec.strip().partition('-')
+        if dash == '' or (first != '' and not first.isdigit()) or (last != '' and not last.isdigit()):
+            return None
+        if first == '':
+            if last == '':
+                return None
+            # A suffix range: the last N bytes of the file
+            start = max(size - int(last), 0)
+            end = size - 1
         else:
-            raise Http404('Album art not found for album "%s / %s"' % (album.artist, album))
+            start = int(first)
+            if last == '':
+                end = size - 1
+            else:
+                end = int(last)
+                if end < start:
+                    return None
+                end = min(end, size - 1)
+        if start <= end and start < size:
+            ranges.append((start, end))
+    if len(ranges) > max_ranges:
+        return None
+    return ranges
+
+class RangeResponseMixin(object):
+    """
+    Helpers for views which answer byte range requests (including
+    ``If-Range`` and multiple ranges) for something ``size`` bytes long,
+    whose data can be read a range at a time.
+    """
+
+    chunk_size = 64*1024
+    max_ranges = 20
+
+    def if_range_passes(self, request, etag, last_modified):
+        """
+        Returns ``True`` if we should honor the request's ``Range`` header,
+        which is the case unless it has an ``If-Range`` header which doesn't
+        match our current data.
+        """
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None:
+            return True
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            return if_range == etag
+        return parse_http_date_safe(if_range) == last_modified
+
+    def get_ranges(self, request, size, etag, last_modified):
+        """
+        Returns the ranges requested by ``request`` (as returned by
+        ``parse_range_header()``), or ``None`` if the whole thing should be
+        sent.
+        """
+        if 'HTTP_RANGE' in request.META and self.if_range_passes(request, etag, last_modified):
+            return parse_range_header(request.META['HTTP_RANGE'], size, self.max_ranges)
+        return None
+
+    def range_not_satisfiable(self, size):
+        """
+        Returns our response for a request whose ranges were all out of
+        bounds.
+        """
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % (size)
+        return response
+
+    def range_response(self, ranges, size, content_type, read_range, close=None):
+        """
+        Returns a "206 Partial Content" response for ``ranges`` (a non-empty
+        list from ``get_ranges()``).  ``read_range(start, end)`` should yield
+        the data from ``start`` to ``end`` (inclusive), and ``close``, if
+        given, is called once we're done.
+        """
+        if len(ranges) == 1:
+            (start, end) = ranges[0]
+            response = StreamingHttpResponse(self.iter_ranges(read_range, [(start, end, b'')], close=close),
+                status=206, content_type=content_type)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+            response['Content-Length'] = end - start + 1
+        else:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for (start, end) in ranges:
+                parts.append((start, end, ('\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+                    boundary, content_type, start, end, size)).encode('ascii')))
+            trailer = ('\r\n--%s--\r\n' % (boundary)).encode('ascii')
+            response = StreamingHttpResponse(self.iter_ranges(read_range, parts, trailer, close=close),
+                status=206, content_type='multipart/byteranges; boundary=%s' % (boundary))
+            response['Content-Length'] = sum([len(header) + end - start + 1
+                for (start, end, header) in parts]) + len(trailer)
+        return response
+
+    def iter_ranges(self, read_range, parts, trailer=b'', close=None):
+        """
+        Yields the given parts of our data in chunks, calling ``close`` (if
+        given) once we're done.  ``parts`` is a list of ``(start, end, header)``
+        tuples, where ``header`` is sent before each part.
+        """
+        try:
+            for (start, end, header) in parts:
+                if header:
+                    yield header
+                for chunk in read_range(start, end):
+                    yield chunk
+            if trailer:
+                yield trailer
+        finally:
+            if close is not None:
+                close()
+
+    def iter_file_range(self, df, start, end):
+        """
+        Yields the data from ``start`` to ``end`` (inclusive) of the open
+        file ``df``, in chunks.
+        """
+        df.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = df.read(min(self.chunk_size, remaining))
+            if not chunk:   # pragma: no cover
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class SongStreamView(RangeResponseMixin, generic.View):
+    """
+    Streams a track straight out of the library, for those who'd rather not
+    set up ``exordium__media_url`` (see ``Song.get_download_url()``).
+    Supports conditional requests and byte ranges (including ``If-Range``
+    and multiple ranges), so players can seek without downloading the whole
+    track again.  If ``App.get_file_serving()`` says to hand files off to
+    the front-end web server, it gets to deal with ranges itself.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        The main request!
+        """
+        song = get_object_or_404(Song, pk=kwargs['pk'])
+        filename = song.full_filename()
+        try:
+            stat_result = os.stat(filename)
+        except OSError:
+            raise Http404('Track not found: %s' % (song.filename))
+
+        # Our checksum is the best ETag we could ask for, so long as the
+        # file hasn't changed since it was computed.
+        if song.sha256sum and not song.changed_on_disk(stat_result.st_mtime_ns):
+            etag = '"%s"' % (song.sha256sum)
+        else:
+            etag = '"%d-%d"' % (stat_result.st_size, stat_result.st_mtime_ns)
+        last_modified = int(stat_result.st_mtime)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_file_response(request, song, filename,
+                stat_result.st_size, etag, last_modified)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def get_file_response(self, request, song, filename, size, etag, last_modified):
+        """
+        Returns the response containing the file data (or the requested
+        ranges of it).
+        """
+        content_type = song.get_mime_type()
+        if App.get_file_serving() != 'django':
+            return file_response(filename, content_type)
+
+        ranges = self.get_ranges(request, size, etag, last_modified)
+        if ranges is None:
+            return file_response(filename, content_type)
+        if len(ranges) == 0:
+            return self.range_not_satisfiable(size)
+
+        df = open(filename, 'rb')
+        return self.range_response(ranges, size, content_type,
+            lambda start, end: self.iter_file_range(df, start, end), close=df.close)
+
+class ZipStreamView(RangeResponseMixin, generic.View):
+    """
+    Base class for views which stream a zipfile straight to the browser as
+    it's generated, rather than writing it out to ``exordium__zipfile_path``
+    first.  The archive is uncompressed, so we know its exact length before
+    sending any of it, and it only depends on the files it contains, so any
+    byte range of it can be regenerated on its own.  That lets interrupted
+    downloads be resumed, via ``Range`` (and ``If-Range``) requests.
+
+    Subclasses need to implement ``get_zip_stream()``.
+    """
+
+    # Whether a range request may read files up front to compute the CRCs
+    # it needs.  Archives spanning many albums can be far too big to read
+    # in full before responding, so those send the whole archive instead
+    # until a full download has cached the CRCs.
+    fill_range_crcs = True
+
+    def get_zip_stream(self, **kwargs):
+        """
+        Returns a tuple containing:
+            1) the ``ZipStream`` to send
+            2) the filename to send it as
+        Should raise ``Http404`` if there's nothing to send.
+        """
+        raise NotImplementedError()
+
+    def get(self, request, *args, **kwargs):
+        """
+        The main request!
+        """
+        if not App.support_zipfile_streaming():
+            raise Http404('Zipfile streaming is not enabled')
+        (stream, zip_filename) = self.get_zip_stream(**kwargs)
+        etag = '"%s"' % (stream.get_etag())
+        last_modified = max([member.mtime for member in stream.members] + [0])
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_zip_response(request, stream, etag, last_modified)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = 'attachment; filename=%s' % (zip_filename)
+        return response
+
+    def get_zip_response(self, request, stream, etag, last_modified):
+        """
+        Returns the response containing the zipfile (or the requested
+        ranges of it).
+        """
+        ranges = self.get_ranges(request, stream.size, etag, last_modified)
+        if ranges is None:
+            return self.full_response(stream)
+        if len(ranges) == 0:
+            return self.range_not_satisfiable(stream.size)
+        if not self.fill_range_crcs and stream.get_missing_crcs(ranges):
+            return self.full_response(stream)
+
+        # Members whose data lies entirely inside a range get their CRCs
+        # computed as they're sent, but anything earlier which the range
+        # needs (descriptors, or the central directory at the end) has to
+        # be known up front.
+        try:
+            ZipChecksum.fill(stream, ranges)
+        except OSError:
+            raise Http404('Album files could not be read')
+        return self.range_response(ranges, stream.size, 'application/zip',
+            lambda start, end: self.iter_stream(stream, stream.iter_range(start, end)))
+
+    def full_response(self, stream):
+        """
+        Returns a response containing the whole zipfile.
+        """
+        response = StreamingHttpResponse(self.iter_stream(stream, iter(stream)),
+            content_type='application/zip')
+        response['Content-Length'] = stream.size
+        return response
+
+    def iter_stream(self, stream, chunks):
+        """
+        Yields ``chunks`` (of ``stream``), storing each member's CRC as
+        soon as its data has been sent, so later requests for ranges of it
+        won't need to read the files again.  CRCs are stored even if the
+        download is interrupted partway through.
+        """
+        computed = []
+        stream.crc_callback = computed.append
+        try:
+            for chunk in chunks:
+                yield chunk
+                if computed:
+                    ZipChecksum.store_members(computed)
+                    del computed[:]
+        finally:
+            if computed:
+                ZipChecksum.store_members(computed)
+
+class AlbumZipStreamView(ZipStreamView):
+    """
+    Streams a zipfile of an album (see ``Album.get_zip_stream()``).
+    """
+
+    def get_zip_stream(self, **kwargs):
+        album = get_object_or_404(Album, pk=kwargs['pk'])
+        try:
+            return (album.get_zip_stream(), album.get_zip_filename())
+        except OSError:
+            raise Http404('Album files not found: %s' % (album))
+
+class ArtistZipStreamView(ZipStreamView, UserAwareView):
+    """
+    Streams a single zipfile containing every album which an artist
+    appears on (the same albums shown on the artist's page), each in its
+    own folder.
+    """
+
+    # Used when the artist's name has nothing left once normalized for a
+    # filename (such as names entirely in non-Latin scripts)
+    zip_filename_default = 'Artist'
+
+    fill_range_crcs = False
+
+    def get_zip_stream(self, **kwargs):
+        artist = get_object_or_404(Artist, normname=kwargs['slug'])
+        albums = list(ArtistView.get_albums(artist, self.get_preference('show_live')))
+        if len(albums) == 0:
+            raise Http404('No albums found for artist: %s' % (artist))
+        try:
+            stream = Album.get_albums_zip_stream(albums)
+        except OSError:
+            raise Http404('Album files not found for artist: %s' % (artist))
+        return (stream, '%s.zip' % (App.norm_filename(artist.name) or self.zip_filename_default))
+
+class AlbumSelectionZipStreamView(ZipStreamView):
+    """
+    Streams a single zipfile containing an arbitrary selection of albums,
+    each in its own folder.  Albums are given by ID with one or more
+    ``album`` query parameters, and are included in the order given.
+    """
+
+    zip_filename = 'Albums.zip'
+
+    # The most albums we'll put in a single zipfile
+    max_albums = 200
+
+    fill_range_crcs = False
+
+    def get_zip_stream(self, **kwargs):
+        album_ids = []
+        for album_id in self.request.GET.getlist('album'):
+            if not album_id.isdigit():
+                raise Http404('Invalid album ID: %s' % (album_id))
+            if int(album_id) not in album_ids:
+                album_ids.append(int(album_id))
+        if len(album_ids) == 0:
+            raise Http404('No albums specified')
+        if len(album_ids) > self.max_albums:
+            raise Http404('Too many albums specified')
+        albums_by_id = Album.objects.in_bulk(album_ids)
+        if len(albums_by_id) != len(album_ids):
+            raise Http404('Album not found')
+        try:
+            stream = Album.get_albums_zip_stream([albums_by_id[album_id] for album_id in album_ids])
+        except OSError:
+            raise Http404('Album files not found')
+        return (stream, self.zip_filename)
 
 def updateprefs(request):
     """
@@ -545,6 +1053,18 @@ class AlbumM3UDownloadView(generic.DetailView, UserAwareView):
     template_name = 'exordium/album_stream.m3u'
     content_type = 'audio/mpegurl'
 
+    def get_context_data(self, **kwargs):
+        """
+        Adds our songs, with absolute URLs, since our own streaming URLs
+        (see ``Song.get_download_url()``) are relative to this server.
+        """
+        context = super(AlbumM3UDownloadView, self).get_context_data(**kwargs)
+        songs = list(self.object.get_songs_ordered())
+        for song in songs:
+            song.stream_url = self.request.build_absolute_uri(song.get_download_url())
+        context['songs'] = songs
+        return context
+
     def render_to_response(self, context, **kwargs):
         """
         Override to set a custom headers
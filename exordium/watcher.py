@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import collections
+
+from django.db import close_old_connections
+
+from .models import App
+
+class Inotify(object):
+    """
+    A very small wrapper around Linux's inotify interface, talking to libc
+    via ``ctypes`` so that we don't need any extra dependencies.  Creating
+    one will raise ``OSError`` on systems without inotify.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    # Each event is a struct of (wd, mask, cookie, len), followed by
+    # ``len`` bytes of NUL-padded filename
+    event_header = struct.Struct('iIII')
+
+    # How much to read at once.  Events are never split across reads, and
+    # this leaves room for plenty of them.
+    read_size = 64*1024
+
+    def __init__(self):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self.libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, 'inotify is not available on this system')
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self.raise_errno()
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+
+    def raise_errno(self, filename=None):
+        """
+        Raises an ``OSError`` for whatever libc call just failed.
+        """
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), filename)
+
+    def add_watch(self, path, mask):
+        """
+        Starts watching ``path`` for the events in ``mask``, returning the
+        watch descriptor.  Watching something we're already watching will
+        return the same descriptor as before.
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self.raise_errno(path)
+        return wd
+
+    def rm_watch(self, wd):
+        """
+        Stops watching the given watch descriptor.  Errors are ignored, since
+        the kernel drops watches by itself when their directory goes away.
+        """
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout=None):
+        """
+        Waits up to ``timeout`` seconds (or forever, if ``None``) for events,
+        returning a list of ``(wd, mask, cookie, name)`` tuples.  The list will
+        be empty if nothing happened in time.
+        """
+        if timeout is None:
+            poll_timeout = None
+        else:
+            poll_timeout = max(int(timeout*1000), 0)
+        if len(self.poller.poll(poll_timeout)) == 0:
+            return []
+        try:
+            data = os.read(self.fd, self.read_size)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self.event_header.size <= len(data):
+            (wd, mask, cookie, length) = self.event_header.unpack_from(data, offset)
+            offset += self.event_header.size
+            name = os.fsdecode(data[offset:offset+length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        """
+        Closes our inotify file descriptor, which drops all our watches.
+        """
+        os.close(self.fd)
+
+class LibraryWatcher(object):
+    """
+    Watches our library for changes via inotify, and applies them to the
+    database as they happen, only looking at the parts of the library which
+    actually changed.
+
+    Events are collected until nothing's happened for ``debounce`` seconds
+    (or until we've been collecting for ``max_delay`` seconds, so that a
+    steady trickle of changes can't hold things up forever).  Then:
+
+    1. Files and directories which were renamed within the library are
+       moved in the database via ``App.move_songs()``, which doesn't need
+       to read or checksum anything.
+    2. ``App.update()`` is run, scoped to each directory in which something
+       changed.  Directories which disappeared are included, so that the
+       songs which were in them get cleaned up, and so are the destinations
+       of moves, so that their album art gets picked up.
+
+    If the kernel's event queue overflows, there's no telling what we missed,
+    so we do a full update instead.
+
+    ``jobs`` and ``batch_size`` are passed through to ``App.update()``.
+    """
+
+    watch_mask = (Inotify.IN_CLOSE_WRITE | Inotify.IN_ATTRIB |
+        Inotify.IN_MOVED_FROM | Inotify.IN_MOVED_TO |
+        Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_ONLYDIR)
+
+    # Files we care about changes to: media, plus anything which could be
+    # album art
+    watch_extensions = ['.mp3', '.ogg', '.m4a'] + App.cover_extensions
+
+    def __init__(self, debounce=5, max_delay=60, jobs=None, batch_size=None, inotify=None):
+        App.ensure_prefs()
+        self.base_path = App.prefs['exordium__base_path']
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.jobs = jobs
+        self.batch_size = batch_size
+        if inotify is None:
+            inotify = Inotify()
+        self.inotify = inotify
+        self.wd_paths = {}
+        self.status = []
+        self.reset()
+        self.watch_tree('')
+
+    def reset(self):
+        """
+        Clears out everything we've collected since our last flush.
+        """
+        self.dirty = set()
+        self.moves = []
+        self.moved_from = collections.OrderedDict()
+        self.full_update = False
+        self.first_event = None
+        self.last_event = None
+
+    def full_path(self, path):
+        """
+        Returns the full path to ``path``, which is relative to our base path.
+        """
+        if path == '':
+            return self.base_path
+        return os.path.join(self.base_path, path)
+
+    @staticmethod
+    def in_tree(path, top):
+        """
+        Returns True if ``path`` is ``top`` or is somewhere underneath it.
+        """
+        return path == top or App.in_scope(path, top)
+
+    def watch_tree(self, path):
+        """
+        Starts watching ``path`` and every directory underneath it.  Any
+        problems are reported in ``status``.
+        """
+        for (base_dir, media, snapshot) in App.walk_media_dirs(self.base_path, self.full_path(path)):
+            try:
+                wd = self.inotify.add_watch(self.full_path(base_dir), self.watch_mask)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self.status.append((App.STATUS_ERROR,
+                        'Out of inotify watches (try raising fs.inotify.max_user_watches): %s' % (base_dir)))
+                else:
+                    self.status.append((App.STATUS_DEBUG, 'Could not watch directory %s: %s' % (base_dir, e)))
+                continue
+            if wd not in self.wd_paths:
+                self.wd_paths[wd] = base_dir
+
+    def unwatch_tree(self, path):
+        """
+        Stops watching ``path`` and every directory underneath it.
+        """
+        for (wd, watch_path) in list(self.wd_paths.items()):
+            if self.in_tree(watch_path, path):
+                self.inotify.rm_watch(wd)
+                del self.wd_paths[wd]
+
+    def rename_tree(self, old_path, new_path):
+        """
+        Updates our watches (and any directories we're waiting to update)
+        after the directory ``old_path`` has been renamed to ``new_path``.
+        """
+        for (wd, watch_path) in list(self.wd_paths.items()):
+            if self.in_tree(watch_path, old_path):
+                self.wd_paths[wd] = '%s%s' % (new_path, watch_path[len(old_path):])
+        for dirty_path in list(self.dirty):
+            if self.in_tree(dirty_path, old_path):
+                self.dirty.remove(dirty_path)
+                self.dirty.add('%s%s' % (new_path, dirty_path[len(old_path):]))
+
+    def process_event(self, wd, mask, cookie, name):
+        """
+        Processes a single inotify event.
+        """
+        if mask & Inotify.IN_Q_OVERFLOW:
+            self.full_update = True
+            self.mark_pending()
+            return
+        if wd not in self.wd_paths:
+            return
+        parent = self.wd_paths[wd]
+        if mask & Inotify.IN_IGNORED:
+            del self.wd_paths[wd]
+            return
+        if name == '':
+            return
+        is_dir = (mask & Inotify.IN_ISDIR) != 0
+        if not is_dir and name.lower()[-4:] not in self.watch_extensions:
+            return
+        if parent == '':
+            path = name
+        else:
+            path = os.path.join(parent, name)
+        self.mark_pending()
+
+        if mask & Inotify.IN_MOVED_FROM:
+            self.moved_from[cookie] = (path, is_dir)
+        elif mask & Inotify.IN_MOVED_TO:
+            if cookie in self.moved_from:
+                (old_path, old_is_dir) = self.moved_from.pop(cookie)
+                self.moves.append((old_path, path, is_dir))
+                if is_dir:
+                    self.rename_tree(old_path, path)
+            elif is_dir:
+                self.watch_tree(path)
+            if is_dir:
+                self.dirty.add(path)
+            else:
+                self.dirty.add(parent)
+        elif is_dir and mask & Inotify.IN_CREATE:
+            # Files could have been put in here before we started watching it
+            self.watch_tree(path)
+            self.dirty.add(path)
+        elif is_dir:
+            self.dirty.add(path)
+        else:
+            self.dirty.add(parent)
+
+    def mark_pending(self):
+        """
+        Notes that we've got something to do, for our debounce timing.
+        """
+        now = time.monotonic()
+        if self.first_event is None:
+            self.first_event = now
+        self.last_event = now
+
+    def get_timeout(self):
+        """
+        Returns how long to wait for more events before we should flush, or
+        ``None`` if there's nothing waiting to be flushed.
+        """
+        if self.first_event is None:
+            return None
+        return max(min(self.last_event + self.debounce,
+            self.first_event + self.max_delay) - time.monotonic(), 0)
+
+    def poll(self, timeout=None):
+        """
+        Waits up to ``timeout`` seconds for events, and processes any which
+        arrive.
+        """
+        for event in self.inotify.read_events(timeout):
+            self.process_event(*event)
+
+    def get_scopes(self, dirty):
+        """
+        Returns a sorted list of the directories in ``dirty`` which need
+        updating, leaving out any which are underneath another one.
+        """
+        scopes = []
+        for path in sorted(dirty):
+            if len(scopes) == 0 or not self.in_tree(path, scopes[-1]):
+                scopes.append(path)
+        return scopes
+
+    def flush(self):
+        """
+        Applies everything we've collected since our last flush.  Yields its
+        processing status log as a generator, as tuples of the form
+        (status, text), like ``App.update()``.
+        """
+        # Anything which was moved away and never showed up again has left
+        # the library entirely.
+        for (path, is_dir) in self.moved_from.values():
+            if is_dir:
+                self.unwatch_tree(path)
+                self.dirty.add(path)
+            else:
+                self.dirty.add(os.path.dirname(path))
+
+        full_update = self.full_update
+        moves = self.moves
+        dirty = self.dirty
+        self.reset()
+
+        # We may well be a long-running process, so make sure we've still
+        # got a usable database connection.
+        close_old_connections()
+
+        if full_update:
+            yield (App.STATUS_INFO, 'Missed some filesystem events, running a full update')
+            self.watch_tree('')
+            for retline in App.update(jobs=self.jobs, batch_size=self.batch_size):
+                yield retline
+            return
+
+        if len(moves) > 0:
+            skipped = []
+            for retline in App.move_songs(moves, skipped):
+                yield retline
+            for (old_path, new_path, is_dir) in skipped:
+                if is_dir:
+                    dirty.add(old_path)
+                else:
+                    dirty.add(os.path.dirname(old_path))
+
+        for scope in self.get_scopes(dirty):
+            for retline in App.update(jobs=self.jobs, batch_size=self.batch_size,
+                    scope=scope):
+                yield retline
+
+    def run(self):
+        """
+        Watches the library forever, yielding our processing status log as
+        a generator, as tuples of the form (status, text).
+        """
+        yield (App.STATUS_INFO, 'Watching %d directories in %s' % (len(self.wd_paths), self.base_path))
+        while True:
+            while len(self.status) > 0:
+                yield self.status.pop(0)
+            self.poll(self.get_timeout())
+            timeout = self.get_timeout()
+            if timeout is not None and timeout <= 0:
+                for retline in self.flush():
+                    yield retline
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Nothing from Django or the rest of Exordium should be imported up here,
+# since this is the first thing a newly-started worker process imports.
+
+def init_worker():
+    """
+    Initializer for the worker processes used by ``App.pool_map()``.
+    Forked workers inherit a Django which is already set up, but workers
+    which are started from scratch (with the "spawn" or "forkserver" start
+    methods, which are the default on Windows and macOS) need to set it up
+    themselves before they can unpickle anything from ``exordium.models``.
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+import os
+import time
+import tempfile
+import threading
+import contextlib
+import concurrent.futures
+
+try:
+    import fcntl
+except ImportError:     # pragma: no cover
+    fcntl = None
+
+class ZipBuildQueue(object):
+    """
+    Runs zipfile builds in a small pool of background threads, so that only
+    ``jobs`` of them compete for disk bandwidth at once.  Builds are keyed
+    (on the zipfile's path, generally), and a build which is requested
+    while one with the same key is still queued or running just gets the
+    existing build's ``Future`` back, rather than starting another.
+
+    Builds shouldn't touch the database, since they're run outside of the
+    request which asked for them.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self.lock = threading.RLock()
+        self.builds = {}
+
+    def get(self, key):
+        """
+        Returns the ``Future`` for the build queued or running under
+        ``key``, or ``None`` if there isn't one.
+        """
+        with self.lock:
+            future = self.builds.get(key)
+            if future is None or future.done():
+                return None
+            return future
+
+    def submit(self, key, func, *args):
+        """
+        Queues up ``func(*args)`` under ``key``, unless something is already
+        queued or running under that key.  Returns the ``Future`` for
+        whichever build ends up handling it.
+        """
+        with self.lock:
+            future = self.get(key)
+            if future is None:
+                future = self.executor.submit(func, *args)
+                self.builds[key] = future
+                future.add_done_callback(lambda done: self.finished(key, done))
+            return future
+
+    def finished(self, key, future):
+        """
+        Forgets about a build once it's done.  (Builds which are done are
+        ignored even before this gets called, so the next request for
+        ``key`` always starts a new one.)
+        """
+        with self.lock:
+            if self.builds.get(key) is future:
+                del self.builds[key]
+
+    def get_pending(self):
+        """
+        Returns a list of the keys currently queued or running.
+        """
+        with self.lock:
+            return sorted([key for (key, future) in self.builds.items() if not future.done()])
+
+class ZipCache(object):
+    """
+    Manages the zipfiles in our zipfile directory (``exordium__zipfile_path``).
+    Each zipfile is stored in a subdirectory named after a digest of its
+    contents (see ``Album.get_zip_digest()``), under the filename it should
+    be downloaded as.  Digests start with an identifier for what they're a
+    digest of (the album's ID) followed by a ``-``, so that older versions
+    can be found without relying on their filenames, which needn't be
+    unique.  Zipfiles are written to a temporary file and moved
+    into place once they're complete, while holding a lock on their digest
+    so that two processes don't build the same zipfile at once.
+
+    Each zipfile's access time is bumped whenever it's handed out, and
+    ``evict()`` removes the least-recently-used zipfiles to keep the
+    directory under a given size.  Since the zipfiles themselves are
+    served by the front-end web server, the access time is our only way
+    of knowing which ones are still being used.
+    """
+
+    lock_prefix = '.lock.'
+    temp_prefix = '.tmp.'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, filename):
+        """
+        Returns the full path to ``filename``, which is relative to our
+        directory.
+        """
+        return os.path.join(self.directory, filename)
+
+    @contextlib.contextmanager
+    def build_lock(self, digest):
+        """
+        Context manager which holds an exclusive lock on building the
+        zipfile for ``digest``, across processes.
+        """
+        lock_path = self.get_path('%s%s' % (self.lock_prefix, digest))
+        with open(lock_path, 'a') as lf:
+            if fcntl is not None:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+    def find(self, digest):
+        """
+        Returns the filename (relative to our directory) of the zipfile
+        stored under ``digest``, or ``None`` if we don't have one.
+        """
+        try:
+            names = sorted(os.listdir(self.get_path(digest)))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        for name in names:
+            if not name.startswith('.') and name.endswith('.zip'):
+                return os.path.join(digest, name)
+        return None
+
+    def write(self, digest, name, stream):
+        """
+        Writes ``stream`` (a ``ZipStream``) out to ``name`` under ``digest``,
+        returning its filename relative to our directory.  The zipfile only
+        shows up under its real name once it's complete.
+        """
+        digest_dir = self.get_path(digest)
+        for attempt in range(2):
+            os.makedirs(digest_dir, exist_ok=True)
+            try:
+                (fd, temp_path) = tempfile.mkstemp(dir=digest_dir,
+                    prefix='%s%s.' % (self.temp_prefix, name))
+                break
+            except FileNotFoundError:   # pragma: no cover
+                # The directory was removed by evict() just after we made
+                # it; make it again.
+                if attempt > 0:
+                    raise
+        filename = os.path.join(digest, name)
+        try:
+            with open(fd, 'wb') as df:
+                stream.write_to(df)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.get_path(filename))
+        except:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return filename
+
+    def rename(self, filename, name):
+        """
+        Renames the zipfile ``filename`` (relative to our directory) to
+        ``name``, leaving it under the same digest, and returns its new
+        filename.
+        """
+        new_filename = os.path.join(os.path.dirname(filename), name)
+        os.replace(self.get_path(filename), self.get_path(new_filename))
+        return new_filename
+
+    def touch(self, filename):
+        """
+        Marks ``filename`` as having just been used, by updating its access
+        time (leaving its mtime alone, since that's when it was built).
+        """
+        full_path = self.get_path(filename)
+        try:
+            stat_result = os.stat(full_path)
+            os.utime(full_path, times=(time.time(), stat_result.st_mtime))
+        except FileNotFoundError:
+            pass
+
+    def get_entries(self):
+        """
+        Returns a list of ``(filename, size, last_used)`` tuples for each
+        zipfile in our directory, least-recently-used first.  Filenames
+        are relative to our directory.  Temporary files and locks aren't
+        included.  Zipfiles sitting directly in our directory (from before
+        they were stored by digest) are included too.
+        """
+        entries = []
+        for (filename, path) in self.scan():
+            try:
+                stat_result = os.stat(path, follow_symlinks=False)
+            except FileNotFoundError:   # pragma: no cover
+                continue
+            entries.append((filename, stat_result.st_size,
+                max(stat_result.st_atime, stat_result.st_mtime)))
+        entries.sort(key=lambda entry: (entry[2], entry[0]))
+        return entries
+
+    def scan(self):
+        """
+        Yields a tuple of ``(filename, full_path)`` for each zipfile in our
+        directory and its digest subdirectories.
+        """
+        try:
+            dir_entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in dir_entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    sub_entries = list(os.scandir(entry.path))
+                except FileNotFoundError:   # pragma: no cover
+                    continue
+                for sub_entry in sub_entries:
+                    if not sub_entry.name.startswith('.') and sub_entry.name.endswith('.zip'):
+                        yield (os.path.join(entry.name, sub_entry.name), sub_entry.path)
+            elif entry.name.endswith('.zip'):
+                yield (entry.name, entry.path)
+
+    def remove(self, filename):
+        """
+        Removes the zipfile ``filename`` (relative to our directory), along
+        with its digest directory if that's now empty.  Returns ``False`` if
+        it was already gone.
+        """
+        try:
+            os.unlink(self.get_path(filename))
+        except FileNotFoundError:   # pragma: no cover
+            return False
+        digest = os.path.dirname(filename)
+        if digest != '':
+            try:
+                os.rmdir(self.get_path(digest))
+            except OSError:
+                # Not empty; a new version must be being written.
+                pass
+        return True
+
+    def evict(self, quota=0, max_age=0, keep=()):
+        """
+        Removes zipfiles which haven't been used in ``max_age`` seconds,
+        and then the least-recently-used zipfiles until the directory's
+        zipfiles take up no more than ``quota`` bytes.  A ``quota`` or
+        ``max_age`` of zero means no limit.  Zipfiles named in ``keep``
+        are left alone.  Returns a list of ``(filename, size)`` tuples for
+        each zipfile removed.
+        """
+        entries = self.get_entries()
+        total = sum([size for (filename, size, last_used) in entries])
+        cutoff = time.time() - max_age
+        removed = []
+        for (filename, size, last_used) in entries:
+            if filename in keep:
+                continue
+            if (max_age > 0 and last_used < cutoff) or (quota > 0 and total > quota):
+                if self.remove(filename):
+                    total -= size
+                    removed.append((filename, size))
+        return removed
+
+    def evict_versions(self, digest, keep=()):
+        """
+        Removes any zipfiles stored under other versions of ``digest``
+        (those with the same prefix, such as older versions of an album
+        whose zipfile was just rebuilt), apart from those in ``keep``.
+        Returns a list of ``(filename, size)`` tuples for each one removed.
+        """
+        prefix = self.get_digest_prefix(digest)
+        removed = []
+        if prefix is None:
+            return removed
+        for (filename, size, last_used) in self.get_entries():
+            dirname = os.path.dirname(filename)
+            if (dirname != '' and dirname != digest and self.get_digest_prefix(dirname) == prefix and
+                    filename not in keep):
+                if self.remove(filename):
+                    removed.append((filename, size))
+        return removed
+
+    @staticmethod
+    def get_digest_prefix(digest):
+        """
+        Returns the part of ``digest`` which identifies what it's a version
+        of: everything up to its first ``-``, or ``None`` if it doesn't
+        have one.
+        """
+        if '-' not in digest:
+            return None
+        return digest.split('-', 1)[0]
+
+    def evict_stale(self, digests):
+        """
+        Removes any zipfiles which aren't stored under one of ``digests``
+        (a set), since they no longer match any album's contents.  Returns
+        a list of ``(filename, size)`` tuples for each one removed.
+        """
+        removed = []
+        for (filename, size, last_used) in self.get_entries():
+            if os.path.dirname(filename) not in digests:
+                if self.remove(filename):
+                    removed.append((filename, size))
+        return removed
+
+    def clean_locks(self):
+        """
+        Removes lock files for zipfiles which aren't being built, so they
+        don't pile up.  Locks which are held are left alone.
+        """
+        if fcntl is None:   # pragma: no cover
+            return
+        try:
+            dir_entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in dir_entries:
+            if not entry.name.startswith(self.lock_prefix):
+                continue
+            with open(entry.path, 'a') as lf:
+                try:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:   # pragma: no cover
+                    pass
+                fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+zip_queues = {}
+zip_queues_lock = threading.Lock()
+
+def get_zip_queue(jobs):
+    """
+    Returns the ``ZipBuildQueue`` which runs ``jobs`` builds at once, so
+    that each process only has the one pool of build threads (unless the
+    number of jobs is changed while it's running).
+    """
+    with zip_queues_lock:
+        if jobs not in zip_queues:
+            zip_queues[jobs] = ZipBuildQueue(jobs)
+        return zip_queues[jobs]
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+import os
+import time
+import zlib
+import bisect
+import struct
+import hashlib
+
+class ZipMember(object):
+    """
+    A single file to be included in a ``ZipStream``.  ``size`` and
+    ``mtime`` (in seconds) should be what the file looks like right now,
+    since the archive's layout is worked out from them before any data is
+    read.  ``crc`` can be passed in if it's already known, and is filled in
+    otherwise once the file has been read.  ``sha256sum``, if given, is
+    only used to identify the file's contents (see ``ZipStream.get_etag()``).
+    """
+
+    def __init__(self, filename, arcname, size, mtime, crc=None, sha256sum=None):
+        self.filename = filename
+        self.arcname = arcname
+        self.size = size
+        self.mtime = mtime
+        self.crc = crc
+        self.sha256sum = sha256sum
+
+    @staticmethod
+    def from_file(filename, arcname, mtime=None):
+        """
+        Creates a member for ``filename``, taking its size (and, unless
+        given, its mtime) from the filesystem.
+        """
+        stat_result = os.stat(filename)
+        if mtime is None:
+            mtime = int(stat_result.st_mtime)
+        return ZipMember(filename, arcname, stat_result.st_size, mtime)
+
+class ZipStream(object):
+    """
+    Generates an uncompressed zipfile on the fly, without needing to write
+    it anywhere first, or to read any of its members into memory.  Since
+    nothing is compressed, the exact size of the archive (``self.size``) is
+    known before any data is read, which lets us send a ``Content-Length``
+    with it.
+
+    Each member is followed by a data descriptor holding its CRC, so CRCs
+    can be computed as the data is sent.  Zip64 records are used for any
+    member or offset which needs them, so archives over 4GB are fine.
+    Timestamps are stored in UTC, and clamped to the range which zipfiles
+    can represent (1980 to 2107), rather than refusing files outside it.
+
+    The archive only depends on its members' names, sizes, mtimes and
+    contents, so the same members always produce the same bytes, and any
+    range of the archive can be generated on its own with ``iter_range()``,
+    which is what lets interrupted downloads be resumed.  A range only
+    needs the CRCs of members whose data it doesn't entirely cover.
+    """
+
+    chunk_size = 64*1024
+
+    # Called with each member as soon as its CRC has been computed from its
+    # data, so callers can store CRCs without waiting for the whole archive.
+    crc_callback = None
+
+    zip64_limit = 0xFFFFFFFF
+    zip64_count_limit = 0xFFFF
+
+    local_header = struct.Struct('<IHHHHHIIIHH')
+    descriptor = struct.Struct('<IIII')
+    descriptor64 = struct.Struct('<IIQQ')
+    central_header = struct.Struct('<IHHHHHHIIIHHHHHII')
+    end_record = struct.Struct('<IHHHHIIH')
+    end_record64 = struct.Struct('<IQHHIIQQQQ')
+    end_locator64 = struct.Struct('<IIQI')
+
+    def __init__(self, members):
+        self.members = members
+        self.offsets = []
+        offset = 0
+        for member in members:
+            self.offsets.append(offset)
+            offset += len(self.get_local_header(member)) + member.size + self.get_descriptor_size(member)
+        self.central_offset = offset
+        self.central_size = sum([len(self.get_central_header(member, member_offset))
+            for (member, member_offset) in zip(members, self.offsets)])
+        self.size = self.central_offset + self.central_size + len(self.get_end_records())
+        self.segments = None
+
+    @staticmethod
+    def get_dos_time(mtime):
+        """
+        Returns a tuple of (time, date) in MS-DOS format, for the given
+        timestamp.
+        """
+        date_time = time.gmtime(mtime)[:6]
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        elif date_time[0] > 2107:
+            date_time = (2107, 12, 31, 23, 59, 58)
+        return ((date_time[3] << 11) | (date_time[4] << 5) | (date_time[5] // 2),
+            ((date_time[0] - 1980) << 9) | (date_time[1] << 5) | date_time[2])
+
+    @staticmethod
+    def get_name(member):
+        """
+        Returns a tuple of the encoded name of ``member``, and the flags to
+        go along with it.  As with Python's ``zipfile``, names which aren't
+        plain ASCII get the UTF-8 flag.
+        """
+        try:
+            return (member.arcname.encode('ascii'), 0x08)
+        except UnicodeEncodeError:
+            return (member.arcname.encode('utf-8'), 0x08 | 0x800)
+
+    def is_zip64(self, member):
+        return member.size >= self.zip64_limit
+
+    def get_local_header(self, member):
+        """
+        Returns the local file header for ``member``.  CRC and sizes are
+        all left to the data descriptor which follows the data.
+        """
+        (name, flags) = self.get_name(member)
+        (dos_time, dos_date) = self.get_dos_time(member.mtime)
+        if self.is_zip64(member):
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            (version, size) = (45, 0xFFFFFFFF)
+        else:
+            extra = b''
+            (version, size) = (20, 0)
+        return self.local_header.pack(0x04034b50, version, flags, 0, dos_time, dos_date,
+            0, size, size, len(name), len(extra)) + name + extra
+
+    def get_descriptor_size(self, member):
+        if self.is_zip64(member):
+            return self.descriptor64.size
+        return self.descriptor.size
+
+    def get_descriptor(self, member):
+        """
+        Returns the data descriptor for ``member``, which needs its CRC.
+        """
+        if self.is_zip64(member):
+            return self.descriptor64.pack(0x08074b50, member.crc, member.size, member.size)
+        return self.descriptor.pack(0x08074b50, member.crc, member.size, member.size)
+
+    def get_central_header(self, member, offset):
+        """
+        Returns the central directory header for ``member``.  Its length
+        doesn't depend on the CRC, so this can be called before we know it.
+        """
+        (name, flags) = self.get_name(member)
+        (dos_time, dos_date) = self.get_dos_time(member.mtime)
+        extra_fields = []
+        size = member.size
+        if member.size >= self.zip64_limit:
+            extra_fields.extend([member.size, member.size])
+            size = 0xFFFFFFFF
+        if offset >= self.zip64_limit:
+            extra_fields.append(offset)
+            offset = 0xFFFFFFFF
+        if extra_fields:
+            extra = struct.pack('<HH', 1, 8*len(extra_fields)) + struct.pack('<%dQ' % (len(extra_fields)), *extra_fields)
+            version = 45
+        else:
+            extra = b''
+            version = 20
+        return self.central_header.pack(0x02014b50, (3 << 8) | version, version, flags, 0,
+            dos_time, dos_date, member.crc or 0, size, size, len(name), len(extra), 0, 0, 0,
+            0o100644 << 16, offset) + name + extra
+
+    def get_end_records(self):
+        """
+        Returns the end of central directory record, preceded by the zip64
+        versions of it if we need them.
+        """
+        count = len(self.members)
+        if (count >= self.zip64_count_limit or self.central_size >= self.zip64_limit or
+                self.central_offset >= self.zip64_limit):
+            end64_offset = self.central_offset + self.central_size
+            records = self.end_record64.pack(0x06064b50, self.end_record64.size - 12,
+                (3 << 8) | 45, 45, 0, 0, count, count, self.central_size, self.central_offset)
+            records += self.end_locator64.pack(0x07064b50, 0, end64_offset, 1)
+            return records + self.end_record.pack(0x06054b50, 0, 0,
+                min(count, 0xFFFF), min(count, 0xFFFF),
+                min(self.central_size, 0xFFFFFFFF), min(self.central_offset, 0xFFFFFFFF), 0)
+        return self.end_record.pack(0x06054b50, 0, 0, count, count,
+            self.central_size, self.central_offset, 0)
+
+    def get_etag(self):
+        """
+        Returns a string which identifies the contents of this archive,
+        based on each member's name, size, mtime and (if we have it) SHA256
+        checksum.  This doesn't depend on knowing any CRCs.
+        """
+        hash_sha256 = hashlib.sha256()
+        for member in self.members:
+            hash_sha256.update(repr((member.arcname, member.size, member.mtime,
+                member.sha256sum)).encode('utf-8'))
+        return hash_sha256.hexdigest()
+
+    def get_missing_crcs(self, ranges=None):
+        """
+        Returns a list of the members whose CRCs aren't known yet.  If
+        ``ranges`` (a list of inclusive ``(start, end)`` tuples) is given,
+        only the members whose CRCs are needed before ``iter_range()`` can
+        generate those ranges are returned.
+        """
+        if ranges is None:
+            return [member for member in self.members if member.crc is None]
+        return [member for (idx, member) in enumerate(self.members) if member.crc is None and
+            any([self.needs_crc(idx, start, end) for (start, end) in ranges])]
+
+    def needs_crc(self, idx, start, end):
+        """
+        Returns ``True`` if the bytes from ``start`` to ``end`` (inclusive)
+        include something which depends on the CRC of the member at ``idx`` (its data
+        descriptor, or the central directory), but not all of its data, in
+        which case the CRC has to be known before we can send them.  When
+        the range does cover all of the data, ``iter_range()`` computes the
+        CRC as it goes.
+        """
+        member = self.members[idx]
+        data_offset = self.offsets[idx] + len(self.get_local_header(member))
+        descriptor_offset = data_offset + member.size
+        if start <= data_offset and descriptor_offset <= end + 1:
+            return False
+        if descriptor_offset <= end and descriptor_offset + self.get_descriptor_size(member) > start:
+            return True
+        return end >= self.central_offset and start < self.central_offset + self.central_size
+
+    def compute_crc(self, member):
+        """
+        Reads ``member``'s file to fill in its CRC.
+        """
+        for chunk in self.iter_member_data(member):
+            pass
+
+    def get_segments(self):
+        """
+        Returns a list of ``(offset, length, kind, idx)`` tuples which make
+        up the whole archive, in order.  ``kind`` is one of ``'header'``,
+        ``'data'``, ``'descriptor'`` or ``'central'``, for the member at
+        ``idx``, or ``'end'`` for the end records (with an ``idx`` of
+        ``None``).  None of this depends on our CRCs, which are only looked
+        up once the bytes are actually generated.
+        """
+        if self.segments is None:
+            segments = []
+            for (idx, (member, offset)) in enumerate(zip(self.members, self.offsets)):
+                header_size = len(self.get_local_header(member))
+                segments.append((offset, header_size, 'header', idx))
+                segments.append((offset + header_size, member.size, 'data', idx))
+                segments.append((offset + header_size + member.size,
+                    self.get_descriptor_size(member), 'descriptor', idx))
+            offset = self.central_offset
+            for (idx, (member, member_offset)) in enumerate(zip(self.members, self.offsets)):
+                header_size = len(self.get_central_header(member, member_offset))
+                segments.append((offset, header_size, 'central', idx))
+                offset += header_size
+            segments.append((offset, self.size - offset, 'end', None))
+            self.segments = segments
+        return self.segments
+
+    def iter_range(self, start, end):
+        """
+        Yields the bytes from ``start`` to ``end`` (inclusive) of the
+        archive, in chunks, reading only the parts of our members' files
+        which fall in that range.  Members whose data lies entirely inside
+        the range have their CRCs computed as they're read, but any other
+        CRCs which the range needs must already be known (see
+        ``get_missing_crcs()``), or we raise ``ValueError``.  Raises
+        ``IOError`` if a file is shorter than it was when we started.
+        """
+        if self.get_missing_crcs([(start, end)]):
+            raise ValueError('CRCs must be known to generate this range of a zipfile')
+        segments = self.get_segments()
+        idx = max(bisect.bisect_left([segment[0] for segment in segments], start) - 1, 0)
+        for (offset, length, kind, member_idx) in segments[idx:]:
+            if offset > end:
+                break
+            if kind == 'data' and start <= offset and offset + length <= end + 1:
+                for chunk in self.iter_member_data(self.members[member_idx]):
+                    yield chunk
+                continue
+            seg_start = max(start, offset) - offset
+            seg_end = min(end + 1, offset + length) - offset
+            if seg_end <= seg_start:
+                continue
+            if kind == 'data':
+                for chunk in self.iter_file_range(self.members[member_idx], seg_start, seg_end):
+                    yield chunk
+            elif kind == 'header':
+                yield self.get_local_header(self.members[member_idx])[seg_start:seg_end]
+            elif kind == 'descriptor':
+                yield self.get_descriptor(self.members[member_idx])[seg_start:seg_end]
+            elif kind == 'central':
+                yield self.get_central_header(self.members[member_idx],
+                    self.offsets[member_idx])[seg_start:seg_end]
+            else:
+                yield self.get_end_records()[seg_start:seg_end]
+
+    def iter_file_range(self, member, start, end):
+        """
+        Yields ``member``'s file data from ``start`` up to (but not
+        including) ``end``, in chunks.
+        """
+        remaining = end - start
+        with open(member.filename, 'rb') as df:
+            df.seek(start)
+            while remaining > 0:
+                chunk = df.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError('File changed size while being zipped: %s' % (member.filename))
+                remaining -= len(chunk)
+                yield chunk
+
+    def iter_member_data(self, member):
+        """
+        Yields the data for ``member`` in chunks, computing its CRC as we
+        go (even if we already had one, since the data is what counts), and
+        passing ``member`` to ``crc_callback`` once it's been computed.
+        Raises ``IOError`` if the file isn't the size it was when we
+        started, since our layout would be wrong.
+        """
+        crc = 0
+        remaining = member.size
+        with open(member.filename, 'rb') as df:
+            while remaining > 0:
+                chunk = df.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError('File changed size while being zipped: %s' % (member.filename))
+                crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        member.crc = crc & 0xFFFFFFFF
+        if self.crc_callback is not None:
+            self.crc_callback(member)
+
+    def __iter__(self):
+        """
+        Yields the whole archive, in chunks.  The central directory is sent
+        a header at a time, so archives with lots of members (such as a
+        whole artist's worth of albums) don't need it all in memory at once.
+        """
+        for member in self.members:
+            yield self.get_local_header(member)
+            for chunk in self.iter_member_data(member):
+                yield chunk
+            yield self.get_descriptor(member)
+        for (member, offset) in zip(self.members, self.offsets):
+            yield self.get_central_header(member, offset)
+        yield self.get_end_records()
+
+    def write_to(self, fileobj):
+        """
+        Writes the whole archive to ``fileobj``.
+        """
+        for chunk in self:
+            fileobj.write(chunk)